@@ -61,6 +61,10 @@ REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
         'rest_framework_simplejwt.authentication.JWTAuthentication',
     ],
+    'DEFAULT_RENDERER_CLASSES': [
+        'vbucks_tracker.instrumentation.TimedJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
 }
 
 # Auth settings
@@ -73,6 +77,12 @@ LOGOUT_REDIRECT_URL = 'vbucks_tracker:home'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Avatars are re-encoded without metadata and bounded to AVATAR_MAX_DIMENSION px;
+# their 64/128/256 px thumbnails are rendered by AVATAR_WORKERS background threads
+# (0: right after the upload is committed, in the request).
+AVATAR_MAX_DIMENSION = int(os.getenv('AVATAR_MAX_DIMENSION', 1024))
+AVATAR_WORKERS = int(os.getenv('AVATAR_WORKERS', 2))
+
 # Static files
 STATIC_URL = '/static/'
 STATICFILES_DIRS = [BASE_DIR / 'static']
@@ -82,21 +92,26 @@ STATIC_ROOT = BASE_DIR / 'staticfiles'
 STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
 
 MIDDLEWARE = [
+    'vbucks_tracker.instrumentation.ServerTimingMiddleware',
+    'vbucks_tracker.instrumentation.QueryBudgetMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
+    'vbucks_tracker.routers.ReplicaPinMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'vbucks_tracker.routers.ShardMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'vbucks_tracker.instrumentation.RequestProfilerMiddleware',
 ]
 
 ROOT_URLCONF = 'FortniteWallet.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'BACKEND': 'vbucks_tracker.instrumentation.TimedDjangoTemplates',
         'DIRS': [BASE_DIR / 'templates']
         ,
         'APP_DIRS': True,
@@ -127,6 +142,68 @@ DATABASE_URL = os.getenv('DATABASE_URL')
 if DATABASE_URL:
     DATABASES['default'] = dj_database_url.parse(DATABASE_URL)
 
+# Read replicas: comma-separated database URLs. The dashboard, list pages, search,
+# analytics and user API read from them; a client that wrote reads from the
+# primary for REPLICA_PIN_SECONDS. Under test they mirror the primary.
+REPLICA_DATABASES = []
+for index, url in enumerate(filter(None, os.getenv('DATABASE_REPLICA_URLS', '').split(',')), 1):
+    DATABASES[f'replica_{index}'] = {**dj_database_url.parse(url.strip()), 'TEST': {'MIRROR': 'default'}}
+    REPLICA_DATABASES.append(f'replica_{index}')
+REPLICA_PIN_SECONDS = int(os.getenv('REPLICA_PIN_SECONDS', 5))
+REPLICA_PIN_COOKIE = 'primary_pin'
+
+# Shards: comma-separated database URLs. Each user's tracker data (transactions,
+# earnings, spendings, refunds, profile, summary and rollups) lives on one of
+# SHARD_DATABASES, recorded in User.shard; users and auth stay on the default
+# database, which is itself the first shard. New users are spread over
+# SHARD_NEW_USERS; `manage.py rebalance_shards` moves existing users.
+SHARD_DATABASES = ['default']
+for index, url in enumerate(filter(None, os.getenv('DATABASE_SHARD_URLS', '').split(',')), 1):
+    DATABASES[f'shard_{index}'] = dj_database_url.parse(url.strip())
+    SHARD_DATABASES.append(f'shard_{index}')
+SHARD_NEW_USERS = [
+    alias.strip() for alias in os.getenv('SHARD_NEW_USERS', ','.join(SHARD_DATABASES)).split(',') if alias.strip()
+]
+
+DATABASE_ROUTERS = ['vbucks_tracker.routers.ShardRouter', 'vbucks_tracker.routers.ReplicaRouter']
+
+# SQLite tuning
+# Applied to every new SQLite connection (see vbucks_tracker/sqlite.py); set
+# SQLITE_TUNING=false for stock SQLite behaviour.
+SQLITE_PRAGMAS = {
+    'journal_mode': os.getenv('SQLITE_JOURNAL_MODE', 'WAL'),
+    'synchronous': os.getenv('SQLITE_SYNCHRONOUS', 'NORMAL'),
+    'busy_timeout': int(os.getenv('SQLITE_BUSY_TIMEOUT_MS', 5000)),
+    'cache_size': -int(os.getenv('SQLITE_CACHE_SIZE_KIB', 64 * 1024)),  # negative: KiB rather than pages
+    'mmap_size': int(os.getenv('SQLITE_MMAP_SIZE', 256 * 1024 * 1024)),
+    'temp_store': os.getenv('SQLITE_TEMP_STORE', 'MEMORY'),
+} if os.getenv('SQLITE_TUNING', 'true').lower() == 'true' else {}
+# Writing views and import batches start their transactions with BEGIN IMMEDIATE
+SQLITE_IMMEDIATE_WRITES = os.getenv('SQLITE_IMMEDIATE_WRITES', 'true').lower() == 'true'
+# Seconds between PRAGMA optimize runs per worker; 0 disables them
+SQLITE_OPTIMIZE_INTERVAL = int(os.getenv('SQLITE_OPTIMIZE_INTERVAL', 3600))
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+# Local memory by default; point CACHE_BACKEND/CACHE_LOCATION at a file, Redis
+# or Memcached cache to share entries between workers.
+
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv('CACHE_LOCATION', 'fortnite-wallet'),
+        'TIMEOUT': int(os.getenv('CACHE_TIMEOUT', 300)),
+    }
+}
+if CACHES['default']['BACKEND'].endswith(('LocMemCache', 'FileBasedCache', 'DatabaseCache')):
+    # Only Django's own backends understand the entry limit
+    CACHES['default']['OPTIONS'] = {'MAX_ENTRIES': int(os.getenv('CACHE_MAX_ENTRIES', 10000))}
+
+# Cache alias and TTL (seconds) for the per-user wallet summaries
+WALLET_SUMMARY_CACHE = 'default'
+WALLET_SUMMARY_CACHE_TIMEOUT = int(os.getenv('WALLET_SUMMARY_CACHE_TIMEOUT', 600))
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -147,6 +224,61 @@ AUTH_PASSWORD_VALIDATORS = [
 ]
 
 
+# Query instrumentation
+# Opt-in: count queries per request, report them in X-Query-* response headers
+# and log statements repeated at least QUERY_REPEAT_THRESHOLD times (N+1).
+QUERY_INSTRUMENTATION = os.getenv('QUERY_INSTRUMENTATION', 'false').lower() == 'true'
+QUERY_REPEAT_THRESHOLD = int(os.getenv('QUERY_REPEAT_THRESHOLD', 5))
+
+# Conditional GET
+# Mixed into the ETags of the dashboard, list pages and user detail API; set it
+# to the release id so a deploy stops browsers from revalidating old pages.
+RESPONSE_ETAG_SALT = os.getenv('RESPONSE_ETAG_SALT', '')
+
+# Request timing
+# Server-Timing response headers split into db, template, serialize and view time.
+SERVER_TIMING = os.getenv('SERVER_TIMING', str(DEBUG)).lower() == 'true'
+# Staff users can profile a single request with ?_profile=1 or an X-Profile: 1
+# header; captures are stored as RequestProfile rows, downloadable in the admin.
+REQUEST_PROFILING = os.getenv('REQUEST_PROFILING', str(DEBUG)).lower() == 'true'
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'vbucks_tracker.queries': {
+            'handlers': ['console'],
+            'level': os.getenv('QUERY_LOG_LEVEL', 'INFO'),
+            'propagate': False,
+        },
+    },
+}
+
+# Background jobs
+# Queued in the Job table and run by `manage.py run_jobs` workers, no broker needed.
+JOB_WORKERS = int(os.getenv('JOB_WORKERS', 2))
+JOB_EXECUTOR = os.getenv('JOB_EXECUTOR', 'thread')  # or 'process'
+# Running jobs that haven't reported progress for this long are presumed lost and retried
+JOB_LEASE_SECONDS = int(os.getenv('JOB_LEASE_SECONDS', 600))
+# Delay before the first retry of a failed job; doubled for every further attempt
+JOB_RETRY_DELAY_SECONDS = int(os.getenv('JOB_RETRY_DELAY_SECONDS', 30))
+# Finished jobs (and their export files) are deleted after this many days
+JOB_RETENTION_DAYS = int(os.getenv('JOB_RETENTION_DAYS', 7))
+
+# Currency conversion
+# Real-money amounts are normalized to this currency when saved.
+FX_BASE_CURRENCY = os.getenv('FX_BASE_CURRENCY', 'BGN')
+# Optional CSV (date,currency,rate) loaded by `manage.py load_fx_rates`
+FX_RATES_FILE = os.getenv('FX_RATES_FILE', BASE_DIR / 'fx_rates.csv')
+# Cache alias and TTL (seconds) for rate lookups; the TTL bounds how long a
+# worker without a shared cache backend can serve a replaced rate
+FX_RATE_CACHE = 'default'
+FX_RATE_CACHE_TIMEOUT = int(os.getenv('FX_RATE_CACHE_TIMEOUT', 300))
+
+
 # Internationalization
 # https://docs.djangoproject.com/en/5.2/topics/i18n/
 
@@ -21,6 +21,9 @@ from django.urls import path, include
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
 
 from accounts.views import UserListAPIView, UserDetailAPIView
+from vbucks_tracker.views import (
+    AnalyticsAPIView, BalanceAPIView, BalanceHistoryAPIView, BulkRefundAPIView, SearchAPIView,
+)
 
 urlpatterns = [
     path('admin/', admin.site.urls),
@@ -30,6 +33,11 @@ urlpatterns = [
     # REST API URLs
     path('api/users/', UserListAPIView.as_view(), name='user-list'),
     path('api/users/<int:pk>/', UserDetailAPIView.as_view(), name='user-detail'),
+    path('api/analytics/', AnalyticsAPIView.as_view(), name='analytics-api'),
+    path('api/balance/', BalanceAPIView.as_view(), name='balance-api'),
+    path('api/balance-history/', BalanceHistoryAPIView.as_view(), name='balance-history-api'),
+    path('api/refunds/bulk/', BulkRefundAPIView.as_view(), name='bulk-refund-api'),
+    path('api/search/', SearchAPIView.as_view(), name='search-api'),
 
     # JWT Token URLs
     path('api/token/', TokenObtainPairView.as_view(), name='token_obtain_pair'),
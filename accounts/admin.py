@@ -1,6 +1,11 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
 from django.utils.html import format_html
+from vbucks_tracker.admin import ShardedAdminMixin
+from vbucks_tracker.jobs import enqueue
+from vbucks_tracker.pagination import EstimatedCountPaginator
+from vbucks_tracker.routers import shard_for, sharding_enabled
+from vbucks_tracker.services import VbucksService
 from .models import User, UserProfile
 
 
@@ -11,10 +16,13 @@ class UserProfileInline(admin.StackedInline):
     readonly_fields = ('avatar_preview',)
 
     def avatar_preview(self, obj):
+        if not obj.avatar:
+            return "No avatar"
+        thumbnail = obj.avatar_urls.get('128', {}).get('webp')
         return format_html(
             '<img src="{}" style="max-height:100px;max-width:100px;"/>',
-            obj.avatar.url
-        ) if obj.avatar else "No avatar"
+            thumbnail or obj.avatar.url
+        )
 
     avatar_preview.short_description = 'Preview'
 
@@ -25,6 +33,57 @@ class CustomUserAdmin(UserAdmin):
     list_filter = ('is_staff', 'is_superuser', 'is_active')
     search_fields = ('username', 'email', 'profile__epic_games_username')
     ordering = ('-date_joined',)
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    actions = ('recompute_wallets',)
+
+    def get_queryset(self, request):
+        queryset = super().get_queryset(request)
+        # Balances can only be joined in while all tracker data is on this database
+        return queryset if sharding_enabled() else VbucksService.annotate_balances(queryset)
+
+    def get_changelist_instance(self, request):
+        changelist = super().get_changelist_instance(request)
+        if sharding_enabled():
+            summaries = VbucksService.get_user_summaries(changelist.result_list)
+            for user in changelist.result_list:
+                user.wallet_balance = summaries[user.pk]['balance']
+        return changelist
+
+    def get_sortable_by(self, request):
+        sortable_by = super().get_sortable_by(request)
+        if sharding_enabled():
+            return [field for field in sortable_by if field != 'vbucks_balance']
+        return sortable_by
+
+    def get_search_fields(self, request):
+        if sharding_enabled():
+            return [field for field in self.search_fields if not field.startswith('profile__')]
+        return self.search_fields
+
+    def get_inline_instances(self, request, obj=None):
+        # New users' profiles are created on their shard when first used
+        if obj is None and sharding_enabled():
+            return []
+        return super().get_inline_instances(request, obj)
+
+    def get_formset_kwargs(self, request, obj, inline, prefix):
+        kwargs = super().get_formset_kwargs(request, obj, inline, prefix)
+        if sharding_enabled():
+            kwargs['queryset'] = kwargs['queryset'].using(shard_for(obj))
+        return kwargs
+
+    @admin.action(description="Recompute wallet summaries in the background", permissions=['change'])
+    def recompute_wallets(self, request, queryset):
+        for user_id in queryset.values_list('pk', flat=True):
+            enqueue('recompute_summary', user_id)
+        self.message_user(request, "Queued the summary recomputes; `manage.py run_jobs` workers will run them.")
+
+    def vbucks_balance(self, obj):
+        return obj.wallet_balance
+
+    vbucks_balance.short_description = 'V-Bucks Balance'
+    vbucks_balance.admin_order_field = 'wallet_balance'
 
     def get_fieldsets(self, request, obj=None):
         if not request.user.is_superuser:
@@ -37,7 +96,7 @@ class CustomUserAdmin(UserAdmin):
 
 
 @admin.register(UserProfile)
-class UserProfileAdmin(admin.ModelAdmin):
+class UserProfileAdmin(ShardedAdminMixin, admin.ModelAdmin):
     list_display = ('user', 'platform', 'epic_username')
     list_filter = ('platform',)
     search_fields = ('user__username', 'epic_games_username')
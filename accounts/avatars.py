@@ -0,0 +1,178 @@
+"""
+Avatar processing.
+
+Uploads are re-encoded without their metadata (EXIF, GPS, ICC, text chunks)
+and bounded to ``AVATAR_MAX_DIMENSION`` px when the profile is saved. The
+square thumbnails pages actually show are rendered after the upload's
+transaction commits, on ``AVATAR_WORKERS`` background threads, and stored
+under content-hashed names so they can be cached forever.
+"""
+import hashlib
+import io
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from django.apps import apps
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connections, transaction
+from django.utils import timezone
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+AVATAR_SIZES = (256, 128, 64)
+# Extension -> Pillow format and encoder options, in the order <picture> offers them
+VARIANT_FORMATS = {
+    'webp': ('WEBP', {'quality': 80, 'method': 4}),
+    'jpeg': ('JPEG', {'quality': 85, 'optimize': True, 'progressive': True}),
+}
+VARIANT_DIRECTORY = 'avatars/variants'
+VARIANT_CONTENT_TYPES = {'webp': 'image/webp', 'jpeg': 'image/jpeg'}
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+
+
+def has_alpha(image):
+    return image.mode in ('RGBA', 'LA', 'PA') or 'transparency' in image.info
+
+
+def _open(source):
+    """Decode an image upright, in RGB(A), with none of the file's metadata kept"""
+    image = Image.open(source)
+    image.draft('RGB', (settings.AVATAR_MAX_DIMENSION,) * 2)  # JPEGs decode at a reduced scale
+    image = ImageOps.exif_transpose(image)
+    image = image.convert('RGBA' if has_alpha(image) else 'RGB')
+    image.info = {}
+    return image
+
+
+def clean_original(upload):
+    """
+    Re-encode an uploaded avatar without metadata and at most
+    AVATAR_MAX_DIMENSION px on each side, as PNG when it is transparent and
+    JPEG otherwise. Returns a ContentFile, or None when Pillow can't read it.
+    """
+    try:
+        upload.seek(0)
+        image = _open(upload)
+        image.thumbnail((settings.AVATAR_MAX_DIMENSION,) * 2, Image.Resampling.LANCZOS)
+    except (UnidentifiedImageError, OSError, Image.DecompressionBombError):
+        return None
+    output = io.BytesIO()
+    if image.mode == 'RGBA':
+        image.save(output, 'PNG', optimize=True)
+        extension = 'png'
+    else:
+        image.save(output, 'JPEG', quality=90)
+        extension = 'jpg'
+    stem = os.path.splitext(os.path.basename(upload.name))[0]
+    return ContentFile(output.getvalue(), name=f'{stem}.{extension}')
+
+
+def render_variants(image):
+    """
+    Square crops of ``image`` at each of AVATAR_SIZES, encoded in every
+    VARIANT_FORMATS, as ``{size: {extension: bytes}}``. Each size is scaled
+    down from the previous one, not from the original.
+    """
+    variants = {}
+    for size in AVATAR_SIZES:
+        image = ImageOps.fit(image, (size, size), Image.Resampling.LANCZOS)
+        flat = image
+        if image.mode == 'RGBA':
+            flat = Image.new('RGB', image.size, 'white')
+            flat.paste(image, mask=image.getchannel('A'))
+        variants[size] = {}
+        for extension, (image_format, options) in VARIANT_FORMATS.items():
+            output = io.BytesIO()
+            # WebP keeps the transparency, JPEG gets a white background
+            (image if image_format == 'WEBP' else flat).save(output, image_format, **options)
+            variants[size][extension] = output.getvalue()
+    return variants
+
+
+def variant_paths(variants):
+    """Every storage name in a profile's ``avatar_variants``"""
+    return [path for formats in variants.values() for path in formats.values()]
+
+
+def delete_files(paths):
+    for path in paths:
+        default_storage.delete(path)
+
+
+def delete_user_avatar_files(user_id, avatar_name=''):
+    """Delete a user's avatar ``avatar_name`` and every thumbnail stored for them, recorded or not"""
+    directory = f'{VARIANT_DIRECTORY}/{user_id}'
+    try:
+        _, files = default_storage.listdir(directory)
+    except FileNotFoundError:
+        files = []
+    delete_files([f'{directory}/{name}' for name in files] + ([avatar_name] if avatar_name else []))
+
+
+def generate_variants(profile_pk, avatar_name, using):
+    """
+    Render and store the thumbnails of the avatar ``avatar_name`` and record
+    them on the profile. Does nothing if the profile has since got another
+    avatar; files of the thumbnails it replaces are deleted.
+    """
+    profiles = apps.get_model('accounts', 'UserProfile').objects.using(using)
+    profile = profiles.filter(pk=profile_pk, avatar=avatar_name).only('user_id', 'avatar_variants').first()
+    if profile is None:
+        return
+    with default_storage.open(avatar_name) as source:
+        rendered = render_variants(_open(source))
+
+    variants = {}
+    for size, formats in rendered.items():
+        variants[str(size)] = {}
+        for extension, data in formats.items():
+            digest = hashlib.sha256(data).hexdigest()[:16]
+            path = f'{VARIANT_DIRECTORY}/{profile.user_id}/{digest}-{size}.{extension}'
+            if not default_storage.exists(path):
+                path = default_storage.save(path, ContentFile(data))
+            variants[str(size)][extension] = path
+
+    # updated_at changes the profile API's ETag
+    if profiles.filter(pk=profile_pk, avatar=avatar_name).update(avatar_variants=variants, updated_at=timezone.now()):
+        delete_files(set(variant_paths(profile.avatar_variants)) - set(variant_paths(variants)))
+
+
+def _generate_in_worker(*args):
+    try:
+        generate_variants(*args)
+    except Exception:
+        logger.exception('Could not generate the avatar variants of profile %s', args[0])
+    finally:
+        # The worker threads' connections aren't closed by any request
+        connections.close_all()
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=settings.AVATAR_WORKERS, thread_name_prefix='avatars')
+    return _executor
+
+
+def schedule_variants(profile, stale_paths=()):
+    """
+    Once the current transaction commits, delete ``stale_paths`` and
+    generate the thumbnails of the profile's avatar on the worker threads
+    (or right away when AVATAR_WORKERS is 0).
+    """
+    args = (profile.pk, profile.avatar.name, profile._state.db) if profile.avatar else None
+
+    def run():
+        delete_files(stale_paths)
+        if args is None:
+            return
+        if settings.AVATAR_WORKERS:
+            _get_executor().submit(_generate_in_worker, *args)
+        else:
+            generate_variants(*args)
+
+    transaction.on_commit(run, using=profile._state.db)
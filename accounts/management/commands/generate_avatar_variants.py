@@ -0,0 +1,28 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from PIL import Image, UnidentifiedImageError
+from accounts.avatars import generate_variants
+from accounts.models import UserProfile
+
+
+class Command(BaseCommand):
+    help = 'Generates the avatar thumbnails of profiles that have none yet, e.g. avatars uploaded before they existed.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help='Regenerate the thumbnails of every avatar.')
+
+    def handle(self, *args, **options):
+        generated = failed = 0
+        for using in settings.SHARD_DATABASES:
+            profiles = UserProfile.objects.using(using).exclude(avatar='').order_by('pk')
+            if not options['all']:
+                profiles = profiles.filter(avatar_variants={})
+            for pk, name in profiles.values_list('pk', 'avatar').iterator():
+                try:
+                    generate_variants(pk, name, using)
+                except (UnidentifiedImageError, OSError, Image.DecompressionBombError) as exc:
+                    failed += 1
+                    self.stderr.write(self.style.WARNING(f'Profile {pk} ({name}): {exc}'))
+                    continue
+                generated += 1
+        self.stdout.write(self.style.SUCCESS(f'Generated thumbnails for {generated} avatars ({failed} unreadable).'))
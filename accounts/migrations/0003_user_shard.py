@@ -0,0 +1,20 @@
+# Generated by Django 5.2.3 on 2026-10-18 14:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0002_modification_timestamps'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='shard',
+            # Existing users' data is on the default database
+            field=models.CharField(blank=True, default='default', editable=False, help_text="Database alias holding the user's tracker data (see SHARD_DATABASES)", max_length=100),
+            preserve_default=False,
+        ),
+    ]
@@ -2,13 +2,29 @@ from django.contrib.auth.models import AbstractUser
 from django.core.exceptions import ValidationError
 from django.core.validators import FileExtensionValidator
 from django.db import models
+from django.urls import reverse
+from vbucks_tracker.routers import ShardedQuerySet, place_user
+from .avatars import VARIANT_DIRECTORY, clean_original, schedule_variants, variant_paths
 
 
 class User(AbstractUser):
+    updated_at = models.DateTimeField(auto_now=True)
+    shard = models.CharField(
+        max_length=100,
+        blank=True,
+        editable=False,
+        help_text="Database alias holding the user's tracker data (see SHARD_DATABASES)"
+    )
+
     class Meta:
         verbose_name = "User"
         verbose_name_plural = "Users"
 
+    def save(self, *args, **kwargs):
+        if not self.shard:
+            self.shard = place_user(self.username)
+        super().save(*args, **kwargs)
+
     def get_vbucks_summary(self):
         """Get V-Bucks summary through the service layer"""
         from vbucks_tracker.services import VbucksService
@@ -37,6 +53,12 @@ class UserProfile(models.Model):
         help_text="Upload a profile picture (square image works best)",
         validators=[FileExtensionValidator(['jpg', 'jpeg', 'png'])]
     )
+    avatar_variants = models.JSONField(
+        default=dict,
+        blank=True,
+        editable=False,
+        help_text="Storage names of the avatar thumbnails: {size: {format: name}}"
+    )
     epic_games_username = models.CharField(
         max_length=100,
         blank=True,
@@ -56,6 +78,9 @@ class UserProfile(models.Model):
         blank=True,
         verbose_name="Main Platform"
     )
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = ShardedQuerySet.as_manager()
 
     class Meta:
         verbose_name = "User Profile"
@@ -70,7 +95,28 @@ class UserProfile(models.Model):
 
     def save(self, *args, **kwargs):
         self.full_clean()
+        new_avatar = bool(self.avatar) and not self.avatar._committed
+        stale = []
+        if new_avatar or (not self.avatar and self.avatar_variants):
+            # Pages fall back to the original until the new thumbnails are ready
+            stale = variant_paths(self.avatar_variants)
+            self.avatar_variants = {}
+        if new_avatar:
+            cleaned = clean_original(self.avatar)
+            new_avatar = cleaned is not None
+            if new_avatar:
+                self.avatar = cleaned
         super().save(*args, **kwargs)
+        if new_avatar or stale:
+            schedule_variants(self, stale)
+
+    @property
+    def avatar_urls(self):
+        """URLs of the avatar thumbnails as ``{size: {format: url}}``, empty until they are generated"""
+        return {
+            size: {extension: reverse('avatar', args=[name.removeprefix(f'{VARIANT_DIRECTORY}/')]) for extension, name in formats.items()}
+            for size, formats in self.avatar_variants.items()
+        }
 
     def __str__(self):
         return f"Profile for {self.user.username}"
\ No newline at end of file
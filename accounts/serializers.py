@@ -1,16 +1,29 @@
 from rest_framework import serializers
+from vbucks_tracker.instrumentation import TimedSerializerMixin
 from .models import User, UserProfile
 
 
+class AnnotatedBalanceField(serializers.ReadOnlyField):
+    """Read a preloaded ``wallet_balance``, falling back to the (cached) summary"""
+
+    def get_attribute(self, instance):
+        if hasattr(instance, 'wallet_balance'):
+            return instance.wallet_balance
+        return instance.vbucks_balance
+
+
 class UserProfileSerializer(serializers.ModelSerializer):
+    avatar_thumbnails = serializers.ReadOnlyField(source='avatar_urls')
+
     class Meta:
         model = UserProfile
-        fields = ['avatar', 'epic_games_username', 'platform']
+        fields = ['avatar', 'avatar_thumbnails', 'epic_games_username', 'platform']
 
 
-class UserSerializer(serializers.ModelSerializer):
+class UserSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     profile = UserProfileSerializer(read_only=True)
+    vbucks_balance = AnnotatedBalanceField()
 
     class Meta:
         model = User
-        fields = ['id', 'username', 'email', 'vbucks_balance', 'profile']
\ No newline at end of file
+        fields = ['id', 'username', 'email', 'vbucks_balance', 'profile']
@@ -1,8 +1,20 @@
+import io
+import shutil
+import tempfile
 from unittest.mock import patch
-from django.test import TestCase
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.test import TestCase, override_settings
 from django.core.exceptions import ValidationError
 from django.core.files.uploadedfile import SimpleUploadedFile
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image
+from rest_framework.test import APIClient
+from accounts import avatars
 from accounts.models import User, UserProfile
+from vbucks_tracker.models import VbucksEarning, VbucksSpending
+from vbucks_tracker.services import VbucksService
 
 class UserModelTests(TestCase):
     def setUp(self):
@@ -47,4 +59,157 @@ class UserProfileTests(TestCase):
         )
         self.profile.avatar = test_image
         self.profile.save()
-        self.assertIn('test', self.profile.avatar.name)
\ No newline at end of file
+        self.assertIn('test', self.profile.avatar.name)
+
+class UserAPITests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.viewer = User.objects.create_user(username='api_viewer', password='test123')
+        self.client.force_authenticate(self.viewer)
+        today = timezone.now().date()
+        for index in range(5):
+            user = User.objects.create_user(username=f'api_user{index}', password='test123')
+            UserProfile.objects.create(user=user, platform='PC')
+            VbucksEarning.objects.create(user=user, type='BP', amount=100 * (index + 1), date=today)
+            VbucksSpending.objects.create(user=user, item_name='Wrap', vbucks_spent=50, date=today)
+
+    def test_list_uses_constant_queries(self):
+        # One query for the page, one for every uncached balance; then cached
+        with self.assertNumQueries(2):
+            self.client.get(reverse('user-list'))
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('user-list'))
+        self.assertEqual(response.status_code, 200)
+        balances = {row['username']: row['vbucks_balance'] for row in response.data['results']}
+        self.assertEqual(balances['api_user0'], 50)
+        self.assertEqual(balances['api_user4'], 450)
+        self.assertEqual(balances['api_viewer'], 0)
+
+    def test_list_is_cursor_paginated(self):
+        response = self.client.get(reverse('user-list'), {'page_size': 2})
+        self.assertEqual(len(response.data['results']), 2)
+        self.assertIsNotNone(response.data['next'])
+        self.assertNotIn('count', response.data)
+
+        next_page = self.client.get(response.data['next'])
+        self.assertEqual(len(next_page.data['results']), 2)
+        self.assertFalse(
+            {row['id'] for row in response.data['results']}
+            & {row['id'] for row in next_page.data['results']}
+        )
+
+    def test_detail_reads_cached_balance(self):
+        user = User.objects.get(username='api_user1')
+        VbucksService.get_user_summary(user)
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('user-detail', args=[user.pk]))
+        self.assertEqual(response.data['vbucks_balance'], 150)
+        self.assertEqual(response.data['profile']['platform'], 'PC')
+
+    def test_detail_supports_conditional_get(self):
+        user = User.objects.get(username='api_user2')
+        url = reverse('user-detail', args=[user.pk])
+        first = self.client.get(url)
+        self.assertIn('ETag', first)
+        with self.assertNumQueries(1):
+            second = self.client.get(url, headers={'If-None-Match': first['ETag']})
+        self.assertEqual(second.status_code, 304)
+        self.assertEqual(self.client.get(url, headers={'If-Modified-Since': first['Last-Modified']}).status_code, 304)
+
+        # Other renderers and new entries get fresh representations
+        self.assertNotEqual(self.client.get(url, {'format': 'api'})['ETag'], first['ETag'])
+        VbucksEarning.objects.create(user=user, type='BP', amount=25, date=timezone.now().date())
+        response = self.client.get(url, headers={'If-None-Match': first['ETag']})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['vbucks_balance'], 275)
+        self.assertEqual(self.client.get(url, headers={'If-Modified-Since': first['Last-Modified']}).status_code, 200)
+
+
+def image_upload(name, size, mode='RGB', image_format='JPEG', **options):
+    output = io.BytesIO()
+    Image.new(mode, size, (200, 30, 30, 128) if mode == 'RGBA' else (200, 30, 30)).save(output, image_format, **options)
+    return SimpleUploadedFile(name, output.getvalue(), content_type=f'image/{image_format.lower()}')
+
+
+@override_settings(AVATAR_WORKERS=0, AVATAR_MAX_DIMENSION=512)
+class AvatarProcessingTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        self.enterContext(override_settings(MEDIA_ROOT=media_root))
+        self.user = User.objects.create_user(username='avatar_user', password='test123')
+        self.profile = UserProfile.objects.create(user=self.user)
+        self.client.force_login(self.user)
+
+    def upload(self, avatar):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('edit_profile'), {
+                'username': 'avatar_user', 'email': 'avatar@example.com', 'platform': 'PC', 'avatar': avatar,
+            })
+        self.assertEqual(response.status_code, 302)
+        self.profile.refresh_from_db()
+
+    def test_upload_is_cleaned_and_thumbnailed(self):
+        exif = Image.Exif()
+        exif[0x010F] = 'Camera maker'
+        self.upload(image_upload('holiday.jpg', (2000, 1000), exif=exif.tobytes()))
+
+        with default_storage.open(self.profile.avatar.name) as original, Image.open(original) as image:
+            self.assertEqual(image.size, (512, 256))
+            self.assertFalse(image.getexif())
+        self.assertEqual(set(self.profile.avatar_variants), {'64', '128', '256'})
+        for size, formats in self.profile.avatar_variants.items():
+            self.assertEqual(set(formats), {'webp', 'jpeg'})
+            for extension, name in formats.items():
+                self.assertIn(f'variants/{self.user.pk}/', name)
+                with default_storage.open(name) as variant, Image.open(variant) as image:
+                    self.assertEqual(image.size, (int(size), int(size)))
+                    self.assertEqual(image.format, extension.upper())
+
+        url = self.profile.avatar_urls['256']['webp']
+        self.assertContains(self.client.get(reverse('profile')), url)
+        response = self.client.get(url)
+        self.assertEqual(response['Content-Type'], 'image/webp')
+        self.assertEqual(response['Cache-Control'], 'public, max-age=31536000, immutable')
+        self.assertEqual(self.client.get(reverse('avatar', args=['../holiday.jpg'])).status_code, 404)
+        self.assertEqual(self.client.get(reverse('avatar', args=['1/missing-64.webp'])).status_code, 404)
+
+    def test_transparency_is_kept_where_the_format_allows(self):
+        self.upload(image_upload('logo.png', (300, 300), mode='RGBA', image_format='PNG'))
+        self.assertTrue(self.profile.avatar.name.endswith('.png'))
+        with default_storage.open(self.profile.avatar_variants['64']['webp']) as variant, Image.open(variant) as image:
+            self.assertEqual(image.mode, 'RGBA')
+        with default_storage.open(self.profile.avatar_variants['64']['jpeg']) as variant, Image.open(variant) as image:
+            self.assertEqual(image.mode, 'RGB')
+
+    def test_replaced_and_removed_avatars_lose_their_thumbnails(self):
+        self.upload(image_upload('first.jpg', (400, 400)))
+        first = avatars.variant_paths(self.profile.avatar_variants)
+        self.upload(image_upload('second.png', (400, 400), image_format='PNG'))
+        second = avatars.variant_paths(self.profile.avatar_variants)
+        self.assertEqual(len(second), 6)
+        self.assertFalse(any(default_storage.exists(path) for path in set(first) - set(second)))
+
+        self.profile.avatar = None
+        with self.captureOnCommitCallbacks(execute=True):
+            self.profile.save()
+        self.assertEqual(self.profile.avatar_variants, {})
+        self.assertFalse(any(default_storage.exists(path) for path in second))
+
+    @override_settings(AVATAR_WORKERS=2)
+    def test_thumbnails_are_rendered_off_the_request_thread(self):
+        with patch.object(avatars, '_get_executor') as executor:
+            self.upload(image_upload('queued.jpg', (100, 100)))
+        executor.return_value.submit.assert_called_once_with(
+            avatars._generate_in_worker, self.profile.pk, self.profile.avatar.name, 'default'
+        )
+        self.assertEqual(self.profile.avatar_variants, {})
+        # Until then pages show the original
+        self.assertContains(self.client.get(reverse('profile')), self.profile.avatar.url)
+
+    def test_backfill_command(self):
+        self.profile.avatar.save('old.jpg', image_upload('old.jpg', (100, 100)), save=False)
+        UserProfile.objects.filter(pk=self.profile.pk).update(avatar=self.profile.avatar.name)
+        call_command('generate_avatar_variants', stdout=io.StringIO())
+        self.profile.refresh_from_db()
+        self.assertEqual(len(avatars.variant_paths(self.profile.avatar_variants)), 6)
@@ -24,4 +24,5 @@ urlpatterns = [
     path('profile/', views.profile_view, name='profile'),
     path('profile/edit/', views.edit_profile_view, name='edit_profile'),
     path('profile/delete/', views.delete_profile_view, name='delete_profile'),
+    path('avatars/<path:name>', views.avatar_view, name='avatar'),
 ]
\ No newline at end of file
@@ -1,12 +1,23 @@
+import posixpath
+from django.core.files.storage import default_storage
+from django.http import FileResponse, Http404
 from django.shortcuts import render, redirect
 from django.contrib.auth import login, logout
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.urls import reverse_lazy
 from rest_framework import generics
-
+from rest_framework.response import Response
+
+from vbucks_tracker.cache import summary_cache
+from vbucks_tracker.conditional import allows_conditional, conditional_response, set_validators, wallet_etag
+from vbucks_tracker.jobs import enqueue
+from vbucks_tracker.routers import ReplicaReadsMixin, prefetch_tracker_related, select_tracker_related
+from vbucks_tracker.services import VbucksService
+from .avatars import VARIANT_CONTENT_TYPES, VARIANT_DIRECTORY
 from .forms import UserRegisterForm, EditUserForm, EditUserProfileForm
 from .models import UserProfile, User
+from .pagination import UserCursorPagination
 from .serializers import UserSerializer
 
 
@@ -15,7 +26,7 @@ def register_view(request):
         form = UserRegisterForm(request.POST)
         if form.is_valid():
             user = form.save()
-            UserProfile.objects.get_or_create(user=user)
+            UserProfile.objects.db_manager(hints={'instance': user}).get_or_create(user=user)
             login(request, user)
             messages.success(request, "Registration successful!")
             return redirect('profile')
@@ -75,8 +86,11 @@ def edit_profile_view(request):
 def delete_profile_view(request):
     if request.method == 'POST':
         user = request.user
+        # The account is closed at once; its data is purged by a background job
+        user.is_active = False
+        user.save(update_fields=['is_active'])
+        enqueue('purge_account', user)
         logout(request)
-        user.delete()
         messages.success(request, "Your account has been deleted.")
         return redirect(reverse_lazy('vbucks_tracker:home'))
 
@@ -84,10 +98,66 @@ def delete_profile_view(request):
         'title': 'Delete Account'
     })
 
-class UserListAPIView(generics.ListAPIView):
-    queryset = User.objects.all()
+def avatar_view(request, name):
+    """Serve an avatar thumbnail. Their names change with their content, so browsers keep them for a year."""
+    path = posixpath.normpath(f'{VARIANT_DIRECTORY}/{name}')
+    extension = path.rpartition('.')[2]
+    if not path.startswith(f'{VARIANT_DIRECTORY}/') or extension not in VARIANT_CONTENT_TYPES:
+        raise Http404
+    try:
+        file = default_storage.open(path)
+    except FileNotFoundError:
+        raise Http404
+    response = FileResponse(file, content_type=VARIANT_CONTENT_TYPES[extension])
+    response['Cache-Control'] = 'public, max-age=31536000, immutable'
+    return response
+
+
+class UserAPIQuerysetMixin:
     serializer_class = UserSerializer
 
-class UserDetailAPIView(generics.RetrieveAPIView):
-    queryset = User.objects.all()
-    serializer_class = UserSerializer
\ No newline at end of file
+    def get_queryset(self):
+        return select_tracker_related(User.objects.all(), 'profile')
+
+
+class UserListAPIView(ReplicaReadsMixin, UserAPIQuerysetMixin, generics.ListAPIView):
+    pagination_class = UserCursorPagination
+
+    def paginate_queryset(self, queryset):
+        page = super().paginate_queryset(queryset)
+        prefetch_tracker_related(page, 'profile')
+        # Balances come from the summary cache; uncached users cost one query (per shard) in total
+        summaries = VbucksService.get_user_summaries(page)
+        for user in page:
+            user.wallet_balance = summaries[user.pk]['balance']
+        return page
+
+
+class UserDetailAPIView(ReplicaReadsMixin, UserAPIQuerysetMixin, generics.RetrieveAPIView):
+    def get_queryset(self):
+        # The summary's version and updated_at validate the cached balance
+        return select_tracker_related(super().get_queryset(), 'wallet_summary')
+
+    def get_validators(self, user):
+        summary = getattr(user, 'wallet_summary', None)
+        profile = getattr(user, 'profile', None)
+        timestamps = [
+            stamp for stamp in (user.updated_at, getattr(profile, 'updated_at', None),
+                                getattr(summary, 'updated_at', None))
+            if stamp
+        ]
+        etag = wallet_etag(
+            self.request, user.pk, summary_cache.generation(), getattr(summary, 'version', None),
+            *timestamps, self.request.accepted_renderer.format,
+        )
+        return etag, max(timestamps, default=None)
+
+    def retrieve(self, request, *args, **kwargs):
+        user = self.get_object()
+        validators = self.get_validators(user) if allows_conditional(request) else None
+        if validators:
+            not_modified = conditional_response(request, *validators)
+            if not_modified is not None:
+                return not_modified
+        response = Response(self.get_serializer(user).data)
+        return set_validators(response, *validators) if validators else response
@@ -0,0 +1,19 @@
+"""
+Gunicorn settings for serving the project through ASGI.
+
+    gunicorn -c gunicorn.conf.py
+
+Uvicorn workers run the async dashboard and list views on an event loop
+(streamed exports are read from the sync thread in batches);
+set ``GUNICORN_APP=FortniteWallet.wsgi:application`` and
+``GUNICORN_WORKER_CLASS=sync`` to fall back to the WSGI handler.
+"""
+import multiprocessing
+import os
+
+wsgi_app = os.getenv('GUNICORN_APP', 'FortniteWallet.asgi:application')
+worker_class = os.getenv('GUNICORN_WORKER_CLASS', 'uvicorn_worker.UvicornWorker')
+bind = os.getenv('GUNICORN_BIND', f"0.0.0.0:{os.getenv('PORT', '8000')}")
+workers = int(os.getenv('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+keepalive = 5
+timeout = 60
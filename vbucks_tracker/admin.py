@@ -1,16 +1,105 @@
+from django.conf import settings
 from django.contrib import admin
+from django.core.exceptions import PermissionDenied
+from django.db import DEFAULT_DB_ALIAS, IntegrityError, transaction
+from django.db.models import Q
+from django.http import HttpResponse, QueryDict
+from django.shortcuts import get_object_or_404
+from django.urls import path, reverse
+from django.utils import timezone
 from django.utils.html import format_html
-from .models import RealMoneyTransaction, VbucksEarning, VbucksSpending, Refund
+from accounts.models import User
+from .models import (
+    RealMoneyTransaction, VbucksEarning, VbucksSpending, Refund, WalletSummary, WalletRollup, FxRate,
+    RequestProfile, Job, LedgerEntry,
+)
+from .pagination import EstimatedCountPaginator
+from .routers import SHARDED_MODELS, sharding_enabled
+from .search import search_backend, search_terms
 
 
-class RealMoneyTransactionAdmin(admin.ModelAdmin):
+class ShardListFilter(admin.SimpleListFilter):
+    """Picks the shard a ShardedAdminMixin admin works on (there is no "all shards")"""
+    title = 'shard'
+    parameter_name = 'shard'
+
+    def lookups(self, request, model_admin):
+        return [(alias, alias) for alias in settings.SHARD_DATABASES]
+
+    def queryset(self, request, queryset):
+        return queryset  # get_queryset() already ran it on the shard
+
+    def choices(self, changelist):
+        selected = self.value() or DEFAULT_DB_ALIAS
+        for lookup, title in self.lookup_choices:
+            yield {
+                'selected': selected == lookup,
+                'query_string': changelist.get_query_string({self.parameter_name: lookup}),
+                'display': title,
+            }
+
+
+class ShardedAdminMixin:
+    """
+    Admin for a model kept on the users' shards: lists, edits and deletes the
+    rows of one shard at a time, picked with the shard filter (the default
+    database unless chosen). Changes stay on the row's shard.
+    """
+
+    def get_shard(self, request):
+        alias = request.GET.get('shard') or QueryDict(request.GET.get('_changelist_filters', '')).get('shard')
+        return alias if alias in settings.SHARD_DATABASES else DEFAULT_DB_ALIAS
+
+    def get_list_filter(self, request):
+        list_filter = super().get_list_filter(request)
+        return (ShardListFilter, *list_filter) if sharding_enabled() else list_filter
+
+    def get_queryset(self, request):
+        queryset = super().get_queryset(request)
+        return queryset.using(self.get_shard(request)) if sharding_enabled() else queryset
+
+    def formfield_for_foreignkey(self, db_field, request, **kwargs):
+        if sharding_enabled() and db_field.related_model._meta.label_lower in SHARDED_MODELS:
+            kwargs.setdefault('using', self.get_shard(request))
+        return super().formfield_for_foreignkey(db_field, request, **kwargs)
+
+
+class FullTextSearchMixin:
+    """
+    Admin search through the full-text index instead of ``icontains`` scans.
+
+    A search for exactly a username lists that user's rows; anything else
+    matches words by prefix in the ``search_kind`` documents.
+    """
+    search_kind = None
+    search_help_text = "Words in names and notes (prefixes match), or an exact username."
+
+    def get_search_condition(self, backend, terms):
+        model = self.model._default_manager.using(backend.using)
+        return Q(pk__in=backend.filter(model.all(), self.search_kind, terms).values('pk'))
+
+    def get_search_results(self, request, queryset, search_term):
+        term = search_term.strip()
+        terms = search_terms(term)
+        if not terms:
+            return queryset, False
+        if User.objects.using(queryset.db).filter(username=term).exists():
+            return queryset.filter(user__username=term), False
+        return queryset.filter(self.get_search_condition(search_backend(queryset.db), terms)), False
+
+
+class RealMoneyTransactionAdmin(ShardedAdminMixin, FullTextSearchMixin, admin.ModelAdmin):
     list_display = ('user', 'transaction_summary', 'amount_with_currency', 'vbucks_earned', 'date')
     list_filter = ('category', 'currency', 'date')
-    search_fields = ('user__username', 'source_name')
+    search_fields = ('user__username', 'source_name', 'notes')
+    search_kind = 'transaction'
     ordering = ('-date',)
+    readonly_fields = ('amount_base',)
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
     fieldsets = (
         ('Transaction', {'fields': ('user', 'category', 'source_name')}),
-        ('Financials', {'fields': ('amount', 'currency', 'vbucks_earned'), 'classes': ('collapse',)}),
+        ('Financials', {'fields': ('amount', 'currency', 'amount_base', 'vbucks_earned'), 'classes': ('collapse',)}),
         ('Metadata', {'fields': ('date', 'notes')})
     )
 
@@ -24,10 +113,11 @@ class RealMoneyTransactionAdmin(admin.ModelAdmin):
     amount_with_currency.short_description = "Amount"
 
 
-class VbucksEarningAdmin(admin.ModelAdmin):
+class VbucksEarningAdmin(ShardedAdminMixin, FullTextSearchMixin, admin.ModelAdmin):
     list_display = ('user', 'earning_type', 'amount', 'date', 'earning_name')
     list_filter = ('type', 'date')
     search_fields = ('user__username', 'earning_name')
+    search_kind = 'earning'
     list_editable = ('amount',)
 
     def earning_type(self, obj):
@@ -36,30 +126,175 @@ class VbucksEarningAdmin(admin.ModelAdmin):
     earning_type.short_description = "Type"
 
 
-class VbucksSpendingAdmin(admin.ModelAdmin):
+class VbucksSpendingAdmin(ShardedAdminMixin, FullTextSearchMixin, admin.ModelAdmin):
     list_display = ('user', 'item_name', 'category', 'vbucks_spent', 'date', 'refunded')
     list_filter = ('category', 'refunded', 'date')
     search_fields = ('user__username', 'item_name')
+    search_kind = 'spending'
     list_editable = ('vbucks_spent', 'refunded')
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
 
 
-class RefundAdmin(admin.ModelAdmin):
+class RefundAdmin(ShardedAdminMixin, FullTextSearchMixin, admin.ModelAdmin):
     list_display = ('user', 'purchase_link', 'vbucks_returned', 'refund_date', 'reason')
     list_filter = ('reason', 'refund_date')
-    search_fields = ('user__username', 'original_purchase__item_name')
+    search_fields = ('user__username', 'original_purchase__item_name', 'notes')
+    search_kind = 'refund'
     raw_id_fields = ('original_purchase',)
+    list_select_related = ('user', 'original_purchase')
+
+    def get_search_condition(self, backend, terms):
+        # The refunded item's name lives in the purchase's document
+        purchases = backend.filter(VbucksSpending.objects.using(backend.using), 'spending', terms)
+        return super().get_search_condition(backend, terms) | Q(original_purchase__in=purchases.values('pk'))
 
     def purchase_link(self, obj):
+        url = reverse('admin:vbucks_tracker_vbucksspending_change', args=[obj.original_purchase_id])
+        if sharding_enabled():
+            url += f'?shard={obj._state.db}'
+        return format_html('<a href="{}">{}</a>', url, obj.original_purchase.item_name)
+
+    purchase_link.short_description = "Original Purchase"
+
+
+class WalletSummaryAdmin(ShardedAdminMixin, admin.ModelAdmin):
+    list_display = ('user', 'balance', 'purchased', 'earned', 'spent', 'refunded', 'version')
+    search_fields = ('user__username',)
+    list_select_related = ('user',)
+    readonly_fields = ('user', 'purchased', 'earned', 'spent', 'refunded', 'balance', 'version')
+
+    def has_add_permission(self, request):
+        return False
+
+
+class WalletRollupAdmin(ShardedAdminMixin, admin.ModelAdmin):
+    list_display = ('user', 'source', 'period', 'period_start', 'category', 'vbucks', 'amount_base', 'entries')
+    list_filter = ('source', 'period')
+    search_fields = ('user__username',)
+    list_select_related = ('user',)
+    date_hierarchy = 'period_start'
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    readonly_fields = list_display
+
+    def has_add_permission(self, request):
+        return False
+
+
+class LedgerEntryAdmin(ShardedAdminMixin, admin.ModelAdmin):
+    list_display = ('user', 'date', 'seq', 'source', 'source_id', 'delta', 'balance', 'created_at')
+    list_filter = ('source',)
+    search_fields = ('user__username',)
+    list_select_related = ('user',)
+    date_hierarchy = 'date'
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    readonly_fields = list_display
+
+    # Append-only: entries are written by the tracker models, and corrected by new entries
+    def has_add_permission(self, request):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+class FxRateAdmin(admin.ModelAdmin):
+    list_display = ('currency', 'date', 'rate')
+    list_filter = ('currency',)
+    date_hierarchy = 'date'
+
+
+class RequestProfileAdmin(admin.ModelAdmin):
+    list_display = ('created_at', 'method', 'path', 'status_code', 'duration_ms', 'query_count', 'user', 'download_link')
+    list_filter = ('method', 'status_code')
+    search_fields = ('path', 'user__username')
+    list_select_related = ('user',)
+    date_hierarchy = 'created_at'
+    readonly_fields = (
+        'created_at', 'user', 'method', 'path', 'status_code', 'duration_ms', 'query_count', 'query_ms',
+        'download_link', 'summary_text',
+    )
+    exclude = ('summary', 'stats')
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).defer('stats')
+
+    def has_add_permission(self, request):
+        return False
+
+    def get_urls(self):
+        return [
+            path(
+                '<int:object_id>/download/',
+                self.admin_site.admin_view(self.download_view),
+                name='vbucks_tracker_requestprofile_download',
+            ),
+        ] + super().get_urls()
+
+    def download_view(self, request, object_id):
+        profile = get_object_or_404(RequestProfile, pk=object_id)
+        if not self.has_view_permission(request, profile):
+            raise PermissionDenied
+        response = HttpResponse(bytes(profile.stats), content_type='application/octet-stream')
+        response['Content-Disposition'] = f'attachment; filename="request-profile-{profile.pk}.prof"'
+        return response
+
+    def download_link(self, obj):
         return format_html(
-            '<a href="{}">{}</a>',
-            f'/admin/vbucks_tracker/vbucksspending/{obj.original_purchase.id}/change/',
-            obj.original_purchase.item_name
+            '<a href="{}">.prof</a>', reverse('admin:vbucks_tracker_requestprofile_download', args=[obj.pk])
         )
 
-    purchase_link.short_description = "Original Purchase"
+    def summary_text(self, obj):
+        return format_html('<pre>{}</pre>', obj.summary)
+
+    download_link.short_description = "Download"
+    summary_text.short_description = "Top functions"
+
+
+class JobAdmin(admin.ModelAdmin):
+    list_display = ('pk', 'kind', 'user_id', 'status', 'progress', 'attempts', 'created_at', 'finished_at')
+    list_filter = ('status', 'kind')
+    search_fields = ('=user_id', 'worker')
+    date_hierarchy = 'created_at'
+    actions = ('retry_jobs',)
+    readonly_fields = (
+        'kind', 'user_id', 'payload', 'status', 'attempts', 'max_attempts', 'run_after', 'progress',
+        'progress_message', 'result', 'worker', 'heartbeat_at', 'created_at', 'started_at', 'finished_at',
+        'error_text',
+    )
+    exclude = ('user', 'error')
+
+    def has_add_permission(self, request):
+        return False
+
+    @admin.action(description="Retry the selected failed jobs", permissions=['change'])
+    def retry_jobs(self, request, queryset):
+        retried = 0
+        for job in queryset.filter(status=Job.FAILED):
+            try:
+                with transaction.atomic():
+                    retried += Job.objects.filter(pk=job.pk, status=Job.FAILED).update(
+                        status=Job.QUEUED, run_after=timezone.now(), max_attempts=job.attempts + 1, finished_at=None
+                    )
+            except IntegrityError:
+                pass  # the user already has one of these queued
+        self.message_user(request, f"Queued {retried} jobs again.")
+
+    def error_text(self, obj):
+        return format_html('<pre>{}</pre>', obj.error)
+
+    error_text.short_description = "Error"
 
 
 admin.site.register(RealMoneyTransaction, RealMoneyTransactionAdmin)
 admin.site.register(VbucksEarning, VbucksEarningAdmin)
 admin.site.register(VbucksSpending, VbucksSpendingAdmin)
-admin.site.register(Refund, RefundAdmin)
\ No newline at end of file
+admin.site.register(Refund, RefundAdmin)
+admin.site.register(WalletSummary, WalletSummaryAdmin)
+admin.site.register(WalletRollup, WalletRollupAdmin)
+admin.site.register(LedgerEntry, LedgerEntryAdmin)
+admin.site.register(FxRate, FxRateAdmin)
+admin.site.register(RequestProfile, RequestProfileAdmin)
+admin.site.register(Job, JobAdmin)
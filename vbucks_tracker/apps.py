@@ -3,4 +3,11 @@ from django.apps import AppConfig
 
 class VbucksTrackerConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
-    name = 'vbucks_tracker'
\ No newline at end of file
+    name = 'vbucks_tracker'
+
+    def ready(self):
+        from django.db.backends.signals import connection_created
+        from .signals import connect_wallet_signals
+        from .sqlite import configure_connection
+        connect_wallet_signals()
+        connection_created.connect(configure_connection, dispatch_uid='vbucks_tracker.sqlite.configure')
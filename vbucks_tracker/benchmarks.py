@@ -0,0 +1,289 @@
+import json
+import math
+import platform
+import time
+import tracemalloc
+from datetime import date, datetime, timezone as dt_timezone
+from asgiref.sync import async_to_sync, sync_to_async
+from django import get_version
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import Count, Q
+from django.test import AsyncClient, Client
+from django.urls import reverse
+from rest_framework_simplejwt.tokens import RefreshToken
+from accounts.models import User
+from .cache import summary_cache
+from .instrumentation import QueryRecorder
+from .models import VbucksSpending
+from .synthetic import SyntheticWalletGenerator
+
+# name -> SyntheticWalletGenerator options; every dataset starts from an empty database
+DATASETS = {
+    'small': {'users': 20, 'rows_per_user': 20},
+    'medium': {'users': 200, 'rows_per_user': 60},
+    'large': {'users': 1000, 'rows_per_user': 200},
+}
+BENCHMARK_PASSWORD = 'benchmark-password-1'
+BENCHMARK_END_DATE = date(2025, 6, 30)
+WARMUP_REQUESTS = 3
+PROFILED_REQUESTS = 3
+
+METRICS = ('p50_ms', 'p95_ms', 'p99_ms', 'queries', 'peak_memory_kib')
+# Allowed relative increase before a metric counts as a regression
+DEFAULT_THRESHOLDS = {'p50_ms': 0.25, 'p95_ms': 0.25, 'p99_ms': 0.5, 'queries': 0.0, 'peak_memory_kib': 0.25}
+# Absolute increases at or below these are noise, whatever the relative change
+NOISE_FLOORS = {'p50_ms': 1.0, 'p95_ms': 2.0, 'p99_ms': 5.0, 'queries': 0, 'peak_memory_kib': 64}
+
+
+class BenchmarkError(RuntimeError):
+    pass
+
+
+class BenchmarkContext:
+    """The user a dataset is benchmarked as, plus state the scenarios draw on"""
+
+    def __init__(self, user):
+        self.user = user
+        self.access_token = str(RefreshToken.for_user(user).access_token)
+        self.refundable = iter(())
+
+    def reserve_refundable(self, count):
+        """Make sure ``count`` unrefunded purchases are available for refund_create"""
+        spendings = VbucksSpending.objects.filter(user=self.user, refunded=False).order_by('pk')
+        for index in range(count - spendings.count()):
+            VbucksSpending.objects.create(
+                user=self.user, item_name=f'Benchmark item {index}', category='EMOTE',
+                vbucks_spent=200, date=BENCHMARK_END_DATE,
+            )
+        self.refundable = iter(list(spendings.values_list('pk', flat=True)[:count]))
+
+
+def _api_request(context):
+    return {'headers': {'Authorization': f'Bearer {context.access_token}'}}
+
+
+def _refund_request(context):
+    return {'data': {'original_purchase': next(context.refundable), 'reason': 'ACCIDENTAL'}}
+
+
+def _token_request(context):
+    return {
+        'data': {'username': context.user.username, 'password': BENCHMARK_PASSWORD},
+        'content_type': 'application/json',
+    }
+
+
+# (name, method, URL name, request kwargs builder, expected status, share of --requests)
+SCENARIOS = (
+    ('dashboard', 'get', 'vbucks_tracker:home', None, 200, 1),
+    ('transaction_list', 'get', 'vbucks_tracker:transaction-list', None, 200, 1),
+    ('earning_list', 'get', 'vbucks_tracker:vbucksearning-list', None, 200, 1),
+    ('spending_list', 'get', 'vbucks_tracker:vbucks-spending-list', None, 200, 1),
+    ('refund_list', 'get', 'vbucks_tracker:refund-list', None, 200, 1),
+    ('gifted_spendings', 'get', 'vbucks_tracker:vbucks-spending-gifted', None, 200, 1),
+    ('refund_create', 'post', 'vbucks_tracker:refund-create', _refund_request, 302, 1),
+    ('api_users', 'get', 'user-list', _api_request, 200, 1),
+    # Password hashing makes each token request slow on purpose; fewer samples suffice
+    ('api_token', 'post', 'token_obtain_pair', _token_request, 200, 0.1),
+)
+HANDLERS = ('wsgi', 'asgi')
+
+
+def percentile(sorted_values, percent):
+    """Nearest-rank percentile of an already sorted list"""
+    rank = max(1, math.ceil(percent / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def summarize(latencies, queries, peak_memory):
+    latencies = sorted(latencies)
+    return {
+        'requests': len(latencies),
+        'p50_ms': round(percentile(latencies, 50) * 1000, 3),
+        'p95_ms': round(percentile(latencies, 95) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 3),
+        'queries': round(sum(queries) / len(queries), 2),
+        'peak_memory_kib': round(max(peak_memory) / 1024, 1),
+    }
+
+
+class ScenarioRunner:
+    """
+    Time one scenario through one handler.
+
+    Latencies come from uninstrumented requests; query counts and the
+    tracemalloc peak come from a few separate profiled requests, so the
+    instrumentation doesn't skew the timings.
+    """
+
+    def __init__(self, context, scenario, requests):
+        self.context = context
+        self.name, self.method, url_name, self.build, self.status, _ = scenario
+        self.path = reverse(url_name)
+        self.requests = requests
+
+    def request_kwargs(self):
+        return self.build(self.context) if self.build else {}
+
+    def check(self, response):
+        if response.status_code != self.status:
+            raise BenchmarkError(
+                f'{self.name}: {self.method.upper()} {self.path} returned HTTP '
+                f'{response.status_code}, expected {self.status}'
+            )
+
+    def profile_start(self):
+        recorder = QueryRecorder().__enter__()
+        tracemalloc.start()
+        return recorder
+
+    def profile_stop(self, recorder, queries, peak_memory):
+        peak_memory.append(tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+        recorder.__exit__(None, None, None)
+        queries.append(recorder.count)
+
+    def run_wsgi(self):
+        client = Client()
+        client.force_login(self.context.user)
+        send = getattr(client, self.method)
+        for _ in range(WARMUP_REQUESTS):
+            self.check(send(self.path, **self.request_kwargs()))
+
+        latencies = []
+        for _ in range(self.requests):
+            kwargs = self.request_kwargs()
+            started = time.perf_counter()
+            response = send(self.path, **kwargs)
+            latencies.append(time.perf_counter() - started)
+            self.check(response)
+
+        queries, peak_memory = [], []
+        for _ in range(PROFILED_REQUESTS):
+            kwargs = self.request_kwargs()
+            recorder = self.profile_start()
+            response = send(self.path, **kwargs)
+            self.profile_stop(recorder, queries, peak_memory)
+            self.check(response)
+        return summarize(latencies, queries, peak_memory)
+
+    async def run_asgi(self):
+        # Database connections are per thread and the handler's ORM calls run
+        # in the thread-sensitive executor, so the recorder is entered there too.
+        client = AsyncClient()
+        await client.aforce_login(self.context.user)
+        send = getattr(client, self.method)
+        for _ in range(WARMUP_REQUESTS):
+            self.check(await send(self.path, **self.request_kwargs()))
+
+        latencies = []
+        for _ in range(self.requests):
+            kwargs = self.request_kwargs()
+            started = time.perf_counter()
+            response = await send(self.path, **kwargs)
+            latencies.append(time.perf_counter() - started)
+            self.check(response)
+
+        queries, peak_memory = [], []
+        for _ in range(PROFILED_REQUESTS):
+            kwargs = self.request_kwargs()
+            recorder = await sync_to_async(self.profile_start)()
+            response = await send(self.path, **kwargs)
+            await sync_to_async(self.profile_stop)(recorder, queries, peak_memory)
+            self.check(response)
+        return summarize(latencies, queries, peak_memory)
+
+    def run(self, handler):
+        if handler == 'wsgi':
+            return self.run_wsgi()
+        return async_to_sync(self.run_asgi)()
+
+
+def seed_dataset(name, options, seed):
+    """Empty the database and generate dataset ``name``; return the user to benchmark as"""
+    call_command('flush', interactive=False, verbosity=0)
+    summary_cache.bump_all()
+    options = dict(options)
+    users = options.pop('users')
+    generator = SyntheticWalletGenerator(
+        seed=seed, end_date=BENCHMARK_END_DATE, prefix=f'bench_{name}_',
+        password=BENCHMARK_PASSWORD, **options
+    )
+    generator.run(users)
+    # The busiest user has the longest lists and the most rollup buckets
+    return (
+        User.objects.annotate(spendings=Count('vbucks_spendings', filter=Q(vbucks_spendings__refunded=False)))
+        .order_by('-spendings', 'pk')
+        .first()
+    )
+
+
+def run_suite(datasets, requests=50, seed=0, scenarios=None, handlers=HANDLERS, progress=None):
+    """
+    Benchmark every scenario through every handler against each dataset.
+
+    ``datasets`` maps names to SyntheticWalletGenerator options (see
+    DATASETS). Returns the JSON-serializable results document.
+    """
+    selected = [scenario for scenario in SCENARIOS if not scenarios or scenario[0] in scenarios]
+    results = {}
+    for dataset, options in datasets.items():
+        context = BenchmarkContext(seed_dataset(dataset, options, seed))
+        for scenario in selected:
+            scenario_requests = max(3, round(requests * scenario[-1]))
+            if scenario[0] == 'refund_create':
+                context.reserve_refundable(
+                    len(handlers) * (WARMUP_REQUESTS + scenario_requests + PROFILED_REQUESTS)
+                )
+            runner = ScenarioRunner(context, scenario, scenario_requests)
+            for handler in handlers:
+                key = f'{dataset}/{scenario[0]}/{handler}'
+                results[key] = runner.run(handler)
+                if progress:
+                    progress(key, results[key])
+
+    return {
+        'meta': {
+            'created': datetime.now(dt_timezone.utc).isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'django': get_version(),
+            'database': connection.vendor,
+            'requests': requests,
+            'seed': seed,
+            'datasets': datasets,
+        },
+        'results': results,
+    }
+
+
+def compare_results(baseline, current, thresholds=None):
+    """
+    Return ``[(key, metric, baseline, current, change)]`` for every metric that
+    regressed past its threshold; keys missing from either run are skipped
+    """
+    thresholds = {**DEFAULT_THRESHOLDS, **(thresholds or {})}
+    regressions = []
+    for key, metrics in current['results'].items():
+        before = baseline['results'].get(key)
+        if before is None:
+            continue
+        for metric, threshold in thresholds.items():
+            old, new = before.get(metric), metrics.get(metric)
+            if old is None or new is None:
+                continue
+            if new - old > NOISE_FLOORS.get(metric, 0) and new > old * (1 + threshold):
+                change = (new - old) / old if old else math.inf
+                regressions.append((key, metric, old, new, change))
+    return regressions
+
+
+def load_results(path):
+    with open(path, encoding='utf-8') as results_file:
+        return json.load(results_file)
+
+
+def save_results(results, path):
+    with open(path, 'w', encoding='utf-8') as results_file:
+        json.dump(results, results_file, indent=2, sort_keys=True)
+        results_file.write('\n')
@@ -0,0 +1,156 @@
+import threading
+import time
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from .routers import current_shard
+
+
+class SummaryCache:
+    """
+    Versioned cache of per-user wallet summaries.
+
+    Entries are keyed by ``(generation, user_id, version)``. Writes to a
+    user's tracker data bump the user's version, and anything that changes
+    every summary at once (new FX rates) bumps the global generation, so stale
+    entries are never read again and simply age out through the backend's
+    TIMEOUT and MAX_ENTRIES culling. Works with any Django cache backend.
+    Hit/miss counters are kept per process.
+    """
+    GENERATION_KEY = 'wallet-summary:generation'
+
+    def __init__(self, alias=None, timeout=None):
+        self._alias = alias
+        self._timeout = timeout
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def cache(self):
+        return caches[self._alias or settings.WALLET_SUMMARY_CACHE]
+
+    @property
+    def timeout(self):
+        return self._timeout if self._timeout is not None else settings.WALLET_SUMMARY_CACHE_TIMEOUT
+
+    @staticmethod
+    def version_key(user_id):
+        return f'wallet-summary:version:{user_id}'
+
+    @staticmethod
+    def entry_key(generation, user_id, version):
+        return f'wallet-summary:{generation}:{user_id}:{version}'
+
+    def _counter_keys(self, user_ids):
+        return [self.GENERATION_KEY, *(self.version_key(user_id) for user_id in user_ids)]
+
+    def _resolve_keys(self, user_ids, counters):
+        """
+        Return the users' entry keys and the counters that need initializing.
+
+        A counter that was evicted restarts from the clock, so it can't
+        collide with entries written under its earlier values.
+        """
+        missing = {key: time.time_ns() for key in self._counter_keys(user_ids) if key not in counters}
+        counters = {**counters, **missing}
+        generation = counters[self.GENERATION_KEY]
+        keys = {
+            user_id: self.entry_key(generation, user_id, counters[self.version_key(user_id)])
+            for user_id in user_ids
+        }
+        return keys, missing
+
+    def _count(self, hits, misses):
+        with self._lock:
+            self.hits += hits
+            self.misses += misses
+
+    def get_many(self, user_ids, compute):
+        """
+        Return ``{user_id: summary}``, calling ``compute(missing_ids)`` once for
+        the users without a fresh entry
+        """
+        user_ids = list(dict.fromkeys(user_ids))
+        if not user_ids:
+            return {}
+        keys, missing_counters = self._resolve_keys(
+            user_ids, self.cache.get_many(self._counter_keys(user_ids))
+        )
+        if missing_counters:
+            self.cache.set_many(missing_counters, timeout=None)
+        cached = self.cache.get_many(keys.values())
+        summaries = {user_id: cached[key] for user_id, key in keys.items() if key in cached}
+        missing = [user_id for user_id in user_ids if user_id not in summaries]
+        self._count(len(summaries), len(missing))
+        if missing:
+            computed = compute(missing)
+            self.cache.set_many({keys[user_id]: computed[user_id] for user_id in missing}, self.timeout)
+            summaries.update(computed)
+        return summaries
+
+    def get(self, user_id, compute):
+        return self.get_many([user_id], lambda missing: {user_id: compute()})[user_id]
+
+    async def aget(self, user_id, compute):
+        """Async variant of get(); ``compute`` is a coroutine function"""
+        keys, missing_counters = self._resolve_keys(
+            [user_id], await self.cache.aget_many(self._counter_keys([user_id]))
+        )
+        key = keys[user_id]
+        if missing_counters:
+            await self.cache.aset_many(missing_counters, timeout=None)
+        else:
+            summary = await self.cache.aget(key)
+            if summary is not None:
+                self._count(1, 0)
+                return summary
+        self._count(0, 1)
+        summary = await compute()
+        await self.cache.aset(key, summary, self.timeout)
+        return summary
+
+    def generation(self):
+        """The current global generation; changes whenever bump_all() runs"""
+        self.cache.add(self.GENERATION_KEY, time.time_ns(), timeout=None)
+        return self.cache.get(self.GENERATION_KEY)
+
+    async def ageneration(self):
+        await self.cache.aadd(self.GENERATION_KEY, time.time_ns(), timeout=None)
+        return await self.cache.aget(self.GENERATION_KEY)
+
+    def bump(self, user_id):
+        """Invalidate the user's summary now and again once the transaction (on their shard) commits"""
+        self._bump_version(user_id)
+        transaction.on_commit(lambda: self._bump_version(user_id), using=current_shard())
+
+    def _bump_version(self, user_id):
+        key = self.version_key(user_id)
+        try:
+            self.cache.incr(key)
+        except ValueError:
+            self.cache.set(key, time.time_ns(), timeout=None)
+
+    def reset(self, user_id):
+        """Start a fresh version sequence, e.g. for a new user reusing a deleted user's id"""
+        self.cache.set(self.version_key(user_id), time.time_ns(), timeout=None)
+
+    def bump_all(self):
+        """Invalidate every user's summary"""
+        self.cache.set(self.GENERATION_KEY, time.time_ns(), timeout=None)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else None,
+            }
+
+    def reset_stats(self):
+        with self._lock:
+            self.hits = self.misses = 0
+
+
+summary_cache = SummaryCache()
@@ -0,0 +1,49 @@
+import hashlib
+from django.conf import settings
+from django.contrib.messages import get_messages
+from django.middleware.csrf import get_token
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
+
+
+def wallet_etag(request, *parts, forms=False):
+    """
+    Strong ETag for a response built from ``parts`` (data versions, ids).
+
+    Also covers the release salt and the CSRF secret that rendered forms
+    embed, so a deploy or a new session never revalidates an old page. Pass
+    ``forms=True`` for pages that embed a CSRF token; the secret is created
+    here when the client has none yet, as rendering would do.
+    """
+    if forms:
+        get_token(request)
+    key = ':'.join(str(part) for part in (
+        settings.RESPONSE_ETAG_SALT, request.META.get('CSRF_COOKIE', ''), *parts
+    ))
+    return quote_etag(hashlib.sha256(key.encode()).hexdigest()[:32])
+
+
+def allows_conditional(request):
+    """Only plain reads without flash messages waiting to be shown may be answered with a 304"""
+    if request.method not in ('GET', 'HEAD'):
+        return False
+    return not (hasattr(request, '_messages') and len(get_messages(request)))
+
+
+def conditional_response(request, etag, last_modified=None):
+    """Return a 304 Not Modified when the client's copy is current, otherwise None"""
+    response = get_conditional_response(
+        request, etag=etag, last_modified=int(last_modified.timestamp()) if last_modified else None
+    )
+    if response is not None:
+        set_validators(response, etag, last_modified)
+    return response
+
+
+def set_validators(response, etag, last_modified=None):
+    """Attach ETag/Last-Modified and make browsers revalidate the private copy on every use"""
+    response.headers['ETag'] = etag
+    if last_modified:
+        response.headers['Last-Modified'] = http_date(last_modified.timestamp())
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
@@ -0,0 +1,91 @@
+# Account deletion benchmark: purge_user on one heavy account against Django's
+# cascading delete, which loads every related row (and sends a post_delete
+# signal for each) before deleting them all in one transaction.
+import time
+import tracemalloc
+from django.db.models.deletion import Collector
+from accounts.models import User
+from .benchmarks import BENCHMARK_END_DATE
+from .jobs import PURGE_CHUNK_SIZE, purge_user
+from .ledger import rebuild_user_ledger
+from .synthetic import SyntheticWalletGenerator
+
+
+def seed_heavy_user(generator, rows):
+    """Create a user with a profile, about ``rows`` tracker rows and their ledger"""
+    generator.run(1)
+    user = User.objects.get(username=generator.username(generator.next_index - 1))
+    generator.fill_user(user, rows)
+    rebuild_user_ledger(user)
+    return user
+
+
+def tracked_rows(user):
+    return sum(
+        getattr(user, name).count()
+        for name in ('real_money_transactions', 'vbucks_earnings', 'vbucks_spendings', 'refunds')
+    )
+
+
+def result(rows, seconds, longest_write, peak_memory):
+    return {
+        'rows': rows,
+        'seconds': round(seconds, 3),
+        'rows_per_s': round(rows / seconds) if seconds else 0,
+        'longest_write_ms': round(longest_write * 1000, 1),
+        'peak_memory_mib': round(peak_memory / 2 ** 20, 2),
+    }
+
+
+def benchmark_purge(user, chunk_size):
+    writes = []
+
+    def on_chunk(model, deleted, seconds):
+        writes.append(seconds)
+
+    rows = tracked_rows(user)
+    tracemalloc.start()
+    started = time.perf_counter()
+    try:
+        purge_user(user, chunk_size, on_chunk)
+        seconds = time.perf_counter() - started
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return result(rows, seconds, max(writes, default=0), peak)
+
+
+def benchmark_cascade(user):
+    # What user.delete() does, timed in its two phases
+    rows = tracked_rows(user)
+    tracemalloc.start()
+    started = time.perf_counter()
+    try:
+        collector = Collector(using=user._state.db, origin=user)
+        collector.collect([user])
+        collected = time.perf_counter()
+        collector.delete()
+        seconds = time.perf_counter() - started
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return result(rows, seconds, seconds - (collected - started), peak)
+
+
+def run_deletion_benchmark(rows, chunk_size=PURGE_CHUNK_SIZE, cascade=False, seed=0, progress=None):
+    """
+    Delete a user with about ``rows`` tracker rows with purge_user and, with
+    ``cascade``, another one with Django's cascade. Returns ``{method:
+    metrics}``; ``progress(message)`` is called between steps.
+    """
+    generator = SyntheticWalletGenerator(seed=seed, prefix='deletion_benchmark_', end_date=BENCHMARK_END_DATE)
+    methods = {'purge': lambda user: benchmark_purge(user, chunk_size)}
+    if cascade:
+        methods['cascade'] = benchmark_cascade
+    results = {}
+    for method, benchmark in methods.items():
+        if progress:
+            progress(f'Seeding a user with {rows} rows for {method}...')
+        user = seed_heavy_user(generator, rows)
+        results[method] = benchmark(user)
+    return results
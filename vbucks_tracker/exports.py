@@ -0,0 +1,97 @@
+import csv
+import zlib
+from django.core.serializers.json import DjangoJSONEncoder
+from .models import RealMoneyTransaction, VbucksEarning, VbucksSpending, Refund
+
+EXPORT_CHUNK_SIZE = 2000
+GZIP_FLUSH_BYTES = 64 * 1024
+
+# dataset name -> (model, exported columns)
+EXPORT_DATASETS = {
+    'transactions': (RealMoneyTransaction, (
+        'id', 'date', 'category', 'source_name', 'amount', 'currency', 'vbucks_earned', 'notes'
+    )),
+    'earnings': (VbucksEarning, ('id', 'date', 'type', 'earning_name', 'amount')),
+    'spendings': (VbucksSpending, ('id', 'date', 'category', 'item_name', 'vbucks_spent', 'refunded')),
+    'refunds': (Refund, (
+        'id', 'refund_date', 'original_purchase_id', 'vbucks_returned', 'reason', 'notes'
+    )),
+}
+EXPORT_FORMATS = {
+    'csv': 'text/csv',
+    'jsonl': 'application/x-ndjson',
+}
+
+
+class _Echo:
+    """File-like object whose write() hands the formatted line straight back"""
+
+    def write(self, value):
+        return value
+
+
+def iter_dataset_rows(user, dataset, chunk_size=EXPORT_CHUNK_SIZE):
+    """Yield the user's rows of ``dataset`` as tuples, streamed from a server-side cursor"""
+    model, columns = EXPORT_DATASETS[dataset]
+    # Streamed after the view returns, so routed by the user hint rather than the request
+    return (
+        model.objects.db_manager(hints={'instance': user}).filter(user=user)
+        .order_by('pk')
+        .values_list(*columns)
+        .iterator(chunk_size=chunk_size)
+    )
+
+
+def iter_csv(user, dataset, chunk_size=EXPORT_CHUNK_SIZE):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(EXPORT_DATASETS[dataset][1])
+    for row in iter_dataset_rows(user, dataset, chunk_size):
+        yield writer.writerow(row)
+
+
+def iter_jsonl(user, datasets, chunk_size=EXPORT_CHUNK_SIZE):
+    encoder = DjangoJSONEncoder(ensure_ascii=False)
+    for dataset in datasets:
+        columns = EXPORT_DATASETS[dataset][1]
+        for row in iter_dataset_rows(user, dataset, chunk_size):
+            record = {'dataset': dataset, **dict(zip(columns, row))}
+            yield encoder.encode(record) + '\n'
+
+
+def gzip_stream(chunks):
+    """Gzip an iterable of strings on the fly, flushing roughly every 64 KB"""
+    compressor = zlib.compressobj(wbits=31)  # 31 = gzip container
+    buffered = []
+    size = 0
+    for chunk in chunks:
+        data = chunk.encode()
+        buffered.append(data)
+        size += len(data)
+        if size >= GZIP_FLUSH_BYTES:
+            yield compressor.compress(b''.join(buffered))
+            buffered, size = [], 0
+    yield compressor.compress(b''.join(buffered)) + compressor.flush()
+
+
+def iter_export(user, export_format, datasets, compress=False, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Stream a user's wallet history.
+
+    CSV holds a single dataset; JSONL can interleave several, tagging each
+    line with its ``dataset``. Yields ``str`` chunks, or ``bytes`` when
+    ``compress`` is set.
+    """
+    if export_format == 'csv':
+        if len(datasets) != 1:
+            raise ValueError("CSV exports hold exactly one dataset")
+        chunks = iter_csv(user, datasets[0], chunk_size)
+    elif export_format == 'jsonl':
+        chunks = iter_jsonl(user, datasets, chunk_size)
+    else:
+        raise ValueError(f"Unknown export format: {export_format}")
+    return gzip_stream(chunks) if compress else chunks
+
+
+def export_filename(dataset, export_format, compress=False, stamp=''):
+    name = f"vbucks-{dataset}{f'-{stamp}' if stamp else ''}.{export_format}"
+    return f'{name}.gz' if compress else name
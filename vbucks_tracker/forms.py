@@ -1,7 +1,10 @@
 from django import forms
-from .models import RealMoneyTransaction, VbucksEarning, VbucksSpending, Refund
+from .models import RealMoneyTransaction, VbucksEarning, VbucksSpending, Refund, WalletRollup
 from django.core.exceptions import ValidationError
 from django.utils import timezone
+from .exports import EXPORT_DATASETS
+from .rollups import parse_range
+from .search import SEARCH_KINDS
 
 
 class RealMoneyTransactionForm(forms.ModelForm):
@@ -107,4 +110,127 @@ class GiftedSpendingFilterForm(forms.Form):
             'class': 'form-select form-select-sm',
             'onchange': 'this.form.submit()'
         })
-    )
\ No newline at end of file
+    )
+
+class WalletExportForm(forms.Form):
+    format = forms.ChoiceField(
+        choices=[('jsonl', 'JSON Lines'), ('csv', 'CSV')],
+        required=False
+    )
+    dataset = forms.ChoiceField(
+        choices=[
+            ('all', 'Everything'),
+            ('transactions', 'Real Money Transactions'),
+            ('earnings', 'V-Bucks Earnings'),
+            ('spendings', 'V-Bucks Spendings'),
+            ('refunds', 'Refunds'),
+        ],
+        required=False
+    )
+    gzip = forms.BooleanField(required=False)
+
+    def clean(self):
+        cleaned_data = super().clean()
+        cleaned_data['format'] = cleaned_data.get('format') or 'jsonl'
+        cleaned_data['dataset'] = cleaned_data.get('dataset') or 'all'
+        if cleaned_data['format'] == 'csv' and cleaned_data['dataset'] == 'all':
+            raise forms.ValidationError("CSV exports need a single dataset")
+        return cleaned_data
+
+    @property
+    def datasets(self):
+        dataset = self.cleaned_data['dataset']
+        return list(EXPORT_DATASETS) if dataset == 'all' else [dataset]
+
+
+class WalletImportForm(forms.Form):
+    dataset = forms.ChoiceField(
+        choices=[
+            ('spendings', 'V-Bucks Spendings'),
+            ('earnings', 'V-Bucks Earnings'),
+            ('transactions', 'Real Money Transactions'),
+        ],
+        widget=forms.Select(attrs={'class': 'form-select'})
+    )
+    file = forms.FileField(
+        help_text="CSV with a header row, or JSON Lines (.jsonl) - same columns as the export",
+        widget=forms.FileInput(attrs={'class': 'form-control', 'accept': '.csv,.jsonl,.json'})
+    )
+
+
+class WalletAnalyticsForm(forms.Form):
+    start = forms.DateField(
+        required=False,
+        widget=forms.DateInput(attrs={'type': 'date', 'class': 'form-control'})
+    )
+    end = forms.DateField(
+        required=False,
+        widget=forms.DateInput(attrs={'type': 'date', 'class': 'form-control'})
+    )
+    source = forms.ChoiceField(
+        choices=[('', 'Everything')] + WalletRollup.SOURCES,
+        required=False,
+        widget=forms.Select(attrs={'class': 'form-select'})
+    )
+
+    def clean(self):
+        cleaned_data = super().clean()
+        cleaned_data['start'], cleaned_data['end'] = parse_range(
+            cleaned_data.get('start'), cleaned_data.get('end')
+        )
+        return cleaned_data
+
+    @property
+    def sources(self):
+        source = self.cleaned_data.get('source')
+        return [source] if source else None
+
+
+class BalanceHistoryForm(forms.Form):
+    """Date range of the balance-over-time series (the last year by default)"""
+    start = forms.DateField(required=False)
+    end = forms.DateField(required=False)
+
+    def clean(self):
+        cleaned_data = super().clean()
+        cleaned_data['start'], cleaned_data['end'] = parse_range(
+            cleaned_data.get('start'), cleaned_data.get('end')
+        )
+        return cleaned_data
+
+
+class BalanceOnForm(forms.Form):
+    """Day of a point-in-time balance (today by default)"""
+    date = forms.DateField(required=False)
+
+    def clean_date(self):
+        return self.cleaned_data['date'] or timezone.localdate()
+
+
+class WalletSearchForm(forms.Form):
+    KINDS = [
+        ('', 'Everything'),
+        ('transaction', 'Transactions'),
+        ('earning', 'Earnings'),
+        ('spending', 'Spendings'),
+        ('refund', 'Refunds'),
+    ]
+
+    q = forms.CharField(
+        max_length=200,
+        required=False,
+        label='Search',
+        widget=forms.TextInput(attrs={'type': 'search', 'class': 'form-control', 'placeholder': 'Item, source or note'})
+    )
+    kind = forms.ChoiceField(
+        choices=KINDS,
+        required=False,
+        label='In',
+        widget=forms.Select(attrs={'class': 'form-select'})
+    )
+    page = forms.IntegerField(min_value=1, required=False, widget=forms.HiddenInput)
+
+    @property
+    def kinds(self):
+        kind = self.cleaned_data.get('kind')
+        return (kind,) if kind else SEARCH_KINDS
@@ -0,0 +1,107 @@
+import csv
+import time
+from decimal import Decimal, InvalidOperation
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.utils.dateparse import parse_date
+
+CENT = Decimal('0.01')
+
+
+def base_currency():
+    return settings.FX_BASE_CURRENCY
+
+
+RATES_VERSION_KEY = 'fx-rate:version'
+
+
+def rate_cache():
+    return caches[settings.FX_RATE_CACHE]
+
+
+def invalidate_rates():
+    """Make every worker look rates up again; run whenever the FxRate table changes"""
+    rate_cache().set(RATES_VERSION_KEY, time.time_ns(), timeout=None)
+
+
+def get_rate(currency, on_date):
+    """
+    Return how many base-currency units one ``currency`` unit was worth on ``on_date``.
+
+    Uses the latest published rate on or before the date, or the earliest
+    rate when the date predates the table. Returns None when the currency
+    has no rates at all. Rates found are kept in FX_RATE_CACHE for
+    FX_RATE_CACHE_TIMEOUT seconds, under a version that invalidate_rates()
+    changes; misses aren't cached, so rates loaded later are picked up.
+    """
+    from .models import FxRate
+
+    if currency == base_currency():
+        return Decimal('1')
+    cache = rate_cache()
+    cache.add(RATES_VERSION_KEY, time.time_ns(), timeout=None)
+    key = f'fx-rate:{cache.get(RATES_VERSION_KEY)}:{currency}:{on_date}'
+    rate = cache.get(key)
+    if rate is not None:
+        return rate
+    rates = FxRate.objects.filter(currency=currency)
+    rate = (
+        rates.filter(date__lte=on_date).order_by('-date').values_list('rate', flat=True).first()
+        or rates.order_by('date').values_list('rate', flat=True).first()
+    )
+    if rate is not None:
+        cache.set(key, rate, settings.FX_RATE_CACHE_TIMEOUT)
+    return rate
+
+
+def to_base(amount, currency, on_date, rate=None):
+    """
+    Convert ``amount`` to the base currency, or None when no rate is known.
+
+    Pass an already looked-up ``rate`` to skip the lookup.
+    """
+    rate = rate if rate is not None else get_rate(currency, on_date)
+    if rate is None or amount is None:
+        return None
+    return (Decimal(amount) * rate).quantize(CENT)
+
+
+def from_base(amount, currency, on_date, rate=None):
+    """
+    Convert a base-currency ``amount`` to ``currency``, or None when no rate is known.
+
+    Pass an already looked-up ``rate`` to skip the lookup.
+    """
+    rate = rate if rate is not None else get_rate(currency, on_date)
+    if rate is None or amount is None:
+        return None
+    return (Decimal(amount) / rate).quantize(CENT)
+
+
+def load_rates(stream):
+    """
+    Upsert rates from a CSV stream with ``date,currency,rate`` columns.
+
+    ``rate`` is the value of one unit of ``currency`` in the base currency.
+    Returns the number of rows loaded.
+    """
+    from .models import FxRate
+
+    loaded = 0
+    with transaction.atomic():
+        for line, row in enumerate(csv.DictReader(stream), start=2):
+            try:
+                rate_date = parse_date(row['date'].strip())
+                rate = Decimal(row['rate'].strip())
+                currency = row['currency'].strip().upper()
+            except (KeyError, AttributeError, InvalidOperation) as exc:
+                raise ValueError(f"Invalid FX rate on line {line}") from exc
+            if rate_date is None or rate <= 0:
+                raise ValueError(f"Invalid FX rate on line {line}")
+            FxRate.objects.update_or_create(
+                date=rate_date, currency=currency, defaults={'rate': rate}
+            )
+            loaded += 1
+    invalidate_rates()
+    return loaded
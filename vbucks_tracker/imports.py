@@ -0,0 +1,143 @@
+import csv
+import io
+import json
+from itertools import islice
+from .forms import RealMoneyTransactionForm, VbucksEarningForm, VbucksSpendingForm
+from .ledger import append_ledger_entries, collect_ledger_changes
+from .rollups import apply_rollup_changes, collect_rollup_changes, new_rollup_changes
+from .routers import shard_for, use_shard
+from .services import VbucksService
+from .sqlite import immediate_atomic
+
+IMPORT_BATCH_SIZE = 2000
+MAX_REPORTED_ERRORS = 1000
+
+# Datasets that can be imported, validated with the same forms as the web UI
+IMPORT_FORMS = {
+    'transactions': RealMoneyTransactionForm,
+    'earnings': VbucksEarningForm,
+    'spendings': VbucksSpendingForm,
+}
+IMPORT_FORMATS = ('csv', 'jsonl')
+
+
+def iter_records(stream, import_format):
+    """
+    Yield ``(line_number, record)`` pairs from a text stream.
+
+    Both parsers read the stream incrementally, so arbitrarily large files
+    are processed in constant memory. Malformed JSON lines are yielded with
+    a ``None`` record so they can be reported like validation errors.
+    """
+    if import_format == 'csv':
+        reader = csv.DictReader(stream)
+        for record in reader:
+            yield reader.line_num, record
+    elif import_format == 'jsonl':
+        for line_number, line in enumerate(stream, start=1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                record = None
+            yield line_number, record if isinstance(record, dict) else None
+    else:
+        raise ValueError(f"Unknown import format: {import_format}")
+
+
+def detect_format(filename):
+    """Guess the import format from a file name"""
+    return 'csv' if filename.lower().endswith('.csv') else 'jsonl'
+
+
+def open_text(binary_file):
+    """Wrap a binary upload or file for incremental UTF-8 text reading"""
+    return io.TextIOWrapper(binary_file, encoding='utf-8-sig', newline='')
+
+
+class ImportResult:
+    def __init__(self):
+        self.created = 0
+        self.failed = 0
+        self.errors = []
+
+    def add_error(self, line, errors):
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append((line, errors))
+
+    @property
+    def truncated_errors(self):
+        return self.failed - len(self.errors)
+
+
+class WalletImporter:
+    """
+    Validate and bulk insert a user's tracker rows.
+
+    Every row goes through the dataset's ModelForm (field and model
+    validation, no queries), valid rows are written with ``bulk_create`` and
+    the WalletSummary, rollups and ledger are adjusted once per batch instead
+    of once per row.
+    """
+
+    def __init__(self, user, dataset, batch_size=IMPORT_BATCH_SIZE):
+        if dataset not in IMPORT_FORMS:
+            raise ValueError(f"Unknown import dataset: {dataset}")
+        self.user = user
+        self.form_class = IMPORT_FORMS[dataset]
+        self.model = self.form_class._meta.model
+        self.batch_size = batch_size
+        # Building a form deep-copies all of its fields, which costs more than
+        # validating a row, so a single bound form is re-pointed at each record.
+        self.form = self.form_class(data={})
+
+    def build_instance(self, record):
+        form = self.form
+        form.data = record
+        form.instance = self.model(user=self.user)
+        form._errors = None
+        if not form.is_valid():
+            return None, form.errors.get_json_data()
+        return form.save(commit=False), None
+
+    def import_batch(self, batch, result):
+        instances = []
+        for line, record in batch:
+            if record is None:
+                result.add_error(line, {'__all__': [{'message': 'Malformed record', 'code': 'invalid'}]})
+                continue
+            instance, errors = self.build_instance(record)
+            if errors:
+                result.add_error(line, errors)
+            else:
+                instances.append(instance)
+
+        if not instances:
+            return
+        delta = {}
+        rollups = new_rollup_changes()
+        for instance in instances:
+            instance.prepare_bulk_insert()
+            for field, value in instance.wallet_contribution().items():
+                delta[field] = delta.get(field, 0) + value
+            collect_rollup_changes(rollups, instance)
+        using = shard_for(self.user)
+        with use_shard(using), immediate_atomic(using):
+            self.model.objects.bulk_create(instances, batch_size=self.batch_size)
+            VbucksService.apply_wallet_delta(self.user.pk, delta)
+            apply_rollup_changes(rollups)
+            # After the insert, which set the primary keys the entries point at
+            ledger = []
+            for instance in instances:
+                collect_ledger_changes(ledger, None, instance)
+            append_ledger_entries(ledger)
+        result.created += len(instances)
+
+    def run(self, records):
+        result = ImportResult()
+        records = iter(records)
+        while batch := list(islice(records, self.batch_size)):
+            self.import_batch(batch, result)
+        return result
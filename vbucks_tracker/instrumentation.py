@@ -0,0 +1,381 @@
+import cProfile
+import io
+import logging
+import marshal
+import pstats
+import re
+import threading
+import time
+import traceback
+from collections import Counter, defaultdict
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+from asgiref.sync import async_to_sync, iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.template.backends.django import DjangoTemplates
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.renderers import JSONRenderer
+from rest_framework_simplejwt.authentication import JWTAuthentication
+
+logger = logging.getLogger('vbucks_tracker.queries')
+
+_PLACEHOLDER_LIST = re.compile(r'\((?:\s*%s\s*,)+\s*%s\s*\)')
+_SAVEPOINT_NAME = re.compile(r'"s\d+_x\d+"')
+_WHITESPACE = re.compile(r'\s+')
+
+
+def normalize_sql(sql):
+    """Reduce a statement to its template: collapse IN lists and savepoint names"""
+    sql = _PLACEHOLDER_LIST.sub('(%s, ...)', sql)
+    sql = _SAVEPOINT_NAME.sub('"<savepoint>"', sql)
+    return _WHITESPACE.sub(' ', sql).strip()
+
+
+def application_stack(limit=8):
+    """The innermost stack frames that belong to this project, outermost first"""
+    base_dir = str(settings.BASE_DIR)
+    frames = [
+        frame for frame in traceback.extract_stack()[:-1]
+        if frame.filename.startswith(base_dir)
+        and 'site-packages' not in frame.filename
+        and not frame.filename.endswith('instrumentation.py')
+    ]
+    return traceback.format_list(frames[-limit:])
+
+
+class QueryRecorder:
+    """
+    Count the statements run on every database connection while active.
+
+    Statements are grouped by normalized SQL; the project stack that issued a
+    template for the second time is kept, since a repeat is what an N+1
+    loop looks like.
+    """
+
+    def __init__(self, repeat_threshold=None, capture_stacks=True):
+        self.repeat_threshold = repeat_threshold or settings.QUERY_REPEAT_THRESHOLD
+        self.capture_stacks = capture_stacks
+        self.count = 0
+        self.duration = 0.0
+        self.templates = Counter()
+        self.stacks = {}
+        self._stack = ExitStack()
+
+    def __enter__(self):
+        for connection in connections.all():
+            self._stack.enter_context(connection.execute_wrapper(self))
+        return self
+
+    def __exit__(self, *exc_info):
+        return self._stack.__exit__(*exc_info)
+
+    # Under ASGI the ORM runs on the request's sync thread, whose connections
+    # are not the event loop thread's: wrap those
+    async def __aenter__(self):
+        return await sync_to_async(self.__enter__)()
+
+    async def __aexit__(self, *exc_info):
+        return await sync_to_async(self.__exit__)(*exc_info)
+
+    def __call__(self, execute, sql, params, many, context):
+        template = normalize_sql(sql)
+        self.templates[template] += 1
+        if self.templates[template] == 2 and self.capture_stacks:
+            self.stacks[template] = application_stack()
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - started
+            self.count += 1
+
+    @property
+    def repeated(self):
+        """``[(template, count, stack)]`` for templates run at least ``repeat_threshold`` times"""
+        return [
+            (template, count, self.stacks.get(template, []))
+            for template, count in self.templates.most_common()
+            if count >= self.repeat_threshold
+        ]
+
+    def describe_repeats(self):
+        return '\n'.join(
+            f'{count}x {template}\n{"".join(stack)}' for template, count, stack in self.repeated
+        )
+
+
+class QueryBudgetMiddleware:
+    """
+    Opt-in (``QUERY_INSTRUMENTATION = True``) per-request query accounting.
+
+    Adds ``X-Query-Count``, ``X-Query-Time-Ms`` and ``X-Query-Repeats``
+    headers, logs a summary line per request and a warning with the
+    originating stack for every repeated statement template.
+    """
+
+    sync_capable = async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.QUERY_INSTRUMENTATION:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        with QueryRecorder() as recorder:
+            response = self.get_response(request)
+        return self.report(request, response, recorder)
+
+    async def __acall__(self, request):
+        async with QueryRecorder() as recorder:
+            response = await self.get_response(request)
+        return self.report(request, response, recorder)
+
+    def report(self, request, response, recorder):
+        repeated = recorder.repeated
+        response['X-Query-Count'] = str(recorder.count)
+        response['X-Query-Time-Ms'] = f'{recorder.duration * 1000:.1f}'
+        response['X-Query-Repeats'] = str(len(repeated))
+        logger.info(
+            '%s %s: %d queries in %.1f ms', request.method, request.path,
+            recorder.count, recorder.duration * 1000
+        )
+        for template, count, stack in repeated:
+            logger.warning(
+                'Possible N+1 on %s %s: %d x %s\n%s', request.method, request.path,
+                count, template, ''.join(stack)
+            )
+        return response
+
+
+_request_timings = ContextVar('request_timings', default=None)
+
+
+class RequestTimings:
+    """Accumulated durations per phase; nested spans of the same phase count once"""
+
+    def __init__(self):
+        self.durations = defaultdict(float)
+        self._open = set()
+
+    @contextmanager
+    def measure(self, name):
+        if name in self._open:
+            yield
+            return
+        self._open.add(name)
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.durations[name] += time.perf_counter() - started
+            self._open.discard(name)
+
+    def header(self):
+        return ', '.join(
+            f'{name};dur={duration * 1000:.1f}' for name, duration in self.durations.items()
+        )
+
+
+@contextmanager
+def server_timing(name):
+    """Count the enclosed block towards the current request's ``name`` Server-Timing entry"""
+    timings = _request_timings.get()
+    if timings is None:
+        yield
+    else:
+        with timings.measure(name):
+            yield
+
+
+class TimedTemplate:
+    """Template wrapper whose rendering counts towards the ``template`` timing"""
+
+    def __init__(self, wrapped):
+        self._wrapped = wrapped
+
+    def __getattr__(self, name):
+        return getattr(self._wrapped, name)
+
+    def render(self, context=None, request=None):
+        with server_timing('template'):
+            return self._wrapped.render(context, request)
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    """The Django template backend, with rendering time reported in Server-Timing"""
+
+    def from_string(self, template_code):
+        return TimedTemplate(super().from_string(template_code))
+
+    def get_template(self, template_name):
+        return TimedTemplate(super().get_template(template_name))
+
+
+class TimedJSONRenderer(JSONRenderer):
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        with server_timing('serialize'):
+            return super().render(data, accepted_media_type, renderer_context)
+
+
+class TimedSerializerMixin:
+    """Count a DRF serializer's output work towards the ``serialize`` timing"""
+
+    def to_representation(self, instance):
+        with server_timing('serialize'):
+            return super().to_representation(instance)
+
+
+class ServerTimingMiddleware:
+    """
+    Report where a request's time went in a ``Server-Timing`` header.
+
+    ``db`` is time spent executing SQL, ``template`` rendering templates,
+    ``serialize`` DRF serializers and JSON rendering, ``view`` the view
+    including all of those and ``total`` the whole middleware stack.
+    Enabled with ``SERVER_TIMING = True``.
+    """
+
+    sync_capable = async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.SERVER_TIMING:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        timings = RequestTimings()
+        token = _request_timings.set(timings)
+        started = time.perf_counter()
+        try:
+            with QueryRecorder(capture_stacks=False) as recorder:
+                response = self.get_response(request)
+        finally:
+            _request_timings.reset(token)
+        return self.report(request, response, timings, recorder, started)
+
+    async def __acall__(self, request):
+        timings = RequestTimings()
+        token = _request_timings.set(timings)
+        started = time.perf_counter()
+        try:
+            async with QueryRecorder(capture_stacks=False) as recorder:
+                response = await self.get_response(request)
+        finally:
+            _request_timings.reset(token)
+        return self.report(request, response, timings, recorder, started)
+
+    def report(self, request, response, timings, recorder, started):
+        if hasattr(request, '_view_started'):
+            timings.durations['view'] = time.perf_counter() - request._view_started
+        timings.durations['db'] = recorder.duration
+        timings.durations['total'] = time.perf_counter() - started
+        response['Server-Timing'] = timings.header()
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request._view_started = time.perf_counter()
+
+
+class RequestProfilerMiddleware:
+    """
+    Staff-only cProfile capture of a single request.
+
+    Requests from staff users (by session or API token) with ``?_profile=1``
+    or an ``X-Profile: 1`` header run their view (and its template
+    rendering) under cProfile; the stats are stored as a RequestProfile,
+    downloadable from the admin, and its id is returned in ``X-Profile-Id``. Only one request is profiled at
+    a time; others arriving meanwhile are served normally. For async views
+    only the synchronous work (ORM, rendering) on the request thread shows
+    up in the profile. Enabled with ``REQUEST_PROFILING = True``; keep it
+    last in MIDDLEWARE so the other middleware's process_view still runs.
+    """
+    QUERY_PARAM = '_profile'
+    HEADER = 'X-Profile'
+    SUMMARY_LINES = 40
+    _lock = threading.Lock()
+
+    sync_capable = async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.REQUEST_PROFILING:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return self.get_response(request)
+
+    async def __acall__(self, request):
+        return await self.get_response(request)
+
+    def profiling_user(self, request):
+        """
+        The staff user asking for a profile of ``request``, or None. API
+        requests carry a JWT that DRF only checks inside the view, so it is
+        checked here for requests without a session.
+        """
+        if request.GET.get(self.QUERY_PARAM) != '1' and request.headers.get(self.HEADER) != '1':
+            return None
+        user = request.user
+        if not user.is_authenticated:
+            try:
+                user, _ = JWTAuthentication().authenticate(request) or (user, None)
+            except AuthenticationFailed:
+                return None
+        return user if user.is_staff else None
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        user = self.profiling_user(request)
+        if user is None or not self._lock.acquire(blocking=False):
+            return None
+        try:
+            return self.profile(request, user, view_func, view_args, view_kwargs)
+        finally:
+            self._lock.release()
+
+    def profile(self, request, user, view_func, view_args, view_kwargs):
+        from .models import RequestProfile
+
+        if iscoroutinefunction(view_func):
+            view_func = async_to_sync(view_func)
+        profiler = cProfile.Profile()
+        started = time.perf_counter()
+        with QueryRecorder(capture_stacks=False) as recorder:
+            profiler.enable()
+            try:
+                response = view_func(request, *view_args, **view_kwargs)
+                if callable(getattr(response, 'render', None)):
+                    response = response.render()
+            finally:
+                profiler.disable()
+        duration = time.perf_counter() - started
+
+        summary = io.StringIO()
+        stats = pstats.Stats(profiler, stream=summary)
+        stats.sort_stats('cumulative').print_stats(self.SUMMARY_LINES)
+        profile = RequestProfile.objects.create(
+            user=user,
+            method=request.method,
+            path=request.get_full_path()[:RequestProfile._meta.get_field('path').max_length],
+            status_code=response.status_code,
+            duration_ms=duration * 1000,
+            query_count=recorder.count,
+            query_ms=recorder.duration * 1000,
+            summary=summary.getvalue(),
+            stats=marshal.dumps(stats.stats),
+        )
+        response['X-Profile-Id'] = str(profile.pk)
+        return response
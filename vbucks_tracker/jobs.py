@@ -0,0 +1,250 @@
+"""
+Background jobs, queued in the Job table and run by ``manage.py run_jobs``.
+
+Each kind of job has a handler registered with ``@job_handler``. A user
+has at most one queued job of each kind: enqueueing another returns the
+waiting one, with the newer payload. Workers claim due jobs oldest first,
+run them on a thread or process pool and retry failed attempts with
+exponential backoff. An attempt whose heartbeat (its progress reports)
+stops for JOB_LEASE_SECONDS is presumed lost with its worker and retried,
+so handlers must be safe to run again.
+"""
+import tempfile
+import traceback
+from dataclasses import dataclass
+from datetime import timedelta
+from typing import Callable
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.db import DEFAULT_DB_ALIAS, IntegrityError, connections, transaction
+from django.utils import timezone
+from accounts.avatars import delete_user_avatar_files
+from accounts.models import User, UserProfile
+from .exports import EXPORT_DATASETS, export_filename, gzip_stream, iter_export
+from .models import Job
+from .rollups import rebuild_user_rollups
+from .routers import shard_for
+from .services import VbucksService
+from .sharding import SHARDED_TABLES, delete_user_rows
+from .sqlite import immediate_atomic
+
+EXPORT_DIRECTORY = 'exports'
+EXPORT_PROGRESS_ROWS = 5000
+PURGE_CHUNK_SIZE = 1000
+
+
+@dataclass(frozen=True)
+class JobType:
+    handler: Callable
+    max_attempts: int
+
+
+JOB_TYPES = {}
+
+
+def job_handler(kind, max_attempts=3):
+    """Register ``func(job)`` to run ``kind`` jobs; what it returns is stored as the job's result"""
+    def register(func):
+        JOB_TYPES[kind] = JobType(func, max_attempts)
+        return func
+    return register
+
+
+def enqueue(kind, user=None, payload=None, delay=0):
+    """
+    Queue a ``kind`` job (for ``user``, a User or pk) and return it. If the
+    user already has one waiting, that job gets ``payload`` and is returned.
+    """
+    if kind not in JOB_TYPES:
+        raise ValueError(f"Unknown job kind: {kind}")
+    payload = payload or {}
+    user_id = getattr(user, 'pk', user)
+    while True:
+        try:
+            with transaction.atomic(using=DEFAULT_DB_ALIAS):
+                return Job.objects.create(
+                    kind=kind, user_id=user_id, payload=payload, max_attempts=JOB_TYPES[kind].max_attempts,
+                    run_after=timezone.now() + timedelta(seconds=delay),
+                )
+        except IntegrityError:
+            if user_id is None:
+                raise
+        queued = Job.objects.filter(kind=kind, user_id=user_id, status=Job.QUEUED)
+        job = queued.first()
+        if job is not None and queued.filter(pk=job.pk).update(payload=payload):
+            job.payload = payload
+            return job
+        # A worker claimed it in the meantime, so a new one is needed after all
+
+
+def claim_job(worker, kinds=None):
+    """Mark the oldest due job as running on ``worker`` and return it, or None when there is none"""
+    now = timezone.now()
+    jobs = Job.objects.filter(status=Job.QUEUED, run_after__lte=now).order_by('run_after', 'pk')
+    if kinds:
+        jobs = jobs.filter(kind__in=kinds)
+    # BEGIN IMMEDIATE serializes claims on SQLite; elsewhere workers skip each other's locked rows
+    with immediate_atomic(DEFAULT_DB_ALIAS):
+        job = jobs.select_for_update(skip_locked=True).first()
+        if job is None:
+            return None
+        job.status = Job.RUNNING
+        job.worker = worker
+        job.attempts += 1
+        job.started_at = job.heartbeat_at = now
+        job.progress, job.progress_message = 0, ''
+        job.save(update_fields=[
+            'status', 'worker', 'attempts', 'started_at', 'heartbeat_at', 'progress', 'progress_message',
+        ])
+    return job
+
+
+def _attempt(job):
+    """The job's row while it is still running the given attempt"""
+    return Job.objects.filter(pk=job.pk, status=Job.RUNNING, attempts=job.attempts)
+
+
+def _retry_or_fail(job, error, retry=True):
+    now = timezone.now()
+    if retry and job.attempts < job.max_attempts:
+        delay = settings.JOB_RETRY_DELAY_SECONDS * 2 ** (job.attempts - 1)
+        try:
+            with transaction.atomic(using=DEFAULT_DB_ALIAS):
+                _attempt(job).update(
+                    status=Job.QUEUED, error=error, worker='', heartbeat_at=None,
+                    run_after=now + timedelta(seconds=delay),
+                )
+            return
+        except IntegrityError:
+            error += "\nNot retried: a newer job of this kind is queued for the user."
+    _attempt(job).update(status=Job.FAILED, error=error, heartbeat_at=None, finished_at=now)
+
+
+def execute_job(job):
+    """Run a claimed job's handler in this thread and record the outcome"""
+    job_type = JOB_TYPES.get(job.kind)
+    if job_type is None:
+        _retry_or_fail(job, f"No handler for {job.kind!r} jobs", retry=False)
+        return
+    try:
+        result = job_type.handler(job)
+    except Exception:
+        _retry_or_fail(job, traceback.format_exc())
+    else:
+        _attempt(job).update(
+            status=Job.SUCCEEDED, result=result, error='', progress=100, heartbeat_at=None,
+            finished_at=timezone.now(),
+        )
+
+
+def run_claimed_job(job_id):
+    """Pool entry point (importable, for process pools): run one claimed job"""
+    try:
+        execute_job(Job.objects.get(pk=job_id))
+    finally:
+        # Pool threads and processes outlive the job; don't leave its connections open
+        connections.close_all()
+
+
+def requeue_stale_jobs():
+    """Retry (or fail) running jobs without a heartbeat for JOB_LEASE_SECONDS; returns how many"""
+    cutoff = timezone.now() - timedelta(seconds=settings.JOB_LEASE_SECONDS)
+    stale = list(Job.objects.filter(status=Job.RUNNING, heartbeat_at__lt=cutoff))
+    for job in stale:
+        _retry_or_fail(job, f"Worker {job.worker} stopped responding")
+    return len(stale)
+
+
+def delete_expired_jobs():
+    """Delete jobs finished more than JOB_RETENTION_DAYS ago, with their export files; returns how many"""
+    cutoff = timezone.now() - timedelta(days=settings.JOB_RETENTION_DAYS)
+    expired = Job.objects.filter(status__in=[Job.SUCCEEDED, Job.FAILED], finished_at__lt=cutoff)
+    for result in expired.filter(kind='export_history', status=Job.SUCCEEDED).values_list('result', flat=True):
+        default_storage.delete(result['file'])
+    return expired.delete()[0]
+
+
+# Job types
+
+@job_handler('recompute_summary')
+def recompute_summary(job):
+    """Rebuild a user's WalletSummary and analytics rollups from the tracker tables"""
+    user = User.objects.filter(pk=job.user_id).first()
+    if user is None:
+        return None
+    job.report_progress(0, 2, "Recomputing totals")
+    summary = VbucksService.rebuild_user_summary(user)
+    job.report_progress(1, 2, "Rebuilding analytics rollups")
+    rebuild_user_rollups(user)
+    return {'balance': summary.balance}
+
+
+@job_handler('export_history')
+def export_history(job):
+    """
+    Write a user's history to a file in default storage, for download from
+    the job page. The payload holds the export form's ``format``,
+    ``dataset``, ``datasets`` and ``gzip``.
+    """
+    user = User.objects.get(pk=job.user_id)
+    export_format, compress = job.payload['format'], job.payload['gzip']
+    datasets = job.payload['datasets']
+    total = sum(
+        EXPORT_DATASETS[dataset][0].objects.db_manager(hints={'instance': user}).filter(user=user).count()
+        for dataset in datasets
+    )
+
+    def counted(lines):
+        for done, line in enumerate(lines, 1):
+            if done % EXPORT_PROGRESS_ROWS == 0:
+                job.report_progress(done, total, f"{done} of {total} rows")
+            yield line
+
+    lines = counted(iter_export(user, export_format, datasets))
+    chunks = gzip_stream(lines) if compress else (line.encode() for line in lines)
+    filename = export_filename(job.payload['dataset'], export_format, compress, timezone.now().date().isoformat())
+    with tempfile.TemporaryFile() as spool:
+        for chunk in chunks:
+            spool.write(chunk)
+        spool.seek(0)
+        name = default_storage.save(f'{EXPORT_DIRECTORY}/{user.pk}/{job.pk}/{filename}', File(spool))
+    return {'file': name, 'filename': filename, 'rows': total}
+
+
+def purge_user(user, chunk_size=PURGE_CHUNK_SIZE, on_chunk=None):
+    """
+    Delete a user's avatar files, their tracker rows (in chunks, see
+    delete_user_rows) and then the user, whose own delete has little left
+    to cascade to. Returns the number of tracker rows deleted.
+    """
+    alias = shard_for(user)
+    avatar = UserProfile.objects.using(alias).filter(user_id=user.pk).values_list('avatar', flat=True).first()
+    # Files first: a retry after a failure further on can still find the avatar's name
+    delete_user_avatar_files(user.pk, avatar or '')
+    deleted = delete_user_rows(user.pk, alias, chunk_size, on_chunk)
+    user.delete()
+    return deleted
+
+
+@job_handler('purge_account', max_attempts=5)
+def purge_account(job):
+    """
+    Purge a deactivated user (see purge_user). Users who were reactivated in
+    the meantime are left alone.
+    """
+    user = User.objects.filter(pk=job.user_id).first()
+    if user is None:
+        return {'rows': 0}
+    if user.is_active:
+        return {'rows': 0, 'skipped': "The account was reactivated"}
+    alias = shard_for(user)
+    total = sum(model.objects.using(alias).filter(user_id=user.pk).count() for model in SHARDED_TABLES)
+    deleted = 0
+
+    def on_chunk(model, count, seconds):
+        nonlocal deleted
+        deleted += count
+        job.report_progress(deleted, total, f"Deleted {deleted} of {total} rows")
+
+    return {'rows': purge_user(user, PURGE_CHUNK_SIZE, on_chunk)}
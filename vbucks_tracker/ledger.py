@@ -0,0 +1,230 @@
+"""
+The V-Bucks ledger: every change to a user's balance as a signed LedgerEntry.
+
+Entries are appended next to the tracker row writes (VbucksService,
+WalletImporter), with a per-user ``seq`` in recording order. Each stores the
+running balance in (date, seq) order, so the balance on any day is the
+latest entry up to that day: one lookup on the (user, date, seq) index.
+Tracker rows are often entered after the fact; a backdated entry shifts the
+stored balances of the entries after it, in one UPDATE.
+"""
+import heapq
+from itertools import islice
+from datetime import timedelta
+from django.db import connections, router, transaction
+from django.db.models import OuterRef, Subquery
+from django.utils import timezone
+from .models import LedgerEntry, RealMoneyTransaction, Refund, VbucksEarning, VbucksSpending, WalletSummary
+from .routers import shard_for
+
+LEDGER_BATCH_SIZE = 2000
+SERIES_CHUNK_SIZE = 2000
+
+# Ledger source -> (tracker model, date column, V-Bucks column, sign), in the
+# order rebuilds replay rows of the same day
+LEDGER_SOURCES = {
+    'TRANSACTION': (RealMoneyTransaction, 'date', 'vbucks_earned', 1),
+    'EARNING': (VbucksEarning, 'date', 'amount', 1),
+    'SPENDING': (VbucksSpending, 'date', 'vbucks_spent', -1),
+    'REFUND': (Refund, 'refund_date', 'vbucks_returned', 1),
+}
+
+
+def _contribution(instance):
+    if instance is None:
+        return None
+    source, day, delta = instance.ledger_contribution()
+    day = LedgerEntry._meta.get_field('date').to_python(day)  # may still be a string
+    return instance.user_id, source, day, delta
+
+
+def collect_ledger_changes(changes, previous, current):
+    """
+    Add the entries for a tracker row write to the list ``changes``: a
+    reversal of ``previous`` (the stored row, None for inserts) and
+    ``current`` (None for deletes). Writes that leave the row's user, date
+    and amount alone need none.
+    """
+    before, after = _contribution(previous), _contribution(current)
+    if before == after:
+        return changes
+    for row, contribution, sign in ((previous, before, -1), (current, after, 1)):
+        if contribution is not None and contribution[3]:
+            user_id, source, day, delta = contribution
+            changes.append(LedgerEntry(
+                user_id=user_id, source=source, source_id=row.pk, date=day, delta=sign * delta, balance=0,
+            ))
+    return changes
+
+
+def _lock_last_seq(user_id):
+    """
+    Lock the user's WalletSummary row, which serializes their writes, and
+    return their last ``seq``, in one query. A missing summary row is
+    rebuilt first, so a user's first concurrent writes queue up as well.
+    """
+    from .services import VbucksService
+
+    last_seq = LedgerEntry.objects.filter(user_id=OuterRef('user_id')).order_by('-seq').values('seq')[:1]
+    locked = (
+        WalletSummary.objects.select_for_update().filter(user_id=user_id)
+        .annotate(last_seq=Subquery(last_seq)).values_list('last_seq', flat=True)
+    )
+    found = list(locked)
+    if not found:
+        VbucksService.rebuild_user_summary(user_id)
+        found = list(locked.all())
+    return found[0] or 0
+
+
+def append_ledger_entries(entries):
+    """
+    Insert new LedgerEntry rows (``balance`` unset) after their users'
+    existing ones and fix up the running balances from the earliest date
+    touched. Three queries per user; run it in the transaction of the
+    tracker write.
+    """
+    by_user = {}
+    for entry in entries:
+        by_user.setdefault(entry.user_id, []).append(entry)
+    for user_id, user_entries in by_user.items():
+        user_entries.sort(key=lambda entry: entry.date)
+        last_seq = _lock_last_seq(user_id)
+        for seq, entry in enumerate(user_entries, last_seq + 1):
+            entry.seq = seq
+        LedgerEntry.objects.bulk_create(user_entries, batch_size=LEDGER_BATCH_SIZE)
+        refresh_balances(user_id, user_entries[0].date)
+
+
+def refresh_balances(user_id, since, using=None):
+    """Recompute the stored running balances of a user's entries dated ``since`` or later"""
+    using = using or router.db_for_write(LedgerEntry)
+    connection = connections[using]
+    if connection.vendor not in ('sqlite', 'postgresql'):
+        _refresh_balances_in_python(user_id, since, using)
+        return
+    table, pk, user, date, seq, delta, balance = map(connection.ops.quote_name, (
+        LedgerEntry._meta.db_table, 'id', 'user_id', 'date', 'seq', 'delta', 'balance',
+    ))
+    # One statement: the balance before ``since`` plus a running sum from there
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"UPDATE {table} SET {balance} = running.{balance} FROM ("
+            f"SELECT {pk}, COALESCE(("
+            f"SELECT {balance} FROM {table} WHERE {user} = %s AND {date} < %s "
+            f"ORDER BY {date} DESC, {seq} DESC LIMIT 1"
+            f"), 0) + SUM({delta}) OVER (ORDER BY {date}, {seq}) AS {balance} "
+            f"FROM {table} WHERE {user} = %s AND {date} >= %s"
+            f") AS running WHERE {table}.{pk} = running.{pk} AND {table}.{balance} <> running.{balance}",
+            [user_id, since, user_id, since],
+        )
+
+
+def _refresh_balances_in_python(user_id, since, using):
+    entries = LedgerEntry.objects.using(using).filter(user_id=user_id)
+    balance = entries.filter(date__lt=since).order_by('-date', '-seq').values_list('balance', flat=True).first() or 0
+    changed = []
+    for entry in entries.filter(date__gte=since).order_by('date', 'seq').only('pk', 'delta', 'balance').iterator():
+        balance += entry.delta
+        if entry.balance != balance:
+            entry.balance = balance
+            changed.append(entry)
+    LedgerEntry.objects.using(using).bulk_update(changed, ['balance'], batch_size=LEDGER_BATCH_SIZE)
+
+
+def balance_on(user, day):
+    """The user's V-Bucks balance at the end of ``day``"""
+    return (
+        LedgerEntry.objects.db_manager(hints={'instance': user})
+        .filter(user=user, date__lte=day).order_by('-date', '-seq')
+        .values_list('balance', flat=True).first()
+    ) or 0
+
+
+def iter_balance_series(user, start, end, chunk_size=SERIES_CHUNK_SIZE):
+    """
+    Yield ``(date, balance)`` from ``start`` to ``end``: the opening balance,
+    then the closing balance of every day with entries, then ``end``. Reads
+    the stored balances in index order, so nothing is summed.
+    """
+    point = (start, balance_on(user, start - timedelta(days=1)))
+    rows = (
+        LedgerEntry.objects.db_manager(hints={'instance': user})
+        .filter(user=user, date__range=(start, end)).order_by('date', 'seq')
+        .values_list('date', 'balance').iterator(chunk_size=chunk_size)
+    )
+    for day, balance in rows:
+        if day != point[0]:
+            yield point
+        point = (day, balance)
+    yield point
+    if point[0] != end:
+        yield end, point[1]
+
+
+def iter_balance_series_json(user, start, end):
+    """iter_balance_series as a streamed JSON document, one point per chunk"""
+    yield f'{{"start": "{start.isoformat()}", "end": "{end.isoformat()}", "points": ['
+    separator = ''
+    for day, balance in iter_balance_series(user, start, end):
+        yield f'{separator}["{day.isoformat()}", {balance}]'
+        separator = ', '
+    yield ']}'
+
+
+def _source_rows(user_id, using, source):
+    """The user's ``source`` rows as ``(date, source, pk, delta)``, in date order"""
+    model, date_column, column, sign = LEDGER_SOURCES[source]
+    rows = (
+        model.objects.using(using).filter(user_id=user_id).order_by(date_column, 'pk')
+        .values_list(date_column, 'pk', column).iterator(chunk_size=LEDGER_BATCH_SIZE)
+    )
+    for day, pk, amount in rows:
+        if date_column == 'refund_date':
+            day = timezone.localdate(day)
+        yield day, source, pk, sign * amount
+
+
+def ledger_rows(instances):
+    """
+    ``(date, source, pk, delta)`` of saved tracker rows in date order; same-day
+    rows keep the order they are passed in (LEDGER_SOURCES order, for rebuilds)
+    """
+    rows = []
+    for instance in instances:
+        _, source, day, delta = _contribution(instance)
+        rows.append((day, source, instance.pk, delta))
+    rows.sort(key=lambda row: row[0])
+    return rows
+
+
+def number_entries(user_id, rows):
+    """Yield a user's first LedgerEntry objects, with seqs and running balances, for rows in date order"""
+    balance = seq = 0
+    for day, source, pk, delta in rows:
+        if not delta:
+            continue
+        seq += 1
+        balance += delta
+        yield LedgerEntry(
+            user_id=user_id, seq=seq, date=day, delta=delta, balance=balance, source=source, source_id=pk,
+        )
+
+
+def rebuild_user_ledger(user):
+    """
+    Replace a user's ledger with one entry per current tracker row, dropping
+    the history of changes; returns the number of entries. The rows are
+    streamed, so big users are fine.
+    """
+    user_id = getattr(user, 'pk', user)
+    using = shard_for(user)
+    rows = heapq.merge(*(_source_rows(user_id, using, source) for source in LEDGER_SOURCES), key=lambda row: row[0])
+    entries = number_entries(user_id, rows)
+    created = 0
+    with transaction.atomic(using=using):
+        LedgerEntry.objects.using(using).filter(user_id=user_id).delete()
+        while batch := list(islice(entries, LEDGER_BATCH_SIZE)):
+            LedgerEntry.objects.using(using).bulk_create(batch)
+            created += len(batch)
+    return created
@@ -0,0 +1,67 @@
+from django.conf import settings
+from django.db.models import F
+from django.core.management.base import BaseCommand
+from vbucks_tracker.cache import summary_cache
+from vbucks_tracker.fx import base_currency, get_rate, to_base
+from vbucks_tracker.models import RealMoneyTransaction
+from vbucks_tracker.rollups import rebuild_user_rollups
+
+BACKFILL_BATCH_SIZE = 2000
+
+
+class Command(BaseCommand):
+    help = 'Fills RealMoneyTransaction.amount_base from the FX rate table, one currency and day at a time.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all', action='store_true',
+            help='Recompute every row, not only rows without a base amount.'
+        )
+
+    def handle(self, *args, **options):
+        updated = missing = 0
+        user_ids = []
+        for alias in settings.SHARD_DATABASES:
+            transactions = RealMoneyTransaction.objects.using(alias)
+            if not options['all']:
+                transactions = transactions.filter(amount_base__isnull=True)
+            user_ids += transactions.order_by().values_list('user_id', flat=True).distinct()
+            shard_updated, shard_missing = self.backfill(transactions)
+            updated += shard_updated
+            missing += shard_missing
+
+        # Queryset updates bypass the wallet signals
+        for user_id in user_ids:
+            rebuild_user_rollups(user_id)
+        summary_cache.bump_all()
+
+        self.stdout.write(self.style.SUCCESS(f'Updated {updated} transactions.'))
+        if missing:
+            self.stdout.write(self.style.WARNING(
+                f'{missing} transactions have no FX rate for their currency; load rates and rerun.'
+            ))
+
+    @staticmethod
+    def backfill(transactions):
+        """Fill one shard's transactions; returns ``(updated, missing rate)`` counts"""
+        updated = transactions.filter(currency=base_currency()).update(amount_base=F('amount'))
+        missing = 0
+        pairs = list(
+            transactions.exclude(currency=base_currency())
+            .order_by().values_list('currency', 'date').distinct()
+        )
+        for currency, day in pairs:
+            rate = get_rate(currency, day)
+            if rate is None:
+                missing += transactions.filter(currency=currency, date=day).count()
+                continue
+            # Rounded by to_base in Python, exactly like rows saved by the app
+            rows = transactions.filter(currency=currency, date=day).order_by('pk').only('pk', 'amount')
+            last_pk = 0
+            while batch := list(rows.filter(pk__gt=last_pk)[:BACKFILL_BATCH_SIZE]):
+                for row in batch:
+                    row.amount_base = to_base(row.amount, currency, day, rate)
+                rows.bulk_update(batch, ['amount_base'])
+                updated += len(batch)
+                last_pk = batch[-1].pk
+        return updated, missing
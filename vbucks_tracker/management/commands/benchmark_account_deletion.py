@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import setup_databases, teardown_databases
+from vbucks_tracker.deletion_benchmark import run_deletion_benchmark
+from vbucks_tracker.jobs import PURGE_CHUNK_SIZE
+
+
+class Command(BaseCommand):
+    help = (
+        'Measures deleting a user with many tracker rows (1M by default) the way purge_account jobs do, '
+        "in chunked raw DELETEs, and optionally with Django's cascading user.delete(), in a throwaway test database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=1_000_000, help='Tracker rows of the deleted user.')
+        parser.add_argument('--chunk-size', type=int, default=PURGE_CHUNK_SIZE, help='Rows per DELETE.')
+        parser.add_argument(
+            '--cascade', action='store_true',
+            help="Also time Django's cascade on a second such user; it sends a signal per row, so keep --rows small."
+        )
+        parser.add_argument('--seed', type=int, default=0, help='Dataset seed.')
+
+    def handle(self, *args, **options):
+        if options['rows'] < 1 or options['chunk_size'] < 1:
+            raise CommandError('--rows and --chunk-size must be positive')
+        old_config = setup_databases(verbosity=0, interactive=False)
+        try:
+            results = run_deletion_benchmark(
+                options['rows'], options['chunk_size'], options['cascade'], options['seed'],
+                progress=self.stdout.write if options['verbosity'] > 1 else None,
+            )
+        finally:
+            teardown_databases(old_config, verbosity=0)
+        self.stdout.write(
+            f"{'method':<8} {'rows':>9} {'seconds':>9} {'rows/s':>9} {'longest write':>14} {'peak memory':>12}"
+        )
+        for method, metrics in results.items():
+            self.stdout.write(
+                f"{method:<8} {metrics['rows']:>9} {metrics['seconds']:>9.2f} {metrics['rows_per_s']:>9} "
+                f"{metrics['longest_write_ms']:>11.1f} ms {metrics['peak_memory_mib']:>8.1f} MiB"
+            )
@@ -0,0 +1,97 @@
+import asyncio
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from django.core.management.base import BaseCommand, CommandError
+from django.test import AsyncClient, Client
+from django.test.utils import override_settings
+from django.urls import reverse
+from accounts.models import User
+
+DEFAULT_URLS = (
+    'vbucks_tracker:home',
+    'vbucks_tracker:transaction-list',
+    'vbucks_tracker:vbucks-spending-list',
+    'vbucks_tracker:vbucks-spending-gifted',
+    'vbucks_tracker:refund-list',
+)
+
+
+class Command(BaseCommand):
+    help = (
+        'Compares dashboard and list view throughput through the WSGI and ASGI handlers, '
+        'in process, as the given user.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('username', help='User whose pages are requested.')
+        parser.add_argument('--requests', type=int, default=200, help='Requests per URL and handler.')
+        parser.add_argument('--concurrency', type=int, default=8, help='Requests in flight at once.')
+        parser.add_argument(
+            '--path', action='append', dest='paths', default=[],
+            help='URL path to request instead of the default pages (can be repeated).'
+        )
+
+    def handle(self, *args, **options):
+        if options['requests'] < 1 or options['concurrency'] < 1:
+            raise CommandError('--requests and --concurrency must be positive')
+        try:
+            user = User.objects.get(username=options['username'])
+        except User.DoesNotExist:
+            raise CommandError(f"Unknown user: {options['username']}")
+        paths = options['paths'] or [reverse(name) for name in DEFAULT_URLS]
+        total, concurrency = options['requests'], options['concurrency']
+
+        with override_settings(ALLOWED_HOSTS=['testserver']):
+            for path in paths:
+                wsgi = self.run_wsgi(user, path, total, concurrency)
+                asgi = asyncio.run(self.run_asgi(user, path, total, concurrency))
+                for handler, (elapsed, latencies) in (('wsgi', wsgi), ('asgi', asgi)):
+                    self.report(path, handler, elapsed, latencies)
+
+    def run_wsgi(self, user, path, total, concurrency):
+        # The test client isn't thread-safe, so each worker logs in its own
+        workers = threading.local()
+
+        def fetch(_):
+            if not hasattr(workers, 'client'):
+                workers.client = Client()
+                workers.client.force_login(user)
+            started = time.perf_counter()
+            response = workers.client.get(path)
+            self.check_response(path, response)
+            return time.perf_counter() - started
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            latencies = list(pool.map(fetch, range(total)))
+        return time.perf_counter() - started, latencies
+
+    async def run_asgi(self, user, path, total, concurrency):
+        client = AsyncClient()
+        await client.aforce_login(user)
+        slots = asyncio.Semaphore(concurrency)
+
+        async def fetch():
+            async with slots:
+                started = time.perf_counter()
+                response = await client.get(path)
+                self.check_response(path, response)
+                return time.perf_counter() - started
+
+        started = time.perf_counter()
+        latencies = await asyncio.gather(*(fetch() for _ in range(total)))
+        return time.perf_counter() - started, latencies
+
+    def check_response(self, path, response):
+        if response.status_code != 200:
+            raise CommandError(f'{path} returned HTTP {response.status_code}')
+
+    def report(self, path, handler, elapsed, latencies):
+        latencies = sorted(latencies)
+        p95 = latencies[int(len(latencies) * 0.95) - 1] if len(latencies) > 1 else latencies[0]
+        self.stdout.write(
+            f'{path:<28} {handler}  {len(latencies) / elapsed:8.1f} req/s  '
+            f'p50 {statistics.median(latencies) * 1000:7.2f} ms  p95 {p95 * 1000:7.2f} ms'
+        )
@@ -0,0 +1,34 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from vbucks_tracker.sqlite_benchmark import STOCK, run_concurrency
+
+
+class Command(BaseCommand):
+    help = (
+        'Measures SQLite write and read throughput with N concurrent writer and reader processes, '
+        "with Django's stock SQLite settings and with SQLITE_PRAGMAS plus BEGIN IMMEDIATE."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', type=int, nargs='+', default=[1, 2, 4, 8],
+            help='Writer (and reader) process counts to run (default: 1 2 4 8).'
+        )
+        parser.add_argument('--seconds', type=float, default=3.0, help='Duration of each run.')
+        parser.add_argument('--directory', help='Where to create the throwaway databases (default: temp dir).')
+
+    def handle(self, *args, **options):
+        if min(options['workers']) < 1 or options['seconds'] <= 0:
+            raise CommandError('--workers and --seconds must be positive')
+        configs = {
+            'stock': STOCK,
+            'tuned': {'pragmas': settings.SQLITE_PRAGMAS, 'begin': 'BEGIN IMMEDIATE'},
+        }
+        self.stdout.write(f"{'workers':>7}  {'config':<6} {'writes/s':>9} {'errors':>7} {'reads/s':>9} {'errors':>7}")
+        for workers in options['workers']:
+            for name, config in configs.items():
+                result = run_concurrency(config, workers, options['seconds'], options['directory'])
+                self.stdout.write(
+                    f"{workers:>7}  {name:<6} {result['writes_per_s']:>9} {result['write_errors']:>7} "
+                    f"{result['reads_per_s']:>9} {result['read_errors']:>7}"
+                )
@@ -0,0 +1,98 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings, setup_databases, teardown_databases
+from vbucks_tracker.benchmarks import (
+    DATASETS, DEFAULT_THRESHOLDS, HANDLERS, METRICS, SCENARIOS, BenchmarkError,
+    compare_results, load_results, run_suite, save_results,
+)
+
+
+def threshold(value):
+    metric, _, fraction = value.partition('=')
+    if metric not in METRICS:
+        raise ValueError(value)
+    return metric, float(fraction)
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmarks the dashboard, list views, refund creation, /api/users/ and token issuance '
+        'through the WSGI and ASGI test clients against seeded datasets in a throwaway test '
+        'database, and optionally fails when metrics regress against a baseline.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dataset', action='append', dest='datasets', choices=sorted(DATASETS), default=[],
+            help='Dataset size to run (can be repeated; default: all).'
+        )
+        parser.add_argument(
+            '--scenario', action='append', dest='scenarios', default=[],
+            choices=[scenario[0] for scenario in SCENARIOS],
+            help='Only run this scenario (can be repeated).'
+        )
+        parser.add_argument(
+            '--handler', action='append', dest='handlers', choices=HANDLERS, default=[],
+            help='Only use this handler (can be repeated).'
+        )
+        parser.add_argument('--requests', type=int, default=50, help='Timed requests per scenario and handler.')
+        parser.add_argument('--seed', type=int, default=0, help='Dataset seed.')
+        parser.add_argument('-o', '--output', help='Write the results as JSON to this file.')
+        parser.add_argument(
+            '--results',
+            help='Compare this existing results file instead of running the benchmarks.'
+        )
+        parser.add_argument('--compare', metavar='BASELINE', help='Fail if a metric regressed against this file.')
+        parser.add_argument(
+            '--threshold', action='append', type=threshold, default=[], metavar='METRIC=FRACTION',
+            help=(
+                'Allowed relative increase for a metric, e.g. p95_ms=0.1 (can be repeated; defaults: '
+                + ', '.join(f'{metric}={value}' for metric, value in DEFAULT_THRESHOLDS.items()) + ').'
+            )
+        )
+
+    def handle(self, *args, **options):
+        if options['results']:
+            results = load_results(options['results'])
+        else:
+            results = self.run_benchmarks(options)
+            if options['output']:
+                save_results(results, options['output'])
+                self.stdout.write(f"Results written to {options['output']}.")
+
+        if options['compare']:
+            self.compare(load_results(options['compare']), results, dict(options['threshold']))
+
+    def run_benchmarks(self, options):
+        if options['requests'] < 1:
+            raise CommandError('--requests must be positive')
+        datasets = {name: DATASETS[name] for name in options['datasets'] or DATASETS}
+        old_config = setup_databases(verbosity=0, interactive=False)
+        try:
+            with override_settings(ALLOWED_HOSTS=['testserver'], DEBUG=False):
+                return run_suite(
+                    datasets,
+                    requests=options['requests'],
+                    seed=options['seed'],
+                    scenarios=options['scenarios'],
+                    handlers=options['handlers'] or HANDLERS,
+                    progress=self.report,
+                )
+        except BenchmarkError as exc:
+            raise CommandError(str(exc))
+        finally:
+            teardown_databases(old_config, verbosity=0)
+
+    def report(self, key, metrics):
+        self.stdout.write(
+            f"{key:<36} p50 {metrics['p50_ms']:8.2f} ms  p95 {metrics['p95_ms']:8.2f} ms  "
+            f"p99 {metrics['p99_ms']:8.2f} ms  {metrics['queries']:5.1f} queries  "
+            f"{metrics['peak_memory_kib']:8.1f} KiB peak"
+        )
+
+    def compare(self, baseline, results, thresholds):
+        regressions = compare_results(baseline, results, thresholds)
+        for key, metric, old, new, change in regressions:
+            self.stdout.write(self.style.ERROR(f'{key} {metric}: {old} -> {new} (+{change:.0%})'))
+        if regressions:
+            raise CommandError(f'{len(regressions)} metrics regressed against {baseline["meta"]["created"]}')
+        self.stdout.write(self.style.SUCCESS('No regressions against the baseline.'))
@@ -0,0 +1,49 @@
+import sys
+from django.core.management.base import BaseCommand, CommandError
+from accounts.models import User
+from vbucks_tracker.exports import EXPORT_DATASETS, EXPORT_FORMATS, iter_export
+
+
+class Command(BaseCommand):
+    help = "Streams a user's wallet history to a file or stdout as CSV or JSON Lines."
+
+    def add_arguments(self, parser):
+        parser.add_argument('username', help='User whose history is exported.')
+        parser.add_argument('--format', choices=EXPORT_FORMATS, default='jsonl')
+        parser.add_argument(
+            '--dataset', choices=['all', *EXPORT_DATASETS], default='all',
+            help='Dataset to export; CSV needs a single dataset.'
+        )
+        parser.add_argument('--gzip', action='store_true', help='Gzip the output on the fly.')
+        parser.add_argument('--output', '-o', help='Output file (default: stdout).')
+        parser.add_argument('--chunk-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options['username'])
+        except User.DoesNotExist:
+            raise CommandError(f"Unknown user: {options['username']}")
+
+        datasets = list(EXPORT_DATASETS) if options['dataset'] == 'all' else [options['dataset']]
+        try:
+            chunks = iter_export(
+                user, options['format'], datasets,
+                compress=options['gzip'], chunk_size=options['chunk_size']
+            )
+        except ValueError as exc:
+            raise CommandError(str(exc))
+
+        if options['output']:
+            mode = 'wb' if options['gzip'] else 'w'
+            encoding = None if options['gzip'] else 'utf-8'
+            with open(options['output'], mode, encoding=encoding, newline='' if encoding else None) as output:
+                for chunk in chunks:
+                    output.write(chunk)
+            self.stderr.write(self.style.SUCCESS(f"Exported {user.username} to {options['output']}"))
+        elif options['gzip']:
+            for chunk in chunks:
+                sys.stdout.buffer.write(chunk)
+            sys.stdout.buffer.flush()
+        else:
+            for chunk in chunks:
+                self.stdout.write(chunk, ending='')
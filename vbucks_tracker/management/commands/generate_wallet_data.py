@@ -0,0 +1,81 @@
+import time
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+from accounts.models import User
+from vbucks_tracker.cache import summary_cache
+from vbucks_tracker.synthetic import SYNTHETIC_BATCH_SIZE, SyntheticWalletGenerator
+
+
+class Command(BaseCommand):
+    help = (
+        'Generates users with profiles and realistic, seeded tracker histories '
+        '(transactions, earnings, spendings and refunds) using chunked bulk inserts.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('users', type=int, help='Number of users to create.')
+        parser.add_argument('--seed', type=int, default=0, help='Random seed (same seed, same data).')
+        parser.add_argument(
+            '--rows-per-user', type=int, default=40,
+            help='Average tracker rows per user; individual users vary widely around it.'
+        )
+        parser.add_argument(
+            '--refund-rate', type=float, default=0.03, help='Share of spendings that get refunded.'
+        )
+        parser.add_argument('--days', type=int, default=730, help='How far back histories reach.')
+        parser.add_argument(
+            '--end-date', type=parse_date, default=None,
+            help='Last day of generated history (YYYY-MM-DD, default today); fix it for reproducible runs.'
+        )
+        parser.add_argument(
+            '--prefix', default='synthetic_', help='Username prefix; must not be in use yet.'
+        )
+        parser.add_argument(
+            '--password', default=None,
+            help='Password shared by all generated users (default: unusable, no logins).'
+        )
+        parser.add_argument('--chunk-size', type=int, default=500, help='Users generated per transaction.')
+        parser.add_argument(
+            '--batch-size', type=int, default=SYNTHETIC_BATCH_SIZE, help='Rows per INSERT statement.'
+        )
+
+    def handle(self, *args, **options):
+        if options['users'] < 1 or options['chunk_size'] < 1 or options['rows_per_user'] < 1:
+            raise CommandError('users, --chunk-size and --rows-per-user must be positive')
+        if not 0 <= options['refund_rate'] <= 1:
+            raise CommandError('--refund-rate must be between 0 and 1')
+        if User.objects.filter(username__startswith=options['prefix']).exists():
+            raise CommandError(f"Users with the prefix {options['prefix']!r} already exist; pick another --prefix")
+
+        generator = SyntheticWalletGenerator(
+            seed=options['seed'],
+            rows_per_user=options['rows_per_user'],
+            refund_rate=options['refund_rate'],
+            days=options['days'],
+            end_date=options['end_date'],
+            prefix=options['prefix'],
+            password=options['password'],
+            batch_size=options['batch_size'],
+        )
+        started = time.perf_counter()
+
+        def progress(counts):
+            if options['verbosity'] > 1:
+                self.stdout.write(f"{counts['users']} users, {self.total_rows(counts)} rows")
+
+        counts = generator.run(options['users'], chunk_size=options['chunk_size'], progress=progress)
+        # New user ids may have belonged to deleted users with cached summaries
+        summary_cache.bump_all()
+
+        elapsed = time.perf_counter() - started
+        rows = self.total_rows(counts)
+        self.stdout.write(self.style.SUCCESS(
+            f"Created {counts['users']} users and {rows} rows "
+            f"({counts['transactions']} transactions, {counts['earnings']} earnings, "
+            f"{counts['spendings']} spendings, {counts['refunds']} refunds) "
+            f"in {elapsed:.1f}s ({rows / elapsed:.0f} rows/s)."
+        ))
+
+    @staticmethod
+    def total_rows(counts):
+        return counts['transactions'] + counts['earnings'] + counts['spendings'] + counts['refunds']
@@ -0,0 +1,38 @@
+import time
+from django.core.management.base import BaseCommand, CommandError
+from accounts.models import User
+from vbucks_tracker.imports import (
+    IMPORT_BATCH_SIZE, IMPORT_FORMATS, IMPORT_FORMS, WalletImporter, detect_format, iter_records
+)
+
+
+class Command(BaseCommand):
+    help = "Bulk imports a user's spendings, earnings or transactions from a CSV or JSON Lines file."
+
+    def add_arguments(self, parser):
+        parser.add_argument('username', help='User who will own the imported rows.')
+        parser.add_argument('path', help='CSV (with header row) or JSON Lines file.')
+        parser.add_argument('--dataset', choices=IMPORT_FORMS, required=True)
+        parser.add_argument('--format', choices=IMPORT_FORMATS, help='Default: guessed from the extension.')
+        parser.add_argument('--batch-size', type=int, default=IMPORT_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options['username'])
+        except User.DoesNotExist:
+            raise CommandError(f"Unknown user: {options['username']}")
+
+        import_format = options['format'] or detect_format(options['path'])
+        importer = WalletImporter(user, options['dataset'], batch_size=options['batch_size'])
+        started = time.perf_counter()
+        with open(options['path'], encoding='utf-8-sig', newline='') as source:
+            result = importer.run(iter_records(source, import_format))
+        elapsed = time.perf_counter() - started
+
+        for line, errors in result.errors:
+            self.stderr.write(f'line {line}: {errors}')
+        if result.truncated_errors:
+            self.stderr.write(f'... {result.truncated_errors} more rejected rows')
+        self.stdout.write(self.style.SUCCESS(
+            f'Imported {result.created} rows ({result.failed} rejected) in {elapsed:.1f}s.'
+        ))
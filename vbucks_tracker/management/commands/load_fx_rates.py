@@ -0,0 +1,24 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from vbucks_tracker.fx import load_rates
+
+
+class Command(BaseCommand):
+    help = 'Loads FX rates (CSV with date,currency,rate columns) into the FxRate table.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path', nargs='?', default=None,
+            help='CSV file to load (default: settings.FX_RATES_FILE).'
+        )
+
+    def handle(self, *args, **options):
+        path = options['path'] or settings.FX_RATES_FILE
+        try:
+            with open(path, encoding='utf-8-sig', newline='') as source:
+                loaded = load_rates(source)
+        except OSError as exc:
+            raise CommandError(f'Cannot read {path}: {exc}')
+        except ValueError as exc:
+            raise CommandError(str(exc))
+        self.stdout.write(self.style.SUCCESS(f'Loaded {loaded} FX rates from {path}.'))
@@ -0,0 +1,61 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from accounts.models import User
+from vbucks_tracker.routers import place_user, shard_for
+from vbucks_tracker.sharding import MOVE_CHUNK_SIZE, ShardMoveConflict, move_user
+
+
+class Command(BaseCommand):
+    help = (
+        "Moves users' tracker data between shards in chunks: every user whose data isn't on the shard "
+        "SHARD_NEW_USERS places them on (e.g. after adding a shard), or the given users to --to."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user', action='append', dest='usernames', default=[],
+            help='Only move this username (can be repeated).'
+        )
+        parser.add_argument('--to', dest='target', help='Move the users to this shard instead of their placement.')
+        parser.add_argument('--chunk-size', type=int, default=MOVE_CHUNK_SIZE, help='Rows copied per transaction.')
+        parser.add_argument('--dry-run', action='store_true', help='Only list the moves.')
+
+    def handle(self, *args, **options):
+        if options['target'] and options['target'] not in settings.SHARD_DATABASES:
+            raise CommandError(f"Unknown shard {options['target']!r}; choose from {', '.join(settings.SHARD_DATABASES)}")
+        if options['chunk_size'] < 1:
+            raise CommandError('--chunk-size must be positive')
+        users = User.objects.order_by('pk')
+        if options['usernames']:
+            users = users.filter(username__in=options['usernames'])
+            missing = set(options['usernames']) - set(users.values_list('username', flat=True))
+            if missing:
+                raise CommandError(f"Unknown users: {', '.join(sorted(missing))}")
+
+        moved = rows = 0
+        conflicts = []
+        for user in users.iterator(chunk_size=500):
+            source = shard_for(user)
+            target = options['target'] or place_user(user.username)
+            if source == target:
+                continue
+            if options['dry_run']:
+                self.stdout.write(f'{user.username}: {source} -> {target}')
+                moved += 1
+                continue
+            try:
+                rows += move_user(user, target, chunk_size=options['chunk_size'])
+            except ShardMoveConflict as exc:
+                conflicts.append(str(exc))
+                self.stderr.write(self.style.WARNING(str(exc)))
+                continue
+            moved += 1
+            if options['verbosity'] > 1:
+                self.stdout.write(f'{user.username}: {source} -> {target}')
+
+        if options['dry_run']:
+            self.stdout.write(self.style.SUCCESS(f'{moved} users would move.'))
+            return
+        self.stdout.write(self.style.SUCCESS(f'Moved {moved} users ({rows} rows).'))
+        if conflicts:
+            raise CommandError(f'{len(conflicts)} users changed while being moved.')
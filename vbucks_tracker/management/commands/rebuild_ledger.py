@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand, CommandError
+from accounts.models import User
+from vbucks_tracker.ledger import rebuild_user_ledger
+
+
+class Command(BaseCommand):
+    help = (
+        "Recreates users' V-Bucks ledgers from the tracker tables, one entry per row, "
+        'dropping the entries that recorded later changes.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user', action='append', dest='usernames', default=[],
+            help='Only process this username (can be repeated).'
+        )
+
+    def handle(self, *args, **options):
+        users = User.objects.order_by('pk')
+        if options['usernames']:
+            users = users.filter(username__in=options['usernames'])
+            missing = set(options['usernames']) - set(users.values_list('username', flat=True))
+            if missing:
+                raise CommandError(f"Unknown users: {', '.join(sorted(missing))}")
+
+        rebuilt = 0
+        for user in users.only('pk', 'shard').iterator(chunk_size=500):
+            rebuild_user_ledger(user)
+            rebuilt += 1
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt ledgers for {rebuilt} users.'))
@@ -0,0 +1,25 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections, transaction
+from vbucks_tracker.search import rebuild_search_index
+
+
+class Command(BaseCommand):
+    help = (
+        'Refills the SQLite full-text search index from the tracker tables, e.g. after loading rows '
+        'with the triggers disabled. PostgreSQL indexes are maintained by the database.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', help='Database to rebuild (default: every shard).')
+
+    def handle(self, *args, **options):
+        for using in [options['database']] if options['database'] else settings.SHARD_DATABASES:
+            if connections[using].vendor != 'sqlite':
+                self.stdout.write(
+                    f'Nothing to rebuild on {using}: its search indexes stay in sync by themselves.'
+                )
+                continue
+            with transaction.atomic(using=using):
+                documents = rebuild_search_index(using)
+            self.stdout.write(self.style.SUCCESS(f'Indexed {documents} documents on {using}.'))
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand, CommandError
+from accounts.models import User
+from vbucks_tracker.rollups import rebuild_user_rollups
+
+
+class Command(BaseCommand):
+    help = 'Recreates the daily and monthly WalletRollup buckets from the tracker tables.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user', action='append', dest='usernames', default=[],
+            help='Only process this username (can be repeated).'
+        )
+
+    def handle(self, *args, **options):
+        users = User.objects.order_by('pk')
+        if options['usernames']:
+            users = users.filter(username__in=options['usernames'])
+            missing = set(options['usernames']) - set(users.values_list('username', flat=True))
+            if missing:
+                raise CommandError(f"Unknown users: {', '.join(sorted(missing))}")
+
+        rebuilt = 0
+        for user in users.only('pk', 'shard').iterator(chunk_size=500):
+            rebuild_user_rollups(user)
+            rebuilt += 1
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt rollups for {rebuilt} users.'))
@@ -0,0 +1,57 @@
+from django.core.management.base import BaseCommand, CommandError
+from accounts.models import User
+from vbucks_tracker.models import WalletSummary
+from vbucks_tracker.routers import shards_for
+from vbucks_tracker.services import VbucksService
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds or verifies the materialized WalletSummary rows against the tracker tables.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user', action='append', dest='usernames', default=[],
+            help='Only process this username (can be repeated).'
+        )
+        parser.add_argument(
+            '--verify', action='store_true',
+            help='Report mismatching summaries without changing them.'
+        )
+
+    def handle(self, *args, **options):
+        users = User.objects.order_by('pk')
+        if options['usernames']:
+            users = users.filter(username__in=options['usernames'])
+            missing = set(options['usernames']) - set(users.values_list('username', flat=True))
+            if missing:
+                raise CommandError(f"Unknown users: {', '.join(sorted(missing))}")
+
+        stored = {}
+        for alias, user_ids in shards_for(users.only('pk', 'shard')).items():
+            stored.update(WalletSummary.objects.using(alias).in_bulk(user_ids, field_name='user_id'))
+        checked = mismatched = 0
+        for user in users.iterator(chunk_size=500):
+            checked += 1
+            expected = VbucksService.compute_user_totals(user)
+            summary = stored.get(user.pk)
+            if summary is None and not any(expected.values()):
+                continue  # Users without tracker data get their row lazily
+            actual = {field: getattr(summary, field) for field in expected} if summary else None
+            if actual == expected:
+                continue
+
+            mismatched += 1
+            if options['verify']:
+                self.stdout.write(self.style.WARNING(
+                    f'{user.username}: stored {actual}, expected {expected}'
+                ))
+            else:
+                VbucksService.rebuild_user_summary(user)
+
+        if options['verify']:
+            message = f'Checked {checked} users, {mismatched} summaries out of sync.'
+            if mismatched:
+                raise CommandError(message)
+        else:
+            message = f'Checked {checked} users, rebuilt {mismatched} summaries.'
+        self.stdout.write(self.style.SUCCESS(message))
@@ -0,0 +1,121 @@
+import multiprocessing
+import os
+import socket
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from vbucks_tracker.jobs import (
+    JOB_TYPES, claim_job, delete_expired_jobs, execute_job, requeue_stale_jobs, run_claimed_job,
+)
+
+# Seconds between stale-job checks and between expired-job cleanups
+MAINTENANCE_INTERVAL = 60
+CLEANUP_INTERVAL = 3600
+
+
+class Command(BaseCommand):
+    help = (
+        "Runs queued background jobs (summary recomputes, exports, account purges) on a pool of worker "
+        "threads or processes until stopped, or until the queue is empty with --burst."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', type=int, default=settings.JOB_WORKERS,
+            help='Jobs run at once; 0 runs them one by one in this process.'
+        )
+        parser.add_argument(
+            '--executor', choices=['thread', 'process'], default=settings.JOB_EXECUTOR,
+            help='Run jobs on worker threads, or on processes for CPU-heavy ones.'
+        )
+        parser.add_argument('--kind', action='append', dest='kinds', default=[], help='Only run this kind of job.')
+        parser.add_argument('--poll-interval', type=float, default=1.0, help='Seconds between queue checks.')
+        parser.add_argument('--burst', action='store_true', help='Exit once no job is due.')
+
+    def handle(self, *args, **options):
+        unknown = set(options['kinds']) - set(JOB_TYPES)
+        if unknown:
+            raise CommandError(f"Unknown job kinds: {', '.join(sorted(unknown))}")
+        if options['workers'] < 0:
+            raise CommandError('--workers must not be negative')
+        self.worker = f'{socket.gethostname()}:{os.getpid()}'
+        self.options = options
+        self.finished = 0
+        self.next_maintenance = self.next_cleanup = 0.0
+        try:
+            if options['workers'] == 0:
+                self.run_inline()
+            else:
+                self.run_pool()
+        except KeyboardInterrupt:
+            self.stdout.write('Stopped.')
+        self.stdout.write(self.style.SUCCESS(f'Ran {self.finished} jobs.'))
+
+    def maintain(self):
+        now = time.monotonic()
+        if now >= self.next_maintenance:
+            self.next_maintenance = now + MAINTENANCE_INTERVAL
+            requeued = requeue_stale_jobs()
+            if requeued:
+                self.stderr.write(self.style.WARNING(f'Requeued {requeued} jobs of workers that stopped responding.'))
+        if now >= self.next_cleanup:
+            self.next_cleanup = now + CLEANUP_INTERVAL
+            delete_expired_jobs()
+
+    def claim(self):
+        job = claim_job(self.worker, self.options['kinds'])
+        if job is not None and self.options['verbosity'] > 1:
+            self.stdout.write(f'Running {job}')
+        return job
+
+    def run_inline(self):
+        while True:
+            self.maintain()
+            job = self.claim()
+            if job is None:
+                if self.options['burst']:
+                    return
+                time.sleep(self.options['poll_interval'])
+                continue
+            execute_job(job)
+            self.finished += 1
+
+    def make_pool(self):
+        workers = self.options['workers']
+        if self.options['executor'] == 'thread':
+            return ThreadPoolExecutor(max_workers=workers, thread_name_prefix='jobs')
+        # Connections must not be shared with the children
+        connections.close_all()
+        return ProcessPoolExecutor(
+            max_workers=workers, mp_context=multiprocessing.get_context('spawn'), initializer=django.setup
+        )
+
+    def run_pool(self):
+        running = set()
+        with self.make_pool() as pool:
+            try:
+                while True:
+                    self.maintain()
+                    # Only claim what can start now, so other workers can take the rest
+                    while len(running) < self.options['workers'] and (job := self.claim()):
+                        running.add(pool.submit(run_claimed_job, job.pk))
+                    if not running:
+                        if self.options['burst']:
+                            return
+                        time.sleep(self.options['poll_interval'])
+                        continue
+                    done, running = wait(running, timeout=self.options['poll_interval'], return_when=FIRST_COMPLETED)
+                    for future in done:
+                        self.finished += 1
+                        if future.exception() is not None:
+                            # Handler errors are recorded on the job; this is the queue itself failing
+                            self.stderr.write(self.style.ERROR(f'Job runner failed: {future.exception()!r}'))
+            except KeyboardInterrupt:
+                # Let the running jobs finish; unclaimed ones stay queued
+                self.stdout.write(f'Finishing {len(running)} running jobs...')
+                wait(running)
+                self.finished += len(running)
+                raise
@@ -0,0 +1,68 @@
+# Generated by Django 5.2.3 on 2026-10-18 07:09
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Sum
+
+
+def build_wallet_summaries(apps, schema_editor):
+    """Backfill one WalletSummary per user that already has tracker data"""
+    User = apps.get_model(*settings.AUTH_USER_MODEL.split('.'))
+    WalletSummary = apps.get_model('vbucks_tracker', 'WalletSummary')
+    sources = [
+        ('purchased', apps.get_model('vbucks_tracker', 'RealMoneyTransaction'), 'vbucks_earned', {}),
+        ('earned', apps.get_model('vbucks_tracker', 'VbucksEarning'), 'amount', {}),
+        ('spent', apps.get_model('vbucks_tracker', 'VbucksSpending'), 'vbucks_spent', {'refunded': False}),
+        ('refunded', apps.get_model('vbucks_tracker', 'Refund'), 'vbucks_returned', {}),
+    ]
+
+    totals = {}
+    for field, model, column, filters in sources:
+        rows = model.objects.filter(**filters).values('user_id').annotate(total=Sum(column))
+        for row in rows:
+            totals.setdefault(row['user_id'], {})[field] = row['total'] or 0
+
+    summaries = []
+    for user_id in User.objects.filter(pk__in=totals).values_list('pk', flat=True):
+        values = totals[user_id]
+        summaries.append(WalletSummary(
+            user_id=user_id,
+            balance=values.get('purchased', 0) + values.get('earned', 0) - values.get('spent', 0),
+            **values
+        ))
+    WalletSummary.objects.bulk_create(summaries, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vbucks_tracker', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='refund',
+            name='reason',
+            field=models.CharField(blank=True, choices=[('DISAPPOINTED', 'Item Disappointed Me'), ('ACCIDENTAL', 'Accidental Purchase'), ('OTHER', 'Other')], help_text='Select the reason for this refund', max_length=200, verbose_name='Reason'),
+        ),
+        migrations.CreateModel(
+            name='WalletSummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('purchased', models.BigIntegerField(default=0, verbose_name='V-Bucks Purchased')),
+                ('earned', models.BigIntegerField(default=0, verbose_name='V-Bucks Earned')),
+                ('spent', models.BigIntegerField(default=0, verbose_name='V-Bucks Spent')),
+                ('refunded', models.BigIntegerField(default=0, verbose_name='V-Bucks Refunded')),
+                ('balance', models.BigIntegerField(default=0, verbose_name='Balance')),
+                ('version', models.PositiveBigIntegerField(default=0, help_text="Incremented on every change to the user's tracker data")),
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='wallet_summary', to=settings.AUTH_USER_MODEL, verbose_name='User')),
+            ],
+            options={
+                'verbose_name': 'Wallet Summary',
+                'verbose_name_plural': 'Wallet Summaries',
+            },
+        ),
+        migrations.RunPython(build_wallet_summaries, migrations.RunPython.noop),
+    ]
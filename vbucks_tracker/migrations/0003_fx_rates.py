@@ -0,0 +1,50 @@
+# Generated by Django 5.2.3 on 2026-10-18 07:22
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import F
+
+
+def fill_base_currency_amounts(apps, schema_editor):
+    """Rows already in the base currency need no rate; the rest use backfill_amount_base"""
+    RealMoneyTransaction = apps.get_model('vbucks_tracker', 'RealMoneyTransaction')
+    RealMoneyTransaction.objects.filter(currency=settings.FX_BASE_CURRENCY).update(amount_base=F('amount'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vbucks_tracker', '0002_wallet_summary'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FxRate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('currency', models.CharField(choices=[('BGN', 'BGN (Bulgarian Lev)'), ('EUR', 'EUR (Euro)'), ('USD', 'USD (US Dollar)'), ('GBP', 'GBP (British Pound)')], max_length=5)),
+                ('rate', models.DecimalField(decimal_places=8, max_digits=18)),
+            ],
+            options={
+                'verbose_name': 'FX Rate',
+                'verbose_name_plural': 'FX Rates',
+                'ordering': ['currency', '-date'],
+            },
+        ),
+        migrations.AddField(
+            model_name='realmoneytransaction',
+            name='amount_base',
+            field=models.DecimalField(blank=True, decimal_places=2, editable=False, help_text="Amount converted to FX_BASE_CURRENCY at the transaction date's rate", max_digits=14, null=True, verbose_name='Amount (base currency)'),
+        ),
+        migrations.AddIndex(
+            model_name='realmoneytransaction',
+            index=models.Index(fields=['user', 'amount_base'], name='vbucks_trac_user_id_1adc78_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='fxrate',
+            constraint=models.UniqueConstraint(fields=('currency', 'date'), name='unique_fx_rate_per_day'),
+        ),
+        migrations.RunPython(fill_base_currency_amounts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,77 @@
+# Generated by Django 5.2.3 on 2026-10-18 07:25
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+def build_wallet_rollups(apps, schema_editor):
+    """Backfill daily and monthly rollup buckets from the existing tracker rows"""
+    WalletRollup = apps.get_model('vbucks_tracker', 'WalletRollup')
+    sources = [
+        ('TRANSACTION', apps.get_model('vbucks_tracker', 'RealMoneyTransaction'), 'category', {
+            'vbucks': Sum('vbucks_earned'), 'amount_base': Sum('amount_base'),
+        }, {}),
+        ('EARNING', apps.get_model('vbucks_tracker', 'VbucksEarning'), 'type', {
+            'vbucks': Sum('amount'),
+        }, {}),
+        ('SPENDING', apps.get_model('vbucks_tracker', 'VbucksSpending'), 'category', {
+            'vbucks': Sum('vbucks_spent'),
+        }, {'refunded': False}),
+    ]
+
+    buckets = {}
+    for source, model, category_field, sums, filters in sources:
+        rows = (
+            model.objects.filter(**filters).order_by()
+            .values('user_id', category_field, 'date')
+            .annotate(entries_total=Count('pk'), **{f'{field}_total': total for field, total in sums.items()})
+        )
+        for row in rows:
+            day = row['date']
+            for period, start in (('D', day), ('M', day.replace(day=1))):
+                key = (row['user_id'], source, period, start, row[category_field])
+                bucket = buckets.setdefault(key, {'vbucks': 0, 'amount_base': 0, 'entries': 0})
+                for field in bucket:
+                    bucket[field] += row.get(f'{field}_total') or 0
+
+    WalletRollup.objects.bulk_create([
+        WalletRollup(
+            user_id=user_id, source=source, period=period,
+            period_start=start, category=category, **values
+        )
+        for (user_id, source, period, start, category), values in buckets.items()
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vbucks_tracker', '0003_fx_rates'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WalletRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source', models.CharField(choices=[('SPENDING', 'V-Bucks Spending'), ('EARNING', 'V-Bucks Earning'), ('TRANSACTION', 'Real Money Transaction')], max_length=12)),
+                ('period', models.CharField(choices=[('D', 'Day'), ('M', 'Month')], max_length=1)),
+                ('period_start', models.DateField(help_text='The day, or the first day of the month')),
+                ('category', models.CharField(max_length=10)),
+                ('vbucks', models.BigIntegerField(default=0)),
+                ('amount_base', models.DecimalField(decimal_places=2, default=0, help_text='Real money in FX_BASE_CURRENCY (transactions only)', max_digits=16)),
+                ('entries', models.PositiveIntegerField(default=0)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='wallet_rollups', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Wallet Rollup',
+                'verbose_name_plural': 'Wallet Rollups',
+                'ordering': ['period_start'],
+                'constraints': [models.UniqueConstraint(fields=('user', 'source', 'period', 'period_start', 'category'), name='unique_wallet_rollup_bucket')],
+            },
+        ),
+        migrations.RunPython(build_wallet_rollups, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.3 on 2026-10-18 08:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vbucks_tracker', '0005_request_profiles'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='walletsummary',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, help_text="When the user's tracker data last changed"),
+        ),
+    ]
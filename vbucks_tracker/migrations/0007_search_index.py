@@ -0,0 +1,182 @@
+from django.db import migrations
+
+# The statements are frozen here rather than built from vbucks_tracker.search,
+# so later changes to that module can't change what this migration does.
+# Document rowids are pk * 4 + a kind code: 0 transaction, 1 earning,
+# 2 spending, 3 refund.
+
+SQLITE_INSTALL = [
+    (
+        "CREATE VIRTUAL TABLE vbucks_tracker_search USING fts5("
+        "body, user_id UNINDEXED, tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')"
+    ),
+    (
+        "CREATE TRIGGER vbucks_tracker_search_transaction_insert "
+        "AFTER INSERT ON vbucks_tracker_realmoneytransaction BEGIN "
+        "INSERT INTO vbucks_tracker_search(rowid, body, user_id) VALUES (NEW.id * 4 + 0, "
+        "coalesce(NEW.source_name, '') || ' ' || coalesce(NEW.notes, ''), NEW.user_id); END"
+    ),
+    (
+        "CREATE TRIGGER vbucks_tracker_search_transaction_update "
+        "AFTER UPDATE OF source_name, notes, user_id ON vbucks_tracker_realmoneytransaction BEGIN "
+        "UPDATE vbucks_tracker_search SET "
+        "body = coalesce(NEW.source_name, '') || ' ' || coalesce(NEW.notes, ''), "
+        "user_id = NEW.user_id WHERE rowid = OLD.id * 4 + 0; END"
+    ),
+    (
+        "CREATE TRIGGER vbucks_tracker_search_transaction_delete "
+        "AFTER DELETE ON vbucks_tracker_realmoneytransaction BEGIN "
+        "DELETE FROM vbucks_tracker_search WHERE rowid = OLD.id * 4 + 0; END"
+    ),
+    (
+        "CREATE TRIGGER vbucks_tracker_search_earning_insert "
+        "AFTER INSERT ON vbucks_tracker_vbucksearning BEGIN "
+        "INSERT INTO vbucks_tracker_search(rowid, body, user_id) VALUES (NEW.id * 4 + 1, "
+        "coalesce(NEW.earning_name, ''), NEW.user_id); END"
+    ),
+    (
+        "CREATE TRIGGER vbucks_tracker_search_earning_update "
+        "AFTER UPDATE OF earning_name, user_id ON vbucks_tracker_vbucksearning BEGIN "
+        "UPDATE vbucks_tracker_search SET body = coalesce(NEW.earning_name, ''), "
+        "user_id = NEW.user_id WHERE rowid = OLD.id * 4 + 1; END"
+    ),
+    (
+        "CREATE TRIGGER vbucks_tracker_search_earning_delete "
+        "AFTER DELETE ON vbucks_tracker_vbucksearning BEGIN "
+        "DELETE FROM vbucks_tracker_search WHERE rowid = OLD.id * 4 + 1; END"
+    ),
+    (
+        "CREATE TRIGGER vbucks_tracker_search_spending_insert "
+        "AFTER INSERT ON vbucks_tracker_vbucksspending BEGIN "
+        "INSERT INTO vbucks_tracker_search(rowid, body, user_id) VALUES (NEW.id * 4 + 2, "
+        "coalesce(NEW.item_name, ''), NEW.user_id); END"
+    ),
+    (
+        "CREATE TRIGGER vbucks_tracker_search_spending_update "
+        "AFTER UPDATE OF item_name, user_id ON vbucks_tracker_vbucksspending BEGIN "
+        "UPDATE vbucks_tracker_search SET body = coalesce(NEW.item_name, ''), "
+        "user_id = NEW.user_id WHERE rowid = OLD.id * 4 + 2; END"
+    ),
+    (
+        "CREATE TRIGGER vbucks_tracker_search_spending_delete "
+        "AFTER DELETE ON vbucks_tracker_vbucksspending BEGIN "
+        "DELETE FROM vbucks_tracker_search WHERE rowid = OLD.id * 4 + 2; END"
+    ),
+    (
+        "CREATE TRIGGER vbucks_tracker_search_refund_insert "
+        "AFTER INSERT ON vbucks_tracker_refund BEGIN "
+        "INSERT INTO vbucks_tracker_search(rowid, body, user_id) VALUES (NEW.id * 4 + 3, "
+        "coalesce(NEW.notes, ''), NEW.user_id); END"
+    ),
+    (
+        "CREATE TRIGGER vbucks_tracker_search_refund_update "
+        "AFTER UPDATE OF notes, user_id ON vbucks_tracker_refund BEGIN "
+        "UPDATE vbucks_tracker_search SET body = coalesce(NEW.notes, ''), "
+        "user_id = NEW.user_id WHERE rowid = OLD.id * 4 + 3; END"
+    ),
+    (
+        "CREATE TRIGGER vbucks_tracker_search_refund_delete "
+        "AFTER DELETE ON vbucks_tracker_refund BEGIN "
+        "DELETE FROM vbucks_tracker_search WHERE rowid = OLD.id * 4 + 3; END"
+    ),
+    # Index the rows that already exist
+    (
+        "INSERT INTO vbucks_tracker_search(rowid, body, user_id) "
+        "SELECT id * 4 + 0, coalesce(source_name, '') || ' ' || coalesce(notes, ''), user_id "
+        "FROM vbucks_tracker_realmoneytransaction"
+    ),
+    (
+        "INSERT INTO vbucks_tracker_search(rowid, body, user_id) "
+        "SELECT id * 4 + 1, coalesce(earning_name, ''), user_id FROM vbucks_tracker_vbucksearning"
+    ),
+    (
+        "INSERT INTO vbucks_tracker_search(rowid, body, user_id) "
+        "SELECT id * 4 + 2, coalesce(item_name, ''), user_id FROM vbucks_tracker_vbucksspending"
+    ),
+    (
+        "INSERT INTO vbucks_tracker_search(rowid, body, user_id) "
+        "SELECT id * 4 + 3, coalesce(notes, ''), user_id FROM vbucks_tracker_refund"
+    ),
+    "INSERT INTO vbucks_tracker_search(vbucks_tracker_search) VALUES ('optimize')",
+]
+
+SQLITE_UNINSTALL = [
+    "DROP TRIGGER IF EXISTS vbucks_tracker_search_transaction_insert",
+    "DROP TRIGGER IF EXISTS vbucks_tracker_search_transaction_update",
+    "DROP TRIGGER IF EXISTS vbucks_tracker_search_transaction_delete",
+    "DROP TRIGGER IF EXISTS vbucks_tracker_search_earning_insert",
+    "DROP TRIGGER IF EXISTS vbucks_tracker_search_earning_update",
+    "DROP TRIGGER IF EXISTS vbucks_tracker_search_earning_delete",
+    "DROP TRIGGER IF EXISTS vbucks_tracker_search_spending_insert",
+    "DROP TRIGGER IF EXISTS vbucks_tracker_search_spending_update",
+    "DROP TRIGGER IF EXISTS vbucks_tracker_search_spending_delete",
+    "DROP TRIGGER IF EXISTS vbucks_tracker_search_refund_insert",
+    "DROP TRIGGER IF EXISTS vbucks_tracker_search_refund_update",
+    "DROP TRIGGER IF EXISTS vbucks_tracker_search_refund_delete",
+    "DROP TABLE IF EXISTS vbucks_tracker_search",
+]
+
+# The expressions PostgresSearchBackend's SearchVector(..., config='simple') compiles to,
+# so the planner can use these indexes for its @@ lookups.
+POSTGRES_INSTALL = [
+    (
+        'CREATE INDEX "vbucks_transaction_search" ON "vbucks_tracker_realmoneytransaction" '
+        "USING gin ((to_tsvector('simple'::regconfig, "
+        "COALESCE(\"source_name\", '') || ' ' || COALESCE(\"notes\", ''))))"
+    ),
+    (
+        'CREATE INDEX "vbucks_earning_search" ON "vbucks_tracker_vbucksearning" '
+        "USING gin ((to_tsvector('simple'::regconfig, COALESCE(\"earning_name\", ''))))"
+    ),
+    (
+        'CREATE INDEX "vbucks_spending_search" ON "vbucks_tracker_vbucksspending" '
+        "USING gin ((to_tsvector('simple'::regconfig, COALESCE(\"item_name\", ''))))"
+    ),
+    (
+        'CREATE INDEX "vbucks_refund_search" ON "vbucks_tracker_refund" '
+        "USING gin ((to_tsvector('simple'::regconfig, COALESCE(\"notes\", ''))))"
+    ),
+]
+
+POSTGRES_UNINSTALL = [
+    'DROP INDEX IF EXISTS "vbucks_transaction_search"',
+    'DROP INDEX IF EXISTS "vbucks_earning_search"',
+    'DROP INDEX IF EXISTS "vbucks_spending_search"',
+    'DROP INDEX IF EXISTS "vbucks_refund_search"',
+]
+
+
+class RunSQLOn(migrations.RunSQL):
+    """RunSQL that only touches databases of the given vendor"""
+
+    def __init__(self, vendor, *args, **kwargs):
+        self.vendor = vendor
+        super().__init__(*args, **kwargs)
+
+    def deconstruct(self):
+        name, args, kwargs = super().deconstruct()
+        return name, [self.vendor, *args], kwargs
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor == self.vendor:
+            super().database_forwards(app_label, schema_editor, from_state, to_state)
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor == self.vendor:
+            super().database_backwards(app_label, schema_editor, from_state, to_state)
+
+
+class Migration(migrations.Migration):
+    """
+    Full-text index over names and notes: an FTS5 table kept in sync by
+    triggers on SQLite, GIN indexes on to_tsvector() on PostgreSQL.
+    """
+
+    dependencies = [
+        ('vbucks_tracker', '0006_summary_updated_at'),
+    ]
+
+    operations = [
+        RunSQLOn('sqlite', SQLITE_INSTALL, SQLITE_UNINSTALL),
+        RunSQLOn('postgresql', POSTGRES_INSTALL, POSTGRES_UNINSTALL),
+    ]
@@ -0,0 +1,81 @@
+# Generated by Django 5.2.3 on 2026-10-18 09:20
+
+import heapq
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def build_ledger(apps, schema_editor):
+    """Backfill one ledger entry per existing tracker row, every user's in date order"""
+    LedgerEntry = apps.get_model('vbucks_tracker', 'LedgerEntry')
+    using = schema_editor.connection.alias
+    sources = [
+        ('TRANSACTION', 'RealMoneyTransaction', 'date', 'vbucks_earned', 1),
+        ('EARNING', 'VbucksEarning', 'date', 'amount', 1),
+        ('SPENDING', 'VbucksSpending', 'date', 'vbucks_spent', -1),
+        ('REFUND', 'Refund', 'refund_date', 'vbucks_returned', 1),
+    ]
+
+    def rows(source, model_name, date_column, column, sign):
+        model = apps.get_model('vbucks_tracker', model_name)
+        values = (
+            model.objects.using(using).order_by('user_id', date_column, 'pk')
+            .values_list('user_id', date_column, 'pk', column).iterator(chunk_size=2000)
+        )
+        for user_id, day, pk, amount in values:
+            if date_column == 'refund_date':
+                day = timezone.localdate(day)
+            yield user_id, day, source, pk, sign * amount
+
+    merged = heapq.merge(*(rows(*source) for source in sources), key=lambda row: row[:2])
+    batch = []
+    user = balance = seq = None
+    for user_id, day, source, pk, delta in merged:
+        if not delta:
+            continue
+        if user_id != user:
+            user, balance, seq = user_id, 0, 0
+        seq += 1
+        balance += delta
+        batch.append(LedgerEntry(
+            user_id=user_id, seq=seq, date=day, delta=delta, balance=balance, source=source, source_id=pk,
+        ))
+        if len(batch) == 2000:
+            LedgerEntry.objects.using(using).bulk_create(batch)
+            batch = []
+    LedgerEntry.objects.using(using).bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vbucks_tracker', '0008_jobs'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LedgerEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('seq', models.PositiveBigIntegerField(help_text="The user's entries in the order they were recorded")),
+                ('date', models.DateField(help_text='When the change took effect')),
+                ('delta', models.BigIntegerField(verbose_name='V-Bucks')),
+                ('balance', models.BigIntegerField(help_text='Balance after this entry')),
+                ('source', models.CharField(choices=[('TRANSACTION', 'Real Money Transaction'), ('EARNING', 'V-Bucks Earning'), ('SPENDING', 'V-Bucks Spending'), ('REFUND', 'Refund')], max_length=12)),
+                ('source_id', models.PositiveBigIntegerField(blank=True, help_text='The tracker row, which may since have changed or been deleted', null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ledger_entries', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Ledger Entry',
+                'verbose_name_plural': 'Ledger Entries',
+                'ordering': ['date', 'seq'],
+                'indexes': [models.Index(fields=['user', 'date', 'seq'], name='ledger_user_date_seq_idx')],
+                'constraints': [models.UniqueConstraint(fields=('user', 'seq'), name='unique_ledger_seq_per_user')],
+            },
+        ),
+        migrations.RunPython(build_ledger, migrations.RunPython.noop),
+    ]
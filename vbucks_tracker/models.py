@@ -1,11 +1,55 @@
+from contextlib import contextmanager
 from django.core.exceptions import ValidationError
-from django.db import models
+from django.db import models, router, transaction
 from django.utils import timezone
 from django.core.validators import MinValueValidator
 from accounts.models import User
+from .routers import ShardedQuerySet, use_shard
 
 
-class RealMoneyTransaction(models.Model):
+class WalletEntry(models.Model):
+    """Base for tracker rows that feed the owner's WalletSummary"""
+    objects = ShardedQuerySet.as_manager()
+
+    class Meta:
+        abstract = True
+
+    def wallet_contribution(self):
+        """Return this row's share of the WalletSummary totals"""
+        raise NotImplementedError
+
+    def rollup_contribution(self):
+        """
+        Return ``(source, category, date, values)`` for the analytics rollups,
+        or None when the row doesn't count towards them
+        """
+        return None
+
+    def ledger_contribution(self):
+        """Return ``(source, date, delta)``: the row's signed change to the balance, for the ledger"""
+        raise NotImplementedError
+
+    def prepare_bulk_insert(self):
+        """Fill derived columns that save() sets, for rows written with bulk_create"""
+
+    @contextmanager
+    def write_transaction(self, using=None):
+        """One transaction on the row's database (its user's shard) for the write and its side effects"""
+        using = using or router.db_for_write(type(self), instance=self)
+        with use_shard(using), transaction.atomic(using=using):
+            yield
+
+    def save(self, *args, **kwargs):
+        """Save the row and its WalletSummary delta in one transaction"""
+        with self.write_transaction(kwargs.get('using')):
+            super().save(*args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        with self.write_transaction(kwargs.get('using')):
+            return super().delete(*args, **kwargs)
+
+
+class RealMoneyTransaction(WalletEntry):
     CATEGORIES = [
         ('VB', 'V-Bucks'),
         ('CREW', 'Fortnite Crew'),
@@ -43,6 +87,15 @@ class RealMoneyTransaction(models.Model):
         default='BGN'
     )
     notes = models.TextField(blank=True)
+    amount_base = models.DecimalField(
+        max_digits=14,
+        decimal_places=2,
+        null=True,
+        blank=True,
+        editable=False,
+        verbose_name="Amount (base currency)",
+        help_text="Amount converted to FX_BASE_CURRENCY at the transaction date's rate"
+    )
 
     class Meta:
         ordering = ['-date']
@@ -50,6 +103,7 @@ class RealMoneyTransaction(models.Model):
         verbose_name_plural = 'Real Money Transactions'
         indexes = [
             models.Index(fields=['user', 'date']),
+            models.Index(fields=['user', 'amount_base']),
         ]
 
     def __str__(self):
@@ -59,8 +113,66 @@ class RealMoneyTransaction(models.Model):
         if self.date and self.date > timezone.now().date():
             raise ValidationError("Transaction date cannot be in the future")
 
+    def wallet_contribution(self):
+        return {'purchased': self.vbucks_earned}
+
+    def ledger_contribution(self):
+        return ('TRANSACTION', self.date, self.vbucks_earned)
+
+    def rollup_contribution(self):
+        return ('TRANSACTION', self.category, self.date, {
+            'vbucks': self.vbucks_earned,
+            'amount_base': self.amount_base or 0,
+            'entries': 1,
+        })
+
+    def compute_amount_base(self):
+        from .fx import to_base
+        return to_base(self.amount, self.currency, self.date)
+
+    def prepare_bulk_insert(self):
+        self.amount_base = self.compute_amount_base()
+
+    def save(self, *args, **kwargs):
+        self.prepare_bulk_insert()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and {'amount', 'currency', 'date'} & set(update_fields):
+            kwargs['update_fields'] = {*update_fields, 'amount_base'}
+        super().save(*args, **kwargs)
+
+
+class FxRate(models.Model):
+    """Value of one unit of ``currency`` in FX_BASE_CURRENCY on ``date``"""
+    date = models.DateField()
+    currency = models.CharField(max_length=5, choices=RealMoneyTransaction.CURRENCIES)
+    rate = models.DecimalField(max_digits=18, decimal_places=8)
+
+    class Meta:
+        ordering = ['currency', '-date']
+        verbose_name = 'FX Rate'
+        verbose_name_plural = 'FX Rates'
+        constraints = [
+            models.UniqueConstraint(fields=['currency', 'date'], name='unique_fx_rate_per_day'),
+        ]
+
+    def __str__(self):
+        return f"{self.currency} {self.date}: {self.rate}"
 
-class VbucksEarning(models.Model):
+    def save(self, *args, **kwargs):
+        from .fx import invalidate_rates
+        super().save(*args, **kwargs)
+        invalidate_rates()
+        transaction.on_commit(invalidate_rates)
+
+    def delete(self, *args, **kwargs):
+        from .fx import invalidate_rates
+        result = super().delete(*args, **kwargs)
+        invalidate_rates()
+        transaction.on_commit(invalidate_rates)
+        return result
+
+
+class VbucksEarning(WalletEntry):
     EARNING_TYPES = [
         ('BP', 'Battle Pass'),
         ('CREW', 'Fortnite Crew'),
@@ -94,8 +206,17 @@ class VbucksEarning(models.Model):
         if self.date and self.date > timezone.now().date():
             raise ValidationError("Earning date cannot be in the future")
 
+    def wallet_contribution(self):
+        return {'earned': self.amount}
+
+    def ledger_contribution(self):
+        return ('EARNING', self.date, self.amount)
+
+    def rollup_contribution(self):
+        return ('EARNING', self.type, self.date, {'vbucks': self.amount, 'entries': 1})
 
-class VbucksSpending(models.Model):
+
+class VbucksSpending(WalletEntry):
     CATEGORIES = [
         ('SKIN', 'Skin'),
         ('EMOTE', 'Emote'),
@@ -131,8 +252,63 @@ class VbucksSpending(models.Model):
         if self.date and self.date > timezone.now().date():
             raise ValidationError("Spending date cannot be in the future")
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+
+    def save(self, *args, **kwargs):
+        """
+        Keep the purchase's Refund in step: setting ``refunded`` by hand (the
+        admin changelist, say) creates or deletes the Refund, and a refunded
+        purchase's Refund returns its new amount. So the flag, the summary and
+        the ledger always agree with the refund rows.
+        """
+        from .services import VbucksService
+
+        loaded = {'refunded': False} if self._state.adding else getattr(self, '_loaded_values', {})
+        update_fields = kwargs.get('update_fields')
+        refunded = self.refunded
+        flipped = (
+            loaded.get('refunded', refunded) != refunded
+            and (update_fields is None or 'refunded' in update_fields)
+        )
+        resized = (
+            refunded and not flipped and loaded.get('vbucks_spent', self.vbucks_spent) != self.vbucks_spent
+            and (update_fields is None or 'vbucks_spent' in update_fields)
+        )
+        with self.write_transaction(kwargs.get('using')):
+            refund = None
+            if (flipped and not refunded) or resized:
+                refund = Refund.objects.filter(original_purchase_id=self.pk).first()
+            if flipped and (refunded or refund):
+                self.refunded = not refunded  # the refund write sets the flag
+            super().save(*args, **kwargs)
+            if flipped and refunded:
+                VbucksService.create_refunds([Refund(user_id=self.user_id, original_purchase=self)])
+            elif refund and flipped:
+                refund.delete()
+            elif refund and refund.vbucks_returned != self.vbucks_spent:
+                refund.vbucks_returned = self.vbucks_spent
+                refund.save(update_fields=['vbucks_returned'])
+        self.refunded = refunded
+        self._loaded_values = {'refunded': refunded, 'vbucks_spent': self.vbucks_spent}
+
+    def wallet_contribution(self):
+        return {'spent': 0 if self.refunded else self.vbucks_spent}
+
+    def ledger_contribution(self):
+        # Refunded or not: a refund is its own, later entry
+        return ('SPENDING', self.date, -self.vbucks_spent)
+
+    def rollup_contribution(self):
+        if self.refunded:
+            return None
+        return ('SPENDING', self.category, self.date, {'vbucks': self.vbucks_spent, 'entries': 1})
+
 
-class Refund(models.Model):
+class Refund(WalletEntry):
     REFUND_REASONS = [
         ('DISAPPOINTED', 'Item Disappointed Me'),
         ('ACCIDENTAL', 'Accidental Purchase'),
@@ -192,21 +368,28 @@ class Refund(models.Model):
             raise ValidationError("This purchase has already been refunded")
         self.vbucks_returned = self.original_purchase.vbucks_spent  # Auto-set amount
 
+    def wallet_contribution(self):
+        return {'refunded': self.vbucks_returned}
+
+    def ledger_contribution(self):
+        return ('REFUND', timezone.localdate(self.refund_date), self.vbucks_returned)
+
     def save(self, *args, **kwargs):
-        """Handle purchase status on save"""
-        self.full_clean()
-        if not self.original_purchase.refunded:
-            self.original_purchase.refunded = True
-            self.original_purchase.save(update_fields=['refunded'])
-        super().save(*args, **kwargs)
+        """New refunds go through the locked, guarded path that also flags the purchase"""
+        if self._state.adding:
+            from .services import VbucksService
+            VbucksService.create_refunds([self])
+        else:
+            super().save(*args, **kwargs)
 
     def delete(self, *args, **kwargs):
         """Handle purchase status on delete"""
-        purchase = self.original_purchase
-        super().delete(*args, **kwargs)
-        purchase.refunded = False
-        purchase.save(update_fields=['refunded'])
-
+        with self.write_transaction(kwargs.get('using')):
+            purchase = VbucksSpending.objects.select_for_update().get(pk=self.original_purchase_id)
+            result = super().delete(*args, **kwargs)
+            purchase.refunded = False
+            purchase.save(update_fields=['refunded'])
+        return result
 
     @property
     def purchase_details(self):
@@ -216,3 +399,236 @@ class Refund(models.Model):
             'original_amount': self.original_purchase.vbucks_spent,
             'purchase_date': self.original_purchase.date
         }
+
+
+class WalletSummary(models.Model):
+    """Materialized per-user V-Bucks totals, kept in sync by the tracker models"""
+    TOTAL_FIELDS = ('purchased', 'earned', 'spent', 'refunded')
+    objects = ShardedQuerySet.as_manager()
+
+    user = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        related_name='wallet_summary',
+        verbose_name="User"
+    )
+    purchased = models.BigIntegerField(default=0, verbose_name="V-Bucks Purchased")
+    earned = models.BigIntegerField(default=0, verbose_name="V-Bucks Earned")
+    spent = models.BigIntegerField(default=0, verbose_name="V-Bucks Spent")
+    refunded = models.BigIntegerField(default=0, verbose_name="V-Bucks Refunded")
+    balance = models.BigIntegerField(default=0, verbose_name="Balance")
+    version = models.PositiveBigIntegerField(
+        default=0,
+        help_text="Incremented on every change to the user's tracker data"
+    )
+    updated_at = models.DateTimeField(
+        auto_now=True,
+        help_text="When the user's tracker data last changed"
+    )
+
+    class Meta:
+        verbose_name = 'Wallet Summary'
+        verbose_name_plural = 'Wallet Summaries'
+
+    def __str__(self):
+        return f"Wallet of {self.user_id}: {self.balance} V-Bucks"
+
+    def as_dict(self):
+        """Return the totals in the shape used by VbucksService.get_user_summary"""
+        return {
+            'total_purchased': self.purchased,
+            'total_earned': self.earned,
+            'total_spent': self.spent,
+            'total_refunded': self.refunded,
+            'balance': self.balance,
+        }
+
+
+class WalletRollup(models.Model):
+    """Per-user daily and monthly totals by category, kept in sync by the tracker models"""
+    SOURCES = [
+        ('SPENDING', 'V-Bucks Spending'),
+        ('EARNING', 'V-Bucks Earning'),
+        ('TRANSACTION', 'Real Money Transaction'),
+    ]
+    PERIODS = [
+        ('D', 'Day'),
+        ('M', 'Month'),
+    ]
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='wallet_rollups')
+    source = models.CharField(max_length=12, choices=SOURCES)
+    period = models.CharField(max_length=1, choices=PERIODS)
+    period_start = models.DateField(help_text="The day, or the first day of the month")
+    category = models.CharField(max_length=10)
+    vbucks = models.BigIntegerField(default=0)
+    amount_base = models.DecimalField(
+        max_digits=16,
+        decimal_places=2,
+        default=0,
+        help_text="Real money in FX_BASE_CURRENCY (transactions only)"
+    )
+    entries = models.PositiveIntegerField(default=0)
+
+    objects = ShardedQuerySet.as_manager()
+
+    class Meta:
+        ordering = ['period_start']
+        verbose_name = 'Wallet Rollup'
+        verbose_name_plural = 'Wallet Rollups'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'source', 'period', 'period_start', 'category'],
+                name='unique_wallet_rollup_bucket'
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.get_source_display()} {self.category} {self.period_start} ({self.period})"
+
+
+class LedgerEntry(models.Model):
+    """
+    One signed change to a user's V-Bucks balance, appended for every
+    tracker row written, changed (a reversal and the new value) or deleted
+    (a reversal); see ledger.py. Only ``balance``, the running balance in
+    (date, seq) order, is ever updated: by backdated entries.
+    """
+    SOURCES = [
+        ('TRANSACTION', 'Real Money Transaction'),
+        ('EARNING', 'V-Bucks Earning'),
+        ('SPENDING', 'V-Bucks Spending'),
+        ('REFUND', 'Refund'),
+    ]
+    objects = ShardedQuerySet.as_manager()
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='ledger_entries')
+    seq = models.PositiveBigIntegerField(help_text="The user's entries in the order they were recorded")
+    date = models.DateField(help_text="When the change took effect")
+    delta = models.BigIntegerField(verbose_name="V-Bucks")
+    balance = models.BigIntegerField(help_text="Balance after this entry")
+    source = models.CharField(max_length=12, choices=SOURCES)
+    source_id = models.PositiveBigIntegerField(
+        null=True,
+        blank=True,
+        help_text="The tracker row, which may since have changed or been deleted"
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['date', 'seq']
+        verbose_name = 'Ledger Entry'
+        verbose_name_plural = 'Ledger Entries'
+        indexes = [
+            # Point-in-time balances and the balance series
+            models.Index(fields=['user', 'date', 'seq'], name='ledger_user_date_seq_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'seq'], name='unique_ledger_seq_per_user'),
+        ]
+
+    def __str__(self):
+        return f"{self.date} {self.delta:+} V-Bucks ({self.get_source_display()})"
+
+
+class RequestProfile(models.Model):
+    """A cProfile capture of one request, taken on demand by a staff user"""
+    user = models.ForeignKey(
+        User,
+        on_delete=models.SET_NULL,
+        null=True,
+        related_name='request_profiles',
+        verbose_name="Requested by"
+    )
+    method = models.CharField(max_length=10)
+    path = models.CharField(max_length=2000)
+    status_code = models.PositiveSmallIntegerField()
+    duration_ms = models.FloatField(verbose_name="Duration (ms)")
+    query_count = models.PositiveIntegerField(default=0)
+    query_ms = models.FloatField(default=0, verbose_name="Query time (ms)")
+    summary = models.TextField(help_text="Top functions by cumulative time")
+    stats = models.BinaryField(help_text="Raw pstats data, as written by pstats.Stats.dump_stats")
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        verbose_name = 'Request Profile'
+        verbose_name_plural = 'Request Profiles'
+
+    def __str__(self):
+        return f"{self.method} {self.path} ({self.duration_ms:.0f} ms)"
+
+
+class Job(models.Model):
+    """A unit of background work, run by the `manage.py run_jobs` workers (see jobs.py)"""
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    SUCCEEDED = 'succeeded'
+    FAILED = 'failed'
+    STATUSES = [
+        (QUEUED, 'Queued'),
+        (RUNNING, 'Running'),
+        (SUCCEEDED, 'Succeeded'),
+        (FAILED, 'Failed'),
+    ]
+
+    kind = models.CharField(max_length=50)
+    # No database constraint: purge jobs outlive the users they delete
+    user = models.ForeignKey(
+        User,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        null=True,
+        blank=True,
+        related_name='+'
+    )
+    payload = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=10, choices=STATUSES, default=QUEUED)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField(default=3)
+    run_after = models.DateTimeField(default=timezone.now, help_text="Not claimed before this time (retry backoff)")
+    progress = models.PositiveSmallIntegerField(default=0, help_text="Percent done")
+    progress_message = models.CharField(max_length=200, blank=True)
+    result = models.JSONField(null=True, blank=True)
+    error = models.TextField(blank=True, help_text="Traceback of the last failed attempt")
+    worker = models.CharField(max_length=100, blank=True)
+    heartbeat_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        help_text="Last sign of life of the running attempt; stale attempts are retried"
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        verbose_name = 'Job'
+        verbose_name_plural = 'Jobs'
+        indexes = [
+            models.Index(fields=['status', 'run_after'], name='job_claim_idx'),
+        ]
+        constraints = [
+            # A user has at most one waiting job of each kind (running ones don't count)
+            models.UniqueConstraint(
+                fields=['kind', 'user'],
+                condition=models.Q(status='queued'),
+                name='unique_queued_job_per_user'
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} #{self.pk} ({self.status})"
+
+    @property
+    def finished(self):
+        return self.status in (self.SUCCEEDED, self.FAILED)
+
+    def report_progress(self, done, total, message=''):
+        """Record how far the running attempt got; also its heartbeat"""
+        self.progress = min(100, done * 100 // total) if total else 0
+        self.progress_message = message[:200]
+        self.heartbeat_at = timezone.now()
+        Job.objects.filter(pk=self.pk).update(
+            progress=self.progress, progress_message=self.progress_message, heartbeat_at=self.heartbeat_at
+        )
@@ -0,0 +1,149 @@
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from django.core.exceptions import ValidationError
+from django.core.paginator import InvalidPage, Paginator
+from django.db import connections
+from django.db.models import Q
+from django.utils.functional import cached_property
+
+
+def estimate_row_count(model, using='default'):
+    """
+    Return the planner's row estimate for ``model``'s table, or None.
+
+    Uses ``pg_class.reltuples`` on PostgreSQL and ``sqlite_stat1`` (filled
+    by ANALYZE / PRAGMA optimize) on SQLite. Both are metadata lookups, so
+    they stay instant however large the table grows.
+    """
+    connection = connections[using]
+    table = model._meta.db_table
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute("SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass", [table])
+            row = cursor.fetchone()
+            return row[0] if row and row[0] >= 0 else None
+        if connection.vendor == 'sqlite':
+            cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'sqlite_stat1'")
+            if cursor.fetchone() is None:
+                return None
+            cursor.execute("SELECT stat FROM sqlite_stat1 WHERE tbl = %s LIMIT 1", [table])
+            row = cursor.fetchone()
+            return int(row[0].split()[0]) if row else None
+    return None
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator that skips COUNT(*) on large unfiltered tables.
+
+    Unfiltered lists above ``exact_count_threshold`` rows use the database's
+    table statistics; filtered lists and small tables are counted exactly.
+    """
+    exact_count_threshold = 10000
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if hasattr(queryset, 'query') and not queryset.query.where:
+            estimate = estimate_row_count(queryset.model, queryset.db)
+            if estimate is not None and estimate > self.exact_count_threshold:
+                return estimate
+        return super().count
+
+
+class KeysetPage:
+    """One page of a KeysetPaginator, exposing cursors instead of page numbers"""
+
+    def __init__(self, object_list, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+class KeysetPaginator:
+    """
+    Seek ("keyset") pagination over a queryset ordered by ``keys`` descending.
+
+    Pages are located with ``WHERE (key, id) < cursor`` instead of OFFSET, so
+    every page costs the same index range scan and no COUNT(*) is issued.
+    Cursors are opaque URL-safe tokens encoding the boundary row's keys.
+    """
+
+    def __init__(self, queryset, per_page, keys=('date', 'id')):
+        self.queryset = queryset
+        self.per_page = int(per_page)
+        self.keys = tuple(keys)
+        self.fields = [queryset.model._meta.get_field(key) for key in self.keys]
+
+    def encode_cursor(self, obj):
+        values = [field.value_to_string(obj) for field in self.fields]
+        return urlsafe_b64encode(json.dumps(values).encode()).decode().rstrip('=')
+
+    def decode_cursor(self, cursor):
+        try:
+            padded = cursor + '=' * (-len(cursor) % 4)
+            values = json.loads(urlsafe_b64decode(padded.encode()))
+            if len(values) != len(self.fields):
+                raise ValueError
+            return [field.to_python(value) for field, value in zip(self.fields, values)]
+        except (ValueError, TypeError, ValidationError) as exc:
+            raise InvalidPage("Invalid cursor") from exc
+
+    def _seek(self, values, lookup):
+        """Build ``(k1, k2, ...) <lookup> (v1, v2, ...)`` as nested OR/AND filters"""
+        condition = Q()
+        for index in reversed(range(len(self.keys))):
+            equal = {key: value for key, value in zip(self.keys[:index], values[:index])}
+            step = Q(**equal, **{f'{self.keys[index]}__{lookup}': values[index]})
+            condition = step | condition if condition else step
+        return condition
+
+    def _page_query(self, after=None, before=None):
+        """Return the queryset fetching one row more than a page, and whether it runs backwards"""
+        if before:
+            values = self.decode_cursor(before)
+            queryset = self.queryset.filter(self._seek(values, 'gt')).order_by(*self.keys)
+            return queryset[:self.per_page + 1], True
+        queryset = self.queryset.order_by(*[f'-{key}' for key in self.keys])
+        if after:
+            queryset = queryset.filter(self._seek(self.decode_cursor(after), 'lt'))
+        return queryset[:self.per_page + 1], False
+
+    def _build_page(self, rows, backwards, after=None):
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if backwards:
+            rows = rows[::-1]
+            has_next, has_previous = True, has_more
+        else:
+            has_next, has_previous = has_more, bool(after)
+
+        return KeysetPage(
+            rows,
+            next_cursor=self.encode_cursor(rows[-1]) if rows and has_next else None,
+            previous_cursor=self.encode_cursor(rows[0]) if rows and has_previous else None,
+        )
+
+    def page(self, after=None, before=None):
+        queryset, backwards = self._page_query(after, before)
+        return self._build_page(list(queryset), backwards, after)
+
+    async def apage(self, after=None, before=None):
+        """Async variant of page() for async views"""
+        queryset, backwards = self._page_query(after, before)
+        return self._build_page([row async for row in queryset], backwards, after)
@@ -0,0 +1,160 @@
+from collections import defaultdict
+from datetime import timedelta
+from django.db import IntegrityError, router, transaction
+from django.db.models import Count, F, Q, Sum
+from django.utils import timezone
+from .models import WalletRollup
+from .routers import shard_for
+
+ROLLUP_VALUES = ('vbucks', 'amount_base', 'entries')
+
+
+def month_start(day):
+    return day.replace(day=1)
+
+
+def next_month(day):
+    return (day.replace(day=28) + timedelta(days=4)).replace(day=1)
+
+
+def collect_rollup_changes(changes, instance, sign=1):
+    """Add (or with ``sign=-1`` remove) a tracker row's daily and monthly buckets to ``changes``"""
+    contribution = instance.rollup_contribution() if instance is not None else None
+    if contribution is None:
+        return changes
+    source, category, day, values = contribution
+    day = WalletRollup._meta.get_field('period_start').to_python(day)  # may still be a string
+    for period, start in (('D', day), ('M', month_start(day))):
+        bucket = changes[(instance.user_id, source, period, start, category)]
+        for field, value in values.items():
+            bucket[field] += sign * value
+    return changes
+
+
+def new_rollup_changes():
+    return defaultdict(lambda: dict.fromkeys(ROLLUP_VALUES, 0))
+
+
+def apply_rollup_changes(changes, create_missing=True):
+    """
+    Add accumulated bucket deltas to the WalletRollup table.
+
+    Each bucket is one UPDATE ... SET x = x + delta; buckets that don't exist
+    yet are inserted (and retried as an update if a concurrent writer won).
+    """
+    for (user_id, source, period, start, category), values in changes.items():
+        if not any(values.values()):
+            continue
+        bucket = WalletRollup.objects.filter(
+            user_id=user_id, source=source, period=period, period_start=start, category=category
+        )
+        increments = {field: F(field) + value for field, value in values.items()}
+        if bucket.update(**increments) or not create_missing:
+            continue
+        try:
+            with transaction.atomic(using=router.db_for_write(WalletRollup)):
+                WalletRollup.objects.create(
+                    user_id=user_id, source=source, period=period,
+                    period_start=start, category=category, **values
+                )
+        except IntegrityError:
+            bucket.update(**increments)
+
+
+def range_filter(start, end):
+    """
+    Match the fewest buckets covering ``start``..``end`` (inclusive).
+
+    Whole months inside the range come from monthly buckets, the partial
+    months at either edge from daily buckets.
+    """
+    first_full = start if start.day == 1 else next_month(start)
+    after_last_full = month_start(end + timedelta(days=1))
+    if first_full >= after_last_full:
+        return Q(period='D', period_start__range=(start, end))
+
+    condition = Q(period='M', period_start__gte=first_full, period_start__lt=after_last_full)
+    if start < first_full:
+        condition |= Q(period='D', period_start__gte=start, period_start__lt=first_full)
+    if after_last_full <= end:
+        condition |= Q(period='D', period_start__gte=after_last_full, period_start__lte=end)
+    return condition
+
+
+def rollup_report(user, start, end, sources=None):
+    """
+    Summarize a user's activity between two dates from the rollup buckets.
+
+    Returns totals per source and category plus a per-month series, read
+    from at most a few dozen pre-aggregated rows.
+    """
+    rows = WalletRollup.objects.filter(range_filter(start, end), user=user)
+    if sources:
+        rows = rows.filter(source__in=sources)
+    rows = rows.values_list('source', 'period_start', 'category', *ROLLUP_VALUES)
+
+    totals = defaultdict(lambda: defaultdict(lambda: dict.fromkeys(ROLLUP_VALUES, 0)))
+    monthly = defaultdict(lambda: defaultdict(lambda: dict.fromkeys(ROLLUP_VALUES, 0)))
+    for source, period_start, category, *values in rows:
+        for bucket in (totals[source][category], monthly[month_start(period_start)][source]):
+            for field, value in zip(ROLLUP_VALUES, values):
+                bucket[field] += value
+
+    return {
+        'start': start,
+        'end': end,
+        'totals': {source: dict(categories) for source, categories in totals.items()},
+        'monthly': [
+            {'month': month, **by_source}
+            for month, by_source in sorted(monthly.items())
+        ],
+    }
+
+
+def rebuild_user_rollups(user):
+    """Recreate all of a user's rollup buckets from the source tables"""
+    from .models import RealMoneyTransaction, VbucksEarning, VbucksSpending
+
+    user_id = getattr(user, 'pk', user)
+    using = shard_for(user)
+    changes = new_rollup_changes()
+    sources = (
+        (RealMoneyTransaction.objects.using(using).filter(user_id=user_id), 'category', {
+            'vbucks': Sum('vbucks_earned'), 'amount_base': Sum('amount_base'),
+        }, 'TRANSACTION'),
+        (VbucksEarning.objects.using(using).filter(user_id=user_id), 'type', {'vbucks': Sum('amount')}, 'EARNING'),
+        (VbucksSpending.objects.using(using).filter(user_id=user_id, refunded=False), 'category', {
+            'vbucks': Sum('vbucks_spent'),
+        }, 'SPENDING'),
+    )
+    for queryset, category_field, sums, source in sources:
+        grouped = queryset.order_by().values(category_field, 'date').annotate(
+            entries_total=Count('pk'), **{f'{field}_total': total for field, total in sums.items()}
+        )
+        for row in grouped:
+            values = {
+                field: row.get(f'{field}_total') or 0 for field in ROLLUP_VALUES
+            }
+            for period, start in (('D', row['date']), ('M', month_start(row['date']))):
+                bucket = changes[(user_id, source, period, start, row[category_field])]
+                for field, value in values.items():
+                    bucket[field] += value
+
+    with transaction.atomic(using=using):
+        WalletRollup.objects.using(using).filter(user_id=user_id).delete()
+        WalletRollup.objects.using(using).bulk_create([
+            WalletRollup(
+                user_id=user_id, source=source, period=period,
+                period_start=start, category=category, **values
+            )
+            for (_, source, period, start, category), values in changes.items()
+        ], batch_size=1000)
+
+
+def parse_range(start, end, default_days=365):
+    """Normalize an optional date range, defaulting to the last ``default_days``"""
+    end = end or timezone.now().date()
+    start = start or end - timedelta(days=default_days)
+    if start > end:
+        start, end = end, start
+    return start, end
@@ -0,0 +1,368 @@
+import functools
+import random
+import time
+import zlib
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.apps import apps
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import DEFAULT_DB_ALIAS, router
+from django.db.models import QuerySet, prefetch_related_objects
+
+_routing = ContextVar('replica_routing', default=None)
+# The shard (an alias, or a request whose user decides) for sharded queries without hints
+_shard = ContextVar('shard_routing', default=None)
+
+# Per-user models stored on the user's shard; everything else stays on the default database
+SHARDED_MODELS = frozenset({
+    'accounts.userprofile',
+    'vbucks_tracker.realmoneytransaction',
+    'vbucks_tracker.vbucksearning',
+    'vbucks_tracker.vbucksspending',
+    'vbucks_tracker.refund',
+    'vbucks_tracker.walletsummary',
+    'vbucks_tracker.walletrollup',
+    'vbucks_tracker.ledgerentry',
+})
+
+
+class RoutingState:
+    """Per-request routing: the replica serving reads, and whether the request wrote"""
+
+    def __init__(self):
+        self.replica = None
+        self.wrote = False
+
+
+def pinned_until(request):
+    try:
+        return float(request.COOKIES.get(settings.REPLICA_PIN_COOKIE, 0))
+    except ValueError:
+        return 0
+
+
+def replica_reads(view):
+    """
+    Serve the view's reads from a replica in ``REPLICA_DATABASES``.
+
+    One replica is picked per request. Clients that wrote within the last
+    ``REPLICA_PIN_SECONDS`` (see ReplicaPinMiddleware) and requests that
+    write stay on the primary. For views without side effects only.
+    """
+    def begin(request):
+        state = _routing.get()
+        token = None
+        if state is None:
+            state = RoutingState()
+            token = _routing.set(state)
+        if settings.REPLICA_DATABASES and pinned_until(request) < time.time():
+            state.replica = random.choice(settings.REPLICA_DATABASES)
+        return state, token
+
+    def end(state, token):
+        state.replica = None
+        if token is not None:
+            _routing.reset(token)
+
+    if iscoroutinefunction(view):
+        @functools.wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            state, token = begin(request)
+            try:
+                return await view(request, *args, **kwargs)
+            finally:
+                end(state, token)
+    else:
+        @functools.wraps(view)
+        def wrapper(request, *args, **kwargs):
+            state, token = begin(request)
+            try:
+                return view(request, *args, **kwargs)
+            finally:
+                end(state, token)
+    return wrapper
+
+
+class ReplicaReadsMixin:
+    """Class-based view counterpart of the replica_reads decorator"""
+
+    @classmethod
+    def as_view(cls, **initkwargs):
+        return replica_reads(super().as_view(**initkwargs))
+
+
+class ReplicaRouter:
+    """
+    Send reads inside replica_reads views to the request's replica; everything
+    else, and every write, goes to the primary.
+
+    Once a request writes, its remaining reads go to the primary as well.
+    """
+
+    def db_for_read(self, model, **hints):
+        state = _routing.get()
+        if state is not None and state.replica and not state.wrote:
+            return state.replica
+        return None
+
+    def db_for_write(self, model, **hints):
+        state = _routing.get()
+        if state is not None:
+            state.wrote = True
+        instance = hints.get('instance')
+        # Rows read from a replica are saved to the primary, not back where they came from
+        if instance is not None and instance._state.db in settings.REPLICA_DATABASES:
+            return DEFAULT_DB_ALIAS
+        return None
+
+    def allow_relation(self, obj1, obj2, **hints):
+        replicated = {DEFAULT_DB_ALIAS, *settings.REPLICA_DATABASES}
+        if obj1._state.db in replicated and obj2._state.db in replicated:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas get their schema from the primary
+        if db in settings.REPLICA_DATABASES:
+            return False
+        return None
+
+
+class ReplicaPinMiddleware:
+    """
+    Read-your-writes for replica_reads views: a request that wrote sets a
+    cookie keeping the client's reads on the primary for the next
+    ``REPLICA_PIN_SECONDS``, longer than the replicas are expected to lag.
+    Enabled when ``REPLICA_DATABASES`` is not empty.
+    """
+
+    sync_capable = async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.REPLICA_DATABASES:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        state = RoutingState()
+        token = _routing.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            _routing.reset(token)
+        return self.pin(response, state)
+
+    async def __acall__(self, request):
+        state = RoutingState()
+        token = _routing.set(state)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _routing.reset(token)
+        return self.pin(response, state)
+
+    def pin(self, response, state):
+        if state.wrote:
+            response.set_cookie(
+                settings.REPLICA_PIN_COOKIE,
+                str(time.time() + settings.REPLICA_PIN_SECONDS),
+                max_age=settings.REPLICA_PIN_SECONDS,
+                httponly=True,
+                samesite='Lax',
+            )
+        return response
+
+
+def sharding_enabled():
+    return len(settings.SHARD_DATABASES) > 1
+
+
+def place_user(username):
+    """
+    Shard for a new user: rendezvous hashing of the username over
+    ``SHARD_NEW_USERS``, so adding a shard only moves the users it wins.
+    """
+    return max(settings.SHARD_NEW_USERS, key=lambda alias: zlib.crc32(f'{alias}:{username}'.encode()))
+
+
+def _user_model():
+    return apps.get_model(settings.AUTH_USER_MODEL)
+
+
+def shard_for(user):
+    """Alias of the database holding the tracker data of ``user`` (a User or its pk)"""
+    if not sharding_enabled():
+        return DEFAULT_DB_ALIAS
+    if not isinstance(user, _user_model()):
+        user = _user_model().objects.filter(pk=user).only('shard').first()
+    return getattr(user, 'shard', None) or DEFAULT_DB_ALIAS
+
+
+def shards_for(users):
+    """Group users (instances or pks) as ``{alias: [pk, ...]}``, with one query for the pks"""
+    grouped = defaultdict(list)
+    if not sharding_enabled():
+        grouped[DEFAULT_DB_ALIAS] = [getattr(user, 'pk', user) for user in users]
+        return grouped
+    pks = [user for user in users if not isinstance(user, _user_model())]
+    stored = dict(_user_model().objects.filter(pk__in=pks).values_list('pk', 'shard')) if pks else {}
+    for user in users:
+        pk = getattr(user, 'pk', user)
+        grouped[getattr(user, 'shard', None) or stored.get(pk) or DEFAULT_DB_ALIAS].append(pk)
+    return grouped
+
+
+def current_shard():
+    """The shard that sharded queries without hints go to in this context"""
+    value = _shard.get()
+    if isinstance(value, str):
+        # e.g. a row loaded from a replica, which is written to the primary
+        return value if value in settings.SHARD_DATABASES else DEFAULT_DB_ALIAS
+    user = getattr(value, 'user', None)
+    if user is None or not user.is_authenticated:
+        return DEFAULT_DB_ALIAS
+    return shard_for(user)
+
+
+@contextmanager
+def use_shard(alias):
+    """Send sharded queries without hints (e.g. ``Model.objects.filter(user_id=...)``) to ``alias``"""
+    token = _shard.set(alias)
+    try:
+        yield alias
+    finally:
+        _shard.reset(token)
+
+
+def on_shard(queryset, alias):
+    """
+    Run a User queryset that joins tracker data on shard ``alias``, which
+    keeps a copy of the row of each user it holds for these joins. Querysets
+    for the default database are left to the routers (and replicas).
+    """
+    return queryset if alias == DEFAULT_DB_ALIAS else queryset.using(alias)
+
+
+class ShardedQuerySet(QuerySet):
+    """
+    Manager queryset of the sharded models. ``create(user=...)`` and
+    ``get_or_create(user=...)`` go to that user's shard even outside a
+    request (commands, signals, tests), as ``db_manager(hints=...)`` would.
+    """
+
+    def _for_user(self, kwargs):
+        user = kwargs.get('user')
+        if self._db is None and isinstance(user, _user_model()) and sharding_enabled():
+            return self.using(router.db_for_write(self.model, instance=user))
+        return self
+
+    def create(self, **kwargs):
+        return super(ShardedQuerySet, self._for_user(kwargs)).create(**kwargs)
+
+    def get_or_create(self, defaults=None, **kwargs):
+        return super(ShardedQuerySet, self._for_user(kwargs)).get_or_create(defaults, **kwargs)
+
+
+def select_tracker_related(queryset, *fields):
+    """
+    ``select_related()`` for User relations to sharded models. The join only
+    works while every user's rows are on the default database; with shards
+    the relations load lazily, or in bulk through prefetch_tracker_related().
+    """
+    return queryset if sharding_enabled() else queryset.select_related(*fields)
+
+
+def prefetch_tracker_related(users, *lookups):
+    """prefetch_related_objects() for User relations to sharded models, one query per shard and lookup"""
+    if not sharding_enabled():
+        return
+    grouped = defaultdict(list)
+    for user in users:
+        grouped[shard_for(user)].append(user)
+    for group in grouped.values():
+        # The router sends each prefetch to the shard of its first instance
+        prefetch_related_objects(group, *lookups)
+
+
+class ShardRouter:
+    """
+    Keep each user's rows of the SHARDED_MODELS on the user's shard (see
+    ``SHARD_DATABASES``); users, auth and every other model stay on the
+    default database.
+
+    The shard comes from the ``instance`` hint (a User, or a tracker row and
+    its user) and otherwise from the current context: the request's user
+    (ShardMiddleware) or use_shard(). Rows on the default database are left
+    to the next router, so replica reads keep working for them.
+    """
+
+    def _shard(self, model, hints):
+        if not sharding_enabled() or model._meta.label_lower not in SHARDED_MODELS:
+            return None
+        instance = hints.get('instance')
+        if instance is None:
+            alias = current_shard()
+        elif isinstance(instance, _user_model()):
+            alias = shard_for(instance)
+        elif instance._state.db:
+            alias = instance._state.db
+        elif type(instance).user.is_cached(instance):
+            alias = shard_for(instance.user)
+        else:
+            alias = shard_for(instance.user_id)
+        if alias == DEFAULT_DB_ALIAS or alias not in settings.SHARD_DATABASES:
+            return None
+        return alias
+
+    def db_for_read(self, model, **hints):
+        return self._shard(model, hints)
+
+    def db_for_write(self, model, **hints):
+        return self._shard(model, hints)
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Shards hold the rows of users stored on the default database
+        databases = {DEFAULT_DB_ALIAS, *settings.SHARD_DATABASES, *settings.REPLICA_DATABASES}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+
+class ShardMiddleware:
+    """
+    Route the request's sharded queries to the authenticated user's shard.
+    The user is looked up lazily, so users authenticated later by DRF count
+    too. Enabled when ``SHARD_DATABASES`` lists more than one database.
+    """
+
+    sync_capable = async_capable = True
+
+    def __init__(self, get_response):
+        if not sharding_enabled():
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        token = _shard.set(request)
+        try:
+            return self.get_response(request)
+        finally:
+            _shard.reset(token)
+
+    async def __acall__(self, request):
+        token = _shard.set(request)
+        try:
+            return await self.get_response(request)
+        finally:
+            _shard.reset(token)
@@ -0,0 +1,247 @@
+import re
+from django.db import connections
+from django.db.models import F, Q, Value
+from django.db.models.expressions import RawSQL
+from django.urls import reverse
+from .models import RealMoneyTransaction, Refund, VbucksEarning, VbucksSpending
+
+# kind -> (model, text fields); the position of a kind is its code in the SQLite index
+SEARCH_SOURCES = {
+    'transaction': (RealMoneyTransaction, ('source_name', 'notes')),
+    'earning': (VbucksEarning, ('earning_name',)),
+    'spending': (VbucksSpending, ('item_name',)),
+    'refund': (Refund, ('notes',)),
+}
+SEARCH_KINDS = tuple(SEARCH_SOURCES)
+VBUCKS_FIELDS = {
+    'transaction': 'vbucks_earned', 'earning': 'amount', 'spending': 'vbucks_spent', 'refund': 'vbucks_returned',
+}
+KIND_COUNT = len(SEARCH_KINDS)
+SEARCH_TABLE = 'vbucks_tracker_search'
+MAX_SEARCH_TERMS = 8
+SEARCH_PAGE_SIZE = 20
+POSTGRES_CONFIG = 'simple'
+
+
+def search_terms(query):
+    """Split free text into at most MAX_SEARCH_TERMS words; punctuation is dropped"""
+    return re.findall(r'\w+', query or '')[:MAX_SEARCH_TERMS]
+
+
+def kind_code(kind):
+    return SEARCH_KINDS.index(kind)
+
+
+class SearchResult:
+    """A ranked match: the tracker row plus what the results list shows for it"""
+
+    def __init__(self, kind, obj, rank):
+        self.kind = kind
+        self.object = obj
+        self.rank = rank
+
+    @property
+    def title(self):
+        if self.kind == 'transaction':
+            return self.object.source_name
+        if self.kind == 'earning':
+            return self.object.earning_name or self.object.get_type_display()
+        if self.kind == 'spending':
+            return self.object.item_name
+        return f'Refund of {self.object.original_purchase.item_name}'
+
+    @property
+    def date(self):
+        return self.object.refund_date.date() if self.kind == 'refund' else self.object.date
+
+    @property
+    def vbucks(self):
+        return getattr(self.object, VBUCKS_FIELDS[self.kind])
+
+    @property
+    def url(self):
+        if self.kind == 'refund':
+            return reverse('vbucks_tracker:refund-list')
+        name = {
+            'transaction': 'transaction-update', 'earning': 'vbucksearning-update', 'spending': 'vbucks-spending-update',
+        }[self.kind]
+        return reverse(f'vbucks_tracker:{name}', args=[self.object.pk])
+
+
+class SearchBackend:
+    """
+    Full-text search over the tracker rows' names and notes.
+
+    ``search`` ranks one user's rows across every kind; ``filter`` narrows a
+    queryset of one kind (the admin search). Terms match as word prefixes and
+    must all be present.
+    """
+
+    def __init__(self, using='default'):
+        self.using = using
+
+    def search(self, user, terms, kinds=SEARCH_KINDS, limit=20, offset=0):
+        """Return ``[(kind, pk, rank)]``, best match first"""
+        raise NotImplementedError
+
+    def filter(self, queryset, kind, terms):
+        raise NotImplementedError
+
+    def results(self, user, query, kinds=SEARCH_KINDS, limit=20, offset=0):
+        """Ranked SearchResults for ``query``; one query per kind found loads the rows"""
+        terms = search_terms(query)
+        if not terms or not kinds:
+            return []
+        matches = self.search(user, terms, kinds, limit, offset)
+        ids = {}
+        for kind, pk, _ in matches:
+            ids.setdefault(kind, []).append(pk)
+        objects = {}
+        for kind, pks in ids.items():
+            model = SEARCH_SOURCES[kind][0]
+            queryset = model.objects.using(self.using).filter(user=user, pk__in=pks)
+            if kind == 'refund':
+                queryset = queryset.select_related('original_purchase')
+            objects[kind] = queryset.in_bulk()
+        # A row deleted between the two queries is simply left out
+        return [
+            SearchResult(kind, objects[kind][pk], rank)
+            for kind, pk, rank in matches if pk in objects[kind]
+        ]
+
+    def page(self, user, query, kinds=SEARCH_KINDS, number=1, per_page=SEARCH_PAGE_SIZE):
+        """Return ``(results, has_next)`` for page ``number``; one extra match stands in for a COUNT"""
+        results = self.results(user, query, kinds, limit=per_page + 1, offset=(number - 1) * per_page)
+        return results[:per_page], len(results) > per_page
+
+
+class SqliteSearchBackend(SearchBackend):
+    """
+    FTS5 index in SEARCH_TABLE, kept in sync by triggers on the tracker tables.
+
+    Each document's rowid is ``pk * KIND_COUNT + kind code``, so triggers and
+    lookups address it directly and no extra columns need storing.
+    """
+
+    def match_expression(self, terms):
+        return ' '.join('"{}"*'.format(term.replace('"', '')) for term in terms)
+
+    def search(self, user, terms, kinds=SEARCH_KINDS, limit=20, offset=0):
+        codes = [kind_code(kind) for kind in kinds]
+        with connections[self.using].cursor() as cursor:
+            cursor.execute(
+                f"SELECT rowid, -bm25({SEARCH_TABLE}) AS score FROM {SEARCH_TABLE} "
+                f"WHERE {SEARCH_TABLE} MATCH %s AND user_id = %s "
+                f"AND rowid %% {KIND_COUNT} IN ({', '.join(map(str, codes))}) "
+                f"ORDER BY score DESC, rowid DESC LIMIT %s OFFSET %s",
+                [self.match_expression(terms), user.pk, limit, offset],
+            )
+            return [
+                (SEARCH_KINDS[rowid % KIND_COUNT], rowid // KIND_COUNT, score)
+                for rowid, score in cursor.fetchall()
+            ]
+
+    def filter(self, queryset, kind, terms):
+        return queryset.filter(pk__in=RawSQL(
+            f"SELECT rowid / {KIND_COUNT} FROM {SEARCH_TABLE} "
+            f"WHERE {SEARCH_TABLE} MATCH %s AND rowid %% {KIND_COUNT} = %s",
+            (self.match_expression(terms), kind_code(kind)),
+        ))
+
+
+class PostgresSearchBackend(SearchBackend):
+    """
+    Matches ``to_tsvector`` of the text fields against a prefix ``tsquery``.
+
+    The expressions are the same ones the GIN indexes from the search
+    migration are built on, so PostgreSQL answers them from those indexes.
+    """
+
+    def vector(self, kind):
+        from django.contrib.postgres.search import SearchVector
+        return SearchVector(*SEARCH_SOURCES[kind][1], config=POSTGRES_CONFIG)
+
+    def query(self, terms):
+        from django.contrib.postgres.search import SearchQuery
+        return SearchQuery(' & '.join(f'{term}:*' for term in terms), search_type='raw', config=POSTGRES_CONFIG)
+
+    def matching(self, queryset, kind, terms):
+        return queryset.annotate(document=self.vector(kind)).filter(document=self.query(terms))
+
+    def search(self, user, terms, kinds=SEARCH_KINDS, limit=20, offset=0):
+        from django.contrib.postgres.search import SearchRank
+        query = self.query(terms)
+        querysets = [
+            self.matching(SEARCH_SOURCES[kind][0].objects.using(self.using).filter(user=user), kind, terms)
+            .annotate(kind=Value(kind), score=SearchRank(F('document'), query))
+            .values_list('kind', 'id', 'score')
+            .order_by()
+            for kind in kinds
+        ]
+        combined = querysets[0].union(*querysets[1:], all=True).order_by('-score', '-id')
+        return list(combined[offset:offset + limit])
+
+    def filter(self, queryset, kind, terms):
+        return self.matching(queryset, kind, terms)
+
+
+class FallbackSearchBackend(SearchBackend):
+    """Unindexed ``icontains`` matching for databases without a full-text index"""
+
+    def matching(self, queryset, kind, terms):
+        for term in terms:
+            condition = Q()
+            for field in SEARCH_SOURCES[kind][1]:
+                condition |= Q(**{f'{field}__icontains': term})
+            queryset = queryset.filter(condition)
+        return queryset
+
+    def search(self, user, terms, kinds=SEARCH_KINDS, limit=20, offset=0):
+        querysets = [
+            self.matching(SEARCH_SOURCES[kind][0].objects.using(self.using).filter(user=user), kind, terms)
+            .annotate(kind=Value(kind), score=Value(0.0))
+            .values_list('kind', 'id', 'score')
+            .order_by()
+            for kind in kinds
+        ]
+        combined = querysets[0].union(*querysets[1:], all=True).order_by('-id')
+        return list(combined[offset:offset + limit])
+
+    def filter(self, queryset, kind, terms):
+        return self.matching(queryset, kind, terms)
+
+
+def search_backend(using='default'):
+    """The search backend for the database behind ``using``"""
+    vendor = connections[using].vendor
+    if vendor == 'sqlite':
+        return SqliteSearchBackend(using)
+    if vendor == 'postgresql':
+        return PostgresSearchBackend(using)
+    return FallbackSearchBackend(using)
+
+
+def _sqlite_document(model, fields, row):
+    return " || ' ' || ".join(f"coalesce({row}.{model._meta.get_field(field).column}, '')" for field in fields)
+
+
+def rebuild_search_index(using='default'):
+    """
+    Refill the SQLite index from the tracker tables and return the number of
+    documents; PostgreSQL's expression indexes never need it
+    """
+    connection = connections[using]
+    if connection.vendor != 'sqlite':
+        return 0
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {SEARCH_TABLE}")
+        for code, (kind, (model, fields)) in enumerate(SEARCH_SOURCES.items()):
+            cursor.execute(
+                f"INSERT INTO {SEARCH_TABLE}(rowid, body, user_id) "
+                f"SELECT id * {KIND_COUNT} + {code}, {_sqlite_document(model, fields, model._meta.db_table)}, "
+                f"user_id FROM {model._meta.db_table}"
+            )
+        cursor.execute(f"INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}) VALUES ('optimize')")
+        cursor.execute(f"SELECT count(*) FROM {SEARCH_TABLE}")
+        return cursor.fetchone()[0]
+
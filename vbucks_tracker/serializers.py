@@ -0,0 +1,31 @@
+from rest_framework import serializers
+from .instrumentation import TimedSerializerMixin
+from .models import Refund
+from .services import MAX_BULK_REFUNDS
+
+
+class RefundSerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    class Meta:
+        model = Refund
+        fields = ['id', 'original_purchase', 'vbucks_returned', 'refund_date', 'reason', 'notes']
+        read_only_fields = fields
+
+
+class BulkRefundSerializer(serializers.Serializer):
+    purchases = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=MAX_BULK_REFUNDS,
+    )
+    reason = serializers.ChoiceField(choices=Refund.REFUND_REASONS, required=False, allow_blank=True)
+    notes = serializers.CharField(required=False, allow_blank=True)
+
+
+class SearchResultSerializer(serializers.Serializer):
+    kind = serializers.CharField()
+    id = serializers.IntegerField(source='object.pk')
+    title = serializers.CharField()
+    date = serializers.DateField()
+    vbucks = serializers.IntegerField()
+    rank = serializers.FloatField()
+    url = serializers.CharField()
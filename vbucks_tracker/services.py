@@ -1,40 +1,306 @@
-from django.db.models import Sum
-from .models import RealMoneyTransaction, VbucksEarning, VbucksSpending, Refund
+from decimal import Decimal
+from django.core.exceptions import ValidationError
+from django.db import router, transaction
+from django.db.models import BigIntegerField, Count, DecimalField, F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from accounts.models import User
+from .cache import summary_cache
+from .fx import base_currency
+from .ledger import append_ledger_entries, collect_ledger_changes
+from .models import RealMoneyTransaction, VbucksEarning, VbucksSpending, Refund, WalletSummary
+from .rollups import apply_rollup_changes, collect_rollup_changes, new_rollup_changes
+from .routers import on_shard, shard_for, shards_for, use_shard
+
+VBUCKS_FIELD = BigIntegerField()
+MONEY_FIELD = DecimalField(max_digits=14, decimal_places=2)
+
+MAX_BULK_REFUNDS = 500
+
+# (summary key, model, summed column, extra filters) for every V-Bucks figure
+VBUCKS_SOURCES = (
+    ('purchased', RealMoneyTransaction, 'vbucks_earned', {}),
+    ('earned', VbucksEarning, 'amount', {}),
+    ('spent', VbucksSpending, 'vbucks_spent', {'refunded': False}),
+    ('refunded', Refund, 'vbucks_returned', {}),
+)
+
+
+def _user_total(model, column, output_field=VBUCKS_FIELD, aggregate=Sum, **filters):
+    """Correlated subquery aggregating ``column`` over the outer user's rows"""
+    rows = (
+        model.objects.filter(user=OuterRef('pk'), **filters)
+        .order_by()
+        .values('user')
+        .annotate(total=aggregate(column))
+        .values('total')
+    )
+    zero = Value(0, output_field=output_field)
+    return Coalesce(Subquery(rows, output_field=output_field), zero, output_field=output_field)
 
 
 class VbucksService:
     @staticmethod
-    def get_user_balance(user):
-        """Calculate the user's current V-Bucks balance"""
-        purchased = RealMoneyTransaction.objects.filter(user=user).aggregate(
-            total=Sum('vbucks_earned')
-        )['total'] or 0
+    def summary_annotations(materialized=True):
+        """
+        Annotations that compute a user's whole summary in a single statement.
 
-        earned = VbucksEarning.objects.filter(user=user).aggregate(
-            total=Sum('amount')
-        )['total'] or 0
+        With ``materialized`` the V-Bucks figures come from the joined
+        WalletSummary row and only fall back to the source tables for users
+        without one; otherwise everything is summed from the source tables.
+        """
+        annotations = {}
+        for key, model, column, filters in VBUCKS_SOURCES:
+            total = _user_total(model, column, **filters)
+            if materialized:
+                total = Coalesce(F(f'wallet_summary__{key}'), total, output_field=VBUCKS_FIELD)
+            annotations[f'total_{key}'] = total
 
-        spent = VbucksSpending.objects.filter(user=user, refunded=False).aggregate(
-            total=Sum('vbucks_spent')
-        )['total'] or 0
+        annotations['total_real_money'] = _user_total(RealMoneyTransaction, 'amount_base', MONEY_FIELD)
+        annotations['real_money_unconverted'] = _user_total(
+            RealMoneyTransaction, 'pk', aggregate=Count, amount_base__isnull=True
+        )
+        for code, _ in RealMoneyTransaction.CURRENCIES:
+            annotations[f'real_money_{code}'] = _user_total(
+                RealMoneyTransaction, 'amount', MONEY_FIELD, currency=code
+            )
+        return annotations
 
-        return purchased + earned - spent
+    @staticmethod
+    def annotate_balances(queryset):
+        """
+        Annotate a User queryset with ``wallet_<key>`` totals and ``wallet_balance``.
+
+        Reads the joined WalletSummary row and only falls back to the source
+        tables for users without one, so listing users costs one query. The
+        users must share a database with their tracker data (no shards).
+        """
+        annotations = VbucksService.summary_annotations()
+        components = {
+            f'wallet_{key}': annotations[f'total_{key}'] for key, *_ in VBUCKS_SOURCES
+        }
+        return queryset.annotate(**components).annotate(
+            wallet_balance=Coalesce(
+                F('wallet_summary__balance'),
+                F('wallet_purchased') + F('wallet_earned') - F('wallet_spent'),
+                output_field=VBUCKS_FIELD
+            )
+        )
+
+    @staticmethod
+    def _summary_from_row(row):
+        summary = {f'total_{key}': row.get(f'total_{key}') or 0 for key, *_ in VBUCKS_SOURCES}
+        summary['balance'] = (
+            summary['total_purchased'] + summary['total_earned'] - summary['total_spent']
+        )
+        # Real money is summed in FX_BASE_CURRENCY; see fx.from_base for display
+        summary['total_real_money'] = row.get('total_real_money') or Decimal('0')
+        summary['real_money_currency'] = base_currency()
+        summary['real_money_unconverted'] = row.get('real_money_unconverted') or 0
+        summary['real_money_by_currency'] = {
+            code: row.get(f'real_money_{code}') or Decimal('0')
+            for code, _ in RealMoneyTransaction.CURRENCIES
+        }
+        return summary
+
+    @staticmethod
+    def _summary_query(user, materialized):
+        annotations = VbucksService.summary_annotations(materialized)
+        return (
+            on_shard(User.objects.filter(pk=getattr(user, 'pk', user)), shard_for(user))
+            .annotate(**annotations)
+            .values(*annotations)
+        )
+
+    @staticmethod
+    def _fetch_summary(user, materialized):
+        row = VbucksService._summary_query(user, materialized).first()
+        return VbucksService._summary_from_row(row or {})
+
+    @staticmethod
+    def get_user_balance(user):
+        """Get the user's current V-Bucks balance"""
+        return VbucksService.get_user_summary(user)['balance']
 
     @staticmethod
     def get_user_summary(user):
-        """Get a complete financial summary for the user"""
-        return {
-            'total_purchased': RealMoneyTransaction.objects.filter(user=user).aggregate(
-                total=Sum('vbucks_earned')
-            )['total'] or 0,
-            'total_earned': VbucksEarning.objects.filter(user=user).aggregate(
-                total=Sum('amount')
-            )['total'] or 0,
-            'total_spent': VbucksSpending.objects.filter(user=user, refunded=False).aggregate(
-                total=Sum('vbucks_spent')
-            )['total'] or 0,
-            'total_refunded': Refund.objects.filter(user=user).aggregate(
-                total=Sum('vbucks_returned')
-            )['total'] or 0,
-            'balance': VbucksService.get_user_balance(user)
-        }
\ No newline at end of file
+        """Get a complete financial summary for the user, cached until their data changes"""
+        return summary_cache.get(
+            getattr(user, 'pk', user), lambda: VbucksService._fetch_summary(user, materialized=True)
+        )
+
+    @staticmethod
+    async def aget_user_summary(user):
+        """Async variant of get_user_summary for async views"""
+        async def compute():
+            row = await VbucksService._summary_query(user, materialized=True).afirst()
+            return VbucksService._summary_from_row(row or {})
+        return await summary_cache.aget(getattr(user, 'pk', user), compute)
+
+    @staticmethod
+    def get_user_summaries(users):
+        """
+        Get ``{user_id: summary}`` for many users (instances or pks),
+        computing the uncached ones in one query per shard
+        """
+        users = {getattr(user, 'pk', user): user for user in users}
+
+        def compute(missing):
+            annotations = VbucksService.summary_annotations()
+            computed = {user_id: VbucksService._summary_from_row({}) for user_id in missing}
+            for alias, user_ids in shards_for([users[user_id] for user_id in missing]).items():
+                rows = (
+                    on_shard(User.objects.filter(pk__in=user_ids), alias)
+                    .annotate(**annotations)
+                    .values('pk', *annotations)
+                )
+                computed.update((row['pk'], VbucksService._summary_from_row(row)) for row in rows)
+            return computed
+        return summary_cache.get_many(users, compute)
+
+    @staticmethod
+    def _data_version_query(user):
+        return WalletSummary.objects.filter(user_id=getattr(user, 'pk', user)).values_list('version', 'updated_at')
+
+    @staticmethod
+    def get_data_version(user):
+        """
+        Return ``(version, updated_at)`` of the user's tracker data, or
+        ``(None, None)`` before their first write; a single indexed lookup
+        """
+        return VbucksService._data_version_query(user).first() or (None, None)
+
+    @staticmethod
+    async def aget_data_version(user):
+        """Async variant of get_data_version"""
+        return await VbucksService._data_version_query(user).afirst() or (None, None)
+
+    @staticmethod
+    def compute_user_totals(user):
+        """Calculate the WalletSummary totals from the source tables in one query"""
+        summary = VbucksService._fetch_summary(user, materialized=False)
+        totals = {key: summary[f'total_{key}'] for key, *_ in VBUCKS_SOURCES}
+        totals['balance'] = summary['balance']
+        return totals
+
+    @staticmethod
+    def rebuild_user_summary(user):
+        """Recalculate the user's WalletSummary from the source tables"""
+        totals = VbucksService.compute_user_totals(user)
+        with use_shard(shard_for(user)):
+            summary, created = WalletSummary.objects.get_or_create(
+                user_id=getattr(user, 'pk', user), defaults=totals
+            )
+            if not created:
+                for field, value in totals.items():
+                    setattr(summary, field, value)
+                summary.version = F('version') + 1
+                summary.save(update_fields=[*totals, 'version', 'updated_at'])
+                summary.refresh_from_db(fields=['version'])
+        summary_cache.bump(summary.user_id)
+        return summary
+
+    @staticmethod
+    def apply_wallet_delta(user_id, delta, create_missing=True):
+        """
+        Add a contribution delta to the user's WalletSummary.
+
+        Always bumps the version so readers can detect any change to the
+        user's tracker data. A missing row is rebuilt from the source tables
+        (which already include the change) unless ``create_missing`` is off.
+        """
+        changes = {field: F(field) + delta.get(field, 0) for field in WalletSummary.TOTAL_FIELDS}
+        balance_delta = delta.get('purchased', 0) + delta.get('earned', 0) - delta.get('spent', 0)
+        updated = WalletSummary.objects.filter(user_id=user_id).update(
+            balance=F('balance') + balance_delta,
+            version=F('version') + 1,
+            updated_at=timezone.now(),
+            **changes
+        )
+        if not updated and create_missing:
+            VbucksService.rebuild_user_summary(user_id)
+        else:
+            summary_cache.bump(user_id)
+
+    @staticmethod
+    def record_entry_change(previous, current, create_missing=True, record_ledger=True):
+        """
+        Propagate a tracker row change to the summary, rollup and ledger tables.
+
+        ``previous`` is the stored row before the write (None for inserts) and
+        ``current`` the row after it (None for deletes).
+        """
+        deltas = {}
+        for row, sign in ((previous, -1), (current, 1)):
+            if row is None:
+                continue
+            delta = deltas.setdefault(row.user_id, {})
+            for field, value in row.wallet_contribution().items():
+                delta[field] = delta.get(field, 0) + sign * value
+        for user_id, delta in deltas.items():
+            VbucksService.apply_wallet_delta(user_id, delta, create_missing=create_missing)
+
+        rollups = new_rollup_changes()
+        collect_rollup_changes(rollups, previous, sign=-1)
+        collect_rollup_changes(rollups, current)
+        apply_rollup_changes(rollups, create_missing=create_missing)
+        if record_ledger:
+            append_ledger_entries(collect_ledger_changes([], previous, current))
+
+    @staticmethod
+    def create_refunds(refunds):
+        """
+        Save new Refund rows and flag their purchases as refunded, all or nothing.
+
+        The purchases are locked with SELECT ... FOR UPDATE and flipped by a
+        conditional ``UPDATE ... WHERE refunded = false``; if that touches
+        fewer rows than were locked, another request got there first and the
+        whole batch is rolled back (this guard also holds on SQLite, which
+        ignores row locks). Refunds are bulk inserted and each owner's summary,
+        rollups and ledger get one combined write, so the query count doesn't
+        grow with the number of refunds.
+        """
+        purchase_ids = [refund.original_purchase_id for refund in refunds]
+        if len(set(purchase_ids)) != len(purchase_ids):
+            raise ValidationError("A purchase can only be refunded once")
+        for refund in refunds:
+            refund.clean_fields(exclude=['user', 'original_purchase', 'vbucks_returned'])
+
+        # A batch belongs to one user, so it is written to that user's shard
+        using = router.db_for_write(Refund, instance=refunds[0]) if refunds else None
+        with use_shard(using), transaction.atomic(using=using):
+            purchases = VbucksSpending.objects.select_for_update().filter(
+                pk__in=purchase_ids, refunded=False
+            ).in_bulk()
+            for refund in refunds:
+                purchase = purchases.get(refund.original_purchase_id)
+                if purchase is None:
+                    raise ValidationError("This purchase has already been refunded")
+                if purchase.user_id != refund.user_id:
+                    raise ValidationError("You can only refund your own purchases")
+
+            claimed = VbucksSpending.objects.filter(pk__in=purchases, refunded=False).update(refunded=True)
+            if claimed != len(purchases):
+                raise ValidationError("This purchase has already been refunded")
+
+            deltas = {}
+            rollups = new_rollup_changes()
+            for refund in refunds:
+                purchase = purchases[refund.original_purchase_id]
+                collect_rollup_changes(rollups, purchase, sign=-1)
+                purchase.refunded = True
+                refund.original_purchase = purchase
+                refund.vbucks_returned = purchase.vbucks_spent
+                delta = deltas.setdefault(refund.user_id, {'spent': 0, 'refunded': 0})
+                delta['spent'] -= purchase.vbucks_spent
+                delta['refunded'] += purchase.vbucks_spent
+
+            Refund.objects.bulk_create(refunds)
+            for user_id, delta in deltas.items():
+                VbucksService.apply_wallet_delta(user_id, delta)
+            apply_rollup_changes(rollups)
+            ledger = []
+            for refund in refunds:
+                collect_ledger_changes(ledger, None, refund)
+            append_ledger_entries(ledger)
+        return refunds
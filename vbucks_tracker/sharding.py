@@ -0,0 +1,171 @@
+import time
+from django.contrib.auth.hashers import make_password
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from accounts.models import User, UserProfile
+from .cache import summary_cache
+from .ledger import LEDGER_SOURCES
+from .models import (
+    LedgerEntry, RealMoneyTransaction, Refund, VbucksEarning, VbucksSpending, WalletRollup, WalletSummary,
+)
+from .routers import shard_for, use_shard
+from .sqlite import immediate_atomic
+
+MOVE_CHUNK_SIZE = 1000
+
+# Copied in this order (refunds after the purchases they point at, ledger
+# entries after every row they point at) and deleted in reverse
+SHARDED_TABLES = (
+    UserProfile, WalletSummary, WalletRollup, RealMoneyTransaction, VbucksEarning, VbucksSpending, Refund,
+    LedgerEntry,
+)
+
+
+class ShardMoveConflict(Exception):
+    """The user's tracker data changed while it was being moved"""
+
+
+def save_user_stub(user, alias):
+    """
+    Create or update the copy of ``user``'s row on shard ``alias``, which the
+    tracker tables there reference and join. It keeps the username, for
+    joins and admin searches, and no credentials.
+    """
+    if alias == DEFAULT_DB_ALIAS:
+        return
+    stubs = User.objects.using(alias)
+    if not stubs.filter(pk=user.pk).update(username=user.username, shard=alias):
+        stubs.bulk_create([User(
+            pk=user.pk, username=user.username, shard=alias,
+            password=make_password(None), date_joined=user.date_joined,
+        )])
+
+
+def delete_user_stub(user_id, alias):
+    """Delete a user's row on shard ``alias`` and with it, by cascade, their tracker data there"""
+    if alias == DEFAULT_DB_ALIAS:
+        return
+    with use_shard(alias):
+        User.objects.using(alias).filter(pk=user_id).delete()
+
+
+def data_fingerprint(user_id, alias, lock=False):
+    """What changes whenever the user's data on ``alias`` does: the summary version and profile timestamp"""
+    summaries = WalletSummary.objects.using(alias).filter(user_id=user_id)
+    if lock:
+        summaries = summaries.select_for_update()
+    return (
+        summaries.values_list('version', flat=True).first(),
+        UserProfile.objects.using(alias).filter(user_id=user_id).values_list('updated_at', flat=True).first(),
+    )
+
+
+def copy_user_rows(user_id, source, target, chunk_size=MOVE_CHUNK_SIZE):
+    """
+    Copy a user's rows from ``source`` to ``target`` in pk order, one
+    transaction per chunk. Rows get new primary keys on the target (ids are
+    per database); refunds are pointed at the copied purchases and ledger
+    entries at the copied tracker rows (or at none, for rows since deleted).
+    Returns the number of rows copied.
+    """
+    new_pks = {model: {} for model, *_ in LEDGER_SOURCES.values()}
+    copied = 0
+    for model in SHARDED_TABLES:
+        rows = model.objects.using(source).filter(user_id=user_id).order_by('pk')
+        last = 0
+        while chunk := list(rows.filter(pk__gt=last)[:chunk_size]):
+            last = chunk[-1].pk
+            for row in chunk:
+                row.source_pk, row.pk, row._state.adding = row.pk, None, True
+                if model is Refund:
+                    row.original_purchase_id = new_pks[VbucksSpending][row.original_purchase_id]
+                elif model is LedgerEntry:
+                    row.source_id = new_pks[LEDGER_SOURCES[row.source][0]].get(row.source_id)
+                elif model is WalletSummary:
+                    row.version += 1  # the ids in cached pages and ETags change
+            with transaction.atomic(using=target):
+                model.objects.using(target).bulk_create(chunk)
+            if model in new_pks:
+                new_pks[model].update((row.source_pk, row.pk) for row in chunk)
+            copied += len(chunk)
+    return copied
+
+
+def _chunk_delete_sql(connection, model, chunk_size):
+    quote = connection.ops.quote_name
+    table = quote(model._meta.db_table)
+    pk = quote(model._meta.pk.column)
+    user = quote(model._meta.get_field('user').column)
+    if connection.vendor == 'mysql':
+        # MySQL can't LIMIT an IN subquery, but can LIMIT the DELETE itself
+        return f"DELETE FROM {table} WHERE {user} = %s LIMIT {int(chunk_size)}"
+    return f"DELETE FROM {table} WHERE {pk} IN (SELECT {pk} FROM {table} WHERE {user} = %s LIMIT {int(chunk_size)})"
+
+
+def delete_user_rows(user_id, alias, chunk_size=MOVE_CHUNK_SIZE, on_chunk=None):
+    """
+    Delete a user's rows on ``alias`` with raw DELETE statements of at most
+    ``chunk_size`` rows, one short write transaction each. Refunds go before
+    the purchases they point at. No instances are loaded and no delete
+    signals are sent. ``on_chunk(model, deleted, seconds)`` is called after
+    each chunk with how long its transaction was held; returns the number of
+    rows deleted.
+    """
+    connection = connections[alias]
+    total = 0
+    for model in reversed(SHARDED_TABLES):
+        sql = _chunk_delete_sql(connection, model, chunk_size)
+        deleted = chunk_size
+        while deleted == chunk_size:
+            started = time.perf_counter()
+            # The summary and rollups leave with the rows, so nothing needs adjusting
+            with immediate_atomic(alias), connection.cursor() as cursor:
+                cursor.execute(sql, [user_id])
+                deleted = cursor.rowcount
+            seconds = time.perf_counter() - started
+            total += deleted
+            if deleted and on_chunk is not None:
+                on_chunk(model, deleted, seconds)
+    return total
+
+
+def move_user(user, target, chunk_size=MOVE_CHUNK_SIZE):
+    """
+    Move a user's tracker data to shard ``target`` and return the number of
+    rows moved.
+
+    Rows are copied chunk by chunk while the user keeps using the source.
+    User.shard is then switched while the source's write lock (and the
+    summary row lock) is held, after checking that nothing changed during
+    the copy; otherwise the copy is discarded and ShardMoveConflict raised,
+    and the move can simply be retried. The source rows are deleted last.
+    """
+    source = shard_for(user)
+    if source == target:
+        return 0
+    before = data_fingerprint(user.pk, source)
+    # Leftovers of an interrupted move are not the user's live data
+    delete_user_rows(user.pk, target, chunk_size)
+    save_user_stub(user, target)
+    try:
+        copied = copy_user_rows(user.pk, source, target, chunk_size)
+        with immediate_atomic(source):
+            if data_fingerprint(user.pk, source, lock=True) != before:
+                raise ShardMoveConflict(
+                    f'{user.username} changed during the copy and was not moved; run the move again'
+                )
+            User.objects.filter(pk=user.pk).update(shard=target)
+    except BaseException:
+        delete_user_rows(user.pk, target, chunk_size)
+        delete_user_stub(user.pk, target)
+        raise
+    user.shard = target
+    summary_cache.bump(user.pk)
+
+    if data_fingerprint(user.pk, source) != before:
+        # A request that loaded the user before the switch wrote to the source
+        raise ShardMoveConflict(
+            f'{user.username} was moved to {target}, but rows written during the switch were left on {source}'
+        )
+    delete_user_rows(user.pk, source, chunk_size)
+    delete_user_stub(user.pk, source)
+    return copied
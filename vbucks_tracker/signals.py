@@ -0,0 +1,68 @@
+from django.db import DEFAULT_DB_ALIAS
+from django.db.models.signals import pre_save, post_save, post_delete
+
+from accounts.models import User
+from .cache import summary_cache
+from .models import RealMoneyTransaction, VbucksEarning, VbucksSpending, Refund
+from .routers import shard_for, use_shard
+from .services import VbucksService
+from .sharding import delete_user_stub, save_user_stub
+
+WALLET_MODELS = (RealMoneyTransaction, VbucksEarning, VbucksSpending, Refund)
+
+
+def capture_previous_row(sender, instance, raw=False, **kwargs):
+    """Remember the stored row before it is overwritten, to compute deltas against"""
+    instance._wallet_previous = None
+    if raw or instance._state.adding or instance.pk is None:
+        return
+    instance._wallet_previous = (
+        sender._default_manager.select_for_update().filter(pk=instance.pk).first()
+    )
+
+
+def apply_saved_row(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    previous = getattr(instance, '_wallet_previous', None)
+    instance._wallet_previous = None
+    with use_shard(instance._state.db):
+        VbucksService.record_entry_change(previous, instance)
+
+
+def remove_deleted_row(sender, instance, origin=None, **kwargs):
+    # Never recreate missing summary rows here: during a user cascade they
+    # may already be gone and recreating them would violate the user FK.
+    # For the same reason a deleted user's rows get no ledger reversals.
+    deleting_user = getattr(origin, 'model', type(origin)) is User
+    with use_shard(instance._state.db):
+        VbucksService.record_entry_change(instance, None, create_missing=False, record_ledger=not deleting_user)
+
+
+def start_summary_version(sender, instance, created=False, raw=False, **kwargs):
+    # SQLite can hand a deleted user's id to a new user; never serve them its cache
+    if created and not raw:
+        summary_cache.reset(instance.pk)
+
+
+def sync_user_stub(sender, instance, raw=False, using=None, update_fields=None, **kwargs):
+    # Keep the copy of the row on the user's shard; copies themselves are saved with using=<shard>
+    if raw or using != DEFAULT_DB_ALIAS or (update_fields is not None and 'username' not in update_fields):
+        return
+    save_user_stub(instance, shard_for(instance))
+
+
+def delete_sharded_data(sender, instance, using=None, **kwargs):
+    # The cascade on the default database doesn't reach the user's shard
+    if using == DEFAULT_DB_ALIAS:
+        delete_user_stub(instance.pk, shard_for(instance))
+
+
+def connect_wallet_signals():
+    for model in WALLET_MODELS:
+        pre_save.connect(capture_previous_row, sender=model)
+        post_save.connect(apply_saved_row, sender=model)
+        post_delete.connect(remove_deleted_row, sender=model)
+    post_save.connect(start_summary_version, sender=User)
+    post_save.connect(sync_user_stub, sender=User)
+    post_delete.connect(delete_sharded_data, sender=User)
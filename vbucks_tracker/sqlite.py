@@ -0,0 +1,116 @@
+import functools
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from django.conf import settings
+from django.db import DatabaseError, connections, transaction
+from .routers import current_shard
+
+logger = logging.getLogger(__name__)
+
+_optimize_lock = threading.Lock()
+_last_optimize = {}
+
+
+def pragma_statements(pragmas):
+    return [f'PRAGMA {name} = {value}' for name, value in pragmas.items()]
+
+
+def configure_connection(sender, connection, **kwargs):
+    """
+    ``connection_created`` receiver applying ``SQLITE_PRAGMAS`` to every new
+    SQLite connection (primary, replicas and shards alike).
+
+    journal_mode=WAL lets readers run alongside the single writer and,
+    with synchronous=NORMAL, only syncs at checkpoints. busy_timeout makes
+    writers wait for the lock instead of failing with "database is locked".
+    """
+    if connection.vendor != 'sqlite' or not settings.SQLITE_PRAGMAS:
+        return
+    if connection.is_in_memory_db():
+        # WAL and memory mapping don't apply to in-memory databases
+        pragmas = {name: value for name, value in settings.SQLITE_PRAGMAS.items()
+                   if name not in ('journal_mode', 'mmap_size')}
+    else:
+        pragmas = settings.SQLITE_PRAGMAS
+    with connection.cursor() as cursor:
+        for statement in pragma_statements(pragmas):
+            cursor.execute(statement)
+    # Connections usually last one request, so opening one is the periodic hook
+    optimize_database(connection)
+
+
+def optimize_database(connection):
+    """
+    Run ``PRAGMA optimize`` at most every ``SQLITE_OPTIMIZE_INTERVAL``
+    seconds per database and worker. It refreshes the planner statistics
+    (and the sqlite_stat1 row estimates the admin paginator uses) for tables
+    whose queries would benefit, and is usually a no-op.
+    """
+    interval = settings.SQLITE_OPTIMIZE_INTERVAL
+    if not interval:
+        return
+    now = time.monotonic()
+    with _optimize_lock:
+        if now - _last_optimize.get(connection.alias, -interval) < interval:
+            return
+        _last_optimize[connection.alias] = now
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA optimize')
+    except DatabaseError:
+        logger.exception('PRAGMA optimize failed on %s', connection.alias)
+
+
+@contextmanager
+def immediate_atomic(using=None):
+    """
+    ``transaction.atomic`` that starts with ``BEGIN IMMEDIATE`` on SQLite.
+
+    A deferred transaction that reads before it writes fails with "database
+    is locked" when another writer got in first, without waiting out
+    busy_timeout; taking the write lock up front makes it queue instead.
+    Nested blocks, other databases and ``SQLITE_IMMEDIATE_WRITES = False``
+    get a plain atomic block. Defaults to the current user's shard.
+    """
+    using = using or current_shard()
+    connection = connections[using]
+    if connection.vendor != 'sqlite' or connection.in_atomic_block or not settings.SQLITE_IMMEDIATE_WRITES:
+        with transaction.atomic(using=using):
+            yield
+        return
+    connection.ensure_connection()
+    previous = connection.transaction_mode
+    connection.transaction_mode = 'IMMEDIATE'
+    try:
+        with transaction.atomic(using=using):
+            # BEGIN has been issued; savepoints and later blocks are unaffected
+            connection.transaction_mode = previous
+            yield
+    finally:
+        connection.transaction_mode = previous
+
+
+def immediate_transaction(view):
+    """Run a view's unsafe requests (POST and friends) in immediate_atomic"""
+    @functools.wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if request.method in ('GET', 'HEAD', 'OPTIONS'):
+            return view(request, *args, **kwargs)
+        with immediate_atomic():
+            return view(request, *args, **kwargs)
+    return wrapper
+
+
+class ImmediateWritesMixin:
+    """
+    Class-based view counterpart of the immediate_transaction decorator.
+
+    The lock is taken before the view runs, so its shard comes from session
+    authentication; DRF views authenticate later and lock in their handler.
+    """
+
+    @classmethod
+    def as_view(cls, **initkwargs):
+        return immediate_transaction(super().as_view(**initkwargs))
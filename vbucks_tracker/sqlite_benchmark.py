@@ -0,0 +1,126 @@
+# Multi-process SQLite throughput benchmark for the wallet write/read pattern.
+# Kept free of Django imports so worker processes can be spawned cheaply; each
+# worker opens its own sqlite3 connection, as a gunicorn worker would.
+import multiprocessing
+import os
+import random
+import sqlite3
+import tempfile
+import time
+
+SCHEMA = (
+    "CREATE TABLE summary (user_id INTEGER PRIMARY KEY, spent INTEGER NOT NULL, version INTEGER NOT NULL)",
+    "CREATE TABLE spending (id INTEGER PRIMARY KEY, user_id INTEGER NOT NULL, item_name TEXT NOT NULL, "
+    "vbucks_spent INTEGER NOT NULL, date TEXT NOT NULL)",
+    "CREATE INDEX spending_user_date ON spending (user_id, date)",
+)
+USERS = 200
+SEED_ROWS_PER_USER = 50
+
+# Django's defaults: rollback journal, synchronous=FULL, a 5 s busy handler and deferred transactions
+STOCK = {'pragmas': {}, 'begin': 'BEGIN'}
+
+
+def create_database(path):
+    connection = sqlite3.connect(path)
+    for statement in SCHEMA:
+        connection.execute(statement)
+    connection.executemany("INSERT INTO summary VALUES (?, 0, 0)", [(user,) for user in range(USERS)])
+    connection.executemany(
+        "INSERT INTO spending (user_id, item_name, vbucks_spent, date) VALUES (?, ?, ?, ?)",
+        [
+            (user, f'Item {index}', 100, f'2024-01-{index % 28 + 1:02d}')
+            for user in range(USERS) for index in range(SEED_ROWS_PER_USER)
+        ],
+    )
+    connection.commit()
+    connection.close()
+
+
+def connect(path, pragmas):
+    connection = sqlite3.connect(path, timeout=5, isolation_level=None)
+    for name, value in pragmas.items():
+        connection.execute(f'PRAGMA {name} = {value}')
+    return connection
+
+
+def write_once(connection, begin, user):
+    """One spending: read the summary, insert the row, bump the summary, as VbucksSpending.save() does"""
+    connection.execute(begin)
+    try:
+        connection.execute("SELECT spent, version FROM summary WHERE user_id = ?", (user,)).fetchone()
+        connection.execute(
+            "INSERT INTO spending (user_id, item_name, vbucks_spent, date) VALUES (?, 'Benchmark', 200, '2024-02-01')",
+            (user,),
+        )
+        connection.execute("UPDATE summary SET spent = spent + 200, version = version + 1 WHERE user_id = ?", (user,))
+        connection.execute("COMMIT")
+    except sqlite3.OperationalError:
+        if connection.in_transaction:
+            connection.execute("ROLLBACK")
+        raise
+
+
+def read_once(connection, user):
+    """One list page plus the summary, as the spending list and dashboard read them"""
+    connection.execute(
+        "SELECT id, item_name, vbucks_spent, date FROM spending WHERE user_id = ? ORDER BY date DESC, id DESC LIMIT 50",
+        (user,),
+    ).fetchall()
+    connection.execute("SELECT spent, version FROM summary WHERE user_id = ?", (user,)).fetchone()
+
+
+def worker(path, config, role, seconds, seed, start, results):
+    connection = connect(path, config['pragmas'])
+    rng = random.Random(seed)
+    done = errors = 0
+    start.wait()
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        user = rng.randrange(USERS)
+        try:
+            if role == 'write':
+                write_once(connection, config['begin'], user)
+            else:
+                read_once(connection, user)
+            done += 1
+        except sqlite3.OperationalError:
+            errors += 1
+    connection.close()
+    results.put((role, done, errors))
+
+
+def run_concurrency(config, workers, seconds=3.0, directory=None):
+    """
+    Run ``workers`` writer and ``workers`` reader processes against a fresh
+    database for ``seconds``; return operations per second and failed
+    ("database is locked") operations for each role.
+    """
+    context = multiprocessing.get_context('spawn')
+    with tempfile.TemporaryDirectory(dir=directory) as tmp:
+        path = os.path.join(tmp, 'benchmark.sqlite3')
+        create_database(path)
+        connect(path, config['pragmas']).close()  # journal_mode=WAL persists in the file
+        start = context.Event()
+        results = context.Queue()
+        processes = [
+            context.Process(target=worker, args=(path, config, role, seconds, index, start, results))
+            for index in range(workers) for role in ('write', 'read')
+        ]
+        for process in processes:
+            process.start()
+        time.sleep(0.5)  # let every worker connect before the clock starts
+        start.set()
+        totals = {'write': [0, 0], 'read': [0, 0]}
+        for _ in processes:
+            role, done, errors = results.get()
+            totals[role][0] += done
+            totals[role][1] += errors
+        for process in processes:
+            process.join()
+    return {
+        'writes_per_s': round(totals['write'][0] / seconds, 1),
+        'write_errors': totals['write'][1],
+        'reads_per_s': round(totals['read'][0] / seconds, 1),
+        'read_errors': totals['read'][1],
+    }
@@ -0,0 +1,257 @@
+import random
+from datetime import datetime, time, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+from accounts.models import User, UserProfile
+from .ledger import ledger_rows, number_entries
+from .models import (
+    LedgerEntry, RealMoneyTransaction, VbucksEarning, VbucksSpending, Refund, WalletRollup, WalletSummary
+)
+from .rollups import collect_rollup_changes, new_rollup_changes
+
+SYNTHETIC_BATCH_SIZE = 2000
+
+# (category, source name, V-Bucks, EUR price, weight)
+STORE_OFFERS = (
+    ('VB', '1,000 V-Bucks', 1000, Decimal('8.99'), 30),
+    ('VB', '2,800 V-Bucks', 2800, Decimal('22.99'), 20),
+    ('VB', '5,000 V-Bucks', 5000, Decimal('36.99'), 8),
+    ('VB', '13,500 V-Bucks', 13500, Decimal('89.99'), 3),
+    ('CREW', 'Fortnite Crew', 1000, Decimal('11.99'), 25),
+    ('QUEST', 'Quest Pack', 600, Decimal('4.99'), 8),
+    ('PACK', 'Skin Pack', 600, Decimal('19.99'), 5),
+    ('OTHER', 'Gift Card', 0, Decimal('25.00'), 1),
+)
+# currency -> (approximate EUR price multiplier, weight)
+CURRENCIES = {
+    'EUR': (Decimal('1'), 45),
+    'BGN': (Decimal('1.96'), 25),
+    'USD': (Decimal('1.08'), 20),
+    'GBP': (Decimal('0.85'), 10),
+}
+# (earning type, name, V-Bucks, weight)
+EARNINGS = (
+    ('BP', 'Battle Pass reward', 100, 40),
+    ('BP', 'Battle Pass reward', 200, 25),
+    ('BP', 'Battle Pass page', 300, 15),
+    ('CREW', 'Crew monthly V-Bucks', 1000, 12),
+    ('QUEST', 'Quest Pack reward', 300, 8),
+)
+# spending category -> (item names, prices, weight)
+SHOP_ITEMS = {
+    'SKIN': (('Outfit', 'Legendary Outfit', 'Icon Series Outfit'), (800, 1200, 1500, 2000), 40),
+    'EMOTE': (('Emote', 'Icon Series Emote'), (200, 300, 500, 800), 25),
+    'BUNDLE': (('Bundle', 'Starter Bundle'), (1800, 2200, 2800), 12),
+    'GIFT': (('Gifted Outfit', 'Gifted Emote'), (500, 800, 1200, 1500), 10),
+    'BP': (('Battle Pass',), (950,), 8),
+    'OTHER': (('Wrap', 'Pickaxe', 'Glider', 'Loading Screen'), (200, 300, 500, 800), 5),
+}
+REFUND_REASONS = ('DISAPPOINTED', 'ACCIDENTAL', 'OTHER')
+
+
+class SyntheticWalletGenerator:
+    """
+    Create users with realistic, reproducible tracker histories.
+
+    Everything is drawn from one ``random.Random(seed)``, so the same seed
+    and options always produce the same data. Rows are built in memory one
+    chunk of users at a time and written with ``bulk_create`` parents first
+    (users, profiles, then tracker rows sorted by user and date, refunds
+    after the purchases they point at). Bulk inserts skip the signals, so
+    each chunk's WalletSummary rows, rollup buckets and ledger entries are
+    computed while generating and inserted alongside.
+    """
+
+    def __init__(self, seed=0, rows_per_user=40, refund_rate=0.03, days=730,
+                 end_date=None, prefix='synthetic_', password=None,
+                 batch_size=SYNTHETIC_BATCH_SIZE):
+        self.rng = random.Random(seed)
+        self.rows_per_user = rows_per_user
+        self.refund_rate = refund_rate
+        self.days = days
+        self.end_date = end_date or datetime.now(dt_timezone.utc).date()
+        self.prefix = prefix
+        self.batch_size = batch_size
+        # Hashing is deliberately slow, so every user shares one precomputed hash
+        self.password_hash = make_password(password)
+        self.offer_weights = [offer[-1] for offer in STORE_OFFERS]
+        self.currency_weights = [weight for _, weight in CURRENCIES.values()]
+        self.earning_weights = [earning[-1] for earning in EARNINGS]
+        self.shop_weights = [weight for *_, weight in SHOP_ITEMS.values()]
+        self.counts = dict.fromkeys(('users', 'transactions', 'earnings', 'spendings', 'refunds'), 0)
+        self.next_index = 0
+
+    def username(self, index):
+        return f'{self.prefix}{index:07d}'
+
+    def random_day(self, start):
+        span = (self.end_date - start).days
+        return start + timedelta(days=self.rng.randint(0, span))
+
+    def session_days(self, start, rows):
+        """Days the player was active; several rows usually land on the same day"""
+        return [self.random_day(start) for _ in range(max(1, rows // 3))]
+
+    def build_user(self, index):
+        joined = self.end_date - timedelta(days=self.rng.randint(0, self.days))
+        username = self.username(index)
+        return User(
+            username=username,
+            email=f'{username}@example.com',
+            password=self.password_hash,
+            date_joined=datetime.combine(joined, time(12), tzinfo=dt_timezone.utc),
+        )
+
+    def build_profile(self, user):
+        return UserProfile(
+            user=user,
+            epic_games_username=user.username,
+            platform=self.rng.choice(UserProfile.PLATFORMS)[0],
+        )
+
+    def build_history(self, user, rows=None):
+        """
+        Return ``(transactions, earnings, spendings)`` for one user, each
+        sorted by date: about ``rows`` rows, or a typical number for a player.
+        """
+        rng = self.rng
+        joined = user.date_joined.date()
+        if rows is None:
+            # Activity is heavy-tailed: most players log a little, a few log a lot
+            rows = max(1, round(self.rows_per_user * rng.lognormvariate(0, 0.8) / 1.377))
+        days = self.session_days(joined, rows)
+
+        transactions = []
+        for _ in range(max(1, round(rows * 0.2))):
+            category, name, vbucks, price, _ = rng.choices(STORE_OFFERS, self.offer_weights)[0]
+            currency = rng.choices(tuple(CURRENCIES), self.currency_weights)[0]
+            transaction_row = RealMoneyTransaction(
+                user_id=user.pk, category=category, source_name=name, vbucks_earned=vbucks,
+                amount=(price * CURRENCIES[currency][0]).quantize(Decimal('0.01')),
+                currency=currency, date=rng.choice(days),
+            )
+            transaction_row.prepare_bulk_insert()
+            transactions.append(transaction_row)
+
+        earnings = []
+        for _ in range(round(rows * 0.25)):
+            earning_type, name, vbucks, _ = rng.choices(EARNINGS, self.earning_weights)[0]
+            earnings.append(VbucksEarning(
+                user_id=user.pk, type=earning_type, earning_name=name, amount=vbucks,
+                date=rng.choice(days),
+            ))
+
+        # Players spend most, but rarely more than, what they were credited
+        budget = sum(row.vbucks_earned for row in transactions) + sum(row.amount for row in earnings)
+        budget *= rng.uniform(0.6, 1.0)
+        spendings = []
+        for _ in range(rows - len(transactions) - len(earnings)):
+            category = rng.choices(tuple(SHOP_ITEMS), self.shop_weights)[0]
+            names, prices, _ = SHOP_ITEMS[category]
+            price = rng.choice(prices)
+            if price > budget:
+                break
+            budget -= price
+            spendings.append(VbucksSpending(
+                user_id=user.pk, category=category, item_name=rng.choice(names), vbucks_spent=price,
+                date=rng.choice(days), refunded=rng.random() < self.refund_rate,
+            ))
+
+        for entries in (transactions, earnings, spendings):
+            entries.sort(key=lambda row: row.date)
+        return transactions, earnings, spendings
+
+    def build_refund(self, spending):
+        refund_day = min(spending.date + timedelta(days=self.rng.randint(0, 2)), self.end_date)
+        return Refund(
+            user_id=spending.user_id, original_purchase=spending,
+            vbucks_returned=spending.vbucks_spent,
+            refund_date=datetime.combine(refund_day, time(self.rng.randint(0, 23)), tzinfo=dt_timezone.utc),
+            reason=self.rng.choice(REFUND_REASONS),
+        )
+
+    def generate_chunk(self, first_index, count):
+        users = [self.build_user(index) for index in range(first_index, first_index + count)]
+        with transaction.atomic():
+            User.objects.bulk_create(users, batch_size=self.batch_size)
+            UserProfile.objects.bulk_create(
+                [self.build_profile(user) for user in users], batch_size=self.batch_size
+            )
+            histories = [self.build_history(user) for user in users]
+            transactions, earnings, spendings = (
+                [row for history in histories for row in history[position]] for position in range(3)
+            )
+            RealMoneyTransaction.objects.bulk_create(transactions, batch_size=self.batch_size)
+            VbucksEarning.objects.bulk_create(earnings, batch_size=self.batch_size)
+            VbucksSpending.objects.bulk_create(spendings, batch_size=self.batch_size)
+            refunds = [self.build_refund(row) for row in spendings if row.refunded]
+            Refund.objects.bulk_create(refunds, batch_size=self.batch_size)
+
+            totals = {user.pk: dict.fromkeys(WalletSummary.TOTAL_FIELDS, 0) for user in users}
+            rollups = new_rollup_changes()
+            for row in (*transactions, *earnings, *spendings, *refunds):
+                for field, value in row.wallet_contribution().items():
+                    totals[row.user_id][field] += value
+                collect_rollup_changes(rollups, row)
+            WalletSummary.objects.bulk_create([
+                WalletSummary(
+                    user_id=user_id,
+                    balance=values['purchased'] + values['earned'] - values['spent'],
+                    **values
+                )
+                for user_id, values in totals.items()
+            ], batch_size=self.batch_size)
+            WalletRollup.objects.bulk_create([
+                WalletRollup(
+                    user_id=user_id, source=source, period=period,
+                    period_start=start, category=category, **values
+                )
+                for (user_id, source, period, start, category), values in sorted(rollups.items())
+            ], batch_size=self.batch_size)
+            user_rows = {user.pk: [] for user in users}
+            for row in (*transactions, *earnings, *spendings, *refunds):
+                user_rows[row.user_id].append(row)
+            LedgerEntry.objects.bulk_create([
+                entry for user_id, rows in user_rows.items() for entry in number_entries(user_id, ledger_rows(rows))
+            ], batch_size=self.batch_size)
+
+        self.counts['users'] += len(users)
+        for name, rows in (('transactions', transactions), ('earnings', earnings),
+                           ('spendings', spendings), ('refunds', refunds)):
+            self.counts[name] += len(rows)
+
+    def fill_user(self, user, rows, progress=None):
+        """
+        Add about ``rows`` tracker rows to the existing ``user``, one batch per
+        transaction, for benchmarks on a single heavy account. The summary,
+        rollups and ledger are not updated. Calls ``progress(added)`` after every batch
+        and returns the number of rows added.
+        """
+        added = 0
+        while added < rows:
+            with transaction.atomic():
+                transactions, earnings, spendings = self.build_history(user, min(self.batch_size, rows - added))
+                RealMoneyTransaction.objects.bulk_create(transactions, batch_size=self.batch_size)
+                VbucksEarning.objects.bulk_create(earnings, batch_size=self.batch_size)
+                VbucksSpending.objects.bulk_create(spendings, batch_size=self.batch_size)
+                refunds = [self.build_refund(row) for row in spendings if row.refunded]
+                Refund.objects.bulk_create(refunds, batch_size=self.batch_size)
+            for name, batch in (('transactions', transactions), ('earnings', earnings),
+                                ('spendings', spendings), ('refunds', refunds)):
+                self.counts[name] += len(batch)
+                added += len(batch)
+            if progress:
+                progress(added)
+        return added
+
+    def run(self, users, chunk_size=500, progress=None):
+        """Generate ``users`` users, calling ``progress(counts)`` after every chunk"""
+        last_index = self.next_index + users
+        while self.next_index < last_index:
+            count = min(chunk_size, last_index - self.next_index)
+            self.generate_chunk(self.next_index, count)
+            self.next_index += count
+            if progress:
+                progress(self.counts)
+        return self.counts
@@ -1,8 +1,11 @@
 from django.test import TestCase, Client
 from django.contrib.auth.models import Group, Permission
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from accounts.models import User
-from vbucks_tracker.models import VbucksEarning
+from vbucks_tracker.models import VbucksEarning, VbucksSpending
+from vbucks_tracker.pagination import EstimatedCountPaginator
 
 
 class AdminPermissionTests(TestCase):
@@ -44,4 +47,53 @@ class AdminPermissionTests(TestCase):
         self.client.login(username='staff', password='staffpass')
         url = reverse('admin:vbucks_tracker_vbucksearning_delete', args=[self.earning.id])
         response = self.client.get(url)
-        self.assertEqual(response.status_code, 403)
\ No newline at end of file
+        self.assertEqual(response.status_code, 403)
+
+class AdminChangelistPerformanceTests(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.admin = User.objects.create_superuser(
+            username='admin',
+            email='admin@test.com',
+            password='adminpass')
+        self.client.force_login(self.admin)
+
+    def create_users(self, start, count):
+        for index in range(start, start + count):
+            user = User.objects.create_user(username=f'player{index}', password='test123')
+            VbucksSpending.objects.create(
+                user=user, item_name='Glider', vbucks_spent=index + 1, date='2024-01-01'
+            )
+            VbucksEarning.objects.create(user=user, type='BP', amount=1000, date='2024-01-01')
+
+    def changelist_query_count(self, **params):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('admin:accounts_user_changelist'), params)
+        self.assertEqual(response.status_code, 200)
+        return len(queries), response
+
+    def test_user_changelist_queries_do_not_scale_with_rows(self):
+        self.create_users(0, 3)
+        small, _ = self.changelist_query_count()
+        self.create_users(3, 12)
+        large, _ = self.changelist_query_count()
+        self.assertEqual(small, large)
+
+    def test_user_changelist_sorts_by_balance(self):
+        self.create_users(0, 3)
+        _, response = self.changelist_query_count(o='3')  # vbucks_balance column
+        usernames = [user.username for user in response.context['cl'].result_list]
+        self.assertEqual(usernames[:3], ['admin', 'player2', 'player1'])
+
+    def test_estimated_count_uses_table_statistics(self):
+        self.create_users(0, 5)
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+        paginator = EstimatedCountPaginator(VbucksSpending.objects.all(), 2)
+        paginator.exact_count_threshold = 1
+        with self.assertNumQueries(2):
+            self.assertEqual(paginator.count, 5)
+
+        filtered = EstimatedCountPaginator(VbucksSpending.objects.filter(vbucks_spent__gt=3), 2)
+        filtered.exact_count_threshold = 1
+        self.assertEqual(filtered.count, 2)
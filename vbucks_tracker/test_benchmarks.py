@@ -0,0 +1,96 @@
+import json
+import os
+import tempfile
+import time
+from io import StringIO
+from unittest import mock
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase
+from accounts.models import User
+from vbucks_tracker.benchmarks import compare_results, run_suite
+from vbucks_tracker import jobs
+from vbucks_tracker.deletion_benchmark import run_deletion_benchmark
+
+
+def results(**metrics):
+    return {'meta': {'created': 'baseline'}, 'results': {'small/dashboard/wsgi': metrics}}
+
+
+class BenchmarkSuiteTests(TestCase):
+    def test_runs_scenarios_through_both_handlers(self):
+        document = run_suite(
+            {'tiny': {'users': 3, 'rows_per_user': 10}}, requests=3,
+            scenarios=['dashboard', 'refund_create', 'api_users'],
+        )
+        self.assertEqual(set(document['results']), {
+            f'tiny/{scenario}/{handler}'
+            for scenario in ('dashboard', 'refund_create', 'api_users') for handler in ('wsgi', 'asgi')
+        })
+        for key, metrics in document['results'].items():
+            self.assertEqual(metrics['requests'], 3)
+            self.assertLessEqual(metrics['p50_ms'], metrics['p95_ms'])
+            self.assertLessEqual(metrics['p95_ms'], metrics['p99_ms'])
+            self.assertGreater(metrics['queries'], 0, key)
+            self.assertGreater(metrics['peak_memory_kib'], 0, key)
+        # Query counts don't depend on the handler
+        for scenario in ('dashboard', 'api_users'):
+            self.assertEqual(document['results'][f'tiny/{scenario}/wsgi']['queries'],
+                             document['results'][f'tiny/{scenario}/asgi']['queries'])
+        json.dumps(document)
+
+    def test_compare_flags_regressions_past_threshold_and_noise_floor(self):
+        baseline = results(p50_ms=10.0, p95_ms=20.0, queries=3, peak_memory_kib=100)
+        current = results(p50_ms=10.9, p95_ms=30.0, queries=4, peak_memory_kib=150)
+        regressions = {(metric, old, new) for _, metric, old, new, _ in compare_results(baseline, current)}
+        # p50 is within its noise floor and memory within 64 KiB
+        self.assertEqual(regressions, {('p95_ms', 20.0, 30.0), ('queries', 3, 4)})
+        self.assertEqual(compare_results(baseline, current, {'p95_ms': 1.0, 'queries': 0.5}), [])
+        self.assertEqual(compare_results({'meta': {}, 'results': {}}, current), [])
+
+    def test_command_compares_stored_results(self):
+        with tempfile.TemporaryDirectory() as directory:
+            baseline_path = os.path.join(directory, 'baseline.json')
+            current_path = os.path.join(directory, 'current.json')
+            for path, document in ((baseline_path, results(p95_ms=20.0)),
+                                   (current_path, results(p95_ms=40.0))):
+                with open(path, 'w') as results_file:
+                    json.dump(document, results_file)
+
+            with self.assertRaisesMessage(CommandError, '1 metrics regressed'):
+                call_command('benchmark_wallet', '--results', current_path, '--compare', baseline_path,
+                             stdout=StringIO())
+            out = StringIO()
+            call_command('benchmark_wallet', '--results', current_path, '--compare', baseline_path,
+                         '--threshold', 'p95_ms=1.5', stdout=out)
+            self.assertIn('No regressions', out.getvalue())
+
+
+class RequestPathBenchmarkTests(TestCase):
+    def test_rejects_empty_runs(self):
+        User.objects.create_user(username='benchmarked', password='test123')
+        for option in ('--requests', '--concurrency'):
+            with self.assertRaisesMessage(CommandError, '--requests and --concurrency must be positive'):
+                call_command('benchmark_request_path', 'benchmarked', option, '0', stdout=StringIO())
+
+
+class DeletionBenchmarkTests(TestCase):
+    def test_purge_and_cascade_delete_the_seeded_users(self):
+        results = run_deletion_benchmark(300, chunk_size=50, cascade=True)
+        self.assertEqual(set(results), {'purge', 'cascade'})
+        for method, metrics in results.items():
+            self.assertGreaterEqual(metrics['rows'], 300, method)
+            self.assertGreater(metrics['seconds'], 0, method)
+            self.assertLessEqual(metrics['longest_write_ms'], metrics['seconds'] * 1000, method)
+        self.assertFalse(User.objects.filter(username__startswith='deletion_benchmark_').exists())
+
+    def test_longest_write_times_the_chunk_transactions_only(self):
+        # Work between the chunk transactions isn't holding the write lock
+        def slow_file_cleanup(user_id, avatar):
+            time.sleep(0.3)
+
+        with mock.patch.object(jobs, 'delete_user_avatar_files', slow_file_cleanup):
+            metrics = run_deletion_benchmark(100, chunk_size=50)['purge']
+        self.assertGreaterEqual(metrics['seconds'], 0.3)
+        self.assertGreater(metrics['longest_write_ms'], 0)
+        self.assertLess(metrics['longest_write_ms'], 300)
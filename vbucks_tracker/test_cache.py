@@ -0,0 +1,79 @@
+import tempfile
+from datetime import date
+from django.test import TestCase, override_settings
+from accounts.models import User
+from vbucks_tracker.cache import SummaryCache, summary_cache
+from vbucks_tracker.models import VbucksEarning, VbucksSpending, Refund
+from vbucks_tracker.services import VbucksService
+
+
+class SummaryCacheTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='cached', password='test123')
+        self.spending = VbucksSpending.objects.create(
+            user=self.user, item_name='Wrap', vbucks_spent=300, date=date(2024, 1, 1)
+        )
+        summary_cache.reset_stats()
+
+    def test_repeated_reads_hit_the_cache(self):
+        VbucksService.get_user_summary(self.user)
+        with self.assertNumQueries(0):
+            summary = VbucksService.get_user_summary(self.user)
+        self.assertEqual(summary['total_spent'], 300)
+        self.assertEqual(summary_cache.stats(), {'hits': 1, 'misses': 1, 'hit_rate': 0.5})
+
+    def test_tracker_writes_invalidate(self):
+        VbucksService.get_user_summary(self.user)
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            VbucksEarning.objects.create(user=self.user, type='BP', amount=1000, date=date(2024, 1, 2))
+        self.assertTrue(callbacks)
+        self.assertEqual(VbucksService.get_user_balance(self.user), 700)
+
+    def test_refund_side_effects_invalidate(self):
+        self.assertEqual(VbucksService.get_user_summary(self.user)['total_spent'], 300)
+        refund = Refund.objects.create(user=self.user, original_purchase=self.spending)
+        self.assertEqual(VbucksService.get_user_summary(self.user)['total_spent'], 0)
+        refund.delete()
+        self.assertEqual(VbucksService.get_user_summary(self.user)['total_spent'], 300)
+
+    def test_bulk_lookup_computes_misses_in_one_query(self):
+        other = User.objects.create_user(username='cached_other', password='test123')
+        VbucksService.get_user_summary(self.user)
+        with self.assertNumQueries(1):
+            summaries = VbucksService.get_user_summaries([self.user.pk, other.pk])
+        self.assertEqual((summaries[self.user.pk]['balance'], summaries[other.pk]['balance']), (-300, 0))
+
+    def test_bump_all_invalidates_everyone(self):
+        VbucksService.get_user_summary(self.user)
+        summary_cache.bump_all()
+        with self.assertNumQueries(1):
+            VbucksService.get_user_summary(self.user)
+
+    def test_zero_ttl_never_serves_entries(self):
+        short_lived = SummaryCache(timeout=0)
+        for _ in range(2):
+            short_lived.get(self.user.pk, lambda: {'balance': 1})
+        self.assertEqual(short_lived.stats()['misses'], 2)
+
+    def test_file_based_backend(self):
+        with tempfile.TemporaryDirectory() as directory:
+            caches = {
+                'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+                'files': {
+                    'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+                    'LOCATION': directory,
+                    'OPTIONS': {'MAX_ENTRIES': 50},
+                },
+            }
+            with override_settings(CACHES=caches, WALLET_SUMMARY_CACHE='files'):
+                computed = []
+                for _ in range(2):
+                    summary_cache.get(self.user.pk, lambda: computed.append(1) or {'balance': 5})
+                summary_cache.bump(self.user.pk)
+                summary_cache.get(self.user.pk, lambda: computed.append(1) or {'balance': 5})
+        self.assertEqual(len(computed), 2)
+
+    async def test_async_reads_share_the_cache(self):
+        summary = await VbucksService.aget_user_summary(self.user)
+        self.assertEqual(summary, VbucksService.get_user_summary(self.user))
+        self.assertEqual(summary_cache.stats()['hits'], 1)
@@ -0,0 +1,72 @@
+import io
+import json
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase
+from django.urls import reverse
+from accounts.models import User
+from vbucks_tracker.imports import WalletImporter, iter_records
+from vbucks_tracker.models import VbucksSpending, WalletSummary
+from vbucks_tracker.services import VbucksService
+
+SPENDINGS_CSV = """id,date,category,item_name,vbucks_spent,refunded
+1,2024-02-01,SKIN,Fishstick,1200,False
+2,2024-02-02,EMOTE,Floss,-5,False
+3,2999-01-01,SKIN,Time Traveller,800,False
+4,2024-02-03,BUNDLE,Starter Bundle,1500,False
+"""
+
+
+class WalletImporterTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='importer', password='test123')
+
+    def test_valid_rows_are_created_and_errors_reported(self):
+        records = iter_records(io.StringIO(SPENDINGS_CSV), 'csv')
+        result = WalletImporter(self.user, 'spendings', batch_size=2).run(records)
+
+        self.assertEqual(result.created, 2)
+        self.assertEqual([line for line, _ in result.errors], [3, 4])
+        self.assertIn('vbucks_spent', result.errors[0][1])
+        self.assertEqual(
+            sorted(VbucksSpending.objects.filter(user=self.user).values_list('item_name', flat=True)),
+            ['Fishstick', 'Starter Bundle']
+        )
+
+    def test_summary_refreshed_per_batch(self):
+        records = iter_records(io.StringIO(SPENDINGS_CSV), 'csv')
+        WalletImporter(self.user, 'spendings', batch_size=2).run(records)
+        summary = WalletSummary.objects.get(user=self.user)
+        self.assertEqual(summary.spent, 2700)
+        self.assertEqual(summary.spent, VbucksService.compute_user_totals(self.user)['spent'])
+
+    def test_batch_uses_bulk_insert(self):
+        lines = '\n'.join(
+            json.dumps({'type': 'BP', 'amount': 100, 'date': '2024-01-01'}) for _ in range(50)
+        )
+        importer = WalletImporter(self.user, 'earnings', batch_size=50)
+        importer.run(iter_records(io.StringIO(lines), 'jsonl'))  # creates the summary and rollup rows
+        # Savepoint, one multi-row INSERT, one summary UPDATE, one UPDATE per
+        # touched rollup bucket (day and month), the ledger's seq lookup,
+        # INSERT and balance UPDATE, release
+        with self.assertNumQueries(9):
+            result = importer.run(iter_records(io.StringIO(lines), 'jsonl'))
+        self.assertEqual(result.created, 50)
+
+    def test_malformed_json_line_is_reported(self):
+        result = WalletImporter(self.user, 'earnings').run(
+            iter_records(io.StringIO('{"type": "BP"\n[]\n'), 'jsonl')
+        )
+        self.assertEqual(result.failed, 2)
+
+
+class ImportViewTests(TestCase):
+    def test_upload(self):
+        user = User.objects.create_user(username='uploader', password='test123')
+        self.client.force_login(user)
+        upload = SimpleUploadedFile('spendings.csv', SPENDINGS_CSV.encode(), content_type='text/csv')
+        response = self.client.post(
+            reverse('vbucks_tracker:import'), {'dataset': 'spendings', 'file': upload}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['result'].created, 2)
+        self.assertContains(response, 'Line 3')
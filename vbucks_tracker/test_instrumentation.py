@@ -0,0 +1,109 @@
+import marshal
+import time
+from asgiref.sync import iscoroutinefunction
+from django.http import HttpResponse
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+from accounts.models import User
+from vbucks_tracker.instrumentation import (
+    QueryBudgetMiddleware, RequestProfilerMiddleware, RequestTimings, ServerTimingMiddleware, server_timing
+)
+from vbucks_tracker.models import RequestProfile
+
+
+def timing_entries(response):
+    return {entry.split(';')[0]: entry for entry in response['Server-Timing'].split(', ')}
+
+
+@override_settings(SERVER_TIMING=True)
+class ServerTimingTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='timed', password='test123')
+        self.client.force_login(self.user)
+
+    def test_template_views_report_db_template_and_view_time(self):
+        for name in ('vbucks_tracker:home', 'vbucks_tracker:vbucks-spending-list', 'vbucks_tracker:analytics'):
+            response = self.client.get(reverse(name))
+            self.assertEqual(set(timing_entries(response)), {'db', 'template', 'view', 'total'}, name)
+
+    def test_api_views_report_serialize_time(self):
+        response = self.client.get(reverse('user-list'))
+        self.assertIn('serialize', timing_entries(response))
+        self.assertNotIn('template', timing_entries(response))
+
+    async def test_async_requests_are_timed(self):
+        await self.async_client.aforce_login(self.user)
+        response = await self.async_client.get(reverse('vbucks_tracker:home'))
+        entries = timing_entries(response)
+        self.assertEqual(set(entries), {'db', 'template', 'view', 'total'})
+        self.assertNotEqual(entries['db'], 'db;dur=0.0')
+
+    @override_settings(QUERY_INSTRUMENTATION=True, REQUEST_PROFILING=True)
+    def test_middleware_keeps_async_stacks_async(self):
+        async def view(request):
+            return HttpResponse()
+
+        for middleware in (ServerTimingMiddleware, QueryBudgetMiddleware, RequestProfilerMiddleware):
+            self.assertTrue(iscoroutinefunction(middleware(view)), middleware.__name__)
+            self.assertFalse(iscoroutinefunction(middleware(lambda request: HttpResponse())), middleware.__name__)
+
+    def test_nested_spans_of_one_phase_count_once(self):
+        timings = RequestTimings()
+        with timings.measure('template'):
+            with timings.measure('template'):
+                time.sleep(0.01)
+        self.assertLess(timings.durations['template'], 0.02)
+        with server_timing('template'):  # no request in flight: a no-op
+            pass
+
+
+@override_settings(REQUEST_PROFILING=True)
+class RequestProfilerTests(TestCase):
+    def setUp(self):
+        self.staff = User.objects.create_user(
+            username='profiler', password='test123', is_staff=True, is_superuser=True
+        )
+
+    def test_staff_can_profile_a_request_and_download_it(self):
+        self.client.force_login(self.staff)
+        response = self.client.get(reverse('vbucks_tracker:vbucks-spending-list'), {'_profile': '1'})
+        self.assertEqual(response.status_code, 200)
+        profile = RequestProfile.objects.get(pk=response['X-Profile-Id'])
+        self.assertEqual(profile.user, self.staff)
+        self.assertEqual(profile.status_code, 200)
+        self.assertGreater(profile.query_count, 0)
+        self.assertIn('function calls', profile.summary)
+
+        # Async views and DRF views are profiled too
+        self.assertIn('X-Profile-Id', self.client.get(reverse('vbucks_tracker:home'), headers={'X-Profile': '1'}))
+        self.assertIn('X-Profile-Id', self.client.get(reverse('user-list'), {'_profile': '1'}))
+
+        download = self.client.get(reverse('admin:vbucks_tracker_requestprofile_download', args=[profile.pk]))
+        self.assertEqual(download.status_code, 200)
+        self.assertTrue(marshal.loads(download.content))
+        changelist = self.client.get(reverse('admin:vbucks_tracker_requestprofile_changelist'))
+        self.assertContains(changelist, reverse('admin:vbucks_tracker_requestprofile_download', args=[profile.pk]))
+
+    def test_staff_can_profile_api_requests_with_a_jwt(self):
+        api = APIClient()
+        api.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(self.staff).access_token}')
+        response = api.get(reverse('user-list'), {'_profile': '1'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(RequestProfile.objects.get(pk=response['X-Profile-Id']).user, self.staff)
+
+        player = User.objects.create_user(username='player', password='test123')
+        api.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(player).access_token}')
+        self.assertNotIn('X-Profile-Id', api.get(reverse('user-list'), {'_profile': '1'}))
+        api.credentials(HTTP_AUTHORIZATION='Bearer not-a-token')
+        self.assertNotIn('X-Profile-Id', api.get(reverse('vbucks_tracker:home'), {'_profile': '1'}))
+        self.assertEqual(RequestProfile.objects.count(), 1)
+
+    def test_non_staff_requests_are_not_profiled(self):
+        user = User.objects.create_user(username='player', password='test123')
+        self.client.force_login(user)
+        response = self.client.get(reverse('vbucks_tracker:home'), {'_profile': '1'})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('X-Profile-Id', response)
+        self.assertFalse(RequestProfile.objects.exists())
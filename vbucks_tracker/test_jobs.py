@@ -0,0 +1,231 @@
+import gzip
+import json
+import shutil
+import tempfile
+import threading
+from datetime import date, timedelta
+from io import StringIO
+from unittest import mock
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.db.models.signals import post_delete
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from accounts.avatars import variant_paths
+from accounts.models import User, UserProfile
+from accounts.tests import image_upload
+from vbucks_tracker import jobs
+from vbucks_tracker.jobs import JobType, claim_job, enqueue, execute_job, requeue_stale_jobs
+from vbucks_tracker.models import Job, Refund, VbucksEarning, VbucksSpending, WalletRollup, WalletSummary
+
+
+def run_jobs(**options):
+    call_command('run_jobs', workers=0, burst=True, stdout=StringIO(), stderr=StringIO(), **options)
+
+
+class JobQueueTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='queued', password='test123')
+        self.other = User.objects.create_user(username='other', password='test123')
+
+    def test_a_user_has_one_queued_job_per_kind(self):
+        first = enqueue('export_history', self.user, {'format': 'csv'})
+        second = enqueue('export_history', self.user, {'format': 'jsonl'})
+        self.assertEqual(first.pk, second.pk)
+        self.assertEqual(Job.objects.get(pk=first.pk).payload, {'format': 'jsonl'})
+        self.assertNotEqual(enqueue('export_history', self.other).pk, first.pk)
+        self.assertNotEqual(enqueue('recompute_summary', self.user).pk, first.pk)
+
+        # Once it runs, changes need another job
+        self.assertEqual(claim_job('test').pk, first.pk)
+        self.assertNotEqual(enqueue('export_history', self.user).pk, first.pk)
+        with self.assertRaises(ValueError):
+            enqueue('unknown', self.user)
+
+    def test_claims_the_oldest_due_job(self):
+        later = enqueue('recompute_summary', self.user, delay=60)
+        due = enqueue('recompute_summary', self.other)
+        job = claim_job('worker-1')
+        self.assertEqual(job.pk, due.pk)
+        self.assertEqual((job.status, job.worker, job.attempts), (Job.RUNNING, 'worker-1', 1))
+        self.assertIsNone(claim_job('worker-2'))
+        self.assertIsNone(claim_job('worker-2', kinds=['export_history']))
+        Job.objects.filter(pk=later.pk).update(run_after=timezone.now())
+        self.assertEqual(claim_job('worker-2').pk, later.pk)
+
+    @override_settings(JOB_RETRY_DELAY_SECONDS=10)
+    def test_failed_attempts_are_retried_with_backoff(self):
+        handler = mock.Mock(side_effect=[RuntimeError('flaky'), RuntimeError('flaky'), {'ok': True}])
+        with mock.patch.dict(jobs.JOB_TYPES, {'flaky': JobType(handler, max_attempts=3)}):
+            job = enqueue('flaky', self.user)
+            execute_job(claim_job('test'))
+            job.refresh_from_db()
+            self.assertEqual((job.status, job.attempts), (Job.QUEUED, 1))
+            self.assertIn('RuntimeError: flaky', job.error)
+            self.assertAlmostEqual((job.run_after - timezone.now()).total_seconds(), 10, delta=2)
+
+            Job.objects.filter(pk=job.pk).update(run_after=timezone.now())
+            execute_job(claim_job('test'))
+            job.refresh_from_db()
+            self.assertAlmostEqual((job.run_after - timezone.now()).total_seconds(), 20, delta=2)
+
+            Job.objects.filter(pk=job.pk).update(run_after=timezone.now())
+            execute_job(claim_job('test'))
+            job.refresh_from_db()
+            self.assertEqual((job.status, job.result, job.error, job.progress), (Job.SUCCEEDED, {'ok': True}, '', 100))
+
+            handler.side_effect = RuntimeError('broken')
+            job = enqueue('flaky', self.user)
+            for _ in range(3):
+                Job.objects.filter(pk=job.pk).update(run_after=timezone.now())
+                execute_job(claim_job('test'))
+            job.refresh_from_db()
+            self.assertEqual((job.status, job.attempts), (Job.FAILED, 3))
+            self.assertIsNotNone(job.finished_at)
+
+    @override_settings(JOB_LEASE_SECONDS=60)
+    def test_jobs_of_lost_workers_are_retried(self):
+        enqueue('recompute_summary', self.user)
+        job = claim_job('gone')
+        self.assertEqual(requeue_stale_jobs(), 0)
+        Job.objects.filter(pk=job.pk).update(heartbeat_at=timezone.now() - timedelta(seconds=61))
+        self.assertEqual(requeue_stale_jobs(), 1)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.worker), (Job.QUEUED, ''))
+        self.assertIn('gone', job.error)
+
+        # A late result from the lost attempt is ignored
+        execute_job(job)
+        self.assertEqual(Job.objects.get(pk=job.pk).status, Job.QUEUED)
+
+    def test_recompute_summary(self):
+        VbucksEarning.objects.create(user=self.user, type='STW', amount=800, date=date(2024, 1, 1))
+        WalletSummary.objects.filter(user=self.user).update(earned=5, balance=5)
+        job = enqueue('recompute_summary', self.user)
+        run_jobs()
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.result), (Job.SUCCEEDED, {'balance': 800}))
+        self.assertEqual(WalletSummary.objects.get(user=self.user).balance, 800)
+
+    def test_deleting_an_account_deactivates_it_and_purges_it_in_the_background(self):
+        spendings = [
+            VbucksSpending.objects.create(user=self.user, item_name=f'Skin {index}', vbucks_spent=100, date=date(2024, 1, 1))
+            for index in range(3)
+        ]
+        Refund.objects.create(user=self.user, original_purchase=spendings[0])
+        UserProfile.objects.create(user=self.user)
+        self.client.force_login(self.user)
+        self.client.post(reverse('delete_profile'))
+
+        self.user.refresh_from_db()
+        self.assertFalse(self.user.is_active)
+        self.assertFalse(self.client.login(username='queued', password='test123'))
+        job = Job.objects.get(kind='purge_account', user_id=self.user.pk)
+
+        with mock.patch.object(jobs, 'PURGE_CHUNK_SIZE', 2):
+            run_jobs(kinds=['purge_account'])
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.result), (Job.SUCCEEDED, {'rows': 12}))
+        self.assertFalse(User.objects.filter(pk=self.user.pk).exists())
+        self.assertFalse(VbucksSpending.objects.filter(user_id=self.user.pk).exists())
+
+    @override_settings(AVATAR_WORKERS=0)
+    def test_purge_deletes_avatar_files_without_loading_rows(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        self.enterContext(override_settings(MEDIA_ROOT=media_root))
+        with self.captureOnCommitCallbacks(execute=True):
+            profile = UserProfile.objects.create(user=self.user, avatar=image_upload('me.jpg', (300, 300)))
+        profile.refresh_from_db()
+        files = [profile.avatar.name, *variant_paths(profile.avatar_variants)]
+        self.assertTrue(all(default_storage.exists(name) for name in files))
+        for index in range(5):
+            VbucksSpending.objects.create(user=self.user, item_name=f'Glider {index}', vbucks_spent=100, date=date(2024, 1, 1))
+
+        # The spendings and their ledger entries, summary, profile and rollups
+        rows = 5 + 5 + 1 + 1 + WalletRollup.objects.filter(user=self.user).count()
+
+        received = []
+
+        def receiver(sender, instance, **kwargs):
+            received.append(instance)
+
+        post_delete.connect(receiver, sender=VbucksSpending, weak=False)
+        self.addCleanup(post_delete.disconnect, receiver, sender=VbucksSpending)
+        self.assertEqual(jobs.purge_user(self.user, chunk_size=2), rows)
+        self.assertEqual(received, [])
+        self.assertFalse(any(default_storage.exists(name) for name in files))
+        self.assertFalse(User.objects.filter(pk=self.user.pk).exists())
+
+    def test_reactivated_accounts_are_not_purged(self):
+        job = enqueue('purge_account', self.user)
+        run_jobs()
+        job.refresh_from_db()
+        self.assertEqual(job.result['skipped'], "The account was reactivated")
+        self.assertTrue(User.objects.filter(pk=self.user.pk).exists())
+
+
+class ExportJobTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        self.enterContext(override_settings(MEDIA_ROOT=media_root))
+        self.user = User.objects.create_user(username='exporter', password='test123')
+        for index in range(7):
+            VbucksSpending.objects.create(user=self.user, item_name=f'Wrap {index}', vbucks_spent=50, date=date(2024, 1, 1))
+        self.client.force_login(self.user)
+
+    def test_background_export_is_downloaded_from_the_job_page(self):
+        response = self.client.post(reverse('vbucks_tracker:export-job'), {'format': 'jsonl', 'gzip': 'on'})
+        job = Job.objects.get(kind='export_history', user=self.user)
+        self.assertRedirects(response, reverse('vbucks_tracker:job-detail', args=[job.pk]))
+        self.assertContains(self.client.get(response.url), 'Waiting to start')
+
+        with mock.patch.object(jobs, 'EXPORT_PROGRESS_ROWS', 3), \
+                mock.patch.object(Job, 'report_progress', autospec=True, side_effect=Job.report_progress) as progress:
+            run_jobs()
+        self.assertEqual([call.args[1:3] for call in progress.call_args_list], [(3, 7), (6, 7)])
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.SUCCEEDED)
+        self.assertEqual(job.result['rows'], 7)
+        self.assertContains(self.client.get(response.url), job.result['filename'])
+
+        download = self.client.get(reverse('vbucks_tracker:job-download', args=[job.pk]))
+        self.assertIn(f'filename="{job.result["filename"]}"', download['Content-Disposition'])
+        lines = gzip.decompress(b''.join(download.streaming_content)).decode().splitlines()
+        self.assertEqual(len(lines), 7)
+        self.assertEqual(json.loads(lines[0])['item_name'], 'Wrap 0')
+
+        self.client.force_login(User.objects.create_user(username='snoop', password='test123'))
+        self.assertEqual(self.client.get(response.url).status_code, 404)
+        self.assertEqual(self.client.get(reverse('vbucks_tracker:job-download', args=[job.pk])).status_code, 404)
+
+    @override_settings(JOB_RETENTION_DAYS=1)
+    def test_expired_exports_are_deleted(self):
+        job = enqueue('export_history', self.user, {'format': 'csv', 'dataset': 'spendings', 'datasets': ['spendings'], 'gzip': False})
+        run_jobs()
+        job.refresh_from_db()
+        self.assertTrue(default_storage.exists(job.result['file']))
+        self.assertEqual(jobs.delete_expired_jobs(), 0)
+        Job.objects.filter(pk=job.pk).update(finished_at=timezone.now() - timedelta(days=2))
+        self.assertEqual(jobs.delete_expired_jobs(), 1)
+        self.assertFalse(default_storage.exists(job.result['file']))
+
+
+class JobWorkerPoolTests(TestCase):
+    def test_claimed_jobs_run_on_the_pool(self):
+        for index in range(4):
+            enqueue('recompute_summary', User.objects.create_user(username=f'pooled{index}', password='test123'))
+        threads = {}
+
+        def record(job_id):
+            # The in-memory test database can't be shared with other threads' connections
+            threads[job_id] = threading.current_thread().name
+
+        out = StringIO()
+        with mock.patch('vbucks_tracker.management.commands.run_jobs.run_claimed_job', record):
+            call_command('run_jobs', workers=2, executor='thread', burst=True, poll_interval=0.01, stdout=out)
+        self.assertIn('Ran 4 jobs.', out.getvalue())
+        self.assertEqual(set(threads), set(Job.objects.values_list('pk', flat=True)))
+        self.assertTrue(all(name.startswith('jobs') for name in threads.values()))
@@ -0,0 +1,214 @@
+import importlib
+import io
+import json
+from datetime import date, datetime, timezone as dt_timezone
+from decimal import Decimal
+from types import SimpleNamespace
+from django.apps import apps
+from django.db import connection
+from django.test import TestCase
+from django.urls import reverse
+from rest_framework.test import APIClient
+from accounts.models import User
+from vbucks_tracker.imports import WalletImporter, iter_records
+from vbucks_tracker.ledger import balance_on, iter_balance_series, rebuild_user_ledger
+from vbucks_tracker.models import (
+    LedgerEntry, RealMoneyTransaction, Refund, VbucksEarning, VbucksSpending, WalletSummary
+)
+from vbucks_tracker.services import VbucksService
+from vbucks_tracker.synthetic import SyntheticWalletGenerator
+
+
+def entries(user):
+    return list(
+        LedgerEntry.objects.filter(user=user).order_by('date', 'seq')
+        .values_list('date', 'seq', 'source', 'delta', 'balance')
+    )
+
+
+class LedgerTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='bookkeeper', password='test123')
+
+    def assertLedgerMatchesSummary(self):
+        last = LedgerEntry.objects.filter(user=self.user).order_by('date', 'seq').last()
+        self.assertEqual(last.balance if last else 0, VbucksService.compute_user_totals(self.user)['balance'])
+
+    def test_writes_append_entries_with_running_balances(self):
+        VbucksEarning.objects.create(user=self.user, type='BP', amount=1000, date=date(2024, 3, 1))
+        VbucksSpending.objects.create(user=self.user, item_name='Peely', vbucks_spent=300, date=date(2024, 3, 5))
+        # Entered after the fact: the later balances move up
+        RealMoneyTransaction.objects.create(
+            user=self.user, source_name='Pack', category='VB', amount=Decimal('8.99'),
+            vbucks_earned=200, date=date(2024, 2, 1)
+        )
+        self.assertEqual(entries(self.user), [
+            (date(2024, 2, 1), 3, 'TRANSACTION', 200, 200),
+            (date(2024, 3, 1), 1, 'EARNING', 1000, 1200),
+            (date(2024, 3, 5), 2, 'SPENDING', -300, 900),
+        ])
+        self.assertEqual(balance_on(self.user, date(2024, 1, 31)), 0)
+        self.assertEqual(balance_on(self.user, date(2024, 3, 4)), 1200)
+        self.assertEqual(balance_on(self.user, date(2025, 1, 1)), 900)
+        with self.assertNumQueries(1):
+            balance_on(self.user, date(2024, 3, 1))
+        self.assertLedgerMatchesSummary()
+
+    def test_changes_are_appended_as_reversals(self):
+        spending = VbucksSpending.objects.create(
+            user=self.user, item_name='Emote', vbucks_spent=500, date=date(2024, 5, 10)
+        )
+        spending.item_name = 'Dance'
+        spending.save()
+        self.assertEqual(LedgerEntry.objects.filter(user=self.user).count(), 1)
+
+        spending.vbucks_spent = 800
+        spending.date = date(2024, 5, 12)
+        spending.save()
+        self.assertEqual(entries(self.user), [
+            (date(2024, 5, 10), 1, 'SPENDING', -500, -500),
+            (date(2024, 5, 10), 2, 'SPENDING', 500, 0),
+            (date(2024, 5, 12), 3, 'SPENDING', -800, -800),
+        ])
+
+        refund = Refund.objects.create(
+            user=self.user, original_purchase=spending, refund_date=datetime(2024, 5, 20, tzinfo=dt_timezone.utc)
+        )
+        self.assertEqual(balance_on(self.user, date(2024, 5, 19)), -800)
+        self.assertEqual(balance_on(self.user, date(2024, 5, 20)), 0)
+        self.assertLedgerMatchesSummary()
+
+        refund.delete()
+        self.assertEqual(balance_on(self.user, date(2024, 5, 31)), -800)
+        spending.delete()
+        self.assertEqual(balance_on(self.user, date(2024, 5, 31)), 0)
+        self.assertEqual(LedgerEntry.objects.filter(user=self.user).count(), 6)
+        self.assertLedgerMatchesSummary()
+
+    def test_appending_recreates_a_missing_summary_row_to_lock(self):
+        earning = VbucksEarning.objects.create(user=self.user, type='BP', amount=300, date=date(2024, 6, 1))
+        WalletSummary.objects.filter(user=self.user).delete()
+        # Deletes never recreate the summary themselves, so the ledger append has to
+        earning.delete()
+        self.assertEqual(WalletSummary.objects.get(user=self.user).balance, 0)
+        self.assertEqual([entry[1:] for entry in entries(self.user)], [(1, 'EARNING', 300, 300), (2, 'EARNING', -300, 0)])
+
+    def test_refunded_flag_edited_in_the_admin_keeps_the_ledger_and_summary_in_step(self):
+        VbucksEarning.objects.create(user=self.user, type='BP', amount=2000, date=date(2024, 4, 1))
+        spending = VbucksSpending.objects.create(
+            user=self.user, item_name='Pickaxe', vbucks_spent=800, date=date(2024, 4, 2)
+        )
+        admin = User.objects.create_superuser(username='ledger_admin', password='test123')
+        self.client.force_login(admin)
+
+        def edit(**values):
+            data = {
+                'form-TOTAL_FORMS': 1, 'form-INITIAL_FORMS': 1, 'form-0-id': spending.pk,
+                'form-0-vbucks_spent': values['vbucks_spent'], '_save': 'Save',
+            }
+            if values['refunded']:
+                data['form-0-refunded'] = 'on'
+            response = self.client.post(reverse('admin:vbucks_tracker_vbucksspending_changelist'), data)
+            self.assertEqual(response.status_code, 302)
+            summary = WalletSummary.objects.get(user=self.user)
+            self.assertEqual(entries(self.user)[-1][4], summary.balance)
+            return summary
+
+        self.assertEqual(edit(vbucks_spent=800, refunded=True).balance, 2000)
+        refund = Refund.objects.get(original_purchase=spending)
+        self.assertEqual(refund.vbucks_returned, 800)
+        self.assertEqual(edit(vbucks_spent=900, refunded=True).refunded, 900)
+        self.assertEqual(edit(vbucks_spent=900, refunded=False).balance, 1100)
+        self.assertFalse(Refund.objects.exists())
+        self.assertLedgerMatchesSummary()
+
+    def test_bulk_writes_append_entries(self):
+        lines = '\n'.join(
+            json.dumps({'type': 'BP', 'amount': 100, 'date': f'2024-01-{day:02d}'}) for day in range(20, 0, -1)
+        )
+        WalletImporter(self.user, 'earnings', batch_size=8).run(iter_records(io.StringIO(lines), 'jsonl'))
+        purchases = [
+            VbucksSpending.objects.create(user=self.user, item_name=f'Wrap {index}', vbucks_spent=300, date=date(2024, 1, 5))
+            for index in range(2)
+        ]
+        # Refunded today, after the series below
+        VbucksService.create_refunds([Refund(user=self.user, original_purchase=purchase) for purchase in purchases])
+        self.assertEqual(LedgerEntry.objects.filter(user=self.user).count(), 24)
+        self.assertEqual(
+            [balance for _, balance in iter_balance_series(self.user, date(2024, 1, 1), date(2024, 1, 20))][:6],
+            [100, 200, 300, 400, -100, 0],
+        )
+        self.assertLedgerMatchesSummary()
+
+        incremental = entries(self.user)
+        self.assertEqual(rebuild_user_ledger(self.user), 24)
+        rebuilt = entries(self.user)
+        self.assertEqual([entry[4] for entry in rebuilt][-1], incremental[-1][4])
+
+    def test_generated_rebuilt_and_migrated_ledgers_agree(self):
+        generator = SyntheticWalletGenerator(seed=3, rows_per_user=60, end_date=date(2025, 6, 30), prefix='ledger_')
+        generator.run(3)
+        users = list(User.objects.filter(username__startswith='ledger_').order_by('pk'))
+        generated = [entries(user) for user in users]
+        for user, ledger in zip(users, generated):
+            self.assertEqual(ledger[-1][4], VbucksService.compute_user_totals(user)['balance'])
+
+        for user in users:
+            rebuild_user_ledger(user)
+        self.assertEqual([entries(user) for user in users], generated)
+
+        LedgerEntry.objects.all().delete()
+        migration = importlib.import_module('vbucks_tracker.migrations.0009_ledger')
+        migration.build_ledger(apps, SimpleNamespace(connection=connection))
+        self.assertEqual([entries(user) for user in users], generated)
+
+    def test_deleting_a_user_deletes_their_ledger(self):
+        VbucksEarning.objects.create(user=self.user, type='BP', amount=100, date=date(2024, 1, 1))
+        self.user.delete()
+        self.assertFalse(LedgerEntry.objects.exists())
+
+
+class BalanceEndpointTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='grapher', password='test123')
+        VbucksEarning.objects.create(user=self.user, type='BP', amount=1000, date=date(2024, 8, 1))
+        VbucksEarning.objects.create(user=self.user, type='BP', amount=200, date=date(2024, 8, 9))
+        VbucksSpending.objects.create(user=self.user, item_name='Glider', vbucks_spent=500, date=date(2024, 8, 9))
+        VbucksSpending.objects.create(user=self.user, item_name='Wrap', vbucks_spent=100, date=date(2024, 8, 20))
+
+    def test_series_has_one_closing_balance_per_day(self):
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('vbucks_tracker:balance-history'), {'start': '2024-08-05', 'end': '2024-08-31'})
+        self.assertEqual(response['Content-Type'], 'application/json')
+        self.assertEqual(json.loads(b''.join(response.streaming_content)), {
+            'start': '2024-08-05',
+            'end': '2024-08-31',
+            'points': [['2024-08-05', 1000], ['2024-08-09', 700], ['2024-08-20', 600], ['2024-08-31', 600]],
+        })
+
+    async def test_series_streams_asynchronously_under_asgi(self):
+        await self.async_client.aforce_login(self.user)
+        response = await self.async_client.get(
+            reverse('vbucks_tracker:balance-history'), {'start': '2024-08-05', 'end': '2024-08-10'}
+        )
+        self.assertTrue(response.is_async)
+        body = b''.join([chunk async for chunk in response.streaming_content])
+        self.assertEqual(json.loads(body)['points'], [['2024-08-05', 1000], ['2024-08-09', 700], ['2024-08-10', 700]])
+
+    def test_api(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        response = client.get(reverse('balance-api'), {'date': '2024-08-10'})
+        self.assertEqual(response.data, {'date': date(2024, 8, 10), 'balance': 700})
+        response = client.get(reverse('balance-history-api'), {'start': '2024-08-01', 'end': '2024-08-09'})
+        self.assertEqual(
+            json.loads(b''.join(response.streaming_content))['points'], [['2024-08-01', 1000], ['2024-08-09', 700]]
+        )
+        self.assertEqual(client.get(reverse('balance-api'), {'date': 'soon'}).status_code, 400)
+        self.assertEqual(APIClient().get(reverse('balance-api')).status_code, 401)
+
+    def test_analytics_page_shows_the_closing_balance(self):
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('vbucks_tracker:analytics'), {'start': '2024-08-01', 'end': '2024-08-15'})
+        self.assertEqual(response.context['closing_balance'], 700)
+        self.assertContains(response, 'id="balance-chart"')
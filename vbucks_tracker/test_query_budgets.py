@@ -0,0 +1,166 @@
+import shutil
+import tempfile
+from datetime import date
+from django.db import transaction
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, override_settings
+from django.urls import reverse
+from accounts.models import User
+from vbucks_tracker import urls
+from vbucks_tracker.instrumentation import QueryBudgetMiddleware, QueryRecorder
+from vbucks_tracker.jobs import claim_job, enqueue, execute_job
+from vbucks_tracker.models import RealMoneyTransaction, VbucksEarning, VbucksSpending, Refund
+from vbucks_tracker.testing import QueryBudgetMixin, iter_url_names
+
+FEW_ROWS = 2
+ROWS = 12
+
+# URL name -> maximum queries for a GET with ROWS rows of every kind. Session
+# and user lookups are included; none of these may grow with the row count,
+# which is checked by comparing the counts with FEW_ROWS and ROWS rows.
+QUERY_BUDGETS = {
+    'vbucks_tracker:home': 4,
+    'vbucks_tracker:transaction-list': 4,
+    'vbucks_tracker:transaction-create': 2,
+    'vbucks_tracker:transaction-update': 3,
+    'vbucks_tracker:transaction-delete': 3,
+    'vbucks_tracker:vbucksearning-list': 4,
+    'vbucks_tracker:vbucksearning-create': 2,
+    'vbucks_tracker:vbucksearning-update': 3,
+    'vbucks_tracker:vbucksearning-delete': 3,
+    'vbucks_tracker:vbucks-spending-list': 4,
+    'vbucks_tracker:vbucks-spending-gifted': 5,
+    'vbucks_tracker:vbucks-spending-create': 2,
+    'vbucks_tracker:vbucks-spending-update': 3,
+    'vbucks_tracker:vbucks-spending-delete': 3,
+    'vbucks_tracker:refund-list': 4,
+    'vbucks_tracker:refund-create': 4,
+    'vbucks_tracker:refund-delete': 3,
+    'vbucks_tracker:export': 6,
+    'vbucks_tracker:import': 2,
+    # Session, user, rollup buckets and the closing balance
+    'vbucks_tracker:analytics': 4,
+    # Session, user, opening balance and the streamed entries
+    'vbucks_tracker:balance-history': 4,
+    # One full-text query plus one per kind of row found
+    'vbucks_tracker:search': 4,
+    'vbucks_tracker:job-detail': 3,
+    'vbucks_tracker:job-download': 3,
+}
+# The same for views that only take POSTs: URL name -> (form data, maximum queries)
+POST_QUERY_BUDGETS = {
+    'vbucks_tracker:export-job': ({'format': 'jsonl'}, 6),
+}
+
+
+class QueryBudgetTests(QueryBudgetMixin, TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='budget', password='test123')
+        self.client.force_login(self.user)
+        self.objects = {}
+        self.rows = 0
+        self.add_rows(FEW_ROWS)
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        self.enterContext(override_settings(MEDIA_ROOT=media_root))
+        self.job = enqueue('export_history', self.user, {
+            'format': 'jsonl', 'dataset': 'spendings', 'datasets': ['spendings'], 'gzip': False,
+        })
+        execute_job(claim_job('budget'))
+
+    def add_rows(self, count):
+        """Add ``count`` rows of every kind; the last ones are the update and delete targets"""
+        for index in range(self.rows, self.rows + count):
+            day = date(2024, 1 + index % 12, 1)
+            self.objects['transaction'] = RealMoneyTransaction.objects.create(
+                user=self.user, source_name='Pack', amount=5, vbucks_earned=500, date=day
+            )
+            self.objects['vbucksearning'] = VbucksEarning.objects.create(
+                user=self.user, type='BP', amount=100, date=day
+            )
+            self.objects['vbucks-spending'] = VbucksSpending.objects.create(
+                user=self.user, item_name=f'Item {index}', category='GIFT', vbucks_spent=200, date=day
+            )
+            refundable = VbucksSpending.objects.create(
+                user=self.user, item_name=f'Refunded {index}', vbucks_spent=100, date=day
+            )
+            self.objects['refund'] = Refund.objects.create(user=self.user, original_purchase=refundable)
+        self.rows += count
+
+    def url_for(self, name):
+        route = name.split(':')[1]
+        if route.endswith(('-update', '-delete')):
+            return reverse(name, args=[self.objects[route.rsplit('-', 1)[0]].pk])
+        if route == 'search':
+            return reverse(name) + '?q=item'
+        if route.startswith('job-'):
+            return reverse(name, args=[self.job.pk])
+        return reverse(name)
+
+    def test_every_url_has_a_budget(self):
+        names = set(iter_url_names(urls.urlpatterns, urls.app_name))
+        self.assertEqual(names - set(QUERY_BUDGETS) - set(POST_QUERY_BUDGETS), set(), 'Add a query budget for these URLs')
+
+    def test_views_stay_within_budget(self):
+        requests = [
+            (name, budget, 'get', {}, 200) for name, budget in QUERY_BUDGETS.items()
+        ] + [
+            (name, budget, 'post', {'data': data}, 302) for name, (data, budget) in POST_QUERY_BUDGETS.items()
+        ]
+        # Rolled back so that e.g. the queued export job doesn't change the second pass
+        with transaction.atomic():
+            few = {name: self.record_queries(self.url_for(name), method, **extra)[1].count
+                   for name, budget, method, extra, status in requests}
+            transaction.set_rollback(True)
+        self.add_rows(ROWS - FEW_ROWS)
+        for name, budget, method, extra, status in requests:
+            with self.subTest(name):
+                with QueryRecorder() as recorder:
+                    response = self.assertQueryBudget(self.url_for(name), budget, method=method, **extra)
+                self.assertEqual(response.status_code, status)
+                self.assertEqual(
+                    recorder.count, few[name], f'{name} ran {few[name]} queries with {FEW_ROWS} rows of every kind'
+                )
+
+
+class QueryBudgetMiddlewareTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='instrumented', password='test123')
+        self.client.force_login(self.user)
+        for index in range(6):
+            spending = VbucksSpending.objects.create(
+                user=self.user, item_name=f'Item {index}', vbucks_spent=100, date=date(2024, 1, 1)
+            )
+            Refund.objects.create(user=self.user, original_purchase=spending)
+
+    def test_headers_are_opt_in(self):
+        response = self.client.get(reverse('vbucks_tracker:refund-list'))
+        self.assertNotIn('X-Query-Count', response)
+
+    def test_reports_counts_and_repeats(self):
+        with self.settings(QUERY_INSTRUMENTATION=True, QUERY_REPEAT_THRESHOLD=5):
+            with self.assertLogs('vbucks_tracker.queries', 'INFO') as logs:
+                response = self.client.get(reverse('vbucks_tracker:refund-list'))
+        self.assertEqual(response['X-Query-Count'], '4')
+        self.assertEqual(response['X-Query-Repeats'], '0')
+        self.assertIn('GET /refunds/: 4 queries', logs.output[0])
+
+    async def test_counts_queries_of_async_requests(self):
+        await self.async_client.aforce_login(self.user)
+        with self.settings(QUERY_INSTRUMENTATION=True, QUERY_REPEAT_THRESHOLD=5):
+            with self.assertLogs('vbucks_tracker.queries', 'INFO'):
+                response = await self.async_client.get(reverse('vbucks_tracker:refund-list'))
+        self.assertEqual(response['X-Query-Count'], '4')
+
+    def test_flags_n_plus_one_with_stack(self):
+        def n_plus_one(request):
+            names = [refund.original_purchase.item_name for refund in Refund.objects.all()]
+            return HttpResponse(', '.join(names))
+
+        with self.settings(QUERY_INSTRUMENTATION=True, QUERY_REPEAT_THRESHOLD=5):
+            middleware = QueryBudgetMiddleware(n_plus_one)
+            with self.assertLogs('vbucks_tracker.queries', 'WARNING') as logs:
+                response = middleware(RequestFactory().get('/n-plus-one/'))
+        self.assertEqual(response['X-Query-Repeats'], '1')
+        self.assertIn('6 x SELECT', logs.output[0])
+        self.assertIn('n_plus_one', logs.output[0])
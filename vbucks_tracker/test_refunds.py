@@ -0,0 +1,120 @@
+from datetime import date
+from unittest.mock import patch
+from django.core.exceptions import ValidationError
+from django.db.models import QuerySet
+from django.test import TestCase
+from django.urls import reverse
+from rest_framework.test import APIClient
+from accounts.models import User
+from vbucks_tracker.models import VbucksSpending, Refund, WalletSummary
+from vbucks_tracker.services import VbucksService
+
+
+class RefundCreationTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='refunder', password='test123')
+        self.purchases = [
+            VbucksSpending.objects.create(
+                user=self.user, item_name=f'Item {index}', vbucks_spent=500 * (index + 1),
+                date=date(2024, 4, 1)
+            )
+            for index in range(3)
+        ]
+
+    def assertSummaryMatchesSource(self):
+        summary = WalletSummary.objects.get(user=self.user)
+        expected = VbucksService.compute_user_totals(self.user)
+        self.assertEqual({field: getattr(summary, field) for field in expected}, expected)
+
+    def test_refund_is_a_fixed_number_of_queries(self):
+        # Savepoint, lock, guarded UPDATE, INSERT, summary UPDATE, two rollup UPDATEs,
+        # ledger seq lookup, INSERT and balance UPDATE, release
+        with self.assertNumQueries(11):
+            refund = Refund.objects.create(user=self.user, original_purchase=self.purchases[0])
+        self.assertEqual(refund.vbucks_returned, 500)
+        self.purchases[0].refresh_from_db()
+        self.assertTrue(self.purchases[0].refunded)
+        self.assertSummaryMatchesSource()
+
+    def test_second_refund_is_rejected(self):
+        Refund.objects.create(user=self.user, original_purchase=self.purchases[0])
+        with self.assertRaises(ValidationError):
+            Refund.objects.create(user=self.user, original_purchase=self.purchases[0])
+        self.assertEqual(Refund.objects.count(), 1)
+        self.assertSummaryMatchesSource()
+
+    def test_concurrent_refund_loses_the_guard(self):
+        original_in_bulk = QuerySet.in_bulk
+
+        def refunded_elsewhere(queryset, *args, **kwargs):
+            locked = original_in_bulk(queryset, *args, **kwargs)
+            # Another request commits its refund between our read and our UPDATE
+            VbucksSpending.objects.filter(pk=self.purchases[0].pk).update(refunded=True)
+            return locked
+
+        with patch.object(QuerySet, 'in_bulk', refunded_elsewhere):
+            with self.assertRaises(ValidationError):
+                VbucksService.create_refunds([
+                    Refund(user=self.user, original_purchase=purchase) for purchase in self.purchases
+                ])
+        self.assertFalse(Refund.objects.exists())
+        untouched = [purchase.pk for purchase in self.purchases[1:]]
+        self.assertFalse(VbucksSpending.objects.filter(pk__in=untouched, refunded=True).exists())
+
+    def test_cannot_refund_someone_elses_purchase(self):
+        other = User.objects.create_user(username='not_the_owner', password='test123')
+        with self.assertRaises(ValidationError):
+            Refund.objects.create(user=other, original_purchase=self.purchases[0])
+
+    def test_delete_restores_purchase(self):
+        refund = Refund.objects.create(user=self.user, original_purchase=self.purchases[1])
+        refund.delete()
+        self.purchases[1].refresh_from_db()
+        self.assertFalse(self.purchases[1].refunded)
+        self.assertSummaryMatchesSource()
+
+    def test_view_reports_already_refunded_purchase(self):
+        self.client.force_login(self.user)
+        url = reverse('vbucks_tracker:refund-create')
+        form_response = self.client.get(url)
+        Refund.objects.create(user=self.user, original_purchase=self.purchases[2])
+        response = self.client.post(url, {'original_purchase': self.purchases[2].pk, 'reason': 'OTHER'})
+        self.assertEqual(form_response.status_code, 200)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Refund.objects.count(), 1)
+
+
+class BulkRefundAPITests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='bulk_refunder', password='test123')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.purchases = [
+            VbucksSpending.objects.create(
+                user=self.user, item_name=f'Bundle {index}', category='BUNDLE',
+                vbucks_spent=1000, date=date(2024, 5, index + 1)
+            )
+            for index in range(10)
+        ]
+        self.url = reverse('bulk-refund-api')
+
+    def test_refunds_all_purchases_in_one_transaction(self):
+        ids = [purchase.pk for purchase in self.purchases]
+        response = self.client.post(self.url, {'purchases': ids, 'reason': 'ACCIDENTAL'}, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(sorted(row['original_purchase'] for row in response.data), ids)
+        summary = WalletSummary.objects.get(user=self.user)
+        self.assertEqual((summary.spent, summary.refunded), (0, 10000))
+
+    def test_any_invalid_purchase_rejects_the_batch(self):
+        Refund.objects.create(user=self.user, original_purchase=self.purchases[3])
+        ids = [purchase.pk for purchase in self.purchases]
+        response = self.client.post(self.url, {'purchases': ids}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(Refund.objects.count(), 1)
+        self.assertEqual(VbucksSpending.objects.filter(refunded=True).count(), 1)
+
+    def test_duplicate_ids_are_rejected(self):
+        pk = self.purchases[0].pk
+        response = self.client.post(self.url, {'purchases': [pk, pk]}, format='json')
+        self.assertEqual(response.status_code, 400)
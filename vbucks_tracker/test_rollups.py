@@ -0,0 +1,125 @@
+from datetime import date
+from decimal import Decimal
+from django.test import TestCase
+from django.urls import reverse
+from rest_framework.test import APIClient
+from accounts.models import User
+from vbucks_tracker.imports import WalletImporter
+from vbucks_tracker.models import RealMoneyTransaction, VbucksEarning, VbucksSpending, Refund, WalletRollup
+from vbucks_tracker.rollups import range_filter, rebuild_user_rollups, rollup_report
+
+
+class WalletRollupTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='analyst', password='test123')
+
+    def buckets(self):
+        return {
+            (rollup.source, rollup.period, rollup.period_start, rollup.category):
+                (rollup.vbucks, rollup.amount_base, rollup.entries)
+            for rollup in WalletRollup.objects.filter(user=self.user)
+            if rollup.entries
+        }
+
+    def assertRollupsMatchSource(self):
+        incremental = self.buckets()
+        rebuild_user_rollups(self.user)
+        self.assertEqual(incremental, self.buckets())
+
+    def test_writes_update_daily_and_monthly_buckets(self):
+        VbucksSpending.objects.create(
+            user=self.user, item_name='Peely', category='SKIN', vbucks_spent=1200, date=date(2024, 5, 3)
+        )
+        VbucksSpending.objects.create(
+            user=self.user, item_name='Pickaxe', category='SKIN', vbucks_spent=800, date=date(2024, 5, 20)
+        )
+        buckets = self.buckets()
+        self.assertEqual(buckets[('SPENDING', 'M', date(2024, 5, 1), 'SKIN')], (2000, 0, 2))
+        self.assertEqual(buckets[('SPENDING', 'D', date(2024, 5, 3), 'SKIN')], (1200, 0, 1))
+
+    def test_updates_deletes_and_refunds_stay_in_sync(self):
+        RealMoneyTransaction.objects.create(
+            user=self.user, source_name='Pack', category='VB', amount=Decimal('9.99'),
+            vbucks_earned=1000, date=date(2024, 1, 31)
+        )
+        earning = VbucksEarning.objects.create(user=self.user, type='BP', amount=300, date=date(2024, 2, 1))
+        spending = VbucksSpending.objects.create(
+            user=self.user, item_name='Emote', category='EMOTE', vbucks_spent=500, date=date(2024, 2, 2)
+        )
+        earning.type = 'QUEST'
+        earning.date = date(2024, 3, 1)
+        earning.save()
+        self.assertRollupsMatchSource()
+
+        refund = Refund.objects.create(user=self.user, original_purchase=spending)
+        self.assertNotIn(('SPENDING', 'M', date(2024, 2, 1), 'EMOTE'), self.buckets())
+        self.assertRollupsMatchSource()
+
+        refund.delete()
+        self.assertEqual(self.buckets()[('SPENDING', 'M', date(2024, 2, 1), 'EMOTE')], (500, 0, 1))
+        earning.delete()
+        self.assertRollupsMatchSource()
+
+    def test_import_applies_rollups_per_batch(self):
+        records = [
+            (line, {'item_name': f'Item {line}', 'category': 'GIFT', 'vbucks_spent': '100',
+                    'date': '2024-07-0%d' % line})
+            for line in range(1, 5)
+        ]
+        WalletImporter(self.user, 'spendings').run(records)
+        self.assertEqual(self.buckets()[('SPENDING', 'M', date(2024, 7, 1), 'GIFT')], (400, 0, 4))
+        self.assertRollupsMatchSource()
+
+    def test_range_uses_monthly_buckets_for_whole_months(self):
+        # Jan 15-31 and Apr 1-10 come from daily buckets, Feb-Mar from monthly ones
+        for day in (date(2024, 1, 20), date(2024, 4, 10)):
+            VbucksEarning.objects.create(user=self.user, type='BP', amount=10, date=day)
+        for day in (date(2024, 2, 5), date(2024, 3, 31)):
+            VbucksEarning.objects.create(user=self.user, type='BP', amount=100, date=day)
+        VbucksEarning.objects.create(user=self.user, type='BP', amount=1000, date=date(2024, 1, 14))
+        VbucksEarning.objects.create(user=self.user, type='BP', amount=1000, date=date(2024, 4, 11))
+
+        rollups = WalletRollup.objects.filter(range_filter(date(2024, 1, 15), date(2024, 4, 10)))
+        periods = sorted(rollups.filter(user=self.user).values_list('period', flat=True))
+        self.assertEqual(periods, ['D', 'D', 'M', 'M'])
+        report = rollup_report(self.user, date(2024, 1, 15), date(2024, 4, 10))
+        self.assertEqual(report['totals']['EARNING']['BP']['vbucks'], 220)
+        self.assertEqual([month['month'].month for month in report['monthly']], [1, 2, 3, 4])
+
+    def test_short_range_within_a_month(self):
+        VbucksEarning.objects.create(user=self.user, type='BP', amount=10, date=date(2024, 6, 2))
+        VbucksEarning.objects.create(user=self.user, type='BP', amount=10, date=date(2024, 6, 9))
+        report = rollup_report(self.user, date(2024, 6, 1), date(2024, 6, 5))
+        self.assertEqual(report['totals']['EARNING']['BP']['vbucks'], 10)
+
+
+class AnalyticsEndpointTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='charts', password='test123')
+        VbucksSpending.objects.create(
+            user=self.user, item_name='Glider Bundle', category='BUNDLE', vbucks_spent=500, date=date(2024, 8, 8)
+        )
+        VbucksEarning.objects.create(user=self.user, type='BP', amount=200, date=date(2024, 8, 9))
+
+    def test_api_filters_by_source_and_range(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        response = client.get(
+            reverse('analytics-api'), {'start': '2024-08-01', 'end': '2024-08-31', 'source': 'SPENDING'}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(list(response.data['totals']), ['SPENDING'])
+        self.assertEqual(response.data['totals']['SPENDING']['BUNDLE']['vbucks'], 500)
+
+    def test_api_requires_authentication(self):
+        response = APIClient().get(reverse('analytics-api'))
+        self.assertEqual(response.status_code, 401)
+
+    def test_analytics_page(self):
+        self.client.force_login(self.user)
+        response = self.client.get(
+            reverse('vbucks_tracker:analytics'), {'start': '2024-08-31', 'end': '2024-08-01'}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['report']['start'], date(2024, 8, 1))
+        self.assertContains(response, 'BUNDLE')
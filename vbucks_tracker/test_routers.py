@@ -0,0 +1,125 @@
+import time
+from contextlib import ExitStack
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from datetime import date
+from unittest import skipUnless
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections, router
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from accounts.models import User
+from vbucks_tracker.models import VbucksSpending
+from vbucks_tracker.routers import ReplicaPinMiddleware, ReplicaRouter, replica_reads
+
+REPLICAS = ['replica_a', 'replica_b']
+
+
+@replica_reads
+def read_view(request):
+    return HttpResponse(router.db_for_read(VbucksSpending))
+
+
+@replica_reads
+def write_view(request):
+    before = router.db_for_read(VbucksSpending)
+    router.db_for_write(VbucksSpending)
+    return HttpResponse(f'{before} {router.db_for_read(VbucksSpending)}')
+
+
+@replica_reads
+async def async_read_view(request):
+    return HttpResponse(router.db_for_read(VbucksSpending))
+
+
+@override_settings(REPLICA_DATABASES=REPLICAS)
+class ReplicaRouterTests(TestCase):
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.middleware = ReplicaPinMiddleware(read_view)
+
+    def test_only_marked_views_read_from_replicas(self):
+        self.assertEqual(router.db_for_read(VbucksSpending), DEFAULT_DB_ALIAS)
+        self.assertIn(read_view(self.factory.get('/')).content.decode(), REPLICAS)
+        self.assertEqual(router.db_for_read(VbucksSpending), DEFAULT_DB_ALIAS)
+        self.assertEqual(router.db_for_write(VbucksSpending), DEFAULT_DB_ALIAS)
+
+    async def test_async_views_read_from_replicas(self):
+        response = await async_read_view(self.factory.get('/'))
+        self.assertIn(response.content.decode(), REPLICAS)
+
+    def test_writes_move_the_request_and_the_client_to_the_primary(self):
+        before, after = write_view(self.factory.get('/')).content.decode().split()
+        self.assertIn(before, REPLICAS)
+        self.assertEqual(after, DEFAULT_DB_ALIAS)
+
+        response = ReplicaPinMiddleware(write_view)(self.factory.get('/'))
+        pin = response.cookies['primary_pin']
+        self.assertEqual(pin['max-age'], 5)
+        self.assertGreater(float(pin.value), time.time())
+        self.assertNotIn('primary_pin', self.middleware(self.factory.get('/')).cookies)
+
+        request = self.factory.get('/')
+        request.COOKIES['primary_pin'] = pin.value
+        self.assertEqual(self.middleware(request).content.decode(), DEFAULT_DB_ALIAS)
+        request.COOKIES['primary_pin'] = str(time.time() - 1)
+        self.assertIn(self.middleware(request).content.decode(), REPLICAS)
+
+    async def test_async_stacks_are_pinned_without_sync_adaptation(self):
+        async def async_write_view(request):
+            return await sync_to_async(write_view)(request)
+
+        middleware = ReplicaPinMiddleware(async_write_view)
+        self.assertTrue(iscoroutinefunction(middleware))
+        response = await middleware(self.factory.get('/'))
+        self.assertIn('primary_pin', response.cookies)
+        self.assertNotIn('primary_pin', (await ReplicaPinMiddleware(async_read_view)(self.factory.get('/'))).cookies)
+
+    def test_replica_rows_are_saved_to_the_primary(self):
+        user = User.objects.create_user(username='replicated', password='test123')
+        spending = VbucksSpending(user=user, item_name='Cape', vbucks_spent=300, date=date(2024, 5, 1))
+        spending._state.db = 'replica_a'
+        routing = ReplicaRouter()
+        self.assertEqual(routing.db_for_write(VbucksSpending, instance=spending), DEFAULT_DB_ALIAS)
+        self.assertTrue(routing.allow_relation(spending, user))
+        self.assertFalse(routing.allow_migrate('replica_a', 'vbucks_tracker'))
+        self.assertIsNone(routing.allow_migrate(DEFAULT_DB_ALIAS, 'vbucks_tracker'))
+
+    def test_creating_a_spending_pins_the_client(self):
+        user = User.objects.create_user(username='pinned', password='test123')
+        self.client.force_login(user)
+        response = self.client.post(reverse('vbucks_tracker:vbucks-spending-create'), {
+            'item_name': 'Fresh Glider', 'category': 'OTHER', 'vbucks_spent': 500, 'date': '2024-05-02',
+        })
+        self.assertEqual(response.status_code, 302)
+        self.assertIn('primary_pin', response.cookies)
+        # The test client sends the pin back, so the list reads the primary and shows the new row
+        listing = self.client.get(reverse('vbucks_tracker:vbucks-spending-list'))
+        self.assertContains(listing, 'Fresh Glider')
+
+
+@skipUnless(settings.REPLICA_DATABASES, 'Set DATABASE_REPLICA_URLS to run against real replica connections')
+class ReplicaDatabaseTests(TransactionTestCase):
+    """Runs the list views against the configured replicas (mirrors of the test database)"""
+    databases = {DEFAULT_DB_ALIAS, *settings.REPLICA_DATABASES}
+
+    def test_list_reads_replica_until_the_client_writes(self):
+        user = User.objects.create_user(username='replica_reader', password='test123')
+        VbucksSpending.objects.create(user=user, item_name='Old Wrap', vbucks_spent=300, date=date(2024, 5, 1))
+        self.client.force_login(user)
+        url = reverse('vbucks_tracker:vbucks-spending-list')
+
+        replicas = [CaptureQueriesContext(connections[alias]) for alias in settings.REPLICA_DATABASES]
+        with ExitStack() as stack:
+            for capture in replicas:
+                stack.enter_context(capture)
+            self.assertContains(self.client.get(url), 'Old Wrap')
+        self.assertTrue(any(len(capture) for capture in replicas))
+
+        self.client.post(reverse('vbucks_tracker:vbucks-spending-create'), {
+            'item_name': 'New Glider', 'category': 'OTHER', 'vbucks_spent': 500, 'date': '2024-05-02',
+        })
+        with CaptureQueriesContext(connections[DEFAULT_DB_ALIAS]) as primary:
+            self.assertContains(self.client.get(url), 'New Glider')
+        self.assertTrue(any('vbucksspending' in query['sql'] for query in primary.captured_queries))
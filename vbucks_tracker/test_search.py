@@ -0,0 +1,156 @@
+from datetime import date
+from io import StringIO
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase
+from django.urls import reverse
+from rest_framework.test import APIClient
+from accounts.models import User
+from vbucks_tracker.models import RealMoneyTransaction, Refund, VbucksEarning, VbucksSpending
+from vbucks_tracker.search import SEARCH_TABLE, search_backend, search_terms
+
+
+class SearchTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='searcher', password='test123')
+        self.other = User.objects.create_user(username='neighbour', password='test123')
+        self.skin = VbucksSpending.objects.create(
+            user=self.user, item_name='Renegade Raider', category='SKIN', vbucks_spent=1200, date=date(2024, 1, 5)
+        )
+        self.wrap = VbucksSpending.objects.create(
+            user=self.user, item_name='Raider Wrap', category='OTHER', vbucks_spent=300, date=date(2024, 1, 6)
+        )
+        self.transaction = RealMoneyTransaction.objects.create(
+            user=self.user, category='VB', source_name='Starter Pack', amount='4.99', currency='EUR',
+            vbucks_earned=600, date=date(2024, 1, 1), notes='Bought for the raider bundle',
+        )
+        self.earning = VbucksEarning.objects.create(
+            user=self.user, type='STW', amount=50, earning_name='Daily quest', date=date(2024, 1, 2)
+        )
+        VbucksSpending.objects.create(
+            user=self.other, item_name='Raider Pickaxe', vbucks_spent=800, date=date(2024, 1, 5)
+        )
+        self.backend = search_backend()
+
+    def titles(self, query, **kwargs):
+        return [result.title for result in self.backend.results(self.user, query, **kwargs)]
+
+    def test_ranks_the_users_rows_across_kinds(self):
+        results = self.backend.results(self.user, 'raider')
+        self.assertEqual({(result.kind, result.object.pk) for result in results}, {
+            ('spending', self.skin.pk), ('spending', self.wrap.pk), ('transaction', self.transaction.pk),
+        })
+        self.assertEqual(results, sorted(results, key=lambda result: -result.rank))
+        # Short documents with the term rank above the transaction's longer note
+        self.assertEqual(results[-1].kind, 'transaction')
+
+    def test_terms_match_as_prefixes_and_must_all_appear(self):
+        self.assertEqual(self.titles('rene raid'), ['Renegade Raider'])
+        self.assertEqual(self.titles('raider bundle'), ['Starter Pack'])
+        # Query syntax is treated as plain words
+        self.assertEqual(self.titles('"quest" *'), ['Daily quest'])
+        self.assertEqual(self.titles('NEAR(quest) OR'), [])
+        self.assertEqual(self.titles('raider', kinds=('transaction',)), ['Starter Pack'])
+        self.assertEqual(self.titles('  ...  '), [])
+        self.assertEqual(len(search_terms(' '.join(['word'] * 20))), 8)
+
+    def test_index_follows_writes(self):
+        self.skin.item_name = 'Skull Trooper'
+        self.skin.save()
+        self.assertEqual(self.titles('raider'), ['Raider Wrap', 'Starter Pack'])
+        self.assertEqual(self.titles('skull'), ['Skull Trooper'])
+
+        refund = Refund.objects.create(user=self.user, original_purchase=self.wrap, notes='Wrong colour')
+        self.assertEqual(self.titles('colour'), ['Refund of Raider Wrap'])
+        refund.delete()
+        self.assertEqual(self.titles('colour'), [])
+
+        VbucksSpending.objects.bulk_create([
+            VbucksSpending(user=self.user, item_name='Skull Ranger', vbucks_spent=1200, date=date(2024, 2, 1))
+        ])
+        self.assertEqual(sorted(self.titles('skull')), ['Skull Ranger', 'Skull Trooper'])
+        VbucksSpending.objects.filter(user=self.user).delete()
+        self.assertEqual(self.titles('skull'), [])
+
+    def test_pages_of_results(self):
+        page, has_next = self.backend.page(self.user, 'raider', per_page=2)
+        self.assertTrue(has_next)
+        rest, has_next = self.backend.page(self.user, 'raider', number=2, per_page=2)
+        self.assertFalse(has_next)
+        self.assertEqual(
+            [(result.kind, result.object.pk) for result in page + rest],
+            [(result.kind, result.object.pk) for result in self.backend.results(self.user, 'raider')],
+        )
+
+    def test_rebuild_command(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {SEARCH_TABLE}")
+        self.assertEqual(self.titles('raider'), [])
+        out = StringIO()
+        call_command('rebuild_search_index', stdout=out)
+        self.assertIn('Indexed 5 documents', out.getvalue())
+        self.assertEqual(len(self.titles('raider')), 3)
+
+
+class SearchViewTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='finder', password='test123')
+        for index in range(25):
+            VbucksSpending.objects.create(
+                user=self.user, item_name=f'Llama {index}', vbucks_spent=100, date=date(2024, 3, 1)
+            )
+
+    def test_search_page(self):
+        self.client.force_login(self.user)
+        url = reverse('vbucks_tracker:search')
+        self.assertIsNone(self.client.get(url).context['results'])
+        response = self.client.get(url, {'q': 'llama', 'kind': 'spending'})
+        self.assertEqual(len(response.context['results']), 20)
+        self.assertContains(response, reverse('vbucks_tracker:vbucks-spending-update', args=[
+            response.context['results'][0].object.pk
+        ]))
+        next_page = self.client.get(f"{url}?{response.context['next_page_query']}")
+        self.assertEqual(len(next_page.context['results']), 5)
+        self.assertIn('previous_page_query', next_page.context)
+        self.assertNotIn('next_page_query', next_page.context)
+
+    def test_search_api(self):
+        client = APIClient()
+        url = reverse('search-api')
+        self.assertEqual(client.get(url, {'q': 'llama'}).status_code, 401)
+        client.force_authenticate(self.user)
+        response = client.get(url, {'q': 'llama'})
+        self.assertEqual(len(response.data['results']), 20)
+        self.assertEqual(set(response.data['results'][0]), {'kind', 'id', 'title', 'date', 'vbucks', 'rank', 'url'})
+        self.assertIsNone(response.data['previous'])
+        second = client.get(response.data['next'])
+        self.assertEqual(len(second.data['results']), 5)
+        self.assertIsNone(second.data['next'])
+        self.assertEqual(client.get(url, {'q': 'llama', 'kind': 'skin'}).status_code, 400)
+
+
+class AdminSearchTests(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create_superuser(username='root', password='adminpass')
+        self.player = User.objects.create_user(username='galaxy', password='test123')
+        self.galaxy = VbucksSpending.objects.create(
+            user=self.player, item_name='Galaxy Scout', vbucks_spent=2000, date=date(2024, 4, 1)
+        )
+        self.glider = VbucksSpending.objects.create(
+            user=self.admin, item_name='Galaxy Glider', vbucks_spent=800, date=date(2024, 4, 2)
+        )
+        self.refund = Refund.objects.create(user=self.admin, original_purchase=self.glider, notes='Duplicate')
+        self.client.force_login(self.admin)
+
+    def changelist(self, model, term):
+        response = self.client.get(reverse(f'admin:vbucks_tracker_{model}_changelist'), {'q': term})
+        return {obj.pk for obj in response.context['cl'].result_list}
+
+    def test_admin_search_uses_the_index_and_exact_usernames(self):
+        self.assertEqual(self.changelist('vbucksspending', 'gala'), {self.galaxy.pk, self.glider.pk})
+        self.assertEqual(self.changelist('vbucksspending', 'galaxy glid'), {self.glider.pk})
+        # An exact username lists that user's rows instead
+        self.assertEqual(self.changelist('vbucksspending', 'galaxy'), {self.galaxy.pk})
+        self.assertEqual(self.changelist('refund', 'glider'), {self.refund.pk})
+        self.assertEqual(self.changelist('refund', 'duplicate'), {self.refund.pk})
+        self.assertEqual(self.changelist('refund', 'scout'), set())
@@ -0,0 +1,223 @@
+from decimal import Decimal
+import io
+from datetime import date
+from io import StringIO
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase
+from django.utils import timezone
+from accounts.models import User
+from vbucks_tracker.models import (
+    FxRate, RealMoneyTransaction, VbucksEarning, VbucksSpending, Refund, WalletSummary
+)
+from vbucks_tracker.fx import get_rate, invalidate_rates, load_rates, to_base
+from vbucks_tracker.services import VbucksService
+
+
+class WalletSummaryTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='wallet_test', password='test123')
+        self.today = timezone.now().date()
+
+    def create_activity(self):
+        RealMoneyTransaction.objects.create(
+            user=self.user, source_name='V-Bucks Pack', amount=9.99,
+            vbucks_earned=1000, date=self.today
+        )
+        VbucksEarning.objects.create(user=self.user, type='BP', amount=300, date=self.today)
+        return VbucksSpending.objects.create(
+            user=self.user, item_name='Renegade Raider', vbucks_spent=800, date=self.today
+        )
+
+    def assertSummaryMatchesSource(self):
+        summary = WalletSummary.objects.get(user=self.user)
+        expected = VbucksService.compute_user_totals(self.user)
+        self.assertEqual(
+            {field: getattr(summary, field) for field in expected},
+            expected
+        )
+
+    def test_creates_update_summary(self):
+        self.create_activity()
+        summary = WalletSummary.objects.get(user=self.user)
+        self.assertEqual(summary.purchased, 1000)
+        self.assertEqual(summary.earned, 300)
+        self.assertEqual(summary.spent, 800)
+        self.assertEqual(summary.balance, 500)
+
+    def test_update_applies_difference(self):
+        spending = self.create_activity()
+        spending.vbucks_spent = 500
+        spending.save()
+        self.assertEqual(VbucksService.get_user_balance(self.user), 800)
+        self.assertSummaryMatchesSource()
+
+    def test_refund_flips_spending_contribution(self):
+        spending = self.create_activity()
+        refund = Refund.objects.create(user=self.user, original_purchase=spending)
+        summary = WalletSummary.objects.get(user=self.user)
+        self.assertEqual((summary.spent, summary.refunded, summary.balance), (0, 800, 1300))
+
+        refund.delete()
+        summary.refresh_from_db()
+        self.assertEqual((summary.spent, summary.refunded, summary.balance), (800, 0, 500))
+        self.assertSummaryMatchesSource()
+
+    def test_cascade_delete_keeps_summary_in_sync(self):
+        spending = self.create_activity()
+        Refund.objects.create(user=self.user, original_purchase=spending)
+        VbucksSpending.objects.filter(pk=spending.pk).delete()
+        self.assertSummaryMatchesSource()
+
+    def test_user_delete_removes_summary(self):
+        self.create_activity()
+        self.user.delete()
+        self.assertFalse(WalletSummary.objects.exists())
+
+    def test_version_increments_on_every_write(self):
+        spending = self.create_activity()
+        version = WalletSummary.objects.get(user=self.user).version
+        spending.item_name = 'Renegade Raider (Rare)'
+        spending.save()
+        self.assertEqual(WalletSummary.objects.get(user=self.user).version, version + 1)
+
+    def test_missing_summary_falls_back_to_source_tables(self):
+        self.create_activity()
+        WalletSummary.objects.all().delete()
+        self.assertEqual(VbucksService.get_user_summary(self.user)['balance'], 500)
+
+
+class SummaryEngineTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='engine_test', password='test123')
+        today = timezone.now().date()
+        load_rates(io.StringIO(f'date,currency,rate\n{today},EUR,2\n{today},USD,1.5\n'))
+        for amount, currency in ((10, 'EUR'), (5.5, 'EUR'), (20, 'USD')):
+            RealMoneyTransaction.objects.create(
+                user=self.user, source_name='Pack', amount=amount,
+                vbucks_earned=1000, currency=currency, date=today
+            )
+        VbucksEarning.objects.create(user=self.user, type='CREW', amount=1000, date=today)
+        refunded = VbucksSpending.objects.create(
+            user=self.user, item_name='Peely', vbucks_spent=1200, date=today
+        )
+        VbucksSpending.objects.create(user=self.user, item_name='Drift', vbucks_spent=950, date=today)
+        Refund.objects.create(user=self.user, original_purchase=refunded)
+
+    def test_summary_is_single_query(self):
+        with self.assertNumQueries(1):
+            summary = VbucksService.get_user_summary(self.user)
+        self.assertEqual(summary['total_purchased'], 3000)
+        self.assertEqual(summary['total_earned'], 1000)
+        self.assertEqual(summary['total_spent'], 950)
+        self.assertEqual(summary['total_refunded'], 1200)
+        self.assertEqual(summary['balance'], 3050)
+        self.assertEqual(summary['total_real_money'], Decimal('61.00'))
+        self.assertEqual(summary['real_money_currency'], 'BGN')
+        self.assertEqual(summary['real_money_by_currency']['EUR'], Decimal('15.50'))
+        self.assertEqual(summary['real_money_by_currency']['GBP'], Decimal('0'))
+
+    def test_source_totals_are_single_query(self):
+        with self.assertNumQueries(1):
+            totals = VbucksService.compute_user_totals(self.user)
+        self.assertEqual(totals, {
+            'purchased': 3000, 'earned': 1000, 'spent': 950, 'refunded': 1200, 'balance': 3050
+        })
+
+    def test_user_without_activity(self):
+        other = User.objects.create_user(username='empty', password='test123')
+        summary = VbucksService.get_user_summary(other)
+        self.assertEqual(summary['balance'], 0)
+        self.assertEqual(summary['total_real_money'], 0)
+
+
+class RebuildWalletSummariesCommandTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='rebuild_test', password='test123')
+        VbucksEarning.objects.create(
+            user=self.user, type='QUEST', amount=200, date=timezone.now().date()
+        )
+        WalletSummary.objects.filter(user=self.user).update(earned=0, balance=0)
+
+    def test_verify_reports_drift(self):
+        with self.assertRaises(CommandError):
+            call_command('rebuild_wallet_summaries', '--verify', stdout=StringIO())
+
+    def test_rebuild_fixes_drift(self):
+        call_command('rebuild_wallet_summaries', stdout=StringIO())
+        summary = WalletSummary.objects.get(user=self.user)
+        self.assertEqual((summary.earned, summary.balance), (200, 200))
+        call_command('rebuild_wallet_summaries', '--verify', stdout=StringIO())
+
+
+class FxConversionTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='fx_test', password='test123')
+        load_rates(io.StringIO(
+            'date,currency,rate\n'
+            '2024-01-01,EUR,1.95583\n'
+            '2024-01-01,USD,1.80\n'
+            '2024-06-01,USD,1.70\n'
+        ))
+
+    def create(self, amount, currency, day):
+        return RealMoneyTransaction.objects.create(
+            user=self.user, source_name='Pack', amount=Decimal(amount),
+            vbucks_earned=1000, currency=currency, date=day
+        )
+
+    def test_amount_base_uses_rate_in_effect(self):
+        self.assertEqual(self.create('10.00', 'USD', date(2024, 3, 1)).amount_base, Decimal('18.00'))
+        self.assertEqual(self.create('10.00', 'USD', date(2024, 7, 1)).amount_base, Decimal('17.00'))
+        self.assertEqual(self.create('10.00', 'BGN', date(2024, 7, 1)).amount_base, Decimal('10.00'))
+
+    def test_currency_without_rates_is_left_unconverted(self):
+        transaction = self.create('5.00', 'GBP', date(2024, 3, 1))
+        self.assertIsNone(transaction.amount_base)
+        summary = VbucksService.get_user_summary(self.user)
+        self.assertEqual(summary['real_money_unconverted'], 1)
+
+    def test_rates_are_cached(self):
+        invalidate_rates()
+        get_rate('EUR', date(2024, 2, 1))
+        with self.assertNumQueries(0):
+            self.assertEqual(get_rate('EUR', date(2024, 2, 1)), Decimal('1.95583'))
+
+    def test_rate_changes_reach_every_worker_and_misses_are_not_cached(self):
+        self.assertEqual(get_rate('EUR', date(2024, 2, 1)), Decimal('1.95583'))
+        # Written without FxRate.save, as another process would: only the version bump shows it
+        FxRate.objects.filter(currency='EUR').update(rate=Decimal('2'))
+        self.assertEqual(get_rate('EUR', date(2024, 2, 1)), Decimal('1.95583'))
+        invalidate_rates()
+        self.assertEqual(get_rate('EUR', date(2024, 2, 1)), Decimal('2'))
+
+        self.assertIsNone(get_rate('GBP', date(2024, 3, 1)))
+        FxRate.objects.bulk_create([FxRate(currency='GBP', date=date(2024, 1, 1), rate=Decimal('2.3'))])
+        self.assertEqual(get_rate('GBP', date(2024, 3, 1)), Decimal('2.3'))
+
+    def test_backfill_command(self):
+        transaction = self.create('10.00', 'EUR', date(2024, 3, 1))
+        RealMoneyTransaction.objects.update(amount_base=None)
+        FxRate.objects.filter(currency='EUR').update(rate=Decimal('2'))
+        invalidate_rates()
+        call_command('backfill_amount_base', stdout=StringIO())
+        transaction.refresh_from_db()
+        self.assertEqual(transaction.amount_base, Decimal('20.00'))
+
+    def test_backfill_rounds_like_saved_rows(self):
+        # 0.625 is a half cent: to_base rounds it half-even, SQLite's round() would not
+        transaction = self.create('1.25', 'EUR', date(2024, 3, 1))
+        FxRate.objects.filter(currency='EUR').update(rate=Decimal('0.5'))
+        invalidate_rates()
+        RealMoneyTransaction.objects.update(amount_base=None)
+        call_command('backfill_amount_base', stdout=StringIO())
+        transaction.refresh_from_db()
+        self.assertEqual(transaction.amount_base, to_base(Decimal('1.25'), 'EUR', date(2024, 3, 1)))
+        self.assertEqual(transaction.amount_base, Decimal('0.62'))
+
+    def test_dashboard_display_currency(self):
+        self.create('19.56', 'BGN', date(2024, 3, 1))
+        self.client.force_login(self.user)
+        response = self.client.get('/', {'currency': 'EUR'})
+        self.assertEqual(response.context['user_currency'], 'EUR')
+        self.assertEqual(response.context['total_real_money'], Decimal('10.00'))
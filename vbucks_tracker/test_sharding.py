@@ -0,0 +1,237 @@
+from datetime import date
+from io import StringIO
+from unittest import mock, skipUnless
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import DEFAULT_DB_ALIAS
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+from accounts.models import User, UserProfile
+from vbucks_tracker import sharding, views
+from vbucks_tracker.models import FxRate, LedgerEntry, Refund, VbucksEarning, VbucksSpending, WalletRollup, WalletSummary
+from vbucks_tracker.routers import ShardMiddleware, ShardRouter, current_shard, place_user, use_shard
+from vbucks_tracker.search import search_backend
+from vbucks_tracker.services import VbucksService
+from vbucks_tracker.sharding import ShardMoveConflict, move_user
+from vbucks_tracker.sqlite import immediate_atomic
+
+SHARDS = [DEFAULT_DB_ALIAS, 'shard_a', 'shard_b']
+
+
+@override_settings(SHARD_DATABASES=SHARDS, SHARD_NEW_USERS=SHARDS)
+class ShardRouterTests(SimpleTestCase):
+    def setUp(self):
+        self.router = ShardRouter()
+        self.user = User(pk=7, username='routed', shard='shard_b')
+
+    def test_placement_is_stable_and_only_moves_users_to_a_new_shard(self):
+        usernames = [f'player{index}' for index in range(300)]
+        placed = {username: place_user(username) for username in usernames}
+        self.assertEqual(set(placed.values()), set(SHARDS))
+        self.assertEqual(placed, {username: place_user(username) for username in usernames})
+        with override_settings(SHARD_NEW_USERS=[*SHARDS, 'shard_c']):
+            moved = {username for username in usernames if place_user(username) != placed[username]}
+            self.assertTrue(moved)
+            self.assertEqual({place_user(username) for username in moved}, {'shard_c'})
+
+    def test_routes_by_user_row_and_context(self):
+        spending = VbucksSpending(user=self.user, item_name='Glider', vbucks_spent=500, date=date(2024, 1, 1))
+        self.assertEqual(spending._state.db, 'shard_b')
+        self.assertEqual(self.router.db_for_write(VbucksSpending, instance=spending), 'shard_b')
+        self.assertEqual(self.router.db_for_read(UserProfile, instance=self.user), 'shard_b')
+        # Users, auth and global tables never leave the default database
+        self.assertIsNone(self.router.db_for_read(User, instance=self.user))
+        self.assertIsNone(self.router.db_for_write(FxRate))
+
+        self.assertIsNone(self.router.db_for_read(WalletSummary))
+        with use_shard('shard_a'):
+            self.assertEqual(self.router.db_for_read(WalletSummary), 'shard_a')
+            self.assertEqual(self.router.db_for_read(WalletRollup, instance=self.user), 'shard_b')
+        # The default shard is left to the replica router
+        with use_shard(DEFAULT_DB_ALIAS):
+            self.assertIsNone(self.router.db_for_read(WalletSummary))
+        other = User(pk=8, username='other', shard='shard_a')
+        other._state.db = DEFAULT_DB_ALIAS
+        self.assertTrue(self.router.allow_relation(spending, other))
+
+    async def test_middleware_routes_async_requests_without_sync_adaptation(self):
+        async def view(request):
+            return HttpResponse(current_shard())
+
+        middleware = ShardMiddleware(view)
+        self.assertTrue(iscoroutinefunction(middleware))
+        request = RequestFactory().get('/')
+        request.user = self.user
+        self.assertEqual((await middleware(request)).content.decode(), 'shard_b')
+        self.assertEqual(current_shard(), DEFAULT_DB_ALIAS)
+
+    def test_new_users_are_placed(self):
+        user = User(username='placed')
+        with mock.patch('django.contrib.auth.base_user.AbstractBaseUser.save'):
+            user.save()
+        self.assertEqual(user.shard, place_user('placed'))
+
+
+@skipUnless(len(settings.SHARD_DATABASES) > 1, 'Set DATABASE_SHARD_URLS to run against real shard databases')
+class ShardedDataTests(TestCase):
+    """Runs the tracker against the configured shards"""
+    databases = {DEFAULT_DB_ALIAS, *settings.SHARD_DATABASES}
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.shard = settings.SHARD_DATABASES[1]
+
+    def create_user(self, username, shard):
+        with override_settings(SHARD_NEW_USERS=[shard]):
+            return User.objects.create_user(username=username, password='test123')
+
+    def create_history(self, user):
+        VbucksEarning.objects.create(user=user, type='STW', amount=1000, earning_name='Quests', date=date(2024, 1, 1))
+        spendings = [
+            VbucksSpending.objects.create(
+                user=user, item_name=f'Raider Skin {index}', vbucks_spent=100, date=date(2024, 1, index + 1)
+            )
+            for index in range(5)
+        ]
+        Refund.objects.create(user=user, original_purchase=spendings[2], notes='Changed my mind')
+        UserProfile.objects.create(user=user, epic_games_username='raider')
+        return spendings
+
+    def rows(self, user_id, alias):
+        return {
+            model.__name__: model.objects.using(alias).filter(user_id=user_id).count()
+            for model in sharding.SHARDED_TABLES
+        }
+
+    def test_users_data_lives_on_their_shard(self):
+        user = self.create_user('sharded', self.shard)
+        self.assertEqual(user.shard, self.shard)
+        stub = User.objects.using(self.shard).get(pk=user.pk)
+        self.assertEqual(stub.username, 'sharded')
+        self.assertFalse(stub.has_usable_password())
+
+        self.client.force_login(user)
+        response = self.client.post(reverse('vbucks_tracker:vbucks-spending-create'), {
+            'item_name': 'Shard Glider', 'category': 'OTHER', 'vbucks_spent': 500, 'date': '2024-05-02',
+        })
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(VbucksSpending.objects.using(self.shard).filter(user=user).count(), 1)
+        self.assertFalse(VbucksSpending.objects.using(DEFAULT_DB_ALIAS).filter(user=user).exists())
+        self.assertEqual(WalletSummary.objects.using(self.shard).get(user=user).spent, 500)
+
+        self.assertContains(self.client.get(reverse('vbucks_tracker:vbucks-spending-list')), 'Shard Glider')
+        self.assertEqual(self.client.get(reverse('vbucks_tracker:home')).context['vbucks_balance'], -500)
+        search = self.client.get(reverse('vbucks_tracker:search'), {'q': 'glider'})
+        self.assertEqual([result.title for result in search.context['results']], ['Shard Glider'])
+        export = self.client.get(reverse('vbucks_tracker:export'), {'format': 'jsonl', 'dataset': 'spendings'})
+        self.assertIn('Shard Glider', b''.join(export.streaming_content).decode())
+
+        other = self.create_user('unsharded', DEFAULT_DB_ALIAS)
+        VbucksEarning.objects.create(user=other, type='STW', amount=300, earning_name='Daily', date=date(2024, 1, 1))
+        api = APIClient()
+        api.force_authenticate(user)
+        balances = {row['username']: row['vbucks_balance'] for row in api.get(reverse('user-list')).data['results']}
+        self.assertEqual(balances, {'sharded': -500, 'unsharded': 300})
+        self.assertEqual(api.get(reverse('user-detail', args=[user.pk])).data['vbucks_balance'], -500)
+
+    def test_bulk_refunds_lock_the_jwt_users_shard(self):
+        user = self.create_user('jwt', self.shard)
+        spendings = self.create_history(user)
+        api = APIClient()
+        api.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(user).access_token}')
+        with mock.patch.object(views, 'immediate_atomic', wraps=immediate_atomic) as lock:
+            response = api.post(reverse('bulk-refund-api'), {'purchases': [spendings[0].pk, spendings[1].pk]}, format='json')
+        self.assertEqual(response.status_code, 201)
+        lock.assert_called_once_with(self.shard)
+        self.assertEqual(Refund.objects.using(self.shard).filter(user=user).count(), 3)
+        self.assertFalse(Refund.objects.using(DEFAULT_DB_ALIAS).filter(user=user).exists())
+
+    def test_admin_works_on_one_shard_at_a_time(self):
+        user = self.create_user('admin_sharded', self.shard)
+        self.create_history(user)
+        admin = self.create_user('root', DEFAULT_DB_ALIAS)
+        admin.is_staff = admin.is_superuser = True
+        admin.save()
+        self.client.force_login(admin)
+        url = reverse('admin:vbucks_tracker_vbucksspending_changelist')
+        self.assertEqual(len(self.client.get(url).context['cl'].result_list), 0)
+        listing = self.client.get(url, {'shard': self.shard, 'q': 'admin_sharded'})
+        self.assertEqual(len(listing.context['cl'].result_list), 5)
+        users = self.client.get(reverse('admin:accounts_user_changelist'))
+        balances = {user.username: user.wallet_balance for user in users.context['cl'].result_list}
+        self.assertEqual(balances['admin_sharded'], 1000 - 400)
+
+    def test_rebalance_moves_rows_in_chunks_and_back(self):
+        user = self.create_user('mover', DEFAULT_DB_ALIAS)
+        spendings = self.create_history(user)
+        before = VbucksService.compute_user_totals(user)
+        counts = self.rows(user.pk, DEFAULT_DB_ALIAS)
+        version = WalletSummary.objects.get(user=user).version
+
+        out = StringIO()
+        call_command('rebalance_shards', '--user', 'mover', '--to', self.shard, '--chunk-size', '2', stdout=out)
+        self.assertIn('Moved 1 users (', out.getvalue())
+        user.refresh_from_db()
+        self.assertEqual(user.shard, self.shard)
+        self.assertEqual(self.rows(user.pk, self.shard), counts)
+        self.assertEqual(set(self.rows(user.pk, DEFAULT_DB_ALIAS).values()), {0})
+        self.assertEqual(VbucksService.compute_user_totals(user), before)
+        self.assertGreater(WalletSummary.objects.using(self.shard).get(user=user).version, version)
+        refund = Refund.objects.using(self.shard).get(user=user)
+        self.assertEqual(refund.original_purchase.item_name, spendings[2].item_name)
+        self.assertTrue(refund.original_purchase.refunded)
+        self.assertEqual(LedgerEntry.objects.using(self.shard).get(user=user, source='REFUND').source_id, refund.pk)
+        found = search_backend(self.shard).results(user, 'raider', kinds=('spending',))
+        self.assertEqual(len(found), 5)
+
+        call_command('rebalance_shards', '--user', 'mover', '--to', DEFAULT_DB_ALIAS, stdout=StringIO())
+        user.refresh_from_db()
+        self.assertEqual(user.shard, DEFAULT_DB_ALIAS)
+        self.assertEqual(self.rows(user.pk, DEFAULT_DB_ALIAS), counts)
+        self.assertFalse(User.objects.using(self.shard).filter(pk=user.pk).exists())
+
+    def test_placement_rebalance_and_dry_run(self):
+        user = self.create_user('placed_later', DEFAULT_DB_ALIAS)
+        self.create_history(user)
+        with override_settings(SHARD_NEW_USERS=[self.shard]):
+            out = StringIO()
+            call_command('rebalance_shards', '--dry-run', stdout=out)
+            self.assertIn(f'placed_later: default -> {self.shard}', out.getvalue())
+            self.assertEqual(User.objects.get(pk=user.pk).shard, DEFAULT_DB_ALIAS)
+            call_command('rebalance_shards', stdout=StringIO())
+        self.assertEqual(User.objects.get(pk=user.pk).shard, self.shard)
+        with self.assertRaises(CommandError):
+            call_command('rebalance_shards', '--to', 'nowhere')
+
+    def test_writes_during_the_copy_abort_the_move(self):
+        user = self.create_user('busy', DEFAULT_DB_ALIAS)
+        self.create_history(user)
+        counts = self.rows(user.pk, DEFAULT_DB_ALIAS)
+        copy = sharding.copy_user_rows
+
+        def copy_then_write(*args, **kwargs):
+            copied = copy(*args, **kwargs)
+            VbucksSpending.objects.create(user=user, item_name='Late', vbucks_spent=100, date=date(2024, 2, 1))
+            return copied
+
+        with mock.patch.object(sharding, 'copy_user_rows', copy_then_write):
+            with self.assertRaises(ShardMoveConflict):
+                move_user(user, self.shard)
+        self.assertEqual(User.objects.get(pk=user.pk).shard, DEFAULT_DB_ALIAS)
+        self.assertEqual(self.rows(user.pk, DEFAULT_DB_ALIAS)['VbucksSpending'], counts['VbucksSpending'] + 1)
+        self.assertEqual(set(self.rows(user.pk, self.shard).values()), {0})
+        self.assertFalse(User.objects.using(self.shard).filter(pk=user.pk).exists())
+
+    def test_deleting_a_user_deletes_their_shard_data(self):
+        user = self.create_user('leaving', self.shard)
+        self.create_history(user)
+        self.assertEqual(self.rows(user.pk, self.shard)['VbucksSpending'], 5)
+        user_id = user.pk
+        user.delete()
+        self.assertEqual(set(self.rows(user_id, self.shard).values()), {0})
+        self.assertFalse(User.objects.using(self.shard).filter(pk=user_id).exists())
@@ -0,0 +1,89 @@
+import os
+import tempfile
+from io import StringIO
+from unittest import mock
+from django.core.management import call_command
+from django.db import connection, connections
+from django.db.backends.sqlite3.base import DatabaseWrapper
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from accounts.models import User
+from vbucks_tracker import sqlite
+from vbucks_tracker.sqlite import immediate_atomic
+from vbucks_tracker.sqlite_benchmark import run_concurrency
+
+
+class ConnectionTuningTests(SimpleTestCase):
+    def test_new_file_connections_get_the_pragmas(self):
+        with tempfile.TemporaryDirectory() as directory:
+            wrapper = DatabaseWrapper(
+                {**connections['default'].settings_dict, 'NAME': os.path.join(directory, 'tuned.sqlite3')},
+                alias='tuning',
+            )
+            try:
+                with wrapper.cursor() as cursor:
+                    pragmas = {
+                        name: cursor.execute(f'PRAGMA {name}').fetchone()[0]
+                        for name in ('journal_mode', 'synchronous', 'busy_timeout', 'cache_size', 'temp_store')
+                    }
+            finally:
+                wrapper.close()
+        self.assertEqual(pragmas, {
+            'journal_mode': 'wal', 'synchronous': 1, 'busy_timeout': 5000, 'cache_size': -65536, 'temp_store': 2,
+        })
+
+    def test_optimize_runs_once_per_interval(self):
+        fake = mock.MagicMock(alias='optimized')
+        with mock.patch.dict(sqlite._last_optimize, clear=True):
+            sqlite.optimize_database(fake)
+            sqlite.optimize_database(fake)
+            with override_settings(SQLITE_OPTIMIZE_INTERVAL=0):
+                sqlite.optimize_database(mock.MagicMock(alias='disabled'))
+        fake.cursor.return_value.__enter__.return_value.execute.assert_called_once_with('PRAGMA optimize')
+
+
+class ImmediateTransactionTests(TransactionTestCase):
+    def test_outermost_block_begins_immediate(self):
+        with CaptureQueriesContext(connection) as queries:
+            with immediate_atomic():
+                User.objects.create_user(username='immediate', password='test123')
+                with immediate_atomic():
+                    pass
+        statements = [query['sql'] for query in queries.captured_queries]
+        self.assertEqual(statements[0], 'BEGIN IMMEDIATE')
+        self.assertEqual(statements.count('BEGIN IMMEDIATE'), 1)
+        # Later transactions are deferred again
+        with CaptureQueriesContext(connection) as queries:
+            with immediate_atomic(), override_settings(SQLITE_IMMEDIATE_WRITES=False):
+                pass
+            with override_settings(SQLITE_IMMEDIATE_WRITES=False), immediate_atomic():
+                pass
+        self.assertEqual(
+            [query['sql'] for query in queries.captured_queries], ['BEGIN IMMEDIATE', 'COMMIT', 'BEGIN', 'COMMIT']
+        )
+
+    def test_writing_views_begin_immediate(self):
+        user = User.objects.create_user(username='writer', password='test123')
+        self.client.force_login(user)
+        with CaptureQueriesContext(connection) as queries:
+            self.client.post(reverse('vbucks_tracker:vbucks-spending-create'), {
+                'item_name': 'Axe', 'category': 'OTHER', 'vbucks_spent': 500, 'date': '2024-05-02',
+            })
+        self.assertIn('BEGIN IMMEDIATE', [query['sql'] for query in queries.captured_queries])
+
+
+class ConcurrencyBenchmarkTests(TestCase):
+    def test_tuned_writers_wait_instead_of_failing(self):
+        result = run_concurrency(
+            {'pragmas': {'journal_mode': 'WAL', 'busy_timeout': 5000}, 'begin': 'BEGIN IMMEDIATE'}, 2, seconds=0.5
+        )
+        self.assertEqual(result['write_errors'], 0)
+        self.assertGreater(result['writes_per_s'], 0)
+        self.assertGreater(result['reads_per_s'], 0)
+
+    def test_command_reports_both_configurations(self):
+        out = StringIO()
+        call_command('benchmark_sqlite', '--workers', '1', '--seconds', '0.2', stdout=out)
+        lines = out.getvalue().splitlines()
+        self.assertEqual([line.split()[1] for line in lines[1:]], ['stock', 'tuned'])
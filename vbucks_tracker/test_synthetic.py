@@ -0,0 +1,67 @@
+from datetime import date
+from io import StringIO
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase
+from accounts.models import User, UserProfile
+from vbucks_tracker.models import VbucksSpending, Refund, WalletRollup, WalletSummary
+from vbucks_tracker.rollups import rebuild_user_rollups
+from vbucks_tracker.services import VbucksService
+from vbucks_tracker.synthetic import SyntheticWalletGenerator
+
+END_DATE = date(2025, 6, 30)
+
+
+class SyntheticWalletGeneratorTests(TestCase):
+    def generate(self, prefix, seed=1, users=12):
+        generator = SyntheticWalletGenerator(seed=seed, rows_per_user=20, refund_rate=0.2,
+                                             end_date=END_DATE, prefix=prefix)
+        generator.run(users, chunk_size=5)
+        return User.objects.filter(username__startswith=prefix).order_by('username')
+
+    def test_generates_consistent_wallets(self):
+        users = self.generate('gen_')
+        self.assertEqual(users.count(), 12)
+        self.assertEqual(UserProfile.objects.filter(user__in=users).count(), 12)
+
+        refunded = VbucksSpending.objects.filter(user__in=users, refunded=True)
+        self.assertTrue(refunded.exists())
+        self.assertEqual(set(refunded.values_list('pk', flat=True)),
+                         set(Refund.objects.values_list('original_purchase_id', flat=True)))
+        for refund in Refund.objects.select_related('original_purchase'):
+            self.assertEqual(refund.vbucks_returned, refund.original_purchase.vbucks_spent)
+            self.assertEqual(refund.user_id, refund.original_purchase.user_id)
+
+        for user in users:
+            summary = WalletSummary.objects.get(user=user)
+            totals = VbucksService.compute_user_totals(user)
+            self.assertEqual({field: getattr(summary, field) for field in totals}, totals)
+
+            buckets = set(WalletRollup.objects.filter(user=user).values_list(
+                'source', 'period', 'period_start', 'category', 'vbucks', 'amount_base', 'entries'
+            ))
+            rebuild_user_rollups(user)
+            self.assertEqual(buckets, set(WalletRollup.objects.filter(user=user).values_list(
+                'source', 'period', 'period_start', 'category', 'vbucks', 'amount_base', 'entries'
+            )))
+
+    def test_same_seed_generates_same_data(self):
+        def history(prefix, seed):
+            users = self.generate(prefix, seed=seed, users=4)
+            return [
+                list(VbucksSpending.objects.filter(user=user).order_by('pk').values_list(
+                    'date', 'category', 'item_name', 'vbucks_spent', 'refunded'
+                ))
+                for user in users
+            ]
+
+        first = history('first_', seed=5)
+        self.assertEqual(first, history('second_', seed=5))
+        self.assertNotEqual(first, history('third_', seed=6))
+
+    def test_command_rejects_used_prefix(self):
+        out = StringIO()
+        call_command('generate_wallet_data', '3', '--prefix', 'cmd_', '--end-date', '2025-06-30', stdout=out)
+        self.assertIn('Created 3 users', out.getvalue())
+        with self.assertRaises(CommandError):
+            call_command('generate_wallet_data', '3', '--prefix', 'cmd_', stdout=StringIO())
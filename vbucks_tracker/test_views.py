@@ -0,0 +1,251 @@
+import csv
+import gzip
+import io
+import json
+import tempfile
+from datetime import date, timedelta
+from decimal import Decimal
+from django.core.management import call_command
+from django.db import connection
+from django.contrib import messages
+from django.contrib.messages.storage.cookie import CookieStorage
+from django.test import RequestFactory, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve, reverse
+from django.utils import timezone
+from accounts.models import User
+from vbucks_tracker.conditional import allows_conditional
+from vbucks_tracker.models import RealMoneyTransaction, VbucksEarning, VbucksSpending, Refund
+from vbucks_tracker.views import BaseListView
+
+
+class KeysetPaginationTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='pager', password='test123')
+        self.client.force_login(self.user)
+        start = date(2024, 1, 1)
+        # Several rows share a date so the id tie-breaker is exercised
+        self.spendings = [
+            VbucksSpending.objects.create(
+                user=self.user,
+                item_name=f'Item {index}',
+                category='GIFT' if index % 3 == 0 else 'SKIN',
+                vbucks_spent=100,
+                date=start + timedelta(days=index // 4),
+            )
+            for index in range(23)
+        ]
+        self.url = reverse('vbucks_tracker:vbucks-spending-list')
+        self.page_size = BaseListView.paginate_by
+        BaseListView.paginate_by = 5
+
+    def tearDown(self):
+        BaseListView.paginate_by = self.page_size
+
+    def walk_pages(self, params=None):
+        pages, response = [], self.client.get(self.url, params or {})
+        while True:
+            pages.append([spending.pk for spending in response.context['spendings']])
+            if not response.context['next_page_query']:
+                return pages, response
+            response = self.client.get(f"{self.url}?{response.context['next_page_query']}")
+
+    def test_pages_cover_every_row_once_in_order(self):
+        pages, _ = self.walk_pages()
+        seen = [pk for page in pages for pk in page]
+        expected = [
+            spending.pk for spending in sorted(
+                self.spendings, key=lambda spending: (spending.date, spending.pk), reverse=True
+            )
+        ]
+        self.assertEqual(seen, expected)
+        self.assertEqual([len(page) for page in pages], [5, 5, 5, 5, 3])
+
+    def test_previous_cursor_returns_previous_page(self):
+        first = self.client.get(self.url)
+        second = self.client.get(f"{self.url}?{first.context['next_page_query']}")
+        back = self.client.get(f"{self.url}?{second.context['previous_page_query']}")
+        self.assertEqual(list(back.context['spendings']), list(first.context['spendings']))
+        self.assertIsNone(first.context['previous_page_query'])
+
+    def test_cursor_keeps_category_filter(self):
+        pages, response = self.walk_pages({'category': 'GIFT'})
+        self.assertEqual(sum(len(page) for page in pages), 8)
+        self.assertEqual(response.context['show_gifted_total'], True)
+
+    def test_no_count_query(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(self.url)
+        self.assertFalse(any('COUNT(' in query['sql'] for query in queries.captured_queries))
+
+    def test_invalid_cursor_is_404(self):
+        response = self.client.get(self.url, {'after': 'not-a-cursor'})
+        self.assertEqual(response.status_code, 404)
+
+    def test_refunds_paginate_by_refund_date(self):
+        for spending in self.spendings[:7]:
+            Refund.objects.create(user=self.user, original_purchase=spending)
+        url = reverse('vbucks_tracker:refund-list')
+        first = self.client.get(url)
+        second = self.client.get(f"{url}?{first.context['next_page_query']}")
+        refunds = list(first.context['refunds']) + list(second.context['refunds'])
+        self.assertEqual(len({refund.pk for refund in refunds}), 7)
+
+
+class ExportViewTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='exporter', password='test123')
+        other = User.objects.create_user(username='someone_else', password='test123')
+        self.client.force_login(self.user)
+        for owner in (self.user, other):
+            RealMoneyTransaction.objects.create(
+                user=owner, source_name='Crew', category='CREW', amount=Decimal('11.99'),
+                vbucks_earned=1000, currency='EUR', date=date(2024, 3, 1)
+            )
+        self.spending = VbucksSpending.objects.create(
+            user=self.user, item_name='Skull, Trooper', vbucks_spent=1200, date=date(2024, 3, 2)
+        )
+        Refund.objects.create(user=self.user, original_purchase=self.spending, reason='ACCIDENTAL')
+        self.url = reverse('vbucks_tracker:export')
+
+    def read(self, response):
+        return b''.join(response.streaming_content)
+
+    def test_csv_export_of_one_dataset(self):
+        response = self.client.get(self.url, {'format': 'csv', 'dataset': 'spendings'})
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        self.assertIn('vbucks-spendings', response['Content-Disposition'])
+        rows = list(csv.reader(io.StringIO(self.read(response).decode())))
+        self.assertEqual(rows[0], ['id', 'date', 'category', 'item_name', 'vbucks_spent', 'refunded'])
+        self.assertEqual(rows[1][3], 'Skull, Trooper')
+        self.assertEqual(len(rows), 2)
+
+    def test_jsonl_export_of_everything_is_user_scoped(self):
+        response = self.client.get(self.url)
+        records = [json.loads(line) for line in self.read(response).decode().splitlines()]
+        self.assertEqual(
+            [record['dataset'] for record in records], ['transactions', 'spendings', 'refunds']
+        )
+        self.assertEqual(records[0]['amount'], '11.99')
+        self.assertEqual(records[2]['original_purchase_id'], self.spending.pk)
+
+    def test_gzip_export(self):
+        response = self.client.get(self.url, {'dataset': 'transactions', 'gzip': 'on'})
+        self.assertEqual(response['Content-Type'], 'application/gzip')
+        self.assertTrue(response['Content-Disposition'].endswith('.jsonl.gz"'))
+        lines = gzip.decompress(self.read(response)).decode().splitlines()
+        self.assertEqual(len(lines), 1)
+
+    async def test_export_streams_asynchronously_under_asgi(self):
+        await self.async_client.aforce_login(self.user)
+        response = await self.async_client.get(self.url, {'dataset': 'spendings'})
+        # A sync iterator would be read into a list before anything is sent
+        self.assertTrue(response.is_async)
+        body = b''.join([chunk async for chunk in response.streaming_content])
+        self.assertEqual(json.loads(body)['item_name'], 'Skull, Trooper')
+
+    def test_csv_of_everything_is_rejected(self):
+        response = self.client.get(self.url, {'format': 'csv'})
+        self.assertEqual(response.status_code, 400)
+
+
+class ExportCommandTests(TestCase):
+    def test_command_writes_file(self):
+        user = User.objects.create_user(username='cli_exporter', password='test123')
+        VbucksEarning.objects.create(user=user, type='BP', amount=300, date=date(2024, 1, 1))
+        with tempfile.TemporaryDirectory() as directory:
+            path = f'{directory}/earnings.csv.gz'
+            call_command(
+                'export_wallet_history', 'cli_exporter', '--format', 'csv',
+                '--dataset', 'earnings', '--gzip', '--output', path, stderr=io.StringIO()
+            )
+            with gzip.open(path, 'rt') as exported:
+                rows = list(csv.reader(exported))
+        self.assertEqual(rows[1][1:], ['2024-01-01', 'BP', '', '300'])
+
+
+class AsyncViewTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='async_viewer', password='test123')
+        VbucksSpending.objects.create(
+            user=self.user, item_name='Gift', category='GIFT', vbucks_spent=500, date=date(2024, 2, 1)
+        )
+        VbucksSpending.objects.create(
+            user=self.user, item_name='Skin', category='SKIN', vbucks_spent=1200, date=date(2024, 2, 2)
+        )
+
+    async def test_dashboard_served_async(self):
+        await self.async_client.aforce_login(self.user)
+        response = await self.async_client.get(reverse('vbucks_tracker:home'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['total_spent'], 1700)
+        self.assertEqual(response.context['user'], self.user)
+
+    async def test_gifted_list_filters_and_totals(self):
+        await self.async_client.aforce_login(self.user)
+        response = await self.async_client.get(reverse('vbucks_tracker:vbucks-spending-gifted'))
+        self.assertEqual([spending.item_name for spending in response.context['spendings']], ['Gift'])
+        self.assertEqual(response.context['total_gifted_spent'], 500)
+
+    async def test_list_redirects_anonymous_users(self):
+        response = await self.async_client.get(reverse('vbucks_tracker:refund-list'))
+        self.assertEqual(response.status_code, 302)
+        self.assertIn(reverse('login'), response['Location'])
+
+    def test_list_views_are_async(self):
+        for name in ('home', 'transaction-list', 'vbucks-spending-gifted', 'refund-list'):
+            view = resolve(reverse(f'vbucks_tracker:{name}')).func
+            self.assertTrue(view.view_class.view_is_async, name)
+
+
+class ConditionalGetTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='revalidator', password='test123')
+        self.client.force_login(self.user)
+        VbucksEarning.objects.create(user=self.user, type='BP', amount=800, date=date(2024, 3, 1))
+
+    def test_unchanged_pages_are_not_modified(self):
+        for name in ('home', 'vbucksearning-list', 'vbucks-spending-gifted'):
+            url = reverse(f'vbucks_tracker:{name}')
+            first = self.client.get(url)
+            self.assertEqual(first.status_code, 200)
+            self.assertIn('no-cache', first['Cache-Control'])
+            self.assertIn('private', first['Cache-Control'])
+            # Validated from the summary version alone
+            with self.assertNumQueries(3):
+                second = self.client.get(url, headers={'If-None-Match': first['ETag']})
+            self.assertEqual(second.status_code, 304, name)
+            self.assertEqual(second['ETag'], first['ETag'])
+            last_modified = self.client.get(url, headers={'If-Modified-Since': first['Last-Modified']})
+            self.assertEqual(last_modified.status_code, 304, name)
+
+    def test_writes_change_the_etag(self):
+        url = reverse('vbucks_tracker:home')
+        etag = self.client.get(url)['ETag']
+        VbucksSpending.objects.create(user=self.user, item_name='Wrap', vbucks_spent=300, date=date(2024, 3, 2))
+        response = self.client.get(url, headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['total_spent'], 300)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_query_string_and_other_users_change_the_etag(self):
+        url = reverse('vbucks_tracker:home')
+        etag = self.client.get(url)['ETag']
+        self.assertNotEqual(self.client.get(url, {'currency': 'EUR'})['ETag'], etag)
+        other = User.objects.create_user(username='other_revalidator', password='test123')
+        self.client.force_login(other)
+        self.assertEqual(self.client.get(url, headers={'If-None-Match': etag}).status_code, 200)
+
+    def test_profile_changes_change_the_etag(self):
+        url = reverse('vbucks_tracker:vbucksearning-list')
+        etag = self.client.get(url)['ETag']
+        User.objects.filter(pk=self.user.pk).update(username='renamed', updated_at=timezone.now())
+        self.assertEqual(self.client.get(url, headers={'If-None-Match': etag}).status_code, 200)
+
+    def test_pending_messages_are_never_answered_with_304(self):
+        request = RequestFactory().get('/')
+        self.assertTrue(allows_conditional(request))
+        request._messages = CookieStorage(request)
+        messages.success(request, 'Saved')
+        self.assertFalse(allows_conditional(request))
+        self.assertFalse(allows_conditional(RequestFactory().post('/')))
@@ -0,0 +1,33 @@
+from django.urls import URLPattern, URLResolver
+from .instrumentation import QueryRecorder
+
+
+def iter_url_names(patterns, namespace=None):
+    """Yield the namespaced name of every named route in ``patterns``, following includes"""
+    for pattern in patterns:
+        if isinstance(pattern, URLResolver):
+            nested = ':'.join(filter(None, [namespace, pattern.namespace])) or None
+            yield from iter_url_names(pattern.url_patterns, nested)
+        elif isinstance(pattern, URLPattern) and pattern.name:
+            yield f'{namespace}:{pattern.name}' if namespace else pattern.name
+
+
+class QueryBudgetMixin:
+    """TestCase mixin asserting an upper bound on the queries a request runs"""
+
+    def record_queries(self, url, method='get', **extra):
+        """Make a request, reading streamed responses to the end; returns ``(response, recorder)``"""
+        with QueryRecorder(repeat_threshold=2) as recorder:
+            response = getattr(self.client, method)(url, **extra)
+            if response.streaming:
+                b''.join(response.streaming_content)
+        return response, recorder
+
+    def assertQueryBudget(self, url, budget, method='get', **extra):
+        response, recorder = self.record_queries(url, method, **extra)
+        self.assertLessEqual(
+            recorder.count, budget,
+            f'{method.upper()} {url} ran {recorder.count} queries, budget is {budget}. '
+            f'Repeated statements:\n{recorder.describe_repeats()}'
+        )
+        return response
@@ -25,7 +25,7 @@ urlpatterns = [
     # V-Bucks Spendings
     path('vbucks-spendings/', include([
         path('', views.VbucksSpendingListView.as_view(), name='vbucks-spending-list'),
-        path('gifted/', views.gifted_spending_view, name='vbucks-spending-gifted'),
+        path('gifted/', views.GiftedSpendingListView.as_view(), name='vbucks-spending-gifted'),
         path('add/', views.VbucksSpendingCreateView.as_view(), name='vbucks-spending-create'),
         path('<int:pk>/edit/', views.VbucksSpendingUpdateView.as_view(), name='vbucks-spending-update'),
         path('<int:pk>/delete/', views.VbucksSpendingDeleteView.as_view(), name='vbucks-spending-delete'),
@@ -37,4 +37,18 @@ urlpatterns = [
         path('add/', views.RefundCreateView.as_view(), name='refund-create'),
         path('<int:pk>/delete/', views.RefundDeleteView.as_view(), name='refund-delete'),
     ])),
+
+    # Data export / import
+    path('export/', views.export_view, name='export'),
+    path('export/background/', views.export_job_view, name='export-job'),
+    path('jobs/<int:pk>/', views.job_detail_view, name='job-detail'),
+    path('jobs/<int:pk>/download/', views.job_download_view, name='job-download'),
+    path('import/', views.import_view, name='import'),
+
+    # Analytics
+    path('analytics/', views.analytics_view, name='analytics'),
+    path('analytics/balance-history/', views.balance_history_view, name='balance-history'),
+
+    # Search
+    path('search/', views.search_view, name='search'),
 ]
\ No newline at end of file
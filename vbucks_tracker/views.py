@@ -1,42 +1,161 @@
+import asyncio
+from itertools import islice
 from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
 from django.contrib.auth.decorators import login_required
+from django.core.exceptions import ValidationError
+from django.core.files.storage import default_storage
+from django.core.paginator import InvalidPage
+from django.db import router
 from django.db.models import Sum
-from django.shortcuts import render
+from django.http import FileResponse, Http404, HttpResponseBadRequest, StreamingHttpResponse
+from django.shortcuts import get_object_or_404, redirect, render
 from django.urls import reverse_lazy
-from django.contrib.auth.mixins import LoginRequiredMixin
+from django.utils import timezone
+from django.contrib.auth.mixins import AccessMixin, LoginRequiredMixin
+from django.views.decorators.http import require_POST
 from django.views.generic import ListView, CreateView, UpdateView, DeleteView, TemplateView
-
-from .models import RealMoneyTransaction, VbucksEarning, VbucksSpending, Refund
-from .forms import RealMoneyTransactionForm, VbucksEarningForm, VbucksSpendingForm, RefundForm
+from rest_framework import exceptions, status
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+from rest_framework.views import APIView
+
+from .cache import summary_cache
+from .conditional import allows_conditional, conditional_response, set_validators, wallet_etag
+from .jobs import enqueue
+from .models import Job, RealMoneyTransaction, VbucksEarning, VbucksSpending, Refund
+from .exports import EXPORT_FORMATS, export_filename, iter_export
+from .fx import from_base, get_rate
+from .forms import (
+    BalanceHistoryForm, BalanceOnForm, RealMoneyTransactionForm, VbucksEarningForm, VbucksSpendingForm,
+    RefundForm, WalletAnalyticsForm, WalletExportForm, WalletImportForm, WalletSearchForm
+)
+from .imports import WalletImporter, detect_format, iter_records, open_text
+from .ledger import balance_on, iter_balance_series_json
+from .pagination import KeysetPaginator
+from .rollups import rollup_report
+from .routers import ReplicaReadsMixin, replica_reads, shard_for
+from .search import search_backend
+from .sqlite import ImmediateWritesMixin, immediate_atomic
+from .serializers import BulkRefundSerializer, RefundSerializer, SearchResultSerializer
 from .services import VbucksService
 
 # Constants for reusable templates
 BASE_FORM_TEMPLATE = 'base_form.html'
 BASE_DELETE_TEMPLATE = 'base_delete.html'
-
-
-class HomePageView(TemplateView):
+# Chunks of a streamed body read per trip to the sync thread under ASGI
+STREAM_BATCH_SIZE = 256
+
+
+async def resolve_user(request):
+    """Load the session user without blocking and pin it as ``request.user``"""
+    request.user = await request.auser()
+    return request.user
+
+
+class AsyncLoginRequiredMixin(AccessMixin):
+    """LoginRequiredMixin for views whose handlers are async"""
+
+    async def dispatch(self, request, *args, **kwargs):
+        user = await resolve_user(request)
+        if not user.is_authenticated:
+            return self.handle_no_permission()
+        return await super().dispatch(request, *args, **kwargs)
+
+
+class ConditionalWalletMixin:
+    """
+    Answer conditional GETs of the user's own pages with 304 Not Modified.
+
+    The validators come from the user's WalletSummary version and
+    updated_at (one indexed lookup) and the summary cache generation, so an
+    unchanged page is confirmed without running its aggregates or rendering
+    its template.
+    """
+
+    async def get_etag_parts(self):
+        """Inputs besides the user's data that change the page"""
+        return ()
+
+    async def not_modified(self, user):
+        """Return ``(response, validators)``; the response is a 304 when the client is current"""
+        # The session is already loaded by resolve_user, so checking for
+        # pending messages doesn't query
+        if not allows_conditional(self.request):
+            return None, None
+        (version, updated_at), generation, parts = await asyncio.gather(
+            VbucksService.aget_data_version(user),
+            summary_cache.ageneration(),
+            self.get_etag_parts(),
+        )
+        # The user's own updated_at covers the username and email in the page header
+        validators = (
+            wallet_etag(self.request, user.pk, user.updated_at, generation, version, *parts, forms=True),
+            max(filter(None, (updated_at, user.updated_at))),
+        )
+        return conditional_response(self.request, *validators), validators
+
+    def with_validators(self, response, validators):
+        return set_validators(response, *validators) if validators else response
+
+
+class HomePageView(ReplicaReadsMixin, ConditionalWalletMixin, TemplateView):
     template_name = "dashboard.html"
 
-    def get_context_data(self, **kwargs):
-        context = super().get_context_data(**kwargs)
-
-        if self.request.user.is_authenticated:
-            summary = VbucksService.get_user_summary(self.request.user)
-            context.update({
-                'total_spent': summary['total_spent'],
-                'total_earned': summary['total_earned'],
-                'total_real_money': RealMoneyTransaction.objects.filter(
-                    user=self.request.user
-                ).aggregate(Sum('amount'))['amount__sum'] or 0,
-                'total_refunds': summary['total_refunded'],
-                'vbucks_balance': summary['balance']
-            })
-        return context
+    async def get(self, request, *args, **kwargs):
+        user = await resolve_user(request)
+        if not user.is_authenticated:
+            return self.render_to_response(self.get_context_data(**kwargs))
+        response, validators = await self.not_modified(user)
+        if response is not None:
+            return response
+        context = self.get_context_data(**kwargs)
+        context.update(await self.get_wallet_context(user))
+        return self.with_validators(self.render_to_response(context), validators)
+
+    async def get_etag_parts(self):
+        # A ?currency= total is converted at today's rate
+        currency = self.request.GET.get('currency')
+        return (currency, await self.get_display_rate(currency)) if currency else ()
+
+    async def get_wallet_context(self, user):
+        # The summary and the display currency's FX rate don't depend on each other
+        currency = self.request.GET.get('currency')
+        summary, rate = await asyncio.gather(
+            VbucksService.aget_user_summary(user),
+            self.get_display_rate(currency),
+        )
+        total_real_money, currency = self.get_real_money_total(summary, currency, rate)
+        return {
+            'total_spent': summary['total_spent'],
+            'total_earned': summary['total_earned'],
+            'total_real_money': total_real_money,
+            'user_currency': currency,
+            'currencies': [code for code, _ in RealMoneyTransaction.CURRENCIES],
+            'real_money_unconverted': summary['real_money_unconverted'],
+            'real_money_by_currency': {
+                code: total for code, total in summary['real_money_by_currency'].items() if total
+            },
+            'total_refunds': summary['total_refunded'],
+            'vbucks_balance': summary['balance']
+        }
+
+    async def get_display_rate(self, currency):
+        if not currency:
+            return None
+        return await sync_to_async(get_rate)(currency, timezone.now().date())
+
+    def get_real_money_total(self, summary, currency, rate):
+        """Convert the base-currency total into the ?currency= the user asked for"""
+        if currency and currency != summary['real_money_currency'] and rate is not None:
+            converted = from_base(summary['total_real_money'], currency, None, rate=rate)
+            return converted, currency
+        return summary['total_real_money'], summary['real_money_currency']
 
 
 # Base View Classes
-class BaseCreateView(LoginRequiredMixin, CreateView):
+class BaseCreateView(ImmediateWritesMixin, LoginRequiredMixin, CreateView):
     template_name = BASE_FORM_TEMPLATE
 
     def form_valid(self, form):
@@ -54,7 +173,7 @@ class BaseCreateView(LoginRequiredMixin, CreateView):
         return context
 
 
-class BaseUpdateView(LoginRequiredMixin, UpdateView):
+class BaseUpdateView(ImmediateWritesMixin, LoginRequiredMixin, UpdateView):
     template_name = BASE_FORM_TEMPLATE
 
     def get_queryset(self):
@@ -71,7 +190,7 @@ class BaseUpdateView(LoginRequiredMixin, UpdateView):
         return context
 
 
-class BaseDeleteView(LoginRequiredMixin, DeleteView):
+class BaseDeleteView(ImmediateWritesMixin, LoginRequiredMixin, DeleteView):
     template_name = BASE_DELETE_TEMPLATE
 
     def get_queryset(self):
@@ -89,7 +208,62 @@ class BaseDeleteView(LoginRequiredMixin, DeleteView):
         return context
 
 
-class BaseListView(LoginRequiredMixin, ListView):
+class BaseListView(ReplicaReadsMixin, AsyncLoginRequiredMixin, ConditionalWalletMixin, ListView):
+    paginate_by = 50
+    keyset_fields = ('date', 'id')
+
+    async def get(self, request, *args, **kwargs):
+        response, validators = await self.not_modified(request.user)
+        if response is not None:
+            return response
+        self.object_list = self.get_queryset()
+        self.page, extra_context = await asyncio.gather(
+            self.apaginate(self.object_list),
+            self.get_extra_context(),
+        )
+        context = self.get_context_data()
+        context.update(extra_context)
+        return self.with_validators(self.render_to_response(context), validators)
+
+    async def apaginate(self, queryset):
+        """Paginate with ?after=/?before= cursors instead of page numbers"""
+        self.paginator = KeysetPaginator(
+            queryset, self.get_paginate_by(queryset), keys=self.keyset_fields
+        )
+        try:
+            return await self.paginator.apage(
+                after=self.request.GET.get('after'),
+                before=self.request.GET.get('before'),
+            )
+        except InvalidPage as exc:
+            raise Http404(str(exc)) from exc
+
+    async def get_extra_context(self):
+        """Context that needs its own queries, fetched alongside the page"""
+        return {}
+
+    def paginate_queryset(self, queryset, page_size):
+        return self.paginator, self.page, self.page.object_list, self.page.has_other_pages()
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        page = context.get('page_obj')
+        if page is not None:
+            context.update({
+                'next_page_query': self._cursor_query('after', page.next_cursor),
+                'previous_page_query': self._cursor_query('before', page.previous_cursor),
+            })
+        return context
+
+    def _cursor_query(self, param, cursor):
+        if cursor is None:
+            return None
+        query = self.request.GET.copy()
+        query.pop('after', None)
+        query.pop('before', None)
+        query[param] = cursor
+        return query.urlencode()
+
     def get_queryset(self):
         queryset = self.model.objects.filter(user=self.request.user)
 
@@ -153,26 +327,30 @@ class VbucksSpendingListView(BaseListView):
     template_name = 'vbucks_spending_list.html'
     context_object_name = 'spendings'
 
+    def get_category(self):
+        return self.request.GET.get('category')
+
     def get_queryset(self):
         queryset = super().get_queryset()
-        category = self.request.GET.get('category')
+        category = self.get_category()
         if category:
             return queryset.filter(category=category)
         return queryset
 
-    def get_context_data(self, **kwargs):
-        context = super().get_context_data(**kwargs)
-        category = self.request.GET.get('category')
+    async def get_extra_context(self):
+        if self.get_category() != 'GIFT':
+            return {}
+        totals = await self.object_list.aaggregate(total=Sum('vbucks_spent'))
+        return {
+            'selected_category': 'GIFT',
+            'total_gifted_spent': totals['total'] or 0,
+            'show_gifted_total': True,
+        }
 
-        if category == 'GIFT':
-            total_gifted_spent = self.get_queryset().filter(category='GIFT') \
-                                     .aggregate(total=Sum('vbucks_spent'))['total'] or 0
-            context.update({
-                'selected_category': 'GIFT',
-                'total_gifted_spent': total_gifted_spent,
-                'show_gifted_total': True,
-            })
-        return context
+
+class GiftedSpendingListView(VbucksSpendingListView):
+    def get_category(self):
+        return 'GIFT'
 
 
 class VbucksSpendingCreateView(BaseCreateView):
@@ -198,6 +376,10 @@ class RefundListView(BaseListView):
     template_name = 'refund_list.html'
     context_object_name = 'refunds'
     ordering = ['-refund_date']
+    keyset_fields = ('refund_date', 'id')
+
+    def get_queryset(self):
+        return super().get_queryset().select_related('original_purchase')
 
 
 class RefundCreateView(BaseCreateView):
@@ -212,10 +394,13 @@ class RefundCreateView(BaseCreateView):
         return kwargs
 
     def form_valid(self, form):
-        """Auto-set user and calculate vbucks_returned"""
+        """Save through the guarded refund path; a concurrent refund becomes a form error"""
         form.instance.user = self.request.user
-        form.instance.vbucks_returned = form.cleaned_data['original_purchase'].vbucks_spent
-        return super().form_valid(form)
+        try:
+            return super().form_valid(form)
+        except ValidationError as exc:
+            form.add_error(None, exc)
+            return self.form_invalid(form)
 
 
 class RefundDeleteView(BaseDeleteView):
@@ -226,26 +411,251 @@ class RefundDeleteView(BaseDeleteView):
         return super().delete(request, *args, **kwargs)
 
 
+async def aiter_chunks(chunks, batch_size=STREAM_BATCH_SIZE):
+    """Advance a sync iterator of str/bytes chunks on the sync thread, yielding each batch as one bytes chunk"""
+    chunks = iter(chunks)
+    next_batch = sync_to_async(lambda: list(islice(chunks, batch_size)))
+    try:
+        while batch := await next_batch():
+            yield b''.join(chunk if isinstance(chunk, bytes) else chunk.encode() for chunk in batch)
+    finally:
+        if hasattr(chunks, 'close'):
+            await sync_to_async(chunks.close)()
+
+
+def streaming_response(request, chunks, **kwargs):
+    """
+    StreamingHttpResponse over ``chunks``. Under ASGI it gets an async
+    iterator, since Django would otherwise read a sync one into a list
+    before sending anything.
+    """
+    if isinstance(getattr(request, '_request', request), ASGIRequest):  # DRF requests wrap Django's
+        chunks = aiter_chunks(chunks)
+    return StreamingHttpResponse(chunks, **kwargs)
+
+
+@login_required
+def export_view(request):
+    """Stream the user's wallet history as CSV or JSON Lines, optionally gzipped"""
+    form = WalletExportForm(request.GET)
+    if not form.is_valid():
+        return HttpResponseBadRequest(form.errors.as_text())
+
+    export_format = form.cleaned_data['format']
+    compress = form.cleaned_data['gzip']
+    response = streaming_response(
+        request,
+        iter_export(request.user, export_format, form.datasets, compress=compress),
+        content_type='application/gzip' if compress else EXPORT_FORMATS[export_format],
+    )
+    filename = export_filename(
+        form.cleaned_data['dataset'], export_format, compress, timezone.now().date().isoformat()
+    )
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+
+@login_required
+@require_POST
+def export_job_view(request):
+    """Queue an export of the user's history, prepared in the background and downloaded from the job page"""
+    form = WalletExportForm(request.POST)
+    if not form.is_valid():
+        return HttpResponseBadRequest(form.errors.as_text())
+    job = enqueue('export_history', request.user, {
+        'format': form.cleaned_data['format'],
+        'dataset': form.cleaned_data['dataset'],
+        'datasets': form.datasets,
+        'gzip': form.cleaned_data['gzip'],
+    })
+    return redirect('vbucks_tracker:job-detail', pk=job.pk)
+
+
+@login_required
+def job_detail_view(request, pk):
+    """Status and progress of one of the user's background jobs"""
+    job = get_object_or_404(Job, pk=pk, user=request.user)
+    return render(request, 'job_detail.html', {'job': job, 'title': 'Background Job'})
+
+
 @login_required
-async def gifted_spending_view(request):
-    user = request.user
-
-    # Async fetch spendings filtered by user and category 'GIFT'
-    spendings = await sync_to_async(
-        lambda: list(
-            VbucksSpending.objects.filter(user=user, category='GIFT')
-            .order_by('-date')
-            .select_related('user')))()
-
-    # Async fetch total gifted spent sum
-    total_gifted_spent = await sync_to_async(
-        lambda: VbucksSpending.objects.filter(user=user, category='GIFT')
-                .aggregate(total=Sum('vbucks_spent'))['total'] or 0)()
-
-    context = {
-        'spendings': spendings,
-        'selected_category': 'GIFT',
-        'total_gifted_spent': total_gifted_spent,
-        'show_gifted_total': True,}
-
-    return render(request, 'vbucks_spending_list.html', context)
+def job_download_view(request, pk):
+    """Download the file a finished export job wrote"""
+    job = get_object_or_404(Job, pk=pk, user=request.user, kind='export_history', status=Job.SUCCEEDED)
+    try:
+        file = default_storage.open(job.result['file'])
+    except FileNotFoundError:
+        raise Http404("The export has expired")
+    return FileResponse(file, as_attachment=True, filename=job.result['filename'])
+
+
+@login_required
+def import_view(request):
+    """Bulk import spendings, earnings or transactions from a CSV/JSONL upload"""
+    result = None
+    if request.method == 'POST':
+        form = WalletImportForm(request.POST, request.FILES)
+        if form.is_valid():
+            upload = form.cleaned_data['file']
+            records = iter_records(open_text(upload.file), detect_format(upload.name))
+            result = WalletImporter(request.user, form.cleaned_data['dataset']).run(records)
+            form = WalletImportForm(initial={'dataset': form.cleaned_data['dataset']})
+    else:
+        form = WalletImportForm()
+
+    return render(request, 'import_history.html', {
+        'form': form,
+        'result': result,
+    })
+
+
+@replica_reads
+@login_required
+def analytics_view(request):
+    """Spending, earning and purchase totals per category for a date range"""
+    form = WalletAnalyticsForm(request.GET)
+    report = None
+    closing_balance = None
+    if form.is_valid():
+        report = rollup_report(
+            request.user, form.cleaned_data['start'], form.cleaned_data['end'], form.sources
+        )
+        closing_balance = balance_on(request.user, form.cleaned_data['end'])
+    return render(request, 'analytics.html', {
+        'form': form,
+        'report': report,
+        'closing_balance': closing_balance,
+    })
+
+
+def balance_history_response(request, form):
+    """Stream the user's balance series for a valid BalanceHistoryForm as JSON"""
+    return streaming_response(
+        request,
+        iter_balance_series_json(request.user, form.cleaned_data['start'], form.cleaned_data['end']),
+        content_type='application/json',
+    )
+
+
+@replica_reads
+@login_required
+def balance_history_view(request):
+    """The user's balance over time (``?start=&end=``), for the analytics chart"""
+    form = BalanceHistoryForm(request.GET)
+    if not form.is_valid():
+        return HttpResponseBadRequest(form.errors.as_text())
+    return balance_history_response(request, form)
+
+
+def search_wallet(user, form):
+    """Return ``(results, page number, has_next)`` for a valid WalletSearchForm"""
+    number = form.cleaned_data['page'] or 1
+    using = router.db_for_read(VbucksSpending)
+    results, has_next = search_backend(using).page(user, form.cleaned_data['q'], form.kinds, number)
+    return results, number, has_next
+
+
+@replica_reads
+@login_required
+def search_view(request):
+    """Ranked full-text search over the user's names and notes"""
+    form = WalletSearchForm(request.GET)
+    context = {'form': form, 'results': None}
+    if form.is_valid() and form.cleaned_data['q']:
+        results, number, has_next = search_wallet(request.user, form)
+        context['results'] = results
+        query = request.GET.copy()
+        if number > 1:
+            query['page'] = number - 1
+            context['previous_page_query'] = query.urlencode()
+        if has_next:
+            query['page'] = number + 1
+            context['next_page_query'] = query.urlencode()
+    return render(request, 'search.html', context)
+
+
+class SearchAPIView(ReplicaReadsMixin, APIView):
+    """Full-text search for the authenticated user (``?q=&kind=&page=``)"""
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        form = WalletSearchForm(request.query_params)
+        if not form.is_valid():
+            raise exceptions.ValidationError(form.errors.get_json_data())
+        results, number, has_next = search_wallet(request.user, form)
+        url = request.build_absolute_uri()
+        previous = None
+        if number > 1:
+            previous = replace_query_param(url, 'page', number - 1) if number > 2 else remove_query_param(url, 'page')
+        return Response({
+            'next': replace_query_param(url, 'page', number + 1) if has_next else None,
+            'previous': previous,
+            'results': SearchResultSerializer(results, many=True).data,
+        })
+
+
+class AnalyticsAPIView(ReplicaReadsMixin, APIView):
+    """Rollup-backed analytics for the authenticated user (``?start=&end=&source=``)"""
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        form = WalletAnalyticsForm(request.query_params)
+        if not form.is_valid():
+            raise exceptions.ValidationError(form.errors.get_json_data())
+        report = rollup_report(
+            request.user, form.cleaned_data['start'], form.cleaned_data['end'], form.sources
+        )
+        return Response(report)
+
+
+class BalanceAPIView(ReplicaReadsMixin, APIView):
+    """The authenticated user's balance at the end of a day (``?date=``, default today)"""
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        form = BalanceOnForm(request.query_params)
+        if not form.is_valid():
+            raise exceptions.ValidationError(form.errors.get_json_data())
+        day = form.cleaned_data['date']
+        return Response({'date': day, 'balance': balance_on(request.user, day)})
+
+
+class BalanceHistoryAPIView(ReplicaReadsMixin, APIView):
+    """
+    The authenticated user's balance over time (``?start=&end=``), streamed
+    from the ledger as ``{"start", "end", "points": [[date, balance], ...]}``
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        form = BalanceHistoryForm(request.query_params)
+        if not form.is_valid():
+            raise exceptions.ValidationError(form.errors.get_json_data())
+        return balance_history_response(request, form)
+
+
+class BulkRefundAPIView(APIView):
+    """Refund many of the authenticated user's purchases in one transaction"""
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        serializer = BulkRefundSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+        refunds = [
+            Refund(
+                user=request.user,
+                original_purchase_id=purchase_id,
+                reason=data.get('reason', ''),
+                notes=data.get('notes', ''),
+            )
+            for purchase_id in data['purchases']
+        ]
+        try:
+            # Locked here rather than with ImmediateWritesMixin: the user, and
+            # with it their shard, is only known once DRF has authenticated them
+            with immediate_atomic(shard_for(request.user)):
+                VbucksService.create_refunds(refunds)
+        except ValidationError as exc:
+            raise exceptions.ValidationError({'purchases': exc.messages})
+        return Response(RefundSerializer(refunds, many=True).data, status=status.HTTP_201_CREATED)